@@ -11,13 +11,23 @@ import time
 # Importamos nuestros módulos locales (asumiendo que database.py y ui_views.py están en la misma carpeta)
 import database as db
 import ui_views as views
+import storage
+import write_ahead
+import profiler
+
+# Con esta variable se usa el cliente en memoria (fake_supabase.FAKE_SUPABASE_ENV). El nombre se repite aquí
+# para que en producción no se importen el cliente de pruebas ni el generador de datos sintéticos.
+FAKE_SUPABASE_ENV = 'GUARDIAN_FAKE_SUPABASE'
 
 
 # --- 1. CONEXIÓN Y CARGA DE DATOS ---
 
 @st.cache_resource
 def init_supabase_connection():
-    """Inicializa la conexión con Supabase usando los secretos."""
+    """Inicializa la conexión con Supabase usando los secretos (o el cliente en memoria si GUARDIAN_FAKE_SUPABASE está definida)."""
+    fake_setting = os.environ.get(FAKE_SUPABASE_ENV, '')
+    if fake_setting:
+        return init_fake_connection(fake_setting)
     try:
         url = st.secrets["SUPABASE_URL"]
         key = st.secrets["SUPABASE_KEY"]
@@ -26,20 +36,52 @@ def init_supabase_connection():
         st.error(f"Error al conectar con Supabase: {e}")
         st.stop()
 
+def init_fake_connection(setting: str):
+    """
+    Cliente Supabase en memoria (sin red) con la latencia/fallos de `setting`, para medir la app de punta a punta.
+    Con rows=N el usuario de prueba empieza con un hogar sintético de N transacciones.
+    """
+    import fake_supabase
+    import synthetic_data
+    try:
+        client, rows = fake_supabase.client_from_setting(setting)
+    except ValueError as e:
+        st.error(f"Configuración inválida del cliente en memoria: {e}")
+        st.stop()
+    if rows:
+        household = synthetic_data.make_household(rows, end=datetime.now())
+        synthetic_data.store_household(client, fake_supabase.FAKE_USER.id, household)
+        client.reset_stats()
+    return client
+
+@st.cache_resource
+def init_storage_backend(_supabase_client):
+    """
+    Backend de datos (uno por proceso). Con GUARDIAN_SQLITE_PATH los datos van a un archivo SQLite local
+    y Supabase solo atiende el login; si no, Supabase (con la cola local de escrituras solo si GUARDIAN_WAL_PATH está definida).
+    """
+    sqlite_path = os.environ.get(storage.SQLITE_PATH_ENV, '')
+    if sqlite_path:
+        return storage.SQLiteBackend(sqlite_path, auth_client=_supabase_client)
+    return storage.SupabaseBackend(write_ahead.write_ahead_client(_supabase_client))
+
+@profiler.timed()
 def init_session_state(supabase_client, user_id, force_load=False):
     """Carga todos los datos del usuario desde Supabase al session_state."""
     # V5.0 Lógica de carga sin cambios
     if 'transactions_df' not in st.session_state or force_load:
-        # Cargar todo desde Supabase
-        st.session_state.transactions_df = db.load_data(supabase_client, db.TRANSACTIONS_TABLE, user_id, db.DEFAULT_TRANSACTIONS)
-        st.session_state.accounts_df = db.load_data(supabase_client, db.ACCOUNTS_TABLE, user_id, db.DEFAULT_ACCOUNTS)
-        st.session_state.goals_df = db.load_data(supabase_client, db.GOALS_TABLE, user_id, db.DEFAULT_GOALS)
-        st.session_state.categories = db.load_categories(supabase_client, user_id)
-        st.session_state.members = db.load_members(supabase_client, user_id)
-        
-        # Cargar configuraciones
-        st.session_state.budget_config = db.load_budget_config(supabase_client, user_id)
-        st.session_state.category_budgets = db.load_category_budgets(supabase_client, user_id)
+        # Cargar todo desde Supabase (consultas en paralelo)
+        data, timings = db.load_user_data(supabase_client, user_id)
+        db.set_transactions(data[db.TRANSACTIONS_TABLE])
+        db.set_state('accounts_df', data[db.ACCOUNTS_TABLE])
+        db.set_state('goals_df', data[db.GOALS_TABLE])
+        st.session_state.categories = data[db.CATEGORIES_TABLE]
+        st.session_state.members = data[db.MEMBERS_TABLE]
+
+        # Configuraciones
+        db.set_state('budget_config', data['budget_config'])
+        db.set_state('category_budgets', data['category_budgets'])
+        st.session_state[db.LOAD_TIMINGS_KEY] = timings
         st.session_state['data_loaded'] = True # Indicador de que la carga inicial ha ocurrido
         
     # V5.0 Lógica de filtros y metas sin cambios
@@ -68,17 +110,11 @@ def init_session_state(supabase_client, user_id, force_load=False):
         if force_recalc:
              st.session_state.force_filter_recalc = False 
 
-    # Sincronizar metas
-    if 'goals_df' in st.session_state and 'Monto Objetivo' in st.session_state.goals_df.columns:
-        transactions_to_use = st.session_state.transactions_df.copy() if 'transactions_df' in st.session_state else pd.DataFrame()
-        st.session_state.goals_df = db.update_goal_progress(
-            transactions_to_use,
-            st.session_state.goals_df.copy()
-        )
-        db.save_data(supabase_client, db.GOALS_TABLE, st.session_state.goals_df, user_id)
-    elif 'goals_df' not in st.session_state and not force_load:
-         st.session_state.goals_df = db.DEFAULT_GOALS.copy()
-         db.save_data(supabase_client, db.GOALS_TABLE, st.session_state.goals_df, user_id)
+    # Sincronizar metas (solo recalcula/guarda si cambiaron el historial o las metas)
+    if 'goals_df' in st.session_state:
+        db.sync_goal_progress(supabase_client, user_id)
+    elif not force_load:
+         db.set_state('goals_df', db.DEFAULT_GOALS.copy())
 
 
 def handle_logout(supabase_client):
@@ -88,7 +124,7 @@ def handle_logout(supabase_client):
     except Exception as e:
         st.warning(f"Error al cerrar sesión en Supabase: {e}")
         
-    keys_to_delete = ['user', 'logged_in', 'data_loaded', 'active_tab', 'transactions_df', 'accounts_df', 'goals_df', 'categories', 'members', 'budget_config', 'category_budgets', 'auth_popup_open']
+    keys_to_delete = ['user', 'logged_in', 'data_loaded', 'active_tab', 'transactions_df', 'accounts_df', 'goals_df', 'categories', 'members', 'budget_config', 'category_budgets', 'auth_popup_open', db.SNAPSHOTS_KEY, 'filter_index_cache', db.VERSIONS_KEY, db.AGGREGATE_CACHE_KEY, db.AGGREGATE_STATS_KEY, db.GOALS_SYNC_KEY, db.LOAD_TIMINGS_KEY, db.HISTORY_KEY, db.LEDGER_KEY, db.CUBE_KEY, db.REFERENCES_KEY, db.GOAL_ENGINE_KEY]
     for key in keys_to_delete:
         if key in st.session_state:
             del st.session_state[key]
@@ -174,6 +210,7 @@ def view_login_page(supabase_client, app_url):
         """, unsafe_allow_html=True)
 
 
+@profiler.timed()
 def main_app_content(supabase_client, user_id, user_email):
     """Contiene la aplicación principal (Sidebar y Vistas de Pestaña)."""
     
@@ -190,6 +227,7 @@ def main_app_content(supabase_client, user_id, user_email):
     st.sidebar.write(f"Sesión iniciada como:")
     st.sidebar.success(f"**{user_email}**")
     st.sidebar.button("🔴 Cerrar Sesión", type="secondary", use_container_width=True, on_click=handle_logout, args=(supabase_client,))
+    views.view_sync_status(supabase_client, user_id)
 
 
     tab_names_icons = {
@@ -207,12 +245,14 @@ def main_app_content(supabase_client, user_id, user_email):
     st.sidebar.markdown("---")
 
     # --- FILTROS EN BARRA LATERAL ---
+    # Un rango que empieza antes de lo ya cargado trae las páginas antiguas que falten
+    views.load_history_with_progress(supabase_client, user_id, until=st.session_state.get('filter_start_date'), container=st.sidebar)
     df_transactions_current = st.session_state.get('transactions_df', pd.DataFrame())
-    df_filtered_for_analysis = views.view_sidebar_filters(df_transactions_current)
+    active_filters = views.view_sidebar_filters(df_transactions_current)
 
     # --- LÓGICA DEL ASISTENTE DE CONFIGURACIÓN ---
     # La aplicación se considera "no configurada" si no hay cuentas ni transacciones.
-    if st.session_state.accounts_df.empty and st.session_state.transactions_df.empty:
+    if st.session_state.accounts_df.empty and st.session_state.transactions_df.empty and db.history_covers(user_id):
          st.session_state.wizard_mode = True
     
     if st.session_state.get('wizard_mode', False):
@@ -222,17 +262,25 @@ def main_app_content(supabase_client, user_id, user_email):
     # --- ENRUTADOR DE PÁGINAS (ROUTER) ---
     active_tab_key = st.session_state.get('active_tab', list(tab_names_icons.keys())[0])
     if active_tab_key == "📊 Dash":
-        views.view_dash(df_filtered_for_analysis)
+        views.view_dash(active_filters, supabase_client, user_id)
     elif active_tab_key == "📝 Registrar":
         views.view_register(supabase_client, user_id)
     elif active_tab_key == "⚙️ Configurar":
         views.view_config(supabase_client, user_id)
     elif active_tab_key == "📋 Historial":
         views.view_history(supabase_client, user_id)
+    views.view_profiler_panel()
+
+    # --- HISTORIAL ANTIGUO EN SEGUNDO PLANO ---
+    # Tras dibujar la página con la ventana reciente, se trae una tanda de páginas antiguas y se vuelve a ejecutar
+    if not db.history_covers(user_id):
+        views.load_history_with_progress(supabase_client, user_id, max_pages=db.HISTORY_PAGES_PER_RUN, container=st.sidebar)
+        st.rerun()
 
 
 # --- 3. FUNCIÓN PRINCIPAL DE LA APLICACIÓN ---
 
+@profiler.timed(root=True)
 def main():
     st.set_page_config(
         page_title="Guardian Doméstico V6.1 - Fix Bucle Pop-up",
@@ -240,7 +288,7 @@ def main():
         initial_sidebar_state="expanded"
     )
 
-    supabase_client = init_supabase_connection()
+    supabase_client = init_storage_backend(init_supabase_connection())
     
     # --- Obtención de URL pública para redirección (Fix de localhost) ---
     app_url = os.environ.get("STREAMLIT_URL", "http://localhost:8501")
@@ -0,0 +1,1229 @@
+# --- Archivo: benchmarks.py ---
+# Benchmarks reproducibles (sin red, contra el cliente en memoria); la corrección se comprueba en tests/ (pytest)
+# Uso: python benchmarks.py [nombre_benchmark ...]  -> una línea JSON por resultado
+#      python benchmarks.py --compare base.jsonl head.jsonl  -> razón de tiempos entre dos corridas (p.ej. dos commits)
+
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+import plotly.tools
+import streamlit as st
+from streamlit import config as st_config
+from streamlit import dataframe_util
+
+import charts
+import database as db
+import profiler
+import storage
+import fake_supabase
+from fake_supabase import FakeResponse, FakeSupabaseClient
+from synthetic_data import SEED, make_household, make_transactions, store_household
+from write_ahead import QueuedClient, WriteAheadLog
+
+
+def _quiet_streamlit():
+    """Streamlit avisa en cada llamada cuando se ejecuta fuera de `streamlit run`."""
+    st_config.set_option('global.showWarningOnDirectExecution', False)
+    st_config.set_option('logger.level', 'error') # También para los loggers que se creen después
+    for name in [n for n in logging.root.manager.loggerDict if n.startswith('streamlit')] + ['streamlit']:
+        logging.getLogger(name).setLevel(logging.ERROR)
+
+
+_quiet_streamlit()
+
+USER_ID = 'bench-user'
+SUITE_TIME_BUDGET_S = 10.0 # bench_suite repite cada medición hasta `repeats` veces o hasta gastar este tiempo
+COMPARE_ID_FIELDS = ('benchmark', 'function', 'filter', 'rows') # Identifican una medición al comparar dos corridas
+REGRESSION_RATIO = 1.2 # --compare marca como regresión lo que tarde 20% más
+
+
+# --- 1. MEDICIÓN ---
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def _apply_filters(df, start_date=None, end_date=None, tipo=db.FILTER_ALL, miembro=db.FILTER_ALL):
+    """Filtros del sidebar aplicados a las filas (lo que hacía la app antes de filtrar sobre el cubo)."""
+    if df.empty or 'Fecha' not in df.columns:
+        return df
+    positions = db.filter_positions(db.get_filter_index(df), start_date, end_date, tipo, miembro)
+    return df if len(positions) == len(df) else df.iloc[positions]
+
+
+# --- 2. BENCHMARKS ---
+
+def bench_save_data_incremental(sizes=(1_000, 10_000, 50_000)):
+    """Costo de guardar UNA transacción nueva según el tamaño del historial."""
+    for n_rows in sizes:
+        client = FakeSupabaseClient()
+        db.set_snapshot(db.TRANSACTIONS_TABLE, USER_ID, None)
+        db.save_data(client, db.TRANSACTIONS_TABLE, make_transactions(n_rows), USER_ID)
+        df = db.load_data(client, db.TRANSACTIONS_TABLE, USER_ID, db.DEFAULT_TRANSACTIONS)
+
+        new_entry = make_transactions(1, seed=n_rows).drop(columns=[db.ROW_ID_COLUMN], errors='ignore')
+        df = pd.concat([df, new_entry], ignore_index=True).sort_values(by='Fecha', ascending=False)
+        client.reset_stats()
+        _, ms = _timed(db.save_data, client, db.TRANSACTIONS_TABLE, df, USER_ID)
+        yield {
+            'benchmark': 'save_data_incremental', 'rows': n_rows, 'ms': round(ms, 2),
+            'round_trips': client.stats['round_trips'], 'rows_sent': client.stats['rows_sent'],
+        }
+
+
+def bench_sidebar_filters(sizes=(10_000, 100_000), repeats=200):
+    """Tiempo de aplicar los filtros del sidebar (últimos 30 días, por tipo y miembro) y del conteo que muestra."""
+    for n_rows in sizes:
+        df = make_transactions(n_rows)
+        _, build_ms = _timed(db.build_filter_index, df)
+        index = db.get_filter_index(df)
+        end = df['Fecha'].max()
+        start = end - pd.Timedelta(days=30)
+        for label, kwargs in [
+            ('30_dias', {}),
+            ('30_dias_gasto', {'tipo': 'Gasto'}),
+            ('30_dias_gasto_miembro', {'tipo': 'Gasto', 'miembro': 'Ana'}),
+        ]:
+            timings = [_timed(_apply_filters, df, start, end, **kwargs)[1] for _ in range(repeats)]
+            count_timings = [_timed(lambda: len(db.filter_positions(index, start, end, **kwargs)))[1] for _ in range(repeats)]
+            yield {
+                'benchmark': 'sidebar_filters', 'rows': n_rows, 'filter': label,
+                'index_build_ms': round(build_ms, 2), 'median_ms': round(float(np.median(timings)), 4),
+                'count_median_ms': round(float(np.median(count_timings)), 4),
+                'rows_out': len(_apply_filters(df, start, end, **kwargs)),
+            }
+
+
+def _load_session(df_transactions):
+    """Prepara el session_state como lo deja init_session_state."""
+    for key in [db.AGGREGATE_CACHE_KEY, db.AGGREGATE_STATS_KEY]:
+        st.session_state.pop(key, None)
+    today = datetime.now().date()
+    db.set_transactions(df_transactions)
+    db.set_state('accounts_df', pd.DataFrame({'Nombre': ['Efectivo', 'Banco', 'Crédito'], 'Tipo': ['Efectivo', 'Banco', 'Crédito'], 'Saldo Inicial': [0.0, 1000.0, 0.0]}))
+    db.set_state('budget_config', {'period_start': today - timedelta(days=15), 'period_end': today, 'budget_amount': 1000.0})
+    db.set_state('category_budgets', {'Comida': 300.0, 'Transporte': 100.0})
+    st.session_state.filter_start_date = df_transactions['Fecha'].max().date() - timedelta(days=30)
+    st.session_state.filter_end_date = df_transactions['Fecha'].max().date()
+    st.session_state.filter_type = db.FILTER_ALL
+    st.session_state.filter_member = db.FILTER_ALL
+
+
+def _dashboard_rerun():
+    """Lo que hace view_dash en cada rerun, sin dibujar."""
+    filters = db.active_filter_tuple()
+    deps = (
+        db.get_version('transactions_df'), db.get_version('accounts_df'),
+        db.get_version('budget_config'), db.get_version('category_budgets'),
+        filters, datetime.now().date()
+    )
+    return db.cached_aggregate('dashboard', deps, lambda: db.compute_dashboard_aggregates(
+        st.session_state.transactions_df, st.session_state.accounts_df, filters,
+        st.session_state.budget_config, st.session_state.category_budgets,
+        account_flows=db.ledger_account_flows(), cube=db.get_rollup_cube()
+    ))
+
+
+def bench_dashboard_cache(sizes=(10_000, 100_000), reruns=100):
+    """Reruns sin cambios de datos: solo el primero debe recalcular los agregados."""
+    for n_rows in sizes:
+        _load_session(make_transactions(n_rows))
+        _, first_ms = _timed(_dashboard_rerun)
+        timings = [_timed(_dashboard_rerun)[1] for _ in range(reruns - 1)]
+        stats = db.aggregate_cache_stats()
+        db.set_transactions(st.session_state.transactions_df.copy())
+        _, after_change_ms = _timed(_dashboard_rerun)
+        yield {
+            'benchmark': 'dashboard_cache', 'rows': n_rows, 'reruns': reruns,
+            'first_ms': round(first_ms, 2), 'cached_median_ms': round(float(np.median(timings)), 4),
+            'after_change_ms': round(after_change_ms, 2),
+            'hits': stats['hits'], 'misses': stats['misses'],
+        }
+
+
+def _legacy_kpis(df, start_date, end_date):
+    """Referencia: las funciones anteriores (un filtrado y copia por métrica)."""
+    df_neto = df[df['Tipo'] != 'Transferencia'].copy()
+    ingresos = df_neto[df_neto['Tipo'] == 'Ingreso']['Monto'].sum()
+    gastos = df_neto[df_neto['Tipo'] == 'Gasto']['Monto'].sum()
+    df_dates = df.copy()
+    df_dates['Fecha'] = df_dates['Fecha'].dt.date
+    period_spend = df_dates[(df_dates['Tipo'] == 'Gasto') & (df_dates['Fecha'] >= start_date) & (df_dates['Fecha'] <= end_date)]['Monto'].sum()
+    df_fixed = df[df['Recurrente'] == True].copy()
+    df_fixed['Monto Mensual'] = df_fixed.apply(lambda row: row['Monto'] * db.FREQUENCY_MULTIPLIER.get(row['Frecuencia'], 0.0), axis=1)
+    fixed_income = df_fixed[df_fixed['Tipo'] == 'Ingreso']['Monto Mensual'].sum()
+    df_period = df[(df['Tipo'] == 'Gasto') & (df['Fecha'] >= pd.Timestamp(start_date)) & (df['Fecha'] < pd.Timestamp(end_date) + timedelta(days=1))].copy()
+    by_category = df_period.groupby('Categoría')['Monto'].sum()
+    df_day = df[df['Tipo'] == 'Gasto'].copy()
+    df_day['Dia'] = df_day['Fecha'].dt.day_name().map(db.DAY_NAMES_MAP)
+    dow_profile = df_day.groupby('Dia')['Monto'].mean()
+    return ingresos, gastos, period_spend, fixed_income, by_category, dow_profile
+
+
+def bench_fused_kpis(sizes=(10_000, 100_000, 1_000_000)):
+    """KPIs del dashboard: funciones separadas (anterior) contra compute_kpis (una pasada)."""
+    for n_rows in sizes:
+        df = make_transactions(n_rows)
+        end_date = df['Fecha'].max().date()
+        start_date = end_date - timedelta(days=15)
+        _, legacy_ms = _timed(_legacy_kpis, df, start_date, end_date)
+        _, fused_ms = _timed(db.compute_kpis, df, start_date, end_date)
+        yield {
+            'benchmark': 'fused_kpis', 'rows': n_rows,
+            'legacy_ms': round(legacy_ms, 2), 'fused_ms': round(fused_ms, 2),
+            'speedup': round(legacy_ms / fused_ms, 1),
+        }
+
+
+def bench_fixed_surplus(sizes=(10_000, 100_000)):
+    """Superávit fijo con historial 100% recurrente: apply fila a fila contra lookup vectorizado."""
+    rng = np.random.default_rng(SEED)
+    for n_rows in sizes:
+        df = make_transactions(n_rows)
+        df['Recurrente'] = True
+        df['Frecuencia'] = rng.choice(list(db.FREQUENCY_MULTIPLIER), size=n_rows)
+
+        def legacy():
+            df_fixed = df[df['Recurrente'] == True].copy()
+            df_fixed['Monto Mensual'] = df_fixed.apply(lambda row: row['Monto'] * db.FREQUENCY_MULTIPLIER.get(row['Frecuencia'], 0.0), axis=1)
+            return df_fixed[df_fixed['Tipo'] == 'Ingreso']['Monto Mensual'].sum(), df_fixed[df_fixed['Tipo'] == 'Gasto']['Monto Mensual'].sum()
+
+        _, legacy_ms = _timed(legacy)
+        _, vector_ms = _timed(db.calculate_fixed_surplus, df)
+        projection, projection_ms = _timed(db.calculate_recurring_projection, df)
+        yield {
+            'benchmark': 'fixed_surplus', 'rows': n_rows, 'legacy_apply_ms': round(legacy_ms, 2),
+            'vectorized_ms': round(vector_ms, 2), 'projection_12m_ms': round(projection_ms, 2),
+            'projection_months': len(projection),
+        }
+
+
+def bench_transaction_memory(sizes=(10_000, 100_000)):
+    """Bytes por transacción: columnas object (como llegan del JSON) contra el almacén normalizado."""
+    for n_rows in sizes:
+        df = make_transactions(n_rows)
+        db.ensure_row_ids(df)
+        text_cols = [c for c in df.columns if c not in ('Fecha', 'Monto', 'Recurrente')]
+        df_object = df.astype({c: object for c in text_cols})
+        df_store, normalize_ms = _timed(db.normalize_transactions, df_object)
+        before = db.transactions_memory_usage(df_object)
+        after = db.transactions_memory_usage(df_store)
+        yield {
+            'benchmark': 'transaction_memory', 'rows': n_rows,
+            'bytes_per_row_object': round(before['bytes_per_row'], 1),
+            'bytes_per_row_store': round(after['bytes_per_row'], 1),
+            'reduction': round(before['bytes'] / after['bytes'], 2),
+            'normalize_ms': round(normalize_ms, 2),
+        }
+
+
+def _seed_user(client, n_rows):
+    """Guarda en el cliente un usuario completo (historial hasta hoy, cuentas, metas, config)."""
+    st.session_state.pop(db.HISTORY_KEY, None)
+    db.set_snapshot(db.TRANSACTIONS_TABLE, USER_ID, None)
+    db.save_data(client, db.TRANSACTIONS_TABLE, make_transactions(n_rows, end=datetime.now()), USER_ID)
+    db.set_snapshot(db.ACCOUNTS_TABLE, USER_ID, None)
+    db.save_data(client, db.ACCOUNTS_TABLE, pd.DataFrame({'Nombre': ['Efectivo', 'Banco', 'Crédito'], 'Tipo': ['Efectivo', 'Banco', 'Crédito'], 'Saldo Inicial': [0.0, 1000.0, 0.0]}), USER_ID)
+    db.set_snapshot(db.GOALS_TABLE, USER_ID, None)
+    db.save_data(client, db.GOALS_TABLE, pd.DataFrame({'Nombre': ['Fondo de Emergencia'], 'Monto Objetivo': [5000.0], 'Monto Aportado': [0.0], 'Fecha Objetivo': [datetime.now().date()]}), USER_ID)
+    db.save_categories(client, db.DEFAULT_CATEGORIES, USER_ID)
+    db.save_members(client, ['Ana', 'Luis'], USER_ID)
+    db.save_config_key(client, USER_ID, db.BUDGET_KEY, {'period_start': '2024-01-01', 'period_end': '2024-01-15', 'budget_amount': 500.0})
+    db.save_config_key(client, USER_ID, db.CATEGORY_BUDGET_KEY, {'Comida': 300.0})
+
+
+def _sequential_startup(client):
+    """Referencia: las siete consultas una detrás de otra (init_session_state anterior)."""
+    db.load_data(client, db.TRANSACTIONS_TABLE, USER_ID, db.DEFAULT_TRANSACTIONS)
+    db.load_data(client, db.ACCOUNTS_TABLE, USER_ID, db.DEFAULT_ACCOUNTS)
+    db.load_data(client, db.GOALS_TABLE, USER_ID, db.DEFAULT_GOALS)
+    db.load_categories(client, USER_ID)
+    db.load_members(client, USER_ID)
+    db.load_budget_config(client, USER_ID)
+    db.load_category_budgets(client, USER_ID)
+
+
+def bench_parallel_startup(latency=0.05, slow_latency=0.15, n_rows=5_000):
+    """Login con latencia simulada: secuencial contra paralelo (debe acercarse a la consulta más lenta)."""
+    client = FakeSupabaseClient()
+    _seed_user(client, n_rows)
+    client.latency = {name: latency for name in [db.ACCOUNTS_TABLE, db.GOALS_TABLE, db.CATEGORIES_TABLE, db.MEMBERS_TABLE, db.CONFIG_TABLE]}
+    client.latency[db.TRANSACTIONS_TABLE] = slow_latency
+
+    db.clear_shared_cache() # Medir las consultas, no la caché entre sesiones
+    client.reset_stats()
+    _, sequential_ms = _timed(_sequential_startup, client)
+    sequential_trips = client.stats['round_trips']
+    db.clear_shared_cache()
+    client.reset_stats()
+    (_, timings), parallel_ms = _timed(db.load_user_data, client, USER_ID)
+    yield {
+        'benchmark': 'parallel_startup', 'rows': n_rows, 'slowest_query_ms': slow_latency * 1000,
+        'sequential_ms': round(sequential_ms, 1), 'sequential_round_trips': sequential_trips,
+        'parallel_ms': round(parallel_ms, 1), 'parallel_round_trips': client.stats['round_trips'],
+        'per_table_ms': timings,
+    }
+
+
+def bench_idle_reruns(n_rows=5_000, reruns=100):
+    """Reruns sin cambios: init_session_state no debe escribir nada en el backend."""
+    import app
+    _quiet_streamlit()
+    client = FakeSupabaseClient()
+    _seed_user(client, n_rows)
+    st.session_state.clear()
+    app.init_session_state(client, USER_ID)
+    db.load_older_transactions(client, USER_ID) # Historial completo (lo hace la app en segundo plano)
+    app.init_session_state(client, USER_ID) # Primera sincronización de metas
+    client.reset_stats()
+    _, idle_ms = _timed(lambda: [app.init_session_state(client, USER_ID) for _ in range(reruns)])
+    idle_writes, idle_trips = client.stats['writes'], client.stats['round_trips']
+
+    # Un cambio real en el historial sí debe recalcular y guardar las metas (una vez)
+    df = db.get_transactions()
+    new_row = df.iloc[[0]].assign(**{'Tipo': 'Transferencia', 'Destino': 'Fondo de Emergencia', 'Monto': 25.0, db.ROW_ID_COLUMN: db.new_row_id()})
+    db.set_transactions(pd.concat([df, new_row], ignore_index=True))
+    client.reset_stats()
+    for _ in range(reruns):
+        app.init_session_state(client, USER_ID)
+    goal_writes = client.stats['writes']
+    yield {
+        'benchmark': 'idle_reruns', 'rows': n_rows, 'reruns': reruns,
+        'idle_ms_per_rerun': round(idle_ms / reruns, 3), 'idle_writes': idle_writes, 'idle_round_trips': idle_trips,
+        'writes_after_edit': goal_writes,
+    }
+
+
+def _stream_older_history(client, progress):
+    """Lo que hace la app en segundo plano: una tanda de páginas por ejecución hasta completar."""
+    batches = 1
+    while not db.load_older_transactions(client, USER_ID, max_pages=db.HISTORY_PAGES_PER_RUN, progress=progress):
+        batches += 1
+    return batches
+
+
+def bench_paged_loading(n_rows=500_000, max_rows=1_000):
+    """Login con un historial grande: carga completa (con el tope de filas del servidor) contra ventana reciente + páginas antiguas."""
+    client = FakeSupabaseClient()
+    _seed_user(client, n_rows)
+    client.max_rows = max_rows
+
+    # Antes: una sola consulta select("*"), que el servidor corta en silencio
+    client.reset_stats()
+    df_full, full_ms = _timed(db.load_data, client, db.TRANSACTIONS_TABLE, USER_ID, db.DEFAULT_TRANSACTIONS)
+    truncated_rows = len(df_full)
+
+    # Ahora: la ventana reciente al iniciar...
+    st.session_state.clear()
+    client.reset_stats()
+    df_recent, recent_ms = _timed(db.load_recent_transactions, client, USER_ID)
+    db.set_transactions(df_recent)
+    recent_trips = client.stats['round_trips']
+
+    # ...un filtro más amplio trae solo las páginas que necesita...
+    wider_start = pd.Timestamp(datetime.now().date() - timedelta(days=db.RECENT_WINDOW_DAYS + 90))
+    db.load_older_transactions(client, USER_ID, until=wider_start)
+    partial_rows = len(db.get_transactions())
+
+    # ...y el resto llega por tandas, informando del progreso
+    reports = []
+    batches, older_ms = _timed(_stream_older_history, client, lambda loaded, total: reports.append((loaded, total)))
+    yield {
+        'benchmark': 'paged_loading', 'rows': n_rows, 'server_max_rows': max_rows,
+        'select_all_ms': round(full_ms, 1), 'select_all_rows': truncated_rows,
+        'recent_window_ms': round(recent_ms, 1), 'recent_window_rows': len(df_recent), 'recent_window_round_trips': recent_trips,
+        'wider_filter_rows': partial_rows, 'background_batches': batches,
+        'older_pages_ms': round(older_ms, 1), 'progress_reports': len(reports),
+    }
+
+
+class _DiscardingClient(FakeSupabaseClient):
+    """Cuenta las transacciones insertadas sin guardarlas, para medir solo la memoria del import."""
+
+    def _apply(self, query):
+        if query.operation == 'insert' and query.table_name == db.TRANSACTIONS_TABLE:
+            self.stats['round_trips'] += 1
+            self.stats['writes'] += 1
+            self.stats['rows_sent'] += len(query.payload)
+            self.stats['transactions_inserted'] = self.stats.get('transactions_inserted', 0) + len(query.payload)
+            return FakeResponse([])
+        return super()._apply(query)
+
+
+def _peak_rss_mb(func, *args, **kwargs):
+    """(resultado, ms, pico de memoria residente en MB por encima de la de partida). Solo Linux (/proc)."""
+    def rss_kb(field):
+        return int(re.search(rf'{field}:\s+(\d+)', open('/proc/self/status').read()).group(1))
+    with open('/proc/self/clear_refs', 'w') as clear_refs:
+        clear_refs.write('5') # Reinicia el pico (VmHWM) a la memoria actual
+    baseline_kb = rss_kb('VmRSS')
+    result, ms = _timed(func, *args, **kwargs)
+    return result, ms, (rss_kb('VmHWM') - baseline_kb) / 1024
+
+
+def bench_csv_import(sizes=(100_000, 1_000_000)):
+    """Import de CSV por trozos: el pico de memoria no debe crecer con el tamaño del archivo."""
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in sizes:
+            path = os.path.join(tmp, f'import_{n_rows}.csv')
+            make_transactions(n_rows).to_csv(path, index=False)
+
+            st.session_state.clear()
+            st.session_state.members = ['Ana']
+            st.session_state.categories = {k: list(v) for k, v in db.DEFAULT_CATEGORIES.items()}
+            db.set_state('accounts_df', pd.DataFrame({'Nombre': ['Efectivo'], 'Tipo': ['Efectivo'], 'Saldo Inicial': [0.0]}))
+            client = _DiscardingClient()
+            reports = []
+            summary, import_ms, import_mb = _peak_rss_mb(
+                db.import_transactions_csv, client, USER_ID, path, progress=lambda rows, fraction: reports.append((rows, fraction))
+            )
+
+            # Referencia: leer el archivo entero de una vez (lo que hacía el import anterior, antes de concatenar y guardar)
+            _, read_all_ms, read_all_mb = _peak_rss_mb(pd.read_csv, path)
+            yield {
+                'benchmark': 'csv_import', 'rows': n_rows, 'file_mb': round(os.path.getsize(path) / 1024 ** 2, 1),
+                'chunk_rows': db.CSV_CHUNK_ROWS, 'chunked_ms': round(import_ms, 1), 'chunked_peak_mb': round(import_mb, 1),
+                'read_all_ms': round(read_all_ms, 1), 'read_all_peak_mb': round(read_all_mb, 1),
+                'imported': summary['imported'], 'chunks': summary['chunks'], 'insert_requests': client.stats['writes'],
+            }
+
+
+def _metadata_import_frame(n_rows, n_accounts, n_categories, n_members, seed=SEED):
+    """Historial importado con miles de cuentas, categorías y miembros nuevos."""
+    df = make_transactions(n_rows, seed)
+    rng = np.random.default_rng(seed)
+    df['Cuenta'] = [f'Cuenta {i}' for i in rng.integers(0, n_accounts, size=n_rows)]
+    df['Categoría'] = [f'Categoría {i}' for i in rng.integers(0, n_categories, size=n_rows)]
+    df['Miembro'] = [f'Miembro {i}' for i in rng.integers(0, n_members, size=n_rows)]
+    return df
+
+
+def _reset_metadata_session(client):
+    """Session_state y cliente con solo los metadatos por defecto."""
+    st.session_state.clear()
+    client.tables.clear()
+    st.session_state.members = ['Ana']
+    st.session_state.categories = {k: list(v) for k, v in db.DEFAULT_CATEGORIES.items()}
+    db.save_members(client, st.session_state.members, USER_ID)
+    db.save_categories(client, st.session_state.categories, USER_ID)
+    db.set_snapshot(db.ACCOUNTS_TABLE, USER_ID, None)
+    db.set_state('accounts_df', db.DEFAULT_ACCOUNTS.copy())
+    db.save_data(client, db.ACCOUNTS_TABLE, st.session_state.accounts_df, USER_ID)
+    db.set_state('goals_df', db.DEFAULT_GOALS.copy())
+    client.reset_stats()
+
+
+def _legacy_sync_metadata(client, user_id, df):
+    """Referencia: la sincronización anterior (concat en bucle y reescritura de tablas completas)."""
+    current_members = set(st.session_state.get('members', []))
+    new_members = [m for m in set(df['Miembro'].unique()) if m not in current_members and pd.notna(m) and m != 'N/A']
+    if new_members:
+        st.session_state.members.extend(new_members)
+        st.session_state.members.sort()
+        db.save_members(client, st.session_state.members, user_id)
+    current_accounts = set(st.session_state.accounts_df['Nombre'].unique())
+    current_goals = set(st.session_state.goals_df['Nombre'].unique())
+    all_csv_accounts = set(df['Cuenta'].unique()).union(set(df[~df['Destino'].isin(current_goals)]['Destino'].unique()))
+    new_accounts_df = pd.DataFrame()
+    for acc in all_csv_accounts:
+        if acc not in current_accounts and pd.notna(acc) and acc != 'N/A':
+            new_accounts_df = pd.concat([new_accounts_df, pd.DataFrame([{'Nombre': acc, 'Tipo': 'Importada', 'Saldo Inicial': 0.0}])], ignore_index=True)
+    if not new_accounts_df.empty:
+        db.set_state('accounts_df', pd.concat([st.session_state.accounts_df, new_accounts_df], ignore_index=True))
+        db.save_data(client, db.ACCOUNTS_TABLE, st.session_state.accounts_df, user_id)
+    for tipo in ['Gasto', 'Ingreso']:
+        current = set(st.session_state.categories.get(tipo, []))
+        st.session_state.categories[tipo] += [c for c in set(df[df['Tipo'] == tipo]['Categoría'].unique()) if c not in current and pd.notna(c) and c != 'N/A']
+        st.session_state.categories[tipo].sort()
+    db.save_categories(client, st.session_state.categories, user_id)
+
+
+def bench_metadata_sync(n_rows=200_000, n_accounts=5_000, n_categories=3_000, n_members=500):
+    """Import que trae miles de cuentas/categorías nuevas: concat en bucle + reescritura contra diferencia de conjuntos + inserts."""
+    df = _metadata_import_frame(n_rows, n_accounts, n_categories, n_members)
+    client = FakeSupabaseClient()
+
+    _reset_metadata_session(client)
+    _, legacy_ms = _timed(_legacy_sync_metadata, client, USER_ID, df)
+    legacy_stats = dict(client.stats)
+
+    _reset_metadata_session(client)
+    _, sync_ms = _timed(db.sync_metadata_from_df, client, USER_ID, df)
+    sync_stats = dict(client.stats)
+
+    # Repetir el mismo import (ya no hay nada nuevo)
+    client.reset_stats()
+    _, repeat_ms = _timed(db.sync_metadata_from_df, client, USER_ID, df)
+    yield {
+        'benchmark': 'metadata_sync', 'rows': n_rows,
+        'legacy_ms': round(legacy_ms, 1), 'legacy_writes': legacy_stats['writes'], 'legacy_rows_sent': legacy_stats['rows_sent'],
+        'sync_ms': round(sync_ms, 1), 'sync_writes': sync_stats['writes'], 'sync_rows_sent': sync_stats['rows_sent'],
+        'speedup': round(legacy_ms / sync_ms, 1), 'repeat_ms': round(repeat_ms, 1), 'repeat_writes': client.stats['writes'],
+    }
+
+
+def _run_mutations(client, n_mutations):
+    """Secuencia de escrituras como las de los callbacks (cuentas, transacciones, config, borrados). Devuelve ms por escritura."""
+    st.session_state.clear()
+    accounts = db.DEFAULT_ACCOUNTS.copy()
+    transactions = make_transactions(200, end=datetime.now())
+    for table, df in [(db.ACCOUNTS_TABLE, accounts), (db.TRANSACTIONS_TABLE, transactions)]:
+        db.set_snapshot(table, USER_ID, None)
+        db.save_data(client, table, df, USER_ID)
+    timings = []
+    for i in range(n_mutations):
+        start = time.perf_counter()
+        if i % 4 == 0:
+            accounts = pd.concat([accounts, pd.DataFrame([{'Nombre': f'Cuenta {i}', 'Tipo': 'Banco', 'Saldo Inicial': float(i)}])], ignore_index=True)
+            db.save_data(client, db.ACCOUNTS_TABLE, accounts, USER_ID)
+        elif i % 4 == 1:
+            new_row = transactions.iloc[[0]].assign(**{'Monto': float(i), db.ROW_ID_COLUMN: db.new_row_id()})
+            transactions = pd.concat([new_row, transactions], ignore_index=True)
+            db.save_data(client, db.TRANSACTIONS_TABLE, transactions, USER_ID)
+        elif i % 4 == 2:
+            db.save_config_key(client, USER_ID, db.BUDGET_KEY, {'period_start': '2024-01-01', 'period_end': '2024-01-31', 'budget_amount': float(i)})
+        else:
+            transactions = transactions.iloc[1:].reset_index(drop=True) # Borra la más reciente
+            db.save_data(client, db.TRANSACTIONS_TABLE, transactions, USER_ID)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def bench_write_ahead(n_mutations=40, latency=0.05, failure_rate=0.3):
+    """Escrituras con red lenta y fallos: directas (bloquean la UI) contra la cola local en SQLite."""
+    direct_ms = _run_mutations(FakeSupabaseClient(latency=latency), n_mutations)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Cola con fallos inyectados: la UI no espera
+        backend = FakeSupabaseClient(latency=latency, failure_rate=failure_rate, seed=SEED)
+        wal = WriteAheadLog(backend, os.path.join(tmp, 'wal.sqlite3'), retry_base=0.01).start()
+        queued_ms = _run_mutations(QueuedClient(backend, wal), n_mutations)
+        _, flush_ms = _timed(wal.wait_until_flushed, timeout=120)
+        queued_stats = dict(wal.stats)
+        wal.close()
+
+        # Reinicio: lo encolado y no enviado se reenvía al abrir de nuevo el archivo
+        path = os.path.join(tmp, 'crash.sqlite3')
+        backend = FakeSupabaseClient()
+        crashed = WriteAheadLog(backend, path) # Sin hilo de envío: la app "se cae" antes de enviar
+        _run_mutations(QueuedClient(backend, crashed), n_mutations)
+        left_behind = crashed.pending()
+        crashed.close()
+        restarted = WriteAheadLog(backend, path).start()
+        _, replay_ms = _timed(restarted.wait_until_flushed, timeout=60)
+        restarted.close()
+
+    yield {
+        'benchmark': 'write_ahead', 'mutations': n_mutations, 'latency_ms': latency * 1000, 'failure_rate': failure_rate,
+        'direct_ui_ms_median': round(float(np.median(direct_ms)), 2), 'queued_ui_ms_median': round(float(np.median(queued_ms)), 2),
+        'flush_ms': round(flush_ms, 1), 'enqueued': queued_stats['enqueued'], 'flush_requests': queued_stats['requests'],
+        'retries': queued_stats['retries'], 'replayed_after_restart': left_behind, 'replay_ms': round(replay_ms, 1),
+    }
+
+
+def bench_sqlite_backend(n_rows=100_000, latency=0.05, repeats=20):
+    """Backend SQLite embebido: lecturas típicas sin red (por los índices) contra el cliente de Supabase con latencia."""
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_backend = storage.SQLiteBackend(os.path.join(tmp, 'guardian.sqlite3'))
+        reference = FakeSupabaseClient()
+        for client in (reference, sqlite_backend):
+            st.session_state.clear()
+            _seed_user(client, n_rows)
+
+        # Lecturas típicas: ventana reciente y filtros por categoría / cuenta
+        since = (datetime.now().date() - timedelta(days=db.RECENT_WINDOW_DAYS)).strftime(db.DB_DATETIME_FORMAT)
+        queries = {
+            'recent_window': [('Fecha', 'gte', since)],
+            'category': [('Categoría', 'eq', 'Comida')],
+            'account': [('Cuenta', 'eq', 'Banco')],
+        }
+        network = FakeSupabaseClient(latency=latency)
+        network.tables = reference.tables # Mismos datos, con espera de red
+        result = {'benchmark': 'sqlite_backend', 'rows': n_rows, 'network_latency_ms': latency * 1000}
+        for name, filters in queries.items():
+            rows, _ = sqlite_backend.select(db.TRANSACTIONS_TABLE, USER_ID, filters=filters)
+            timings = [_timed(sqlite_backend.select, db.TRANSACTIONS_TABLE, USER_ID, filters=filters)[1] for _ in range(repeats)]
+            _, network_ms = _timed(storage.get_backend(network).select, db.TRANSACTIONS_TABLE, USER_ID, filters=filters)
+            result.update({f'{name}_rows': len(rows), f'{name}_sqlite_ms': round(float(np.median(timings)), 2), f'{name}_network_ms': round(network_ms, 1)})
+        sqlite_backend.close()
+    yield result
+
+
+def _client_side_aggregates(client, df_accounts, df_goals, period):
+    """Referencia: traer todo el historial por páginas y sumar en pandas."""
+    records, _, _ = db.fetch_transaction_pages(client, USER_ID)
+    df = db.normalize_transactions(db._clean_loaded_frame(records, db.TRANSACTIONS_TABLE))
+    return {
+        'balances': db.calculate_account_balances(df, df_accounts),
+        'goals': db.update_goal_progress(df, df_goals),
+        'spend': db.compute_kpis(df, *period)['period_spend_by_category'],
+    }
+
+
+def _pushed_down_aggregates(client, df_accounts, df_goals, period):
+    """Los mismos agregados calculados por la base de datos."""
+    return {
+        'balances': db.calculate_account_balances(db.DEFAULT_TRANSACTIONS, df_accounts, flows=db.load_account_flows(client, USER_ID)),
+        'goals': db.update_goal_progress(db.DEFAULT_TRANSACTIONS, df_goals, contributions=db.load_goal_contributions(client, USER_ID)),
+        'spend': db.load_category_spend(client, USER_ID, *period),
+    }
+
+
+def bench_aggregate_pushdown(n_rows=200_000, latency=0.05, max_rows=1_000):
+    """Saldos, aportes a metas y gasto por categoría: sumar en el cliente (todo el historial) contra en la base de datos."""
+    st.session_state.clear()
+    client = FakeSupabaseClient(max_rows=max_rows, count_bytes=True)
+    _seed_user(client, n_rows)
+    df_accounts = db.load_data(client, db.ACCOUNTS_TABLE, USER_ID, db.DEFAULT_ACCOUNTS)
+    df_goals = db.load_data(client, db.GOALS_TABLE, USER_ID, db.DEFAULT_GOALS)
+    today = datetime.now().date()
+    period = (today - timedelta(days=30), today)
+    client.latency = latency
+
+    result = {'benchmark': 'aggregate_pushdown', 'rows': n_rows, 'latency_ms': latency * 1000}
+    for name, compute in [('client', _client_side_aggregates), ('pushdown', _pushed_down_aggregates)]:
+        client.reset_stats()
+        _, ms = _timed(compute, client, df_accounts, df_goals, period)
+        result.update({f'{name}_ms': round(ms, 1), f'{name}_round_trips': client.stats['round_trips'], f'{name}_bytes': client.stats['bytes_received']})
+
+    # El mismo contrato en SQLite (sin red)
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_backend = storage.SQLiteBackend(os.path.join(tmp, 'guardian.sqlite3'))
+        sqlite_backend.insert(db.TRANSACTIONS_TABLE, client.rows(db.TRANSACTIONS_TABLE))
+        for name, compute in [('client', _client_side_aggregates), ('pushdown', _pushed_down_aggregates)]:
+            _, ms = _timed(compute, sqlite_backend, df_accounts, df_goals, period)
+            result[f'sqlite_{name}_ms'] = round(ms, 1)
+        sqlite_backend.close()
+    result['bytes_ratio'] = round(result['client_bytes'] / max(result['pushdown_bytes'], 1), 1)
+    yield result
+
+
+def bench_balance_ledger(sizes=(100_000, 1_000_000)):
+    """Saldos con el libro incremental contra el cálculo completo."""
+    df_accounts = pd.DataFrame({'Nombre': ['Efectivo', 'Banco', 'Crédito', 'Nueva'], 'Tipo': ['Efectivo', 'Banco', 'Crédito', 'Banco'], 'Saldo Inicial': [0.0, 1000.0, 0.0, 50.0]})
+    for n_rows in sizes:
+        st.session_state.clear()
+        db.set_transactions(db.ensure_row_ids(make_transactions(n_rows, end=datetime.now())))
+        _, rebuild_ms = _timed(db.ledger_account_flows)
+        new_row = make_transactions(1, seed=SEED + 1, end=datetime.now())
+        db.set_transactions(pd.concat([db.get_transactions(), new_row], ignore_index=True), delta=(None, new_row))
+        df = db.get_transactions()
+        batch_ms = [_timed(db.calculate_account_balances, df, df_accounts)[1] for _ in range(5)]
+        ledger_ms = [_timed(lambda: db.calculate_account_balances(df, df_accounts, flows=db.ledger_account_flows()))[1] for _ in range(5)]
+        yield {
+            'benchmark': 'balance_ledger', 'rows': n_rows, 'batch_ms': round(float(np.median(batch_ms)), 2),
+            'ledger_ms': round(float(np.median(ledger_ms)), 2), 'rebuild_ms': round(rebuild_ms, 1),
+        }
+
+
+def _row_based_charts(df, filters):
+    """Referencia: los gráficos filtrados calculados sobre las transacciones (como antes del cubo)."""
+    df_filtered = _apply_filters(df, *filters)
+    df_gastos = df_filtered[df_filtered['Tipo'] == 'Gasto']
+    df_flujo = df_filtered[df_filtered['Tipo'].isin(['Ingreso', 'Gasto'])]
+    pivot = df_flujo.pivot_table(index=df_flujo['Fecha'].dt.normalize().rename('Fecha_Dia'), columns='Tipo', values='Monto', aggfunc='sum', observed=True).fillna(0)
+    return {
+        'count': len(df_filtered),
+        'pie_gastos': df_gastos.groupby('Categoría', observed=True)['Monto'].sum(),
+        'pie_ingresos': df_filtered[df_filtered['Tipo'] == 'Ingreso'].groupby('Categoría', observed=True)['Monto'].sum(),
+        'cash_flow': pivot,
+        'dow_profile': db.compute_kpis(df)['dow_profile'],
+    }
+
+
+def bench_rollup_cube(sizes=(100_000, 1_000_000)):
+    """Gráficos filtrados desde el cubo diario contra agrupar las transacciones."""
+    today = datetime.now().date()
+    for n_rows in sizes:
+        st.session_state.clear()
+        df = make_transactions(n_rows, end=datetime.now())
+        db.set_transactions(db.ensure_row_ids(df))
+        df = db.get_transactions()
+        _, build_ms = _timed(db.get_rollup_cube)
+        cube = db.get_rollup_cube()
+        config = {'period_start': today - timedelta(days=15), 'period_end': today, 'budget_amount': 1000.0}
+        results = {'benchmark': 'rollup_cube', 'rows': n_rows, 'cube_rows': len(cube['daily']), 'monthly_rows': len(cube['monthly']), 'build_ms': round(build_ms, 1)}
+        for label, days in [('30d', 30), ('5y', 5 * 365)]:
+            filters = (today - timedelta(days=days), today, db.FILTER_ALL, db.FILTER_ALL)
+            rows_ms = [_timed(_row_based_charts, df, filters)[1] for _ in range(3)]
+            cube_ms = [_timed(db.compute_dashboard_aggregates, df, pd.DataFrame(), filters, config, {}, cube=cube)[1] for _ in range(3)]
+            results.update({f'rows_{label}_ms': round(float(np.median(rows_ms)), 1), f'cube_{label}_ms': round(float(np.median(cube_ms)), 1)})
+        new_row = make_transactions(1, seed=SEED + 1, end=datetime.now())
+        _, delta_ms = _timed(db.set_transactions, pd.concat([df, new_row], ignore_index=True), delta=(None, new_row))
+        results['mutation_with_delta_ms'] = round(delta_ms, 1)
+        yield results
+
+
+def _seed_household(client, user_id, n_accounts=20):
+    """Datos de referencia de un hogar: cuentas, categorías, miembros y configuración."""
+    db.set_snapshot(db.ACCOUNTS_TABLE, user_id, None)
+    accounts = pd.DataFrame({'Nombre': [f'Cuenta {i}' for i in range(n_accounts)], 'Tipo': 'Banco', 'Saldo Inicial': 100.0})
+    db.save_data(client, db.ACCOUNTS_TABLE, accounts, user_id)
+    db.save_categories(client, db.DEFAULT_CATEGORIES, user_id)
+    db.save_members(client, ['Ana', 'Luis'], user_id)
+    db.save_config_key(client, user_id, db.BUDGET_KEY, {'period_start': '2024-01-01', 'period_end': '2024-01-15', 'budget_amount': 500.0})
+    db.save_config_key(client, user_id, db.CATEGORY_BUDGET_KEY, {'Comida': 300.0})
+
+
+def _reference_loads(client, user_id):
+    """Lo que lee cada sesión al entrar (sin el historial): cuatro consultas sin caché."""
+    accounts = db.load_data(client, db.ACCOUNTS_TABLE, user_id, db.DEFAULT_ACCOUNTS)
+    config = db.load_config_keys(client, user_id, {db.BUDGET_KEY: {}, db.CATEGORY_BUDGET_KEY: {}})
+    return sorted(accounts['Nombre']), db.load_categories(client, user_id), db.load_members(client, user_id), config
+
+
+def _concurrent_sessions(func, n_sessions, workers):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, range(n_sessions)))
+
+
+def bench_shared_cache(n_households=20, n_sessions=400, workers=32, latency=0.01):
+    """Muchas sesiones simultáneas de pocos hogares: caché del proceso contra una carga por sesión."""
+    client = FakeSupabaseClient(latency=latency)
+    households = [f'hogar-{i}' for i in range(n_households)]
+    for user_id in households:
+        _seed_household(client, user_id)
+    ttl = db.SHARED_CACHE_TTL_SECONDS
+    try:
+        # 1. Sin caché: cada sesión hace sus consultas
+        db.SHARED_CACHE_TTL_SECONDS = 0
+        client.reset_stats()
+        _, uncached_ms = _timed(_concurrent_sessions, lambda i: _reference_loads(client, households[i % n_households]), n_sessions, workers)
+        uncached_trips = client.stats['round_trips']
+
+        # 2. Con caché: una carga por hogar aunque entren a la vez
+        db.SHARED_CACHE_TTL_SECONDS = ttl
+        db.clear_shared_cache()
+        client.reset_stats()
+        _, cached_ms = _timed(_concurrent_sessions, lambda i: _reference_loads(client, households[i % n_households]), n_sessions, workers)
+        cached_trips = client.stats['round_trips']
+        stats = db.shared_cache_stats()
+    finally:
+        db.SHARED_CACHE_TTL_SECONDS = ttl
+    yield {
+        'benchmark': 'shared_cache', 'households': n_households, 'sessions': n_sessions, 'workers': workers,
+        'uncached_ms': round(uncached_ms, 1), 'uncached_round_trips': uncached_trips,
+        'cached_ms': round(cached_ms, 1), 'cached_round_trips': cached_trips,
+        'cache_bytes': stats['bytes'], 'bytes_per_household': round(stats['bytes'] / n_households),
+        'hits': stats['hits'], 'misses': stats['misses'],
+    }
+
+
+def _editor_payload(df_page):
+    """Lo que cuesta mandar una tabla al editor: cast a texto de las categóricas, columna de selección y Arrow."""
+    df_page = df_page.astype({col: object for col in db.TRANSACTION_CATEGORICAL_COLUMNS if col in df_page.columns})
+    df_page.insert(0, 'Seleccionar', False)
+    return dataframe_util.convert_pandas_df_to_arrow_bytes(df_page)
+
+
+def _full_history_render(df):
+    """Referencia: el historial entero ordenado y enviado al editor."""
+    return _editor_payload(df.sort_values(by='Fecha', ascending=False))
+
+
+def _paged_history_render(page, page_size):
+    order = db.get_history_order('Fecha', False, '')
+    return _editor_payload(db.history_page(db.get_transactions(), order, page, page_size))
+
+
+def bench_history_pages(sizes=(10_000, 100_000, 1_000_000), page_size=100, repeats=20):
+    """Render del historial: la tabla completa al editor contra una página cortada de un orden precalculado."""
+    for n_rows in sizes:
+        st.session_state.clear()
+        db.set_transactions(db.ensure_row_ids(make_transactions(n_rows)))
+        df = db.get_transactions()
+        full_payload, full_ms = _timed(_full_history_render, df)
+        _, order_ms = _timed(db.get_history_order, 'Fecha', False, '')
+        _, search_ms = _timed(db.get_history_order, 'Descripción', True, 'comida')
+        last_page = (n_rows - 1) // page_size
+        page_ms = [_timed(_paged_history_render, page, page_size)[1] for page in np.linspace(0, last_page, repeats).astype(int)]
+        yield {
+            'benchmark': 'history_pages', 'rows': n_rows, 'page_size': page_size,
+            'full_render_ms': round(full_ms, 1), 'full_payload_bytes': len(full_payload),
+            'order_first_ms': round(order_ms, 1), 'search_first_ms': round(search_ms, 1),
+            'page_render_ms_median': round(float(np.median(page_ms)), 2), 'page_payload_bytes': len(_paged_history_render(0, page_size)),
+        }
+
+
+def _legacy_history_save(client, edited_full):
+    """Referencia: el guardado anterior (toda la tabla editada convertida, reordenada, comparada y guardada)."""
+    df_to_save = edited_full.copy()
+    df_to_save['Monto'] = pd.to_numeric(df_to_save['Monto'], errors='coerce').fillna(0.0)
+    df_to_save['Fecha'] = pd.to_datetime(df_to_save['Fecha'], errors='coerce')
+    df_to_save = df_to_save.dropna(subset=['Fecha', 'Monto'])
+    changes = db.transaction_changes(db.get_transactions(), df_to_save)
+    db.set_transactions(df_to_save.sort_values(by='Fecha', ascending=False).reset_index(drop=True), delta=changes)
+    db.save_data(client, db.TRANSACTIONS_TABLE, st.session_state.transactions_df, USER_ID)
+    db.sync_goal_progress(client, USER_ID)
+
+
+def _seed_history_session(client, df):
+    """Sesión con el historial completo guardado, cuentas y una meta (libro y cubo al día)."""
+    st.session_state.clear()
+    db.set_snapshot(db.TRANSACTIONS_TABLE, USER_ID, None)
+    db.save_data(client, db.TRANSACTIONS_TABLE, df, USER_ID)
+    db.set_transactions(df)
+    db.set_state('goals_df', pd.DataFrame({'Nombre': ['Fondo de Emergencia'], 'Monto Objetivo': [5000.0], 'Monto Aportado': [0.0], 'Fecha Objetivo': [datetime.now().date()]}))
+    db.set_snapshot(db.GOALS_TABLE, USER_ID, None)
+    db.save_data(client, db.GOALS_TABLE, st.session_state.goals_df, USER_ID)
+    db.ledger_account_flows()
+    db.get_rollup_cube()
+    db.sync_goal_progress(client, USER_ID)
+
+
+def bench_history_save(sizes=(10_000, 100_000, 1_000_000)):
+    """Guardar una celda editada en el historial: toda la tabla contra solo las filas cambiadas (por id)."""
+    import ui_views as views
+    for n_rows in sizes:
+        df = db.ensure_row_ids(make_transactions(n_rows, end=datetime.now()))
+        results = {'benchmark': 'history_save', 'rows': n_rows}
+        for label in ['legacy', 'delta']:
+            client = FakeSupabaseClient()
+            _seed_history_session(client, df)
+            df_all = db.get_transactions()
+            page = db.history_page(df_all, db.get_history_order(), 0, 100)
+            edited = page.astype({col: object for col in db.TRANSACTION_CATEGORICAL_COLUMNS})
+            edited.loc[edited.index[0], 'Monto'] = 999.0
+            client.reset_stats()
+            if label == 'legacy':
+                edited_full = df_all.astype({col: object for col in db.TRANSACTION_CATEGORICAL_COLUMNS})
+                edited_full.loc[0, 'Monto'] = 999.0
+                _, ms = _timed(_legacy_history_save, client, edited_full)
+            else:
+                _, ms = _timed(views._save_history_page, client, USER_ID, df_all, page, edited)
+            results.update({f'{label}_ms': round(ms, 1), f'{label}_round_trips': client.stats['round_trips'], f'{label}_rows_sent': client.stats['rows_sent']})
+        yield results
+
+
+def _legacy_register(client, new_entry):
+    """Referencia: el alta anterior (concat + orden de todo el historial y guardado comparando toda la tabla)."""
+    db.ensure_row_ids(new_entry)
+    db.set_transactions(pd.concat([db.get_transactions(), new_entry], ignore_index=True).sort_values(by='Fecha', ascending=False), delta=(None, new_entry))
+    db.save_data(client, db.TRANSACTIONS_TABLE, st.session_state.transactions_df, USER_ID)
+    db.sync_goal_progress(client, USER_ID)
+
+
+def bench_register_path(sizes=(10_000, 100_000, 500_000), repeats=10):
+    """Registrar UNA transacción (historial, saldos, cubo, metas y guardado): tiempo total según el tamaño del historial."""
+    import ui_views as views
+    for n_rows in sizes:
+        df = db.ensure_row_ids(make_transactions(n_rows, end=datetime.now()))
+        results = {'benchmark': 'register_path', 'rows': n_rows}
+        for label, register in [('legacy', _legacy_register), ('delta', lambda client, row: views._register_transaction(client, USER_ID, row))]:
+            client = FakeSupabaseClient()
+            _seed_history_session(client, df)
+            timings = []
+            for i in range(repeats):
+                new_entry = make_transactions(1, seed=SEED + i, end=datetime.now()).drop(columns=[db.ROW_ID_COLUMN], errors='ignore')
+                client.reset_stats()
+                timings.append(_timed(register, client, new_entry)[1])
+            results[f'{label}_ms_median'] = round(float(np.median(timings)), 2)
+        yield results
+
+
+def _legacy_in_use(df, value, columns):
+    """Referencia: la comprobación anterior (lista de Python y búsqueda lineal por columna)."""
+    return any(value in df[col].tolist() for col in columns)
+
+
+def bench_reference_guards(sizes=(100_000, 1_000_000), repeats=20):
+    """Comprobar si una cuenta/categoría/miembro/meta está en uso: recorrer el historial contra los conteos incrementales."""
+    checks = [('Banco', ['Cuenta', 'Destino']), ('Comida', ['Categoría']), ('Ana', ['Miembro']), ('Fondo de Emergencia', ['Destino']), ('Sin Uso', ['Cuenta', 'Destino'])]
+    for n_rows in sizes:
+        st.session_state.clear()
+        db.set_transactions(db.ensure_row_ids(make_transactions(n_rows, end=datetime.now())))
+        df = db.get_transactions()
+        _, build_ms = _timed(db.get_reference_counts)
+        legacy_ms = [_timed(_legacy_in_use, df, value, columns)[1] for _ in range(max(1, repeats // 10)) for value, columns in checks]
+        counts_ms = [_timed(db.reference_count, value, columns)[1] for _ in range(repeats) for value, columns in checks]
+        new_row = make_transactions(1, seed=SEED + 5, end=datetime.now())
+        _, delta_ms = _timed(db.set_transactions, pd.concat([df, new_row], ignore_index=True), delta=(None, new_row))
+        yield {
+            'benchmark': 'reference_guards', 'rows': n_rows, 'build_ms': round(build_ms, 2),
+            'legacy_check_ms_median': round(float(np.median(legacy_ms)), 2), 'counts_check_ms_median': round(float(np.median(counts_ms)), 4),
+            'mutation_with_delta_ms': round(delta_ms, 1),
+        }
+
+
+def _plotly_chart_payload(fig):
+    """Lo que hace st.plotly_chart con la figura en cada rerun: validarla y serializarla."""
+    return pio.to_json(plotly.tools.return_figure_from_figure_or_data(fig, validate_figure=True), validate=False)
+
+
+def _dashboard_figures(aggregates, title, cached):
+    """Las figuras de view_dash: construidas en cada rerun (antes) o pedidas a la fábrica en caché."""
+    if not cached:
+        return [charts.build_projection_figure(aggregates['recurring_projection']), _legacy_budget_figure(aggregates['budget_chart'], title),
+                charts.build_top5_figure(aggregates['top5']), charts.build_day_pattern_figure(aggregates['day_pattern']),
+                charts.build_cash_flow_figure(aggregates['cash_flow']), charts.build_pie_figure(aggregates['pie_gastos']),
+                charts.build_pie_figure(aggregates['pie_ingresos'])]
+    return [charts.projection_figure(aggregates['recurring_projection']), charts.budget_figure(aggregates['budget_chart'], title),
+            charts.top5_figure(aggregates['top5']), charts.day_pattern_figure(aggregates['day_pattern']),
+            charts.cash_flow_figure(aggregates['cash_flow']), charts.pie_figure(aggregates['pie_gastos']),
+            charts.pie_figure(aggregates['pie_ingresos'])]
+
+
+def _legacy_budget_figure(df_budget_chart, title):
+    """Gráfico de presupuesto anterior: px.bar más una forma y una anotación por categoría."""
+    fig = px.bar(df_budget_chart, y='Categoría', x='Gastado', orientation='h', title=title,
+                 color='Excedido', color_discrete_map={True: 'crimson', False: 'mediumseagreen'}, text='Gastado', template='plotly_white')
+    for i, row in df_budget_chart.iterrows():
+        fig.add_shape(type='line', y0=i - 0.4, y1=i + 0.4, x0=row['Presupuesto'], x1=row['Presupuesto'], line=dict(color='royalblue', width=2, dash='dash'))
+        fig.add_annotation(x=row['Presupuesto'], y=i, text=f" P: ${row['Presupuesto']:,.0f}", showarrow=False,
+                           xanchor="left", yshift=10, font=dict(color='royalblue', size=10))
+    fig.update_layout(xaxis_title="Monto Gastado ($)", yaxis_title=None, showlegend=False, yaxis={'categoryorder': 'total descending'})
+    fig.update_traces(texttemplate='$%{text:,.2f}', textposition='outside')
+    return fig
+
+
+def _legacy_goal_gauges(df_goals):
+    """Medidores anteriores: una figura por meta (cada una dibujada en su propia columna)."""
+    figures = []
+    for _, row in df_goals.iterrows():
+        fig = go.Figure(charts._gauge_indicator(row['Nombre'], row['Monto Aportado'], row['Monto Objetivo'], row['Días Restantes']))
+        fig.update_layout(height=250, margin=dict(l=20, r=20, t=60, b=20))
+        figures.append(fig)
+    return figures
+
+
+def _budget_frame(n_categories, seed=SEED):
+    rng = np.random.default_rng(seed)
+    budget = rng.uniform(50, 500, size=n_categories).round(2)
+    spent = (budget * rng.uniform(0.2, 1.5, size=n_categories)).round(2)
+    df = pd.DataFrame({'Categoría': [f'Categoría {i}' for i in range(n_categories)], 'Presupuesto': budget, 'Gastado': spent,
+                       'Porcentaje': spent / budget * 100, 'Excedido': spent > budget})
+    return df.sort_values(by='Gastado', ascending=False)
+
+
+def _goals_frame(n_goals, seed=SEED):
+    rng = np.random.default_rng(seed)
+    target = rng.uniform(500, 20_000, size=n_goals).round(2)
+    return pd.DataFrame({'Nombre': [f'Meta {i}' for i in range(n_goals)], 'Monto Aportado': (target * rng.uniform(0, 1.2, size=n_goals)).round(2),
+                         'Monto Objetivo': target, 'Días Restantes': rng.integers(0, 720, size=n_goals),
+                         'Fecha Proyectada': [None if i % 4 == 3 else (datetime(2027, 1, 1) + timedelta(days=30 * i)).date() for i in range(n_goals)]})
+
+
+def bench_chart_cache(n_rows=100_000, reruns=20, category_counts=(10, 50, 200), goal_counts=(3, 12, 30)):
+    """Figuras del dashboard y de metas: construirlas en cada rerun contra la fábrica en caché por contenido."""
+    charts.clear_figure_cache()
+    _load_session(make_transactions(n_rows, end=datetime.now()))
+    st.session_state.category_budgets = {category: 150.0 for category in db.DEFAULT_CATEGORIES['Gasto']}
+    _dashboard_rerun() # Agregados ya en caché: se miden solo las figuras
+    title = 'Gasto vs. Presupuesto'
+
+    def rerun(cached):
+        return [_plotly_chart_payload(fig) for fig in _dashboard_figures(_dashboard_rerun(), title, cached)]
+    _, cold_ms = _timed(rerun, True)
+    legacy_ms = [_timed(rerun, False)[1] for _ in range(max(1, reruns // 4))]
+    cached_ms = [_timed(rerun, True)[1] for _ in range(reruns)]
+    stats = charts.figure_cache_stats()
+    yield {
+        'benchmark': 'chart_cache', 'rows': n_rows, 'figures': 7, 'legacy_rerun_ms_median': round(float(np.median(legacy_ms)), 1),
+        'cold_rerun_ms': round(cold_ms, 1), 'cached_rerun_ms_median': round(float(np.median(cached_ms)), 1),
+        'figure_builds': stats['builds'], 'figure_requests': stats['requests'],
+    }
+
+    for n_categories in category_counts:
+        df_budget = _budget_frame(n_categories)
+        legacy = [_timed(lambda: _plotly_chart_payload(_legacy_budget_figure(df_budget, title)))[1] for _ in range(3)]
+        batched = [_timed(lambda: _plotly_chart_payload(charts.build_budget_figure(df_budget, title)))[1] for _ in range(3)]
+        yield {'benchmark': 'chart_cache', 'budget_categories': n_categories,
+               'shapes_loop_ms_median': round(float(np.median(legacy)), 1), 'batched_trace_ms_median': round(float(np.median(batched)), 1)}
+
+    for n_goals in goal_counts:
+        df_goals = _goals_frame(n_goals)
+        legacy = [_timed(lambda: [_plotly_chart_payload(fig) for fig in _legacy_goal_gauges(df_goals)])[1] for _ in range(3)]
+        combined = [_timed(lambda: _plotly_chart_payload(charts.build_goal_gauges_figure(df_goals)))[1] for _ in range(3)]
+        yield {'benchmark': 'chart_cache', 'goals': n_goals, 'charts_before': n_goals, 'charts_after': 1,
+               'separate_gauges_ms_median': round(float(np.median(legacy)), 1), 'combined_gauges_ms_median': round(float(np.median(combined)), 1)}
+
+
+@profiler.timed(name='bench.noop')
+def _profiled_noop():
+    return None
+
+
+def _profiled_startup(client):
+    import app
+    st.session_state.clear()
+    db.clear_shared_cache()
+    with profiler.stage('bench.rerun', root=True):
+        app.init_session_state(client, USER_ID, force_load=True)
+
+
+def bench_profiler(n_rows=20_000, n_calls=50_000, reruns=10):
+    """Instrumentación: lo que registra una carga inicial y su coste con y sin activar."""
+    client = FakeSupabaseClient()
+    _seed_user(client, n_rows)
+    profiler.clear()
+    profiler.enable()
+    try:
+        # Una carga inicial completa: etapas registradas y lo que vio el cliente
+        client.reset_stats()
+        _profiled_startup(client)
+        stage_records = profiler.rerun_records(None, profiler.last_rerun(None))
+        root = next(r for r in stage_records if r['root'])
+        summary = profiler.summarize(stage_records)
+        with tempfile.TemporaryDirectory() as tmp:
+            _, export_ms = _timed(profiler.export_jsonl, os.path.join(tmp, 'perfil.jsonl'))
+
+        # Coste: carga inicial completa (sin caché compartida) y llamada instrumentada, con y sin registro
+        enabled_ms = [_timed(_profiled_startup, client)[1] for _ in range(reruns)]
+        _, enabled_calls_ms = _timed(lambda: [_profiled_noop() for _ in range(n_calls)])
+    finally:
+        profiler.disable()
+    disabled_ms = [_timed(_profiled_startup, client)[1] for _ in range(reruns)]
+    _, disabled_calls_ms = _timed(lambda: [_profiled_noop() for _ in range(n_calls)])
+    profiler.clear()
+    yield {
+        'benchmark': 'profiler', 'rows': n_rows, 'startup_round_trips': root['round_trips'], 'startup_rows_received': root['rows_received'],
+        'startup_stages': len(stage_records), 'export_ms': round(export_ms, 2), 'top_stages': summary['stage'].head(3).tolist(),
+        'startup_ms_disabled': round(float(np.median(disabled_ms)), 2), 'startup_ms_enabled': round(float(np.median(enabled_ms)), 2),
+        'stage_overhead_us_disabled': round(disabled_calls_ms * 1000 / n_calls, 3), 'stage_overhead_us_enabled': round(enabled_calls_ms * 1000 / n_calls, 3),
+    }
+
+
+def _git_revision():
+    """Commit del árbol medido (con -dirty si hay cambios sin confirmar), para comparar corridas entre commits."""
+    try:
+        result = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def _measure(func, repeats, setup=None, client=None):
+    """
+    Mediana/mín./máx. de `func(*setup())` (setup no se mide), repitiendo mientras quede presupuesto de tiempo.
+    Con `client` (en memoria) añade lo que costó al backend una llamada: viajes, filas y bytes.
+    """
+    timings = []
+    for _ in range(repeats):
+        args = setup() if setup is not None else ()
+        if client is not None:
+            client.reset_stats()
+        timings.append(_timed(func, *args)[1])
+        if sum(timings) > SUITE_TIME_BUDGET_S * 1000:
+            break
+    result = {'repeats': len(timings), 'median_ms': round(float(np.median(timings)), 3),
+              'min_ms': round(min(timings), 3), 'max_ms': round(max(timings), 3)}
+    if client is not None:
+        result.update({key: client.stats[key] for key in ['round_trips', 'rows_sent', 'rows_received', 'bytes_sent', 'bytes_received', 'failures']})
+    return result
+
+
+def _load_household_session(household):
+    """Deja el session_state como init_session_state con los datos del hogar (historial completo en memoria)."""
+    st.session_state.clear()
+    db.set_transactions(db.ensure_row_ids(household[db.TRANSACTIONS_TABLE]))
+    db.set_state('accounts_df', household[db.ACCOUNTS_TABLE])
+    db.set_state('goals_df', household[db.GOALS_TABLE])
+    st.session_state.categories = {tipo: list(names) for tipo, names in household[db.CATEGORIES_TABLE].items()}
+    st.session_state.members = list(household[db.MEMBERS_TABLE])
+    db.set_state('budget_config', dict(household['budget_config']))
+    db.set_state('category_budgets', dict(household['category_budgets']))
+    df = db.get_transactions()
+    st.session_state.filter_start_date = df['Fecha'].max().date() - timedelta(days=30)
+    st.session_state.filter_end_date = df['Fecha'].max().date()
+    st.session_state.filter_type = db.FILTER_ALL
+    st.session_state.filter_member = db.FILTER_ALL
+
+
+def bench_suite(sizes=(10_000, 100_000, 1_000_000), repeats=5):
+    """
+    Tiempos de las funciones de database.py y del cálculo del dashboard sobre hogares sintéticos (make_household).
+    La primera línea describe el entorno (commit, versiones); el resto es una medición por función y tamaño.
+    El cliente en memoria toma su latencia/fallos/conteo de bytes de GUARDIAN_FAKE_SUPABASE (igual que la app).
+    """
+    fake_setting = os.environ.get(fake_supabase.FAKE_SUPABASE_ENV, '')
+    yield {
+        'benchmark': 'suite_meta', 'revision': _git_revision(), 'python': platform.python_version(), 'pandas': pd.__version__,
+        'numpy': np.__version__, 'streamlit': st.__version__, 'machine': platform.machine(), 'seed': SEED, 'sizes': list(sizes),
+        'fake_supabase': fake_supabase.parse_setting(fake_setting),
+    }
+    for n_rows in sizes:
+        household = make_household(n_rows, end=datetime.now())
+        client, _ = fake_supabase.client_from_setting(fake_setting)
+        store_household(client, USER_ID, household)
+        db.clear_shared_cache()
+        _load_household_session(household)
+        df = db.get_transactions()
+        accounts, goals, budget = household[db.ACCOUNTS_TABLE], household[db.GOALS_TABLE], household['budget_config']
+
+        def fresh_metadata_session():
+            # Importar el historial completo en una cuenta sin metadatos: todo es nuevo
+            st.session_state.members, st.session_state.categories = [], {}
+            db.set_state('accounts_df', pd.DataFrame(columns=['Nombre', 'Tipo', 'Saldo Inicial']))
+            return client, USER_ID, df
+
+        def restore_session():
+            _load_household_session(household)
+            return ()
+
+        filters = db.active_filter_tuple()
+        cube = db.get_rollup_cube()
+        backend_cases = {'load_data', 'sync_metadata_from_df', 'sync_metadata_from_df_new'}
+        cases = [
+            ('load_data', lambda: db.load_data(client, db.TRANSACTIONS_TABLE, USER_ID, db.DEFAULT_TRANSACTIONS), None),
+            ('calculate_account_balances', lambda: db.calculate_account_balances(df, accounts), None),
+            ('update_goal_progress', lambda: db.update_goal_progress(df, goals), None),
+            ('calculate_daily_budget', lambda: db.calculate_daily_budget(budget['period_start'], budget['period_end'], budget['budget_amount'], df), None),
+            ('calculate_fixed_surplus', lambda: db.calculate_fixed_surplus(df), None),
+            ('calculate_recurring_projection', lambda: db.calculate_recurring_projection(df), None),
+            ('sync_metadata_from_df', lambda: db.sync_metadata_from_df(client, USER_ID, df), None),
+            ('sync_metadata_from_df_new', db.sync_metadata_from_df, fresh_metadata_session),
+            ('rollup_cube_build', db.rebuild_daily_cube, restore_session),
+            ('compute_dashboard_aggregates', lambda: db.compute_dashboard_aggregates(
+                df, accounts, filters, budget, household['category_budgets'], cube=cube), None),
+            ('dashboard_rerun_cached', _dashboard_rerun, None),
+        ]
+        for name, func, setup in cases:
+            if name == 'dashboard_rerun_cached':
+                restore_session()
+                _dashboard_rerun()
+            result = _measure(func, repeats, setup, client=client if name in backend_cases else None)
+            yield {'benchmark': 'suite', 'function': name, 'rows': n_rows, **result}
+
+
+def _read_results(path):
+    with open(path, encoding='utf-8') as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def compare_results(base_path, head_path, threshold=REGRESSION_RATIO):
+    """Compara dos corridas (JSON-lines) en las mediciones con 'median_ms': una línea por medición con la razón head/base."""
+    def keyed(records):
+        return {tuple((field, r[field]) for field in COMPARE_ID_FIELDS if field in r): r for r in records if 'median_ms' in r}
+    base, head = keyed(_read_results(base_path)), keyed(_read_results(head_path))
+    for key in [k for k in head if k in base]:
+        base_ms, head_ms = base[key]['median_ms'], head[key]['median_ms']
+        ratio = head_ms / base_ms if base_ms > 0 else float('inf')
+        yield {**dict(key), 'base_ms': base_ms, 'head_ms': head_ms, 'ratio': round(ratio, 3), 'regression': ratio > threshold}
+
+
+def bench_fake_client(n_config_rows=20_000, batch=2_000, latency=0.01, n_rows=20_000):
+    """Cliente en memoria: upsert por clave única y una carga de la app configurada con una sola variable."""
+    import app
+    client = FakeSupabaseClient(count_bytes=True)
+    backend = storage.get_backend(client)
+    backend.upsert(db.CONFIG_TABLE, [{'user_id': f'u{i}', 'clave': 'k', 'valor': i} for i in range(n_config_rows)], on_conflict='user_id, clave')
+    updates = [{'user_id': f'u{i}', 'clave': 'k', 'valor': -i} for i in range(batch)]
+    _, upsert_ms = _timed(backend.upsert, db.CONFIG_TABLE, updates, on_conflict='user_id, clave')
+
+    # Una sola variable: opciones del cliente y usuario de prueba con hogar sintético
+    setting = f'latency={latency},count_bytes=1,rows={n_rows}'
+    st.session_state.clear()
+    db.clear_shared_cache()
+    client = app.init_fake_connection(setting)
+    session = client.auth.get_session()
+    st.session_state.clear()
+    db.clear_shared_cache()
+    _, startup_ms = _timed(app.init_session_state, client, session.user.id, force_load=True)
+    yield {
+        'benchmark': 'fake_client', 'config_rows': n_config_rows, 'upsert_batch': batch, 'upsert_on_conflict_ms': round(upsert_ms, 1),
+        'setting': setting, 'startup_ms': round(startup_ms, 1), 'startup_round_trips': client.stats['round_trips'],
+        'startup_rows_received': client.stats['rows_received'], 'startup_bytes_received': client.stats['bytes_received'],
+    }
+
+
+def _legacy_goal_progress(df_transactions, df_goals):
+    """Referencia: el cálculo anterior de aportes (filtro, groupby, merge y reindex sobre todo el historial)."""
+    goal_names = df_goals['Nombre'].tolist()
+    df_transfers = df_transactions[(df_transactions['Tipo'] == 'Transferencia') & (df_transactions['Destino'].isin(goal_names))]
+    df_contributions = df_transfers.groupby('Destino', observed=True)['Monto'].sum().reset_index()
+    df_contributions.columns = ['Nombre', 'Monto Calculado']
+    df_updated = pd.merge(df_goals.drop(columns=['Monto Aportado'], errors='ignore'), df_contributions, on='Nombre', how='left').fillna({'Monto Calculado': 0.0})
+    df_updated['Monto Aportado'] = df_updated['Monto Calculado']
+    df_updated = df_updated.reindex(columns=list(db.DEFAULT_GOALS.columns), fill_value=0.0)
+    df_updated['Monto Objetivo'] = df_updated['Monto Objetivo'].astype(float)
+    df_updated['Monto Aportado'] = df_updated['Monto Aportado'].astype(float)
+    df_updated['Fecha Objetivo'] = pd.to_datetime(df_updated['Fecha Objetivo']).dt.date
+    return df_updated
+
+
+def bench_goal_engine(sizes=(100_000, 1_000_000), repeats=5):
+    """Metas: aportes por delta y proyección vectorizada contra el recálculo completo sobre el historial."""
+    for n_rows in sizes:
+        st.session_state.clear()
+        household = make_household(n_rows, end=datetime.now())
+        df_goals = household[db.GOALS_TABLE]
+        db.set_transactions(db.ensure_row_ids(household[db.TRANSACTIONS_TABLE]))
+        df = db.get_transactions()
+        _, rebuild_ms = _timed(db.rebuild_goal_engine)
+        legacy_ms = [_timed(_legacy_goal_progress, df, df_goals)[1] for _ in range(repeats)]
+        engine_ms = [_timed(lambda: db.goal_progress(db.update_goal_progress(None, df_goals, contributions=db.engine_goal_contributions())))[1] for _ in range(repeats)]
+        new_row = make_transactions(1, seed=SEED + 7, end=datetime.now()).assign(Tipo='Transferencia', Destino=df_goals['Nombre'].iloc[0])
+        _, mutation_ms = _timed(db.set_transactions, pd.concat([df, new_row], ignore_index=True), delta=(None, new_row))
+        # Quitar y volver a añadir la misma fila deja el motor igual: mide solo el ajuste por delta
+        delta_ms = [_timed(db.apply_goal_delta, new_row, new_row)[1] for _ in range(repeats)]
+        yield {
+            'benchmark': 'goal_engine', 'rows': n_rows, 'rebuild_ms': round(rebuild_ms, 1),
+            'legacy_ms_median': round(float(np.median(legacy_ms)), 2), 'engine_ms_median': round(float(np.median(engine_ms)), 2),
+            'goal_delta_ms_median': round(float(np.median(delta_ms)), 2), 'mutation_with_delta_ms': round(mutation_ms, 1),
+        }
+
+
+BENCHMARKS = {
+    'save_data_incremental': bench_save_data_incremental,
+    'sidebar_filters': bench_sidebar_filters,
+    'dashboard_cache': bench_dashboard_cache,
+    'fused_kpis': bench_fused_kpis,
+    'fixed_surplus': bench_fixed_surplus,
+    'transaction_memory': bench_transaction_memory,
+    'parallel_startup': bench_parallel_startup,
+    'idle_reruns': bench_idle_reruns,
+    'paged_loading': bench_paged_loading,
+    'csv_import': bench_csv_import,
+    'metadata_sync': bench_metadata_sync,
+    'write_ahead': bench_write_ahead,
+    'sqlite_backend': bench_sqlite_backend,
+    'aggregate_pushdown': bench_aggregate_pushdown,
+    'balance_ledger': bench_balance_ledger,
+    'rollup_cube': bench_rollup_cube,
+    'shared_cache': bench_shared_cache,
+    'history_pages': bench_history_pages,
+    'history_save': bench_history_save,
+    'register_path': bench_register_path,
+    'reference_guards': bench_reference_guards,
+    'chart_cache': bench_chart_cache,
+    'profiler': bench_profiler,
+    'suite': bench_suite,
+    'fake_client': bench_fake_client,
+    'goal_engine': bench_goal_engine,
+}
+
+
+def main(argv):
+    if argv[:1] == ['--compare']:
+        # python benchmarks.py --compare base.jsonl head.jsonl -> sale con 1 si alguna medición empeoró
+        regressions = 0
+        for row in compare_results(argv[1], argv[2]):
+            regressions += row['regression']
+            print(json.dumps(row, ensure_ascii=False), flush=True)
+        return 1 if regressions else 0
+    names = argv or list(BENCHMARKS)
+    for name in names:
+        for result in BENCHMARKS[name]():
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
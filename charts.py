@@ -0,0 +1,194 @@
+# --- Archivo: charts.py ---
+# Fábrica de figuras Plotly: cada figura se construye una sola vez por contenido de sus datos
+
+import streamlit as st
+import pandas as pd
+import hashlib
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+# --- 1. CONFIGURACIÓN ---
+
+FIGURE_CACHE_ENTRIES = 256   # Figuras distintas retenidas en el proceso (LRU de st.cache_resource)
+GOALS_PER_ROW = 3            # Medidores de metas por fila en la figura combinada
+GAUGE_ROW_HEIGHT = 250       # Alto (px) de cada fila de medidores
+
+# Contadores del proceso (para benchmarks): llamadas a la fábrica y figuras realmente construidas
+_figure_stats = {'requests': 0, 'builds': 0}
+
+
+# --- 2. CLAVE DE CONTENIDO Y CACHÉ ---
+
+def data_key(*parts):
+    """Huella (blake2b) del contenido de los agregados y parámetros que definen una figura."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            digest.update(repr((list(part.columns), [str(t) for t in part.dtypes], part.shape)).encode())
+            digest.update(pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b'|')
+    return digest.hexdigest()
+
+
+@st.cache_resource(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def _cached_figure(kind: str, key: str, _build, _args):
+    """Construye la figura la primera vez que aparece (kind, key); después se reutiliza tal cual."""
+    _figure_stats['builds'] += 1
+    return _build(*_args)
+
+
+def cached_figure(kind: str, build, *args):
+    """Devuelve la figura de `build(*args)`, compartida entre reruns y sesiones mientras los datos no cambien.
+
+    La figura entregada es compartida: no debe modificarse (st.plotly_chart solo la lee).
+    """
+    _figure_stats['requests'] += 1
+    return _cached_figure(kind, data_key(*args), build, args)
+
+
+def figure_cache_stats():
+    """Llamadas a la fábrica y figuras construidas desde que arrancó el proceso."""
+    return dict(_figure_stats)
+
+
+def clear_figure_cache():
+    """Vacía la caché de figuras (y sus contadores)."""
+    _cached_figure.clear()
+    _figure_stats.update(requests=0, builds=0)
+
+
+# --- 3. CONSTRUCTORES (funciones puras: agregado -> figura) ---
+
+def build_projection_figure(df_projection: pd.DataFrame):
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=df_projection['Mes'], y=df_projection['Ingreso Fijo'], name='Ingreso Fijo', marker_color='green'))
+    fig.add_trace(go.Bar(x=df_projection['Mes'], y=-df_projection['Gasto Fijo'], name='Gasto Fijo', marker_color='red'))
+    fig.add_trace(go.Scatter(x=df_projection['Mes'], y=df_projection['Neto Acumulado'], mode='lines+markers', name='Neto Acumulado', line=dict(color='blue', dash='dot')))
+    fig.update_layout(barmode='relative', xaxis_title=None, yaxis_title='Monto ($)', hovermode="x unified", template='plotly_white')
+    return fig
+
+
+def budget_reference_lines(budgets, half_height=0.4):
+    """Coordenadas de las líneas de presupuesto como un único trazo: un segmento vertical por barra separado por None.
+
+    La etiqueta de cada línea va en el extremo superior del segmento.
+    """
+    xs, ys, labels = [], [], []
+    for position, budget in enumerate(budgets):
+        xs += [budget, budget, None]
+        ys += [position - half_height, position + half_height, None]
+        labels += ['', f" P: ${budget:,.0f}", '']
+    return xs, ys, labels
+
+
+def build_budget_figure(df_budget_chart: pd.DataFrame, title: str):
+    """Gastado vs. presupuesto por categoría: barras en eje numérico (una fila por categoría, en el orden del
+    agregado) y todas las líneas de presupuesto en un solo trazo."""
+    positions = list(range(len(df_budget_chart)))
+    exceeded = df_budget_chart['Excedido'].astype(bool)
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        y=positions, x=df_budget_chart['Gastado'], orientation='h', name='Gastado',
+        customdata=df_budget_chart['Categoría'], text=df_budget_chart['Gastado'],
+        texttemplate='$%{text:,.2f}', textposition='outside',
+        marker_color=exceeded.map({True: 'crimson', False: 'mediumseagreen'}).tolist(),
+        hovertemplate='%{customdata}<br>Gastado: $%{x:,.2f}<extra></extra>',
+    ))
+    xs, ys, labels = budget_reference_lines(df_budget_chart['Presupuesto'].astype(float).tolist())
+    fig.add_trace(go.Scatter(
+        x=xs, y=ys, text=labels, mode='lines+text', name='Presupuesto', textposition='top right',
+        line=dict(color='royalblue', width=2, dash='dash'), textfont=dict(color='royalblue', size=10),
+        hoverinfo='skip',
+    ))
+    fig.update_layout(title=title, template='plotly_white', xaxis_title="Monto Gastado ($)", yaxis_title=None, showlegend=False,
+                      yaxis=dict(tickvals=positions, ticktext=df_budget_chart['Categoría'].tolist(), autorange='reversed'))
+    return fig
+
+
+def build_top5_figure(df_top5: pd.DataFrame):
+    fig = px.bar(df_top5, x='Monto', y='Categoría', orientation='h',
+                 color='Monto', color_continuous_scale=px.colors.sequential.OrRd,
+                 labels={'Monto': 'Monto ($)', 'Categoría': ''},
+                 template='plotly_white')
+    fig.update_layout(yaxis={'categoryorder': 'total ascending'}, xaxis_title=None, yaxis_title=None)
+    return fig
+
+
+def build_day_pattern_figure(df_gasto_promedio: pd.DataFrame):
+    fig = px.bar(df_gasto_promedio, x='Día de la Semana', y='Gasto Promedio ($)',
+                 color_discrete_sequence=['#4CAF50'],
+                 labels={'Gasto Promedio ($)': 'Gasto Promedio ($)'},
+                 template='plotly_white')
+    fig.update_layout(xaxis_title=None)
+    return fig
+
+
+def build_cash_flow_figure(df_pivot: pd.DataFrame):
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=df_pivot['Fecha_Dia'], y=df_pivot['Ingreso'], mode='lines+markers', name='Ingreso', line=dict(color='green')))
+    fig.add_trace(go.Scatter(x=df_pivot['Fecha_Dia'], y=df_pivot['Gasto'], mode='lines+markers', name='Gasto', line=dict(color='red')))
+    fig.add_trace(go.Scatter(x=df_pivot['Fecha_Dia'], y=df_pivot['Balance Acumulado'], mode='lines+markers', name='Balance Acumulado', line=dict(color='blue', dash='dot')))
+    fig.update_layout(title='Flujo Diario y Balance Acumulado', xaxis_title='Fecha', yaxis_title='Monto ($)', hovermode="x unified", template='plotly_white')
+    return fig
+
+
+def build_pie_figure(df_pie: pd.DataFrame):
+    fig = px.pie(df_pie, values='Monto', names='Categoría', template='plotly_white', hole=0.3)
+    fig.update_traces(textposition='outside', textinfo='percent+label')
+    return fig
+
+
+def _gauge_indicator(name, contributed, target, days_left, projected=None):
+    target = target if target > 0 else 1
+    projection = f"Proyección: {projected:%d/%m/%Y}" if pd.notna(projected) else "Sin ritmo de aporte"
+    return go.Indicator(
+        mode="gauge+number+delta", value=contributed,
+        number={'prefix': "$", 'valueformat': ',.2f'},
+        delta={'reference': target, 'relative': False, 'valueformat': ',.2f', 'suffix': ' Objetivo'},
+        title={'text': f"<span style='font-size:1.1em'>{name}</span><br><span style='font-size:0.8em'>Días restantes: {days_left} · {projection}</span>"},
+        gauge={'axis': {'range': [0, target]}, 'bar': {'color': "darkorange"},
+               'steps': [{'range': [0, target * 0.5], 'color': 'lightgray'}, {'range': [target * 0.5, target], 'color': 'darkgray'}],
+               'threshold': {'line': {'color': "green", 'width': 4}, 'thickness': 0.75, 'value': target}},
+    )
+
+
+def build_goal_gauges_figure(df_goals: pd.DataFrame, cols_per_row: int = GOALS_PER_ROW):
+    """Todos los medidores de metas en una sola figura (subplots de tipo indicador, `cols_per_row` por fila)."""
+    num_rows = max(1, (len(df_goals) + cols_per_row - 1) // cols_per_row)
+    fig = make_subplots(rows=num_rows, cols=cols_per_row, specs=[[{'type': 'indicator'}] * cols_per_row] * num_rows,
+                        vertical_spacing=0.35 / num_rows)
+    names, contributed = df_goals['Nombre'].tolist(), df_goals['Monto Aportado'].tolist()
+    targets, days_left = df_goals['Monto Objetivo'].tolist(), df_goals['Días Restantes'].tolist()
+    projected = df_goals['Fecha Proyectada'].tolist()
+    for i in range(len(df_goals)):
+        fig.add_trace(_gauge_indicator(names[i], contributed[i], targets[i], days_left[i], projected[i]),
+                      row=i // cols_per_row + 1, col=i % cols_per_row + 1)
+    fig.update_layout(height=GAUGE_ROW_HEIGHT * num_rows, margin=dict(l=20, r=20, t=60, b=20))
+    return fig
+
+
+# --- 4. FIGURAS EN CACHÉ (lo que usan las vistas) ---
+
+def projection_figure(df_projection: pd.DataFrame):
+    return cached_figure('projection', build_projection_figure, df_projection)
+
+def budget_figure(df_budget_chart: pd.DataFrame, title: str):
+    return cached_figure('budget', build_budget_figure, df_budget_chart, title)
+
+def top5_figure(df_top5: pd.DataFrame):
+    return cached_figure('top5', build_top5_figure, df_top5)
+
+def day_pattern_figure(df_gasto_promedio: pd.DataFrame):
+    return cached_figure('day_pattern', build_day_pattern_figure, df_gasto_promedio)
+
+def cash_flow_figure(df_pivot: pd.DataFrame):
+    return cached_figure('cash_flow', build_cash_flow_figure, df_pivot)
+
+def pie_figure(df_pie: pd.DataFrame):
+    return cached_figure('pie', build_pie_figure, df_pie)
+
+def goal_gauges_figure(df_goals: pd.DataFrame):
+    return cached_figure('goal_gauges', build_goal_gauges_figure, df_goals[['Nombre', 'Monto Aportado', 'Monto Objetivo', 'Días Restantes', 'Fecha Proyectada']])
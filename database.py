@@ -6,8 +6,23 @@ import pandas as pd
 import json
 from datetime import datetime, timedelta
 import os
+import time
+import sys
+import copy
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import numpy as np
 from supabase import Client
+import storage
+import profiler
+
+# Copy-on-Write: las vistas que se entregan del historial no pueden modificar el original
+# (en pandas >= 3 siempre está activo)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
 
 # --- 1. CONFIGURACIÓN Y CONSTANTES ---
 
@@ -23,6 +38,66 @@ CONFIG_TABLE = 'configuracion'
 BUDGET_KEY = 'budget_config'
 CATEGORY_BUDGET_KEY = 'category_budgets'
 
+# Persistencia incremental: tablas con id de fila estable y tamaño de lote
+ROW_ID_COLUMN = 'id'
+ROW_ID_TABLES = [TRANSACTIONS_TABLE, ACCOUNTS_TABLE, GOALS_TABLE]
+SAVE_BATCH_SIZE = 500
+DB_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+SNAPSHOTS_KEY = 'db_snapshots'
+
+# Sincronización de metas: versiones (historial, metas) con las que se calculó el último aporte
+GOALS_SYNC_KEY = 'goals_synced_versions'
+
+# Carga inicial en paralelo (una consulta por tabla + una para la configuración)
+STARTUP_LOAD_WORKERS = 6
+LOAD_TIMINGS_KEY = 'load_timings'
+
+# Carga paginada del historial: primero la ventana reciente, lo antiguo por páginas y bajo demanda
+LOAD_PAGE_SIZE = 1000 # Máximo de filas por respuesta que PostgREST devuelve por defecto
+RECENT_WINDOW_DAYS = 30
+HISTORY_PAGES_PER_RUN = 20
+HISTORY_KEY = 'transactions_history'
+
+# Importación de CSV por trozos (memoria acotada sin importar el tamaño del archivo)
+CSV_CHUNK_ROWS = 50_000
+
+# Libro de saldos: entradas/salidas/transferencias recibidas por nombre, actualizado por diferencias
+LEDGER_KEY = 'balance_ledger'
+LEDGER_COLUMNS = ['Entradas', 'Salidas', 'Entradas_T']
+
+# Cubo de agregados: totales diarios por (día, Tipo, Categoría, Miembro, Cuenta) y su resumen mensual
+CUBE_KEY = 'rollup_cube'
+CUBE_DIMENSIONS = ['Tipo', 'Categoría', 'Miembro', 'Cuenta']
+
+# Conteos de referencias (cuántas transacciones usan cada cuenta, categoría, miembro o destino)
+REFERENCES_KEY = 'reference_counts'
+REFERENCE_COLUMNS = ['Cuenta', 'Categoría', 'Miembro', 'Destino']
+
+# Motor de metas: aportes por (meta, mes), ritmo de aporte reciente y fecha proyectada de cumplimiento
+GOAL_ENGINE_KEY = 'goal_engine'
+GOAL_RATE_MONTHS = 6              # Meses recientes con los que se estima el aporte mensual
+GOAL_PROJECTION_MAX_MONTHS = 1200 # Más allá de este horizonte la meta se considera sin fecha proyectada
+DAYS_PER_MONTH = 30.4375
+
+# Columnas del historial que se guardan como categóricas (pocos valores distintos)
+TRANSACTION_CATEGORICAL_COLUMNS = ['Tipo', 'Categoría', 'Cuenta', 'Miembro', 'Destino', 'Frecuencia']
+
+# Estado versionado y caché de agregados del dashboard
+VERSIONS_KEY = 'data_versions'
+AGGREGATE_CACHE_KEY = 'aggregate_cache'
+AGGREGATE_STATS_KEY = 'aggregate_cache_stats'
+AGGREGATE_CACHE_SIZE = 8
+
+# Caché compartida entre sesiones (por proceso y por usuario) de los datos de referencia
+SHARED_CACHE_TABLES = ['cuentas', 'categorias', 'miembros', 'configuracion']
+SHARED_CACHE_TTL_SECONDS = 300 # 0 desactiva la caché
+SHARED_CACHE_MAX_USERS = 500
+
+# Historial paginado (vista de edición)
+HISTORY_PAGE_SIZES = [50, 100, 250, 500]
+HISTORY_SORT_COLUMNS = ['Fecha', 'Monto', 'Tipo', 'Categoría', 'Cuenta', 'Miembro', 'Descripción']
+HISTORY_SEARCH_COLUMNS = ['Descripción', 'Categoría', 'Cuenta', 'Miembro', 'Destino', 'Tipo']
+
 # --- Datos por Defecto (se usan si la DB está vacía) ---
 DEFAULT_CATEGORIES = {
     'Ingreso': ['Salario', 'Freelance', 'Regalo', 'Inversión', 'Otros Ingresos'],
@@ -60,90 +135,243 @@ DAY_NAMES_MAP = {
 
 # --- 2. FUNCIONES DE BASE DE DATOS (NUEVAS PARA SUPABASE) ---
 
+def new_row_id():
+    """
+    Genera un id de fila estable (se crea en el cliente, no en la DB).
+    En Supabase la columna id debe ser de texto: ver supabase_row_ids.sql.
+    """
+    return uuid.uuid4().hex
+
+def ensure_row_ids(df: pd.DataFrame):
+    """
+    Asigna un id a las filas que no lo tienen (o que lo tienen duplicado).
+    Modifica el DataFrame recibido para que el id quede en el session_state.
+    """
+    if ROW_ID_COLUMN not in df.columns:
+        df[ROW_ID_COLUMN] = None
+    missing = df[ROW_ID_COLUMN].isna() | df[ROW_ID_COLUMN].duplicated()
+    if missing.any():
+        df[ROW_ID_COLUMN] = df[ROW_ID_COLUMN].astype(object)
+        df.loc[missing, ROW_ID_COLUMN] = [new_row_id() for _ in range(int(missing.sum()))]
+    return df
+
+def _to_db_frame(df: pd.DataFrame):
+    """Convierte un DataFrame al formato que se envía a Supabase (JSON)."""
+    df_db = df.copy()
+    # Convertir fechas a strings ISO para que Supabase (JSON) las entienda
+    for col in ['Fecha', 'Fecha Objetivo']:
+        if col in df_db.columns:
+            df_db[col] = pd.to_datetime(df_db[col], errors='coerce').dt.strftime(DB_DATETIME_FORMAT)
+    df_db = df_db.astype(object)
+    return df_db.where(df_db.notna(), None)
+
+def _db_records(df_db: pd.DataFrame):
+    """Filas de un DataFrame ya convertido con _to_db_frame como lista de dicts (más rápido que to_dict)."""
+    columns = list(df_db.columns)
+    return [dict(zip(columns, row)) for row in df_db.to_numpy(dtype=object).tolist()]
+
+def _row_hashes(df: pd.DataFrame):
+    """
+    Huella (uint64) de cada fila, indexada por id, para detectar cambios.
+    Se calcula sobre tipos nativos normalizados (sin pasar a JSON) para que sea barata.
+    """
+    value_cols = sorted(c for c in df.columns if c not in (ROW_ID_COLUMN, 'user_id'))
+    normalized = {}
+    for col in value_cols:
+        values = df[col]
+        if col in ('Fecha', 'Fecha Objetivo'):
+            values = pd.to_datetime(values, errors='coerce').astype('datetime64[ns]')
+        elif col in ('Monto', 'Monto Objetivo', 'Monto Aportado', 'Saldo Inicial', 'Recurrente'):
+            values = pd.to_numeric(values, errors='coerce').astype('float64')
+        else:
+            values = values.astype(object).where(values.notna(), '').astype(str)
+        normalized[col] = values.to_numpy()
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(normalized), index=False)
+    return pd.Series(hashes.to_numpy(), index=pd.Index(df[ROW_ID_COLUMN].to_numpy(dtype=object), dtype=object), dtype='uint64')
+
+def _concat_hashes(*parts: pd.Series):
+    """Une huellas manteniendo el índice de ids como object (pd.concat lo pasaría a str, mucho más lento en isin)."""
+    ids = np.concatenate([part.index.to_numpy(dtype=object) for part in parts])
+    values = np.concatenate([part.to_numpy(dtype='uint64') for part in parts])
+    return pd.Series(values, index=pd.Index(ids, dtype=object), dtype='uint64')
+
+def _snapshot_key(table_name: str, user_id: str):
+    return f"{table_name}:{user_id}"
+
+def get_snapshot(table_name: str, user_id: str):
+    """Huellas de las filas tal como están guardadas en Supabase (o None si se desconoce)."""
+    return st.session_state.get(SNAPSHOTS_KEY, {}).get(_snapshot_key(table_name, user_id))
+
+def set_snapshot(table_name: str, user_id: str, hashes):
+    snapshots = st.session_state.setdefault(SNAPSHOTS_KEY, {})
+    if hashes is None:
+        snapshots.pop(_snapshot_key(table_name, user_id), None)
+    else:
+        snapshots[_snapshot_key(table_name, user_id)] = hashes
+
+def diff_rows(previous: pd.Series, current: pd.Series):
+    """
+    Compara dos conjuntos de huellas indexadas por id.
+    Devuelve (ids a insertar/actualizar, ids a borrar).
+    """
+    is_new = ~current.index.isin(previous.index)
+    previous_aligned = previous.reindex(current.index[~is_new])
+    changed = np.zeros(len(current), dtype=bool)
+    changed[is_new] = True
+    changed[~is_new] = previous_aligned.to_numpy() != current.to_numpy()[~is_new]
+    upsert_ids = current.index[changed]
+    delete_ids = previous.index.difference(current.index)
+    return upsert_ids, delete_ids
+
+def _batches(items, size=SAVE_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _clean_loaded_frame(records: list, table_name: str):
+    """Convierte las filas devueltas por Supabase en un DataFrame con los tipos correctos."""
+    df = pd.DataFrame(records)
+    # Limpieza de columnas de Supabase (user_id). El id se conserva para guardar por diferencias.
+    df = df.drop(columns=['user_id'], errors='ignore')
+
+    # --- Lógica de limpieza de tipos (muy importante) ---
+    if table_name == TRANSACTIONS_TABLE:
+        df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
+        df['Monto'] = pd.to_numeric(df['Monto'], errors='coerce').fillna(0.0)
+        df = df.dropna(subset=['Fecha'])
+        # Asegurar columnas opcionales
+        for col, default_val in [('Recurrente', False), ('Frecuencia', 'Única/N/A'), ('Miembro', 'N/A'), ('Destino', 'N/A')]:
+            if col not in df.columns: df[col] = default_val
+
+    elif table_name == GOALS_TABLE:
+        df = df.rename(columns={"Monto Objetivo": "Monto Objetivo", "Monto Aportado": "Monto Aportado", "Fecha Objetivo": "Fecha Objetivo"})
+        df['Fecha Objetivo'] = pd.to_datetime(df['Fecha Objetivo'], errors='coerce').dt.date
+        df['Monto Objetivo'] = pd.to_numeric(df['Monto Objetivo'], errors='coerce').fillna(0.0)
+        df['Monto Aportado'] = pd.to_numeric(df['Monto Aportado'], errors='coerce').fillna(0.0)
+
+    elif table_name == ACCOUNTS_TABLE:
+        df = df.rename(columns={"Saldo Inicial": "Saldo Inicial"})
+        df['Saldo Inicial'] = pd.to_numeric(df['Saldo Inicial'], errors='coerce').fillna(0.0)
+
+    if table_name in ROW_ID_TABLES:
+        df = df.reset_index(drop=True)
+        ensure_row_ids(df)
+    return df
+
+def _loaded_hashes(records: list, df: pd.DataFrame):
+    """Huellas de lo leído. Las filas que no sobrevivieron a la limpieza (p.ej. sin Fecha válida) quedan con 0 y se borrarán al guardar."""
+    snapshot = pd.Series(0, index=pd.Index([r[ROW_ID_COLUMN] for r in records if r.get(ROW_ID_COLUMN) is not None], dtype=object), dtype='uint64')
+    hashes = _row_hashes(df)
+    return _concat_hashes(snapshot[~snapshot.index.isin(hashes.index)], hashes)
+
+def _load_clean_frame(backend, table_name: str, user_id: str):
+    """Lee y limpia una tabla: (DataFrame o None si está vacía, huellas de lo leído)."""
+    records, _ = backend.select(table_name, user_id)
+    if not records:
+        return None, pd.Series(dtype='uint64')
+    df = _clean_loaded_frame(records, table_name)
+    return df, (_loaded_hashes(records, df) if table_name in ROW_ID_TABLES else None)
+
+@profiler.timed(detail_arg=(1, 'table_name'))
 def load_data(supabase_client: Client, table_name: str, user_id: str, default_df: pd.DataFrame):
     """Carga un DataFrame desde Supabase para un usuario específico."""
     try:
-        # Cargar todos los datos que coincidan con el user_id
-        response = supabase_client.table(table_name).select("*").eq("user_id", user_id).execute()
-
-        if response.data:
-            df = pd.DataFrame(response.data)
-            # Limpieza de columnas de Supabase (id, user_id)
-            df = df.drop(columns=['id', 'user_id'], errors='ignore')
-
-            # --- Lógica de limpieza de tipos (muy importante) ---
-            if table_name == TRANSACTIONS_TABLE:
-                df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
-                df['Monto'] = pd.to_numeric(df['Monto'], errors='coerce').fillna(0.0)
-                df = df.dropna(subset=['Fecha'])
-                # Asegurar columnas opcionales
-                for col, default_val in [('Recurrente', False), ('Frecuencia', 'Única/N/A'), ('Miembro', 'N/A'), ('Destino', 'N/A')]:
-                    if col not in df.columns: df[col] = default_val
-
-            elif table_name == GOALS_TABLE:
-                df = df.rename(columns={"Monto Objetivo": "Monto Objetivo", "Monto Aportado": "Monto Aportado", "Fecha Objetivo": "Fecha Objetivo"})
-                df['Fecha Objetivo'] = pd.to_datetime(df['Fecha Objetivo'], errors='coerce').dt.date
-                df['Monto Objetivo'] = pd.to_numeric(df['Monto Objetivo'], errors='coerce').fillna(0.0)
-                df['Monto Aportado'] = pd.to_numeric(df['Monto Aportado'], errors='coerce').fillna(0.0)
-
-            elif table_name == ACCOUNTS_TABLE:
-                df = df.rename(columns={"Saldo Inicial": "Saldo Inicial"})
-                df['Saldo Inicial'] = pd.to_numeric(df['Saldo Inicial'], errors='coerce').fillna(0.0)
-
-            return df
+        # Cargar todos los datos que coincidan con el user_id (las tablas de referencia, desde la caché compartida)
+        backend = storage.get_backend(supabase_client)
+        if table_name in SHARED_CACHE_TABLES:
+            df, hashes = shared_cached(backend, user_id, table_name, (), lambda: _load_clean_frame(backend, table_name, user_id))
         else:
+            df, hashes = _load_clean_frame(backend, table_name, user_id)
+
+        if table_name in ROW_ID_TABLES:
+            set_snapshot(table_name, user_id, hashes)
+        if df is None:
             return default_df.copy() # Retorna el DataFrame por defecto si no hay datos
+        # Copia perezosa (Copy-on-Write): la sesión puede modificarla sin tocar la compartida
+        return df.copy(deep=False) if table_name in SHARED_CACHE_TABLES else df
 
     except Exception as e:
         st.error(f"Error al cargar datos de '{table_name}': {e}")
+        if table_name in ROW_ID_TABLES:
+            set_snapshot(table_name, user_id, None)
         return default_df.copy()
 
-def save_data(supabase_client: Client, table_name: str, df: pd.DataFrame, user_id: str):
+@profiler.timed(detail_arg=(1, 'table_name'))
+def save_data(supabase_client: Client, table_name: str, df: pd.DataFrame, user_id: str, changes=None):
     """
-    Guarda un DataFrame completo en Supabase para un usuario.
-    Esto BORRA y REEMPLAZA todos los datos de esa tabla para ese usuario.
+    Guarda un DataFrame en Supabase para un usuario.
+    Para transacciones, cuentas y metas solo envía las filas nuevas, modificadas
+    (upsert por id) y borradas, comparando contra la última versión guardada.
+    Con `changes` = (filas quitadas, filas añadidas) ya conocidas no se compara la tabla entera.
+    Si no hay versión conocida, BORRA y REEMPLAZA todos los datos del usuario.
     """
+    if table_name in ROW_ID_TABLES:
+        ensure_row_ids(df if changes is None else changes[1])
+    backend = storage.get_backend(supabase_client)
     try:
-        # 1. Borrar todos los datos existentes de este usuario en esta tabla
-        supabase_client.table(table_name).delete().eq("user_id", user_id).execute()
-
-        # 2. Preparar los nuevos datos para insertar
-        if not df.empty:
-            df_to_save = df.copy()
+        previous = get_snapshot(table_name, user_id) if table_name in ROW_ID_TABLES else None
 
+        if previous is None:
+            # 1a. Reemplazo completo: borrar todo y volver a insertar
+            loaded_from = history_loaded_from(user_id) if table_name == TRANSACTIONS_TABLE else None
+            # Si solo está en memoria el historial reciente, lo antiguo aún no cargado no se toca
+            backend.delete(table_name, user_id, [('Fecha', 'gte', loaded_from)] if loaded_from is not None else [])
+            df_to_save = _to_db_frame(df)
             # Añadir el user_id a cada fila
             df_to_save['user_id'] = user_id
+            rows_to_insert = _db_records(df_to_save)
+            for batch in _batches(rows_to_insert):
+                if loaded_from is None:
+                    backend.insert(table_name, batch)
+                else:
+                    backend.upsert(table_name, batch, on_conflict=ROW_ID_COLUMN)
+            current = _row_hashes(df) if table_name in ROW_ID_TABLES else None
+        else:
+            # 1b. Incremental: solo las diferencias contra la última versión guardada
+            if changes is not None:
+                removed, added = changes
+                added_ids = pd.Index(added[ROW_ID_COLUMN].to_numpy(dtype=object), dtype=object)
+                removed_ids = pd.Index(removed[ROW_ID_COLUMN].to_numpy(dtype=object), dtype=object)
+                delete_ids = removed_ids.difference(added_ids)
+                df_upsert = added
+                current = _concat_hashes(previous[~previous.index.isin(removed_ids.union(added_ids))], _row_hashes(added))
+            else:
+                current = _row_hashes(df)
+                upsert_ids, delete_ids = diff_rows(previous, current)
+                df_upsert = df[pd.Index(df[ROW_ID_COLUMN].to_numpy(dtype=object), dtype=object).isin(upsert_ids)]
 
-            # Renombrar columnas de Pandas a las de la DB
-            if table_name == GOALS_TABLE:
-                df_to_save = df_to_save.rename(columns={"Monto Objetivo": "Monto Objetivo", "Monto Aportado": "Monto Aportado", "Fecha Objetivo": "Fecha Objetivo"})
-            elif table_name == ACCOUNTS_TABLE:
-                 df_to_save = df_to_save.rename(columns={"Saldo Inicial": "Saldo Inicial"})
-
-            # Convertir fechas a strings ISO para que Supabase (JSON) las entienda
-            if 'Fecha' in df_to_save.columns:
-                 df_to_save['Fecha'] = pd.to_datetime(df_to_save['Fecha']).dt.isoformat()
-            if 'Fecha Objetivo' in df_to_save.columns:
-                df_to_save['Fecha Objetivo'] = pd.to_datetime(df_to_save['Fecha Objetivo']).dt.isoformat()
+            for batch in _batches(list(delete_ids)):
+                backend.delete(table_name, user_id, [(ROW_ID_COLUMN, 'in', batch)])
 
-            # Convertir DataFrame a lista de diccionarios
-            data_to_insert = df_to_save.to_dict('records')
+            if len(df_upsert):
+                df_to_save = _to_db_frame(df_upsert)
+                df_to_save['user_id'] = user_id
+                rows_to_upsert = _db_records(df_to_save)
+                for batch in _batches(rows_to_upsert):
+                    backend.upsert(table_name, batch, on_conflict=ROW_ID_COLUMN)
 
-            # 3. Insertar los nuevos datos
-            supabase_client.table(table_name).insert(data_to_insert).execute()
+        # 2. Recordar lo que quedó guardado
+        if table_name in ROW_ID_TABLES:
+            set_snapshot(table_name, user_id, current)
 
     except Exception as e:
+        # Sin versión conocida, el próximo guardado hará un reemplazo completo
+        if table_name in ROW_ID_TABLES:
+            set_snapshot(table_name, user_id, None)
         st.error(f"Error fatal al guardar datos en '{table_name}': {e}")
+    invalidate_shared_cache(supabase_client, user_id, table_name)
 
 # --- Funciones de Carga/Guardado Específicas ---
 
+@profiler.timed()
 def load_categories(supabase_client: Client, user_id: str):
     """Carga las categorías del usuario."""
     try:
-        response = supabase_client.table(CATEGORIES_TABLE).select("tipo, nombre").eq("user_id", user_id).execute()
-        if response.data:
+        backend = storage.get_backend(supabase_client)
+        rows = shared_cached(backend, user_id, CATEGORIES_TABLE, (), lambda: backend.select(CATEGORIES_TABLE, user_id, columns=['tipo', 'nombre'])[0])
+        if rows:
             categories = {}
-            for row in response.data:
+            for row in rows:
                 if row['tipo'] not in categories:
                     categories[row['tipo']] = []
                 categories[row['tipo']].append(row['nombre'])
@@ -154,11 +382,13 @@ def load_categories(supabase_client: Client, user_id: str):
         st.error(f"Error al cargar categorías: {e}")
         return DEFAULT_CATEGORIES.copy()
 
+@profiler.timed()
 def save_categories(supabase_client: Client, categories: dict, user_id: str):
     """Guarda el diccionario de categorías (borra y reemplaza)."""
     try:
+        backend = storage.get_backend(supabase_client)
         # 1. Borrar todas las categorías del usuario
-        supabase_client.table(CATEGORIES_TABLE).delete().eq("user_id", user_id).execute()
+        backend.delete(CATEGORIES_TABLE, user_id)
 
         # 2. Preparar nuevas
         rows_to_insert = []
@@ -167,109 +397,207 @@ def save_categories(supabase_client: Client, categories: dict, user_id: str):
                 rows_to_insert.append({'user_id': user_id, 'tipo': tipo, 'nombre': nombre})
 
         # 3. Insertar
-        if rows_to_insert:
-            supabase_client.table(CATEGORIES_TABLE).insert(rows_to_insert).execute()
+        backend.insert(CATEGORIES_TABLE, rows_to_insert)
     except Exception as e:
         st.error(f"Error al guardar categorías: {e}")
+    invalidate_shared_cache(supabase_client, user_id, CATEGORIES_TABLE)
 
+@profiler.timed()
 def load_members(supabase_client: Client, user_id: str):
     """Carga los miembros del usuario."""
     try:
-        response = supabase_client.table(MEMBERS_TABLE).select("nombre").eq("user_id", user_id).execute()
-        if response.data:
-            return sorted([row['nombre'] for row in response.data])
+        backend = storage.get_backend(supabase_client)
+        rows = shared_cached(backend, user_id, MEMBERS_TABLE, (), lambda: backend.select(MEMBERS_TABLE, user_id, columns=['nombre'])[0])
+        if rows:
+            return sorted([row['nombre'] for row in rows])
         else:
             return DEFAULT_MEMBERS.copy()
     except Exception as e:
         st.error(f"Error al cargar miembros: {e}")
         return DEFAULT_MEMBERS.copy()
 
+@profiler.timed()
 def save_members(supabase_client: Client, members: list, user_id: str):
     """Guarda la lista de miembros (borra y reemplaza)."""
     try:
-        supabase_client.table(MEMBERS_TABLE).delete().eq("user_id", user_id).execute()
-        if members:
-            rows_to_insert = [{'user_id': user_id, 'nombre': nombre} for nombre in members]
-            supabase_client.table(MEMBERS_TABLE).insert(rows_to_insert).execute()
+        backend = storage.get_backend(supabase_client)
+        backend.delete(MEMBERS_TABLE, user_id)
+        backend.insert(MEMBERS_TABLE, [{'user_id': user_id, 'nombre': nombre} for nombre in members])
     except Exception as e:
         st.error(f"Error al guardar miembros: {e}")
+    invalidate_shared_cache(supabase_client, user_id, MEMBERS_TABLE)
 
 
+@profiler.timed(detail_arg=(2, 'key'))
 def load_config_key(supabase_client: Client, user_id: str, key: str, default_value: any):
     """Carga una clave específica de la tabla de configuración."""
     try:
-        response = supabase_client.table(CONFIG_TABLE).select("valor").eq("user_id", user_id).eq("clave", key).execute()
-        if response.data:
-            return response.data[0]['valor'] # El valor ya es un JSON/dict
-        else:
-            return default_value
+        return _load_config_cached(supabase_client, user_id, [key]).get(key, default_value)
     except Exception as e:
         st.error(f"Error al cargar configuración '{key}': {e}")
         return default_value
 
+@profiler.timed(detail_arg=(2, 'key'))
 def save_config_key(supabase_client: Client, user_id: str, key: str, value: any):
     """Guarda (actualiza o inserta) una clave en la tabla de configuración."""
     try:
-        # 'upsert' = update or insert
-        supabase_client.table(CONFIG_TABLE).upsert({
-            'user_id': user_id,
-            'clave': key,
-            'valor': value # Supabase maneja la conversión a JSONB
-        }, on_conflict='user_id, clave').execute()
+        # 'upsert' = update or insert (el backend se encarga de la conversión a JSON)
+        storage.get_backend(supabase_client).save_config(user_id, key, value)
     except Exception as e:
         st.error(f"Error al guardar configuración '{key}': {e}")
+    invalidate_shared_cache(supabase_client, user_id, CONFIG_TABLE)
+
+@profiler.timed()
+def load_config_keys(supabase_client: Client, user_id: str, defaults: dict):
+    """Carga varias claves de configuración en UNA sola consulta (clave -> valor o su default)."""
+    values = {key: value for key, value in defaults.items()}
+    try:
+        values.update(_load_config_cached(supabase_client, user_id, list(defaults)))
+    except Exception as e:
+        st.error(f"Error al cargar configuración: {e}")
+    return values
+
+def _load_config_cached(supabase_client: Client, user_id: str, keys: list):
+    """{clave: valor} desde la caché compartida; copia profunda porque las sesiones modifican los dicts en su sitio."""
+    backend = storage.get_backend(supabase_client)
+    values = shared_cached(backend, user_id, CONFIG_TABLE, tuple(keys), lambda: backend.load_config(user_id, keys))
+    return copy.deepcopy(values)
 
 # --- Funciones de Lógica Específicas (adaptadas) ---
 
-def load_budget_config(supabase_client: Client, user_id: str):
-    """Carga la configuración de presupuesto guardada."""
+def _default_budget_config():
     today = datetime.now().date()
-    default_config = {
+    return {
         'period_start': today.isoformat(),
         'period_end': (today + timedelta(days=15)).isoformat(),
         'budget_amount': 1000.0
     }
 
-    config = load_config_key(supabase_client, user_id, BUDGET_KEY, default_config)
-
-    # Convertir strings de vuelta a objetos de fecha
+def parse_budget_config(config: dict):
+    """Convierte las fechas del presupuesto (strings ISO) a objetos date."""
+    today = datetime.now().date()
     try:
         config['period_start'] = datetime.fromisoformat(config['period_start']).date()
         config['period_end'] = datetime.fromisoformat(config['period_end']).date()
     except: # Si falla, usa los defaults
         config['period_start'] = today
         config['period_end'] = (today + timedelta(days=15))
-
     return config
 
+@profiler.timed()
+def load_budget_config(supabase_client: Client, user_id: str):
+    """Carga la configuración de presupuesto guardada."""
+    config = load_config_key(supabase_client, user_id, BUDGET_KEY, _default_budget_config())
+
+    # Convertir strings de vuelta a objetos de fecha
+    return parse_budget_config(config)
+
+@profiler.timed()
 def load_category_budgets(supabase_client: Client, user_id: str):
     """Carga los presupuestos por categoría."""
     return load_config_key(supabase_client, user_id, CATEGORY_BUDGET_KEY, DEFAULT_CATEGORY_BUDGETS)
 
 
-# --- Lógica de Cálculo (Sin cambios, operan en DataFrames) ---
+# --- Lógica de Cálculo (operan en DataFrames) ---
+
+KPI_TYPES = ['Ingreso', 'Gasto', 'Transferencia']
+
+def _category_codes(values: pd.Series):
+    """Códigos enteros y categorías de una columna (gratis si ya es categórica). -1 = nulo."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    return pd.factorize(values)
+
+def _lookup_codes(values: pd.Series, mapping: dict, default):
+    """Traduce una columna con un dict vía sus categorías (un lookup por valor distinto, no por fila)."""
+    codes, categories = _category_codes(values)
+    lookup = np.array([mapping.get(cat, default) for cat in categories] + [default])
+    return lookup[codes] # el código -1 (nulo) cae en el valor por defecto
+
+def _day_bounds(start_date, end_date):
+    """Rango [inicio, fin + 1 día) en datetime64[ns] (NaT si falta una fecha)."""
+    start = np.datetime64(pd.Timestamp(start_date), 'ns') if start_date else np.datetime64('NaT', 'ns')
+    end = np.datetime64(pd.Timestamp(end_date) + timedelta(days=1), 'ns') if end_date else np.datetime64('NaT', 'ns')
+    return start, end
+
+def compute_kpis(df_transactions, period_start=None, period_end=None):
+    """
+    Calcula en una sola pasada (arrays NumPy, sin copias del DataFrame) todas las métricas del dashboard:
+    ingresos, gastos, neto, gasto del período (total y por categoría),
+    ingreso/gasto fijo mensual y el gasto promedio por día de la semana.
+    """
+    day_order = list(DAY_NAMES_MAP.values())
+    kpis = {
+        'income': 0.0, 'expense': 0.0, 'net': 0.0,
+        'period_spend': 0.0, 'period_spend_by_category': pd.Series(dtype='float64'),
+        'fixed_income': 0.0, 'fixed_expense': 0.0, 'fixed_surplus': 0.0,
+        'recurring_projection': None,
+        'dow_profile': pd.Series(dtype='float64', index=pd.Index([], name='Día de la Semana')),
+    }
+    if df_transactions.empty or 'Tipo' not in df_transactions.columns:
+        return kpis
+
+    # 1. Extraer columnas como arrays (una sola vez)
+    tipo_codes = _lookup_codes(df_transactions['Tipo'], {t: i for i, t in enumerate(KPI_TYPES)}, -1)
+    monto = pd.to_numeric(df_transactions['Monto'], errors='coerce').to_numpy(dtype='float64', na_value=0.0)
+    fechas = pd.to_datetime(df_transactions['Fecha'], errors='coerce').to_numpy(dtype='datetime64[ns]')
+    is_gasto = tipo_codes == 1
+
+    # 2. Totales por tipo (bincount = suma agrupada en una pasada)
+    totals = np.bincount(tipo_codes[tipo_codes >= 0], weights=monto[tipo_codes >= 0], minlength=len(KPI_TYPES))
+    kpis['income'], kpis['expense'] = float(totals[0]), float(totals[1])
+    kpis['net'] = kpis['income'] - kpis['expense']
+
+    # 3. Gasto del período (total y por categoría)
+    start, end = _day_bounds(period_start, period_end)
+    if not np.isnat(start) and not np.isnat(end):
+        in_period = is_gasto & (fechas >= start) & (fechas < end)
+        if in_period.any():
+            cat_codes, cat_names = pd.factorize(df_transactions['Categoría'][in_period])
+            by_cat = np.bincount(cat_codes[cat_codes >= 0], weights=monto[in_period][cat_codes >= 0], minlength=len(cat_names))
+            kpis['period_spend'] = float(monto[in_period].sum())
+            kpis['period_spend_by_category'] = pd.Series(by_cat, index=pd.Index(cat_names, name='Categoría'))
 
+    # 4. Ingreso / gasto fijo mensual y proyección a 12 meses
+    if 'Recurrente' in df_transactions.columns:
+        recurrente = df_transactions['Recurrente'].to_numpy() == True
+        if recurrente.any():
+            multipliers = _lookup_codes(df_transactions['Frecuencia'], FREQUENCY_MULTIPLIER, 0.0).astype('float64')
+            monthly = np.where(recurrente, monto * multipliers, 0.0)
+            kpis['fixed_income'] = float(monthly[tipo_codes == 0].sum())
+            kpis['fixed_expense'] = float(monthly[is_gasto].sum())
+            kpis['fixed_surplus'] = kpis['fixed_income'] - kpis['fixed_expense']
+            kpis['recurring_projection'] = project_recurring_cash_flow(
+                monto[recurrente], multipliers[recurrente], tipo_codes[recurrente], fechas[recurrente]
+            )
+
+    # 5. Gasto promedio por día de la semana (0 = Lunes; el 1970-01-01 fue jueves)
+    gasto_valid = is_gasto & ~np.isnat(fechas)
+    if gasto_valid.any():
+        days = fechas[gasto_valid].astype('datetime64[D]').astype('int64')
+        dow = (days + 3) % 7
+        sums = np.bincount(dow, weights=monto[gasto_valid], minlength=7)
+        counts = np.bincount(dow, minlength=7)
+        present = counts > 0
+        kpis['dow_profile'] = pd.Series(
+            sums[present] / counts[present],
+            index=pd.Index(np.array(day_order)[present], name='Día de la Semana')
+        )
+    return kpis
+
+@profiler.timed()
 def calculate_balance(df):
-    df_neto = df[df['Tipo'] != 'Transferencia'].copy()
-    ingresos = df_neto[df_neto['Tipo'] == 'Ingreso']['Monto'].sum()
-    gastos = df_neto[df_neto['Tipo'] == 'Gasto']['Monto'].sum()
-    return ingresos, gastos, ingresos - gastos
+    kpis = compute_kpis(df)
+    return kpis['income'], kpis['expense'], kpis['net']
 
-def calculate_daily_budget(start_date, end_date, budget_total, df_transactions):
+@profiler.timed()
+def calculate_daily_budget(start_date, end_date, budget_total, df_transactions, kpis=None):
     if not all([start_date, end_date]) or budget_total < 0:
         return 0.0, 0, 0.0
     today = datetime.now().date()
-    df_transactions_filtered = df_transactions.copy()
-    if pd.api.types.is_datetime64_any_dtype(df_transactions_filtered['Fecha']):
-        df_transactions_filtered['Fecha'] = df_transactions_filtered['Fecha'].dt.date
-    else:
-        df_transactions_filtered['Fecha'] = pd.to_datetime(df_transactions_filtered['Fecha']).dt.date
-
-    gastos_realizados = df_transactions_filtered[
-        (df_transactions_filtered['Tipo'] == 'Gasto') &
-        (df_transactions_filtered['Fecha'] >= start_date) &
-        (df_transactions_filtered['Fecha'] <= end_date)
-    ]['Monto'].sum()
+    if kpis is None:
+        kpis = compute_kpis(df_transactions, start_date, end_date)
+    gastos_realizados = kpis['period_spend']
     presupuesto_restante = budget_total - gastos_realizados
     if today > end_date:
         days_left = 0
@@ -283,39 +611,64 @@ def calculate_daily_budget(start_date, end_date, budget_total, df_transactions):
         daily_budget = 0.0
     return daily_budget, days_left, presupuesto_restante
 
-def update_goal_progress(df_transactions, df_goals):
+def update_goal_progress(df_transactions, df_goals, contributions: pd.DataFrame = None):
+    """Aporte de cada meta (transferencias a su nombre). `contributions` (Nombre, Monto Calculado) evita recorrer el historial."""
     if df_goals.empty or 'Nombre' not in df_goals.columns:
         return df_goals
-    goal_names = df_goals['Nombre'].tolist()
-    if df_transactions.empty or 'Tipo' not in df_transactions.columns:
-        df_contributions = pd.DataFrame(columns=['Nombre', 'Monto Calculado'])
-    else:
-        df_transfers_to_goals = df_transactions[
-            (df_transactions['Tipo'] == 'Transferencia') &
-            (df_transactions['Destino'].isin(goal_names))
-        ]
-        if df_transfers_to_goals.empty:
-             df_contributions = pd.DataFrame(columns=['Nombre', 'Monto Calculado'])
+    if contributions is None:
+        if df_transactions.empty or 'Tipo' not in df_transactions.columns:
+            totals = pd.Series(dtype='float64')
         else:
-            df_contributions = df_transfers_to_goals.groupby('Destino')['Monto'].sum().reset_index()
-            df_contributions.columns = ['Nombre', 'Monto Calculado']
-    cols_to_drop = ['Monto Aportado'] if 'Monto Aportado' in df_goals.columns else []
-    df_goals_no_aportado = df_goals.drop(columns=cols_to_drop, errors='ignore')
-    df_updated = pd.merge(
-        df_goals_no_aportado,
-        df_contributions,
-        on='Nombre',
-        how='left'
-    ).fillna({'Monto Calculado': 0.0})
-    df_updated['Monto Aportado'] = df_updated['Monto Calculado']
+            destino, monto, _ = _goal_transfers(df_transactions)
+            totals = monto.groupby(destino, observed=True).sum()
+            totals.index = totals.index.astype(object)
+    else:
+        totals = pd.Series(pd.to_numeric(contributions['Monto Calculado'], errors='coerce').fillna(0.0).to_numpy(dtype='float64'),
+                           index=contributions['Nombre'].astype(object)).groupby(level=0).sum()
     final_cols = list(DEFAULT_GOALS.columns)
-    df_updated = df_updated.reindex(columns=final_cols, fill_value=0.0)
+    if ROW_ID_COLUMN in df_goals.columns:
+        final_cols.append(ROW_ID_COLUMN)
+    df_updated = df_goals.reindex(columns=final_cols, fill_value=0.0)
     df_updated['Monto Objetivo'] = df_updated['Monto Objetivo'].astype(float)
-    df_updated['Monto Aportado'] = df_updated['Monto Aportado'].astype(float)
+    df_updated['Monto Aportado'] = totals.reindex(df_updated['Nombre'].astype(object)).fillna(0.0).to_numpy(dtype='float64')
     df_updated['Fecha Objetivo'] = pd.to_datetime(df_updated['Fecha Objetivo']).dt.date
-    return df_updated.drop(columns=['Monto Calculado'], errors='ignore')
+    return df_updated
+
+@profiler.timed()
+def sync_goal_progress(supabase_client: Client, user_id: str, force: bool = False):
+    """
+    Recalcula el aporte de las metas solo si cambió el historial o las metas desde la
+    última vez, y lo guarda en Supabase solo si algún 'Monto Aportado' cambió.
+    Con el historial a medias el aporte lo calcula la base de datos.
+    Devuelve True si hubo que guardar.
+    """
+    if 'goals_df' not in st.session_state or 'Monto Objetivo' not in st.session_state.goals_df.columns:
+        return False
+    versions = (get_version('transactions_df'), get_version('goals_df'))
+    if not force and st.session_state.get(GOALS_SYNC_KEY) == versions:
+        return False
+
+    if history_loaded_from(user_id) is not None:
+        contributions = load_goal_contributions(supabase_client, user_id)
+        if contributions is None:
+            # Sin el agregado del servidor el aporte saldría incompleto: se espera a tener todo el historial
+            st.session_state[GOALS_SYNC_KEY] = versions
+            return False
+    else:
+        contributions = engine_goal_contributions() # Historial completo en memoria: del motor de metas
+    df_goals = st.session_state.goals_df
+    df_updated = update_goal_progress(get_transactions(), df_goals, contributions=contributions)
+    previous = pd.to_numeric(df_goals['Monto Aportado'], errors='coerce').fillna(0.0).to_numpy() if 'Monto Aportado' in df_goals.columns else None
+    changed = previous is None or len(previous) != len(df_updated) or not np.allclose(previous, df_updated['Monto Aportado'].to_numpy())
+    if changed:
+        set_state('goals_df', df_updated)
+        save_data(supabase_client, GOALS_TABLE, df_updated, user_id)
+    st.session_state[GOALS_SYNC_KEY] = (get_version('transactions_df'), get_version('goals_df'))
+    return changed
 
-def calculate_account_balances(df_transactions, df_accounts):
+@profiler.timed()
+def calculate_account_balances(df_transactions, df_accounts, flows: pd.DataFrame = None):
+    """Saldo actual de cada cuenta. `flows` (Nombre, Entradas, Salidas, Entradas_T) evita recorrer el historial."""
     if df_accounts.empty:
         return pd.DataFrame(columns=['Nombre', 'Tipo', 'Saldo Inicial', 'Saldo Actual'])
     df_acc_calc = df_accounts.copy()
@@ -323,29 +676,32 @@ def calculate_account_balances(df_transactions, df_accounts):
     df_outflows = pd.DataFrame(columns=['Nombre', 'Salidas'])
     df_inflows = pd.DataFrame(columns=['Nombre', 'Entradas'])
     df_transfer_in = pd.DataFrame(columns=['Nombre', 'Entradas_T'])
-    if not df_transactions.empty:
+    if flows is None and not df_transactions.empty:
         df_outflows_raw = df_transactions[
             df_transactions['Tipo'].isin(['Gasto', 'Transferencia'])
         ]
         if not df_outflows_raw.empty:
-            df_outflows = df_outflows_raw.groupby('Cuenta')['Monto'].sum().reset_index()
+            df_outflows = df_outflows_raw.groupby('Cuenta', observed=True)['Monto'].sum().reset_index()
             df_outflows.columns = ['Nombre', 'Salidas']
         df_inflows_raw = df_transactions[
             df_transactions['Tipo'] == 'Ingreso'
         ]
         if not df_inflows_raw.empty:
-            df_inflows = df_inflows_raw.groupby('Cuenta')['Monto'].sum().reset_index()
+            df_inflows = df_inflows_raw.groupby('Cuenta', observed=True)['Monto'].sum().reset_index()
             df_inflows.columns = ['Nombre', 'Entradas']
         df_transfer_in_raw = df_transactions[
             (df_transactions['Tipo'] == 'Transferencia') &
             (df_transactions['Destino'].isin(account_names))
         ]
         if not df_transfer_in_raw.empty:
-            df_transfer_in = df_transfer_in_raw.groupby('Destino')['Monto'].sum().reset_index()
+            df_transfer_in = df_transfer_in_raw.groupby('Destino', observed=True)['Monto'].sum().reset_index()
             df_transfer_in.columns = ['Nombre', 'Entradas_T']
-    df_acc_calc = pd.merge(df_acc_calc, df_inflows, on='Nombre', how='left')
-    df_acc_calc = pd.merge(df_acc_calc, df_outflows, on='Nombre', how='left')
-    df_acc_calc = pd.merge(df_acc_calc, df_transfer_in, on='Nombre', how='left')
+    if flows is not None:
+        df_acc_calc = pd.merge(df_acc_calc, flows[['Nombre', 'Entradas', 'Salidas', 'Entradas_T']], on='Nombre', how='left')
+    else:
+        df_acc_calc = pd.merge(df_acc_calc, df_inflows, on='Nombre', how='left')
+        df_acc_calc = pd.merge(df_acc_calc, df_outflows, on='Nombre', how='left')
+        df_acc_calc = pd.merge(df_acc_calc, df_transfer_in, on='Nombre', how='left')
     df_acc_calc.fillna({'Entradas': 0.0, 'Salidas': 0.0, 'Entradas_T': 0.0}, inplace=True)
     df_acc_calc['Saldo Inicial'] = pd.to_numeric(df_acc_calc['Saldo Inicial'], errors='coerce').fillna(0.0)
     df_acc_calc['Saldo Actual'] = (
@@ -356,39 +712,102 @@ def calculate_account_balances(df_transactions, df_accounts):
     )
     return df_acc_calc.drop(columns=['Entradas', 'Salidas', 'Entradas_T'], errors='ignore')
 
+def monthly_recurring_amounts(df_transactions):
+    """Monto mensual equivalente de cada transacción (0 si no es recurrente), sin apply fila a fila."""
+    if df_transactions.empty or 'Recurrente' not in df_transactions.columns:
+        return pd.Series(0.0, index=df_transactions.index, dtype='float64')
+    recurrente = df_transactions['Recurrente'].to_numpy() == True
+    multipliers = _lookup_codes(df_transactions['Frecuencia'], FREQUENCY_MULTIPLIER, 0.0).astype('float64')
+    monto = pd.to_numeric(df_transactions['Monto'], errors='coerce').to_numpy(dtype='float64', na_value=0.0)
+    return pd.Series(np.where(recurrente, monto * multipliers, 0.0), index=df_transactions.index)
+
+def project_recurring_cash_flow(monto, multipliers, tipo_codes, fechas, months=12, start_month=None):
+    """
+    Proyecta los flujos recurrentes mes a mes (matriz transacciones x meses, vectorizada).
+    Frecuencias >= mensual suman Monto x multiplicador cada mes; las más espaciadas
+    (Bimensual, Trimestral, Anual) suman Monto en los meses que tocan según el mes de su Fecha.
+    """
+    if start_month is None:
+        start_month = pd.Timestamp(datetime.now().date()).to_period('M')
+    month_index = start_month.ordinal + np.arange(months) # meses desde 1970-01
+    anchor = fechas.astype('datetime64[M]').astype('int64')
+    anchor = np.where(np.isnat(fechas), month_index[0], anchor)
+
+    every_month = multipliers >= 1.0
+    period = np.where(multipliers > 0, np.rint(1.0 / np.where(multipliers > 0, multipliers, 1.0)), 0).astype('int64')
+    months_since = month_index[np.newaxis, :] - anchor[:, np.newaxis]
+    occurs = (period[:, np.newaxis] > 0) & (np.mod(months_since, np.maximum(period, 1)[:, np.newaxis]) == 0)
+    amounts = np.where(
+        every_month[:, np.newaxis], (monto * multipliers)[:, np.newaxis],
+        np.where(occurs, monto[:, np.newaxis], 0.0)
+    )
+    ingreso = amounts[tipo_codes == 0].sum(axis=0)
+    gasto = amounts[tipo_codes == 1].sum(axis=0)
+    projection = pd.DataFrame({
+        'Mes': pd.PeriodIndex.from_ordinals(month_index, freq='M').to_timestamp(),
+        'Ingreso Fijo': ingreso,
+        'Gasto Fijo': gasto,
+    })
+    projection['Neto Fijo'] = projection['Ingreso Fijo'] - projection['Gasto Fijo']
+    projection['Neto Acumulado'] = projection['Neto Fijo'].cumsum()
+    return projection
+
+@profiler.timed()
 def calculate_fixed_surplus(df_transactions):
-    df_fixed = df_transactions[df_transactions['Recurrente'] == True].copy()
-    if df_fixed.empty:
+    monthly = monthly_recurring_amounts(df_transactions)
+    if not monthly.any():
         return 0.0, 0.0, 0.0
-    def get_monthly_amount(row):
-        multiplier = FREQUENCY_MULTIPLIER.get(row['Frecuencia'], 0.0)
-        return row['Monto'] * multiplier
-    df_fixed['Monto Mensual'] = df_fixed.apply(get_monthly_amount, axis=1)
-    monthly_income = df_fixed[df_fixed['Tipo'] == 'Ingreso']['Monto Mensual'].sum()
-    monthly_expense = df_fixed[df_fixed['Tipo'] == 'Gasto']['Monto Mensual'].sum()
+    monthly_income = float(monthly[(df_transactions['Tipo'] == 'Ingreso').to_numpy()].sum())
+    monthly_expense = float(monthly[(df_transactions['Tipo'] == 'Gasto').to_numpy()].sum())
     surplus = monthly_income - monthly_expense
     return monthly_income, monthly_expense, surplus
 
+@profiler.timed()
+def calculate_recurring_projection(df_transactions):
+    """Tabla de proyección a 12 meses del flujo recurrente (None si no hay recurrentes)."""
+    return compute_kpis(df_transactions)['recurring_projection']
+
 
 # --- 5. FUNCIONES DE SINCRONIZACIÓN (Adaptadas para Supabase) ---
 
+def _distinct(values: pd.Series):
+    """Valores distintos no nulos de una columna, en orden de aparición."""
+    return pd.unique(values.dropna().astype(object).to_numpy())
+
+def _new_values(candidates, known):
+    """Los candidatos (ya distintos) que no están en `known`, sin 'N/A'."""
+    known = set(known)
+    return [v for v in candidates if v not in known and v != 'N/A']
+
+def insert_new_rows(supabase_client: Client, table_name: str, df_new: pd.DataFrame, user_id: str):
+    """Inserta solo filas nuevas (en una sola petición) y las añade a la última versión guardada, sin reescribir la tabla."""
+    ensure_row_ids(df_new)
+    df_to_save = _to_db_frame(df_new)
+    df_to_save['user_id'] = user_id
+    try:
+        storage.get_backend(supabase_client).insert(table_name, _db_records(df_to_save))
+    finally:
+        invalidate_shared_cache(supabase_client, user_id, table_name)
+    previous = get_snapshot(table_name, user_id)
+    if previous is not None:
+        set_snapshot(table_name, user_id, _concat_hashes(previous, _row_hashes(df_new)))
+
 def sync_metadata_from_df(supabase_client: Client, user_id: str, df: pd.DataFrame):
     """
     Lee un DataFrame de transacciones (del CSV) y añade cualquier
     nueva Categoría, Miembro o Cuenta a las tablas de configuración.
+    Las novedades se calculan por diferencia de conjuntos sobre los valores
+    distintos del DataFrame y solo se insertan las filas nuevas.
     """
     changes_made_global = False
 
     # --- 1. Sincronizar Miembros ---
     try:
-        current_members = set(st.session_state.get('members', []))
-        csv_members = set(df['Miembro'].unique())
-        new_members = [m for m in csv_members if m not in current_members and pd.notna(m) and m != 'N/A']
-
+        new_members = _new_values(_distinct(df['Miembro']), st.session_state.get('members', []))
         if new_members:
-            st.session_state.members.extend(new_members)
-            st.session_state.members.sort()
-            save_members(supabase_client, st.session_state.members, user_id) # Usar nueva función
+            storage.get_backend(supabase_client).insert(MEMBERS_TABLE, [{'user_id': user_id, 'nombre': m} for m in new_members])
+            invalidate_shared_cache(supabase_client, user_id, MEMBERS_TABLE)
+            st.session_state.members = sorted(st.session_state.get('members', []) + new_members)
             st.toast(f"👥 ¡Se añadieron {len(new_members)} nuevos miembros!", icon="👥")
             changes_made_global = True
     except Exception as e:
@@ -396,24 +815,17 @@ def sync_metadata_from_df(supabase_client: Client, user_id: str, df: pd.DataFram
 
     # --- 2. Sincronizar Cuentas ---
     try:
-        current_accounts = set(st.session_state.get('accounts_df', pd.DataFrame(columns=['Nombre']))['Nombre'].unique())
-        current_goals = set(st.session_state.get('goals_df', pd.DataFrame(columns=['Nombre']))['Nombre'].unique())
-        csv_cuentas = set(df['Cuenta'].unique())
-        csv_destinos_cuentas = set(df[~df['Destino'].isin(current_goals)]['Destino'].unique())
-        all_csv_accounts = csv_cuentas.union(csv_destinos_cuentas)
-
-        new_accounts_df = pd.DataFrame()
-        new_account_names = []
-
-        for acc in all_csv_accounts:
-            if acc not in current_accounts and pd.notna(acc) and acc != 'N/A':
-                new_account = {'Nombre': acc, 'Tipo': 'Importada', 'Saldo Inicial': 0.0}
-                new_accounts_df = pd.concat([new_accounts_df, pd.DataFrame([new_account])], ignore_index=True)
-                new_account_names.append(acc)
-
-        if not new_accounts_df.empty:
-            st.session_state.accounts_df = pd.concat([st.session_state.accounts_df, new_accounts_df], ignore_index=True)
-            save_data(supabase_client, ACCOUNTS_TABLE, st.session_state.accounts_df, user_id) # Usar nueva función
+        df_accounts = st.session_state.get('accounts_df', pd.DataFrame(columns=['Nombre']))
+        current_goals = st.session_state.get('goals_df', pd.DataFrame(columns=['Nombre']))['Nombre']
+        # Los destinos que no son metas también son cuentas
+        destinos = df['Destino'][~df['Destino'].isin(current_goals)]
+        csv_accounts = pd.unique(np.concatenate([_distinct(df['Cuenta']), _distinct(destinos)]))
+        new_account_names = _new_values(csv_accounts, df_accounts['Nombre'])
+
+        if new_account_names:
+            new_accounts_df = pd.DataFrame({'Nombre': new_account_names, 'Tipo': 'Importada', 'Saldo Inicial': 0.0})
+            insert_new_rows(supabase_client, ACCOUNTS_TABLE, new_accounts_df, user_id)
+            set_state('accounts_df', pd.concat([df_accounts, new_accounts_df], ignore_index=True))
             st.toast(f"🏦 ¡Se añadieron {len(new_account_names)} nuevas cuentas!", icon="🏦")
             changes_made_global = True
     except Exception as e:
@@ -421,31 +833,1128 @@ def sync_metadata_from_df(supabase_client: Client, user_id: str, df: pd.DataFram
 
     # --- 3. Sincronizar Categorías ---
     try:
-        current_categories_gasto = set(st.session_state.get('categories', {}).get('Gasto', []))
-        current_categories_ingreso = set(st.session_state.get('categories', {}).get('Ingreso', []))
-        csv_gastos = set(df[df['Tipo'] == 'Gasto']['Categoría'].unique())
-        csv_ingresos = set(df[df['Tipo'] == 'Ingreso']['Categoría'].unique())
-
-        new_gastos = [c for c in csv_gastos if c not in current_categories_gasto and pd.notna(c) and c != 'N/A']
-        new_ingresos = [c for c in csv_ingresos if c not in current_categories_ingreso and pd.notna(c) and c != 'N/A']
-
-        changes_made_cats = False
-        if new_gastos:
-            st.session_state.categories.setdefault('Gasto', []).extend(new_gastos)
-            st.session_state.categories['Gasto'].sort()
-            changes_made_cats = True
-            st.toast(f"📉 ¡Se añadieron {len(new_gastos)} nuevas categorías de gasto!", icon="📉")
-
-        if new_ingresos:
-            st.session_state.categories.setdefault('Ingreso', []).extend(new_ingresos)
-            st.session_state.categories['Ingreso'].sort()
-            changes_made_cats = True
-            st.toast(f"📈 ¡Se añadieron {len(new_ingresos)} nuevas categorías de ingreso!", icon="📈")
-
-        if changes_made_cats:
-            save_categories(supabase_client, st.session_state.categories, user_id) # Usar nueva función
+        categories = st.session_state.get('categories', {})
+        pairs = df.loc[df['Tipo'].isin(['Gasto', 'Ingreso']), ['Tipo', 'Categoría']].astype(object).drop_duplicates()
+        new_by_type = {
+            tipo: _new_values(_distinct(pairs.loc[pairs['Tipo'] == tipo, 'Categoría']), categories.get(tipo, []))
+            for tipo in ['Gasto', 'Ingreso']
+        }
+        rows_to_insert = [{'user_id': user_id, 'tipo': tipo, 'nombre': nombre} for tipo, nombres in new_by_type.items() for nombre in nombres]
+
+        if rows_to_insert:
+            storage.get_backend(supabase_client).insert(CATEGORIES_TABLE, rows_to_insert)
+            invalidate_shared_cache(supabase_client, user_id, CATEGORIES_TABLE)
+            for tipo, nombres in new_by_type.items():
+                if nombres:
+                    categories.setdefault(tipo, []).extend(nombres)
+                    categories[tipo].sort()
+            st.session_state.categories = categories
+            if new_by_type['Gasto']:
+                st.toast(f"📉 ¡Se añadieron {len(new_by_type['Gasto'])} nuevas categorías de gasto!", icon="📉")
+            if new_by_type['Ingreso']:
+                st.toast(f"📈 ¡Se añadieron {len(new_by_type['Ingreso'])} nuevas categorías de ingreso!", icon="📈")
             changes_made_global = True
     except Exception as e:
         st.warning(f"Error al sincronizar categorías: {e}")
 
     return changes_made_global
+
+
+# --- 6. MOTOR DE FILTROS (Índice ordenado por fecha + códigos categóricos) ---
+
+FILTER_ALL = 'Todos'
+
+def build_filter_index(df: pd.DataFrame):
+    """
+    Construye el índice de filtrado de un DataFrame de transacciones:
+    posiciones ordenadas por Fecha y códigos enteros de Tipo y Miembro (en ese orden).
+    """
+    fechas = pd.to_datetime(df['Fecha'], errors='coerce').to_numpy(dtype='datetime64[ns]')
+    order = np.argsort(fechas, kind='stable')
+    tipo_codes, tipo_cats = _category_codes(df['Tipo'])
+    miembro_codes, miembro_cats = _category_codes(df['Miembro'])
+    return {
+        'order': order,
+        'fechas': fechas[order],
+        'tipo_codes': tipo_codes[order],
+        'tipo_lookup': {cat: code for code, cat in enumerate(tipo_cats)},
+        'miembro_codes': miembro_codes[order],
+        'miembro_lookup': {cat: code for code, cat in enumerate(miembro_cats)},
+    }
+
+def filter_positions(index: dict, start_date=None, end_date=None, tipo=FILTER_ALL, miembro=FILTER_ALL):
+    """
+    Devuelve las posiciones (iloc) que cumplen los filtros, ordenadas por fecha.
+    El rango de fechas se resuelve con búsqueda binaria; Tipo/Miembro con máscaras sobre códigos.
+    """
+    fechas = index['fechas']
+    lo = 0 if start_date is None else np.searchsorted(fechas, np.datetime64(pd.Timestamp(start_date), 'ns'), side='left')
+    hi = len(fechas) if end_date is None else np.searchsorted(fechas, np.datetime64(pd.Timestamp(end_date) + timedelta(days=1), 'ns'), side='left')
+    positions = index['order'][lo:hi]
+
+    mask = None
+    for value, codes_key, lookup_key in [(tipo, 'tipo_codes', 'tipo_lookup'), (miembro, 'miembro_codes', 'miembro_lookup')]:
+        if value is None or value == FILTER_ALL:
+            continue
+        code = index[lookup_key].get(value, -2) # -2: no existe, la máscara queda vacía
+        value_mask = index[codes_key][lo:hi] == code
+        mask = value_mask if mask is None else (mask & value_mask)
+    return positions if mask is None else positions[mask]
+
+def get_filter_index(df: pd.DataFrame):
+    """Índice de filtrado en caché (se reconstruye solo si cambia el DataFrame)."""
+    cached = st.session_state.get('filter_index_cache')
+    if cached is None or cached['df'] is not df or cached['rows'] != len(df):
+        cached = {'df': df, 'rows': len(df), 'index': build_filter_index(df)}
+        st.session_state['filter_index_cache'] = cached
+    return cached['index']
+
+
+# --- 7. ESTADO VERSIONADO Y CACHÉ DE AGREGADOS ---
+
+def bump_version(name: str):
+    """Incrementa la versión de un dato del session_state (tras cualquier cambio)."""
+    versions = st.session_state.setdefault(VERSIONS_KEY, {})
+    versions[name] = versions.get(name, 0) + 1
+    return versions[name]
+
+def get_version(name: str):
+    return st.session_state.get(VERSIONS_KEY, {}).get(name, 0)
+
+def set_state(name: str, value):
+    """Guarda un dato en el session_state y aumenta su versión."""
+    st.session_state[name] = value
+    bump_version(name)
+    return value
+
+def active_filter_tuple():
+    """Filtros del sidebar que afectan a los agregados."""
+    return (
+        st.session_state.get('filter_start_date'), st.session_state.get('filter_end_date'),
+        st.session_state.get('filter_type', FILTER_ALL), st.session_state.get('filter_member', FILTER_ALL)
+    )
+
+def cached_aggregate(name: str, deps: tuple, compute):
+    """
+    Devuelve el resultado en caché para (name, deps) o lo calcula con compute().
+    LRU acotada a AGGREGATE_CACHE_SIZE entradas por sesión.
+    """
+    cache = st.session_state.setdefault(AGGREGATE_CACHE_KEY, OrderedDict())
+    stats = st.session_state.setdefault(AGGREGATE_STATS_KEY, {'hits': 0, 'misses': 0})
+    key = (name, deps)
+    if key in cache:
+        cache.move_to_end(key)
+        stats['hits'] += 1
+        return cache[key]
+    stats['misses'] += 1
+    value = compute()
+    cache[key] = value
+    while len(cache) > AGGREGATE_CACHE_SIZE:
+        cache.popitem(last=False)
+    return value
+
+def aggregate_cache_stats():
+    """Contadores de aciertos/fallos de la caché de agregados."""
+    stats = st.session_state.get(AGGREGATE_STATS_KEY, {'hits': 0, 'misses': 0})
+    return {**stats, 'entries': len(st.session_state.get(AGGREGATE_CACHE_KEY, {}))}
+
+@profiler.timed()
+def compute_dashboard_aggregates(df_transactions, df_accounts, filters, budget_config, category_budgets, server_aggregates=None, account_flows=None, cube=None):
+    """
+    Calcula todos los agregados que muestra el dashboard (saldos, KPIs y datos de gráficos).
+    `filters` = (inicio, fin, tipo, miembro) como active_filter_tuple(). Los gráficos salen del cubo diario
+    (`cube`, ver get_rollup_cube; si falta se construye desde df_transactions).
+    `server_aggregates` (ver load_server_aggregates) sustituye a los que necesitan el historial completo
+    (saldos, totales, patrón semanal y gasto del período); sin ellos, esas cifras solo cubren lo cargado;
+    `account_flows` (p.ej. del libro de saldos) evita recorrer el historial para los saldos.
+    """
+    aggregates = {'balances': None, 'balances_error': None}
+    try:
+        flows = server_aggregates['account_flows'] if server_aggregates else account_flows
+        aggregates['balances'] = calculate_account_balances(df_transactions, df_accounts, flows=flows)
+    except Exception as e:
+        aggregates['balances_error'] = str(e)
+    if df_transactions.empty:
+        return aggregates
+    if cube is None:
+        daily = build_daily_cube(df_transactions)
+        cube = {'daily': daily, 'monthly': monthly_cube(daily), 'recurring': _recurring_rows(df_transactions)}
+
+    # KPIs: totales, gasto del período y patrón semanal desde el cubo (o del servidor); lo fijo solo mira las recurrentes
+    kpis = cube_kpis(cube, budget_config['period_start'], budget_config['period_end'])
+    recurring = compute_kpis(cube['recurring'])
+    kpis.update({key: recurring[key] for key in ['fixed_income', 'fixed_expense', 'fixed_surplus', 'recurring_projection']})
+    if server_aggregates:
+        kpis['period_spend_by_category'] = server_aggregates['period_spend_by_category']
+        kpis['period_spend'] = float(kpis['period_spend_by_category'].sum())
+        kpis.update(server_aggregates['totals'])
+        kpis['net'] = kpis['income'] - kpis['expense']
+    daily_budget, days_left, presupuesto_restante = calculate_daily_budget(
+        budget_config['period_start'], budget_config['period_end'], budget_config['budget_amount'], df_transactions, kpis=kpis
+    )
+    aggregates['kpis'] = {
+        'ingresos': kpis['income'], 'gastos': kpis['expense'], 'balance_total': kpis['net'],
+        'income_fixed': kpis['fixed_income'], 'expense_fixed': kpis['fixed_expense'], 'surplus_fixed': kpis['fixed_surplus'],
+        'daily_budget': daily_budget, 'days_left': days_left, 'presupuesto_restante': presupuesto_restante,
+    }
+    aggregates['recurring_projection'] = kpis['recurring_projection']
+
+    # Presupuesto por categoría (período global)
+    aggregates['budget_chart'] = None
+    if category_budgets:
+        spending_by_cat = kpis['period_spend_by_category']
+        budget_data = []
+        for category, budget in category_budgets.items():
+            if budget > 0.0:
+                spent = float(spending_by_cat.get(category, 0.0))
+                budget_data.append({'Categoría': category, 'Presupuesto': budget, 'Gastado': spent, 'Porcentaje': (spent / budget) * 100 if budget > 0 else 0, 'Excedido': spent > budget})
+        df_budget_chart = pd.DataFrame(budget_data)
+        if not df_budget_chart.empty:
+            df_budget_chart = df_budget_chart.sort_values(by='Gastado', ascending=False)
+        aggregates['budget_chart'] = df_budget_chart
+
+    # Patrón de gasto por día de la semana (historial completo)
+    dow_profile = kpis['dow_profile']
+    aggregates['day_pattern'] = None
+    if not dow_profile.empty:
+        df_gasto_promedio = dow_profile.rename('Gasto Promedio ($)').reset_index()
+        df_gasto_promedio['Día de la Semana'] = pd.Categorical(df_gasto_promedio['Día de la Semana'], categories=list(DAY_NAMES_MAP.values()), ordered=True)
+        aggregates['day_pattern'] = df_gasto_promedio
+
+    # Gráficos según filtros
+    df_filtered = slice_cube(cube['daily'], *filters)
+    aggregates['filtered_empty'] = df_filtered.empty
+    if df_filtered.empty:
+        return aggregates
+    df_gastos = df_filtered[df_filtered['Tipo'] == 'Gasto']
+    df_ingresos = df_filtered[df_filtered['Tipo'] == 'Ingreso']
+    gastos_por_cat = df_gastos.groupby('Categoría')['Monto'].sum()
+    aggregates['top5'] = gastos_por_cat.nlargest(5).reset_index() if not df_gastos.empty else None
+    aggregates['pie_gastos'] = gastos_por_cat.reset_index() if not df_gastos.empty else None
+    aggregates['pie_ingresos'] = df_ingresos.groupby('Categoría')['Monto'].sum().reset_index() if not df_ingresos.empty else None
+
+    df_flujo = df_filtered[df_filtered['Tipo'].isin(['Ingreso', 'Gasto'])]
+    aggregates['cash_flow'] = None
+    if not df_flujo.empty:
+        df_pivot = df_flujo.pivot_table(index=df_flujo['Día'].rename('Fecha_Dia'), columns='Tipo', values='Monto', aggfunc='sum').fillna(0)
+        if 'Ingreso' not in df_pivot.columns: df_pivot['Ingreso'] = 0.0
+        if 'Gasto' not in df_pivot.columns: df_pivot['Gasto'] = 0.0
+        df_pivot = df_pivot.reset_index()
+        df_pivot['Balance Neto'] = df_pivot['Ingreso'] - df_pivot['Gasto']
+        df_pivot['Balance Acumulado'] = df_pivot['Balance Neto'].cumsum()
+        aggregates['cash_flow'] = df_pivot
+    return aggregates
+
+
+
+# --- 8. ALMACÉN DE TRANSACCIONES (tipos compactos, vistas de solo lectura) ---
+
+def normalize_transactions(df: pd.DataFrame):
+    """
+    Convierte el historial a tipos compactos: categóricas para columnas repetitivas,
+    Monto float64, Fecha datetime64[ns] y Recurrente bool.
+    Las columnas que ya tienen el tipo correcto no se copian.
+    """
+    conversions = {
+        col: 'category' for col in TRANSACTION_CATEGORICAL_COLUMNS
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype)
+    }
+    if 'Monto' in df.columns and df['Monto'].dtype != 'float64':
+        df = df.assign(Monto=pd.to_numeric(df['Monto'], errors='coerce').astype('float64'))
+    if 'Fecha' in df.columns and df['Fecha'].dtype != 'datetime64[ns]':
+        df = df.assign(Fecha=pd.to_datetime(df['Fecha'], errors='coerce').astype('datetime64[ns]'))
+    if 'Recurrente' in df.columns and df['Recurrente'].dtype != 'bool':
+        df = df.assign(Recurrente=df['Recurrente'].astype(object).fillna(False).astype(bool))
+    return df.astype(conversions) if conversions else df
+
+def set_transactions(df: pd.DataFrame, delta=None):
+    """
+    Guarda el historial normalizado en el session_state (y aumenta su versión).
+    `delta` = (filas quitadas, filas añadidas) respecto al historial anterior mantiene el libro
+    de saldos, el cubo, los conteos de referencias y el motor de metas al día sin recalcularlos; sin delta se
+    reconstruyen la próxima vez que se lean.
+    """
+    ledger_current, cube_current, references_current = _is_current(LEDGER_KEY), _is_current(CUBE_KEY), _is_current(REFERENCES_KEY)
+    goals_current = _is_current(GOAL_ENGINE_KEY)
+    df = set_state('transactions_df', normalize_transactions(df))
+    if delta is not None:
+        if ledger_current:
+            apply_ledger_delta(*delta)
+        if cube_current:
+            apply_cube_delta(*delta)
+        if references_current:
+            apply_reference_delta(*delta)
+        if goals_current:
+            apply_goal_delta(*delta)
+    return df
+
+def get_transactions():
+    """
+    Vista de solo lectura del historial: con Copy-on-Write cualquier modificación
+    hecha sobre ella crea su propia copia y no altera el session_state.
+    """
+    return st.session_state.get('transactions_df', DEFAULT_TRANSACTIONS)
+
+def transactions_memory_usage(df: pd.DataFrame):
+    """Bytes totales y por transacción (incluye strings)."""
+    total = int(df.memory_usage(deep=True).sum())
+    return {'bytes': total, 'bytes_per_row': total / len(df) if len(df) else 0.0}
+
+
+
+# --- 9. CARGA INICIAL EN PARALELO ---
+
+@profiler.timed()
+def load_user_data(supabase_client: Client, user_id: str):
+    """
+    Carga todos los datos del usuario con las consultas en paralelo (hilos).
+    Las dos claves de configuración se leen en una sola consulta y del historial
+    solo se trae la ventana reciente (ver sección 10).
+    Devuelve (datos, tiempos en ms por tabla).
+    """
+    tasks = {
+        TRANSACTIONS_TABLE: lambda: load_recent_transactions(supabase_client, user_id),
+        ACCOUNTS_TABLE: lambda: load_data(supabase_client, ACCOUNTS_TABLE, user_id, DEFAULT_ACCOUNTS),
+        GOALS_TABLE: lambda: load_data(supabase_client, GOALS_TABLE, user_id, DEFAULT_GOALS),
+        CATEGORIES_TABLE: lambda: load_categories(supabase_client, user_id),
+        MEMBERS_TABLE: lambda: load_members(supabase_client, user_id),
+        CONFIG_TABLE: lambda: load_config_keys(supabase_client, user_id, {
+            BUDGET_KEY: _default_budget_config(), CATEGORY_BUDGET_KEY: dict(DEFAULT_CATEGORY_BUDGETS)
+        }),
+    }
+    # Los hilos necesitan el contexto de Streamlit para usar st.session_state / st.error
+    ctx = get_script_run_ctx(suppress_warning=True)
+    open_stages = profiler.current_stack() # Las cargas de cada hilo cuentan dentro de esta etapa
+    st.session_state.setdefault(SNAPSHOTS_KEY, {}) # Crear antes de que los hilos lo compartan
+    timings = {}
+
+    def run(name):
+        if ctx is not None:
+            add_script_run_ctx(ctx=ctx)
+        profiler.attach(open_stages)
+        start = time.perf_counter()
+        try:
+            result = tasks[name]()
+        finally:
+            profiler.attach(())
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    start_total = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=STARTUP_LOAD_WORKERS) as executor:
+        futures = {name: executor.submit(run, name) for name in tasks}
+        results = {name: future.result() for name, future in futures.items()}
+    timings['total'] = round((time.perf_counter() - start_total) * 1000, 1)
+
+    config = results.pop(CONFIG_TABLE)
+    results['budget_config'] = parse_budget_config(config[BUDGET_KEY])
+    results['category_budgets'] = config[CATEGORY_BUDGET_KEY]
+    return results, timings
+
+
+# --- 10. CARGA PAGINADA DEL HISTORIAL ---
+
+TRANSACTION_LOAD_COLUMNS = [ROW_ID_COLUMN] + list(DEFAULT_TRANSACTIONS.columns)
+
+def fetch_transaction_pages(supabase_client: Client, user_id: str, since=None, before=None, after=None, loaded=0,
+                            max_pages=None, stop_before=None, page_size=LOAD_PAGE_SIZE, progress=None):
+    """
+    Trae transacciones por páginas, de la más reciente a la más antigua y solo con las columnas necesarias.
+    `since`/`before` acotan Fecha en el servidor; `stop_before` corta en cuanto se pasa esa fecha.
+    Cada página sigue a la última fila de la anterior por la clave (Fecha, id), no por posición: las altas y
+    bajas entre páginas no desplazan filas. `after` = (Fecha, id) de la última fila de una carga anterior y
+    `loaded` las filas que ya trajo. `progress(cargadas, total)` se llama tras cada página.
+    Devuelve (filas, total del rango, completo).
+    """
+    backend = storage.get_backend(supabase_client)
+    filters = ([('Fecha', 'gte', since)] if since is not None else []) + ([('Fecha', 'lt', before)] if before is not None else [])
+    records, total, pages = [], None, 0
+    while max_pages is None or pages < max_pages:
+        page, count = backend.select(
+            TRANSACTIONS_TABLE, user_id, columns=TRANSACTION_LOAD_COLUMNS,
+            filters=filters + ([('Fecha', 'after_key', after)] if after is not None else []),
+            order=[('Fecha', True), (ROW_ID_COLUMN, False)], limit=page_size, count=pages == 0
+        )
+        if pages == 0:
+            total = loaded + count if count is not None else None
+        records.extend(page)
+        pages += 1
+        if progress:
+            progress(loaded + len(records), total)
+        # El conteo manda: el servidor puede devolver menos filas que page_size aunque queden más
+        if not page or (loaded + len(records) >= total if total is not None else len(page) < page_size):
+            return records, total, True
+        after = (page[-1]['Fecha'], page[-1][ROW_ID_COLUMN])
+        if stop_before is not None and str(page[-1]['Fecha']) < stop_before:
+            break
+    return records, total, False
+
+def history_loaded_from(user_id: str):
+    """Fecha (ISO) desde la que el historial está en memoria, o None si está completo."""
+    state = st.session_state.get(HISTORY_KEY)
+    if not state or state['user_id'] != user_id or state['complete']:
+        return None
+    return state['boundary']
+
+def history_covers(user_id: str, start_date=None):
+    """True si el historial en memoria ya incluye todo lo posterior a `start_date` (o todo, si es None)."""
+    state = st.session_state.get(HISTORY_KEY)
+    if not state or state['user_id'] != user_id or state['complete']:
+        return True
+    return start_date is not None and state['covered_from'] <= pd.Timestamp(start_date).strftime(DB_DATETIME_FORMAT)
+
+def history_progress():
+    """(filas antiguas cargadas, total antiguo o None) mientras falte historial; None si está completo."""
+    state = st.session_state.get(HISTORY_KEY)
+    if not state or state['complete']:
+        return None
+    return state['loaded'], state['total']
+
+@profiler.timed()
+def load_recent_transactions(supabase_client: Client, user_id: str, days: int = RECENT_WINDOW_DAYS):
+    """Carga solo la ventana reciente del historial; lo antiguo queda pendiente para load_older_transactions."""
+    boundary = (datetime.now().date() - timedelta(days=days)).strftime(DB_DATETIME_FORMAT)
+    st.session_state[HISTORY_KEY] = {'user_id': user_id, 'boundary': boundary, 'covered_from': boundary,
+                                     'after': None, 'loaded': 0, 'total': None, 'complete': False}
+    try:
+        records, _, _ = fetch_transaction_pages(supabase_client, user_id, since=boundary)
+        if not records:
+            set_snapshot(TRANSACTIONS_TABLE, user_id, pd.Series(dtype='uint64'))
+            return DEFAULT_TRANSACTIONS.copy()
+        df = _clean_loaded_frame(records, TRANSACTIONS_TABLE)
+        set_snapshot(TRANSACTIONS_TABLE, user_id, _loaded_hashes(records, df))
+        return df
+    except Exception as e:
+        st.error(f"Error al cargar datos de '{TRANSACTIONS_TABLE}': {e}")
+        set_snapshot(TRANSACTIONS_TABLE, user_id, None)
+        return DEFAULT_TRANSACTIONS.copy()
+
+@profiler.timed()
+def load_older_transactions(supabase_client: Client, user_id: str, until=None, max_pages=None, progress=None):
+    """
+    Añade a las transacciones en memoria más historial anterior a la ventana inicial.
+    Se detiene al completar el historial, tras `max_pages` páginas o en cuanto cubre la fecha `until`.
+    Devuelve True si el historial quedó completo.
+    """
+    state = st.session_state.get(HISTORY_KEY)
+    if not state or state['user_id'] != user_id or state['complete']:
+        return True
+    if until is not None and history_covers(user_id, until):
+        return False
+    stop_before = pd.Timestamp(until).strftime(DB_DATETIME_FORMAT) if until is not None else None
+    try:
+        records, total, complete = fetch_transaction_pages(
+            supabase_client, user_id, before=state['boundary'], after=state['after'], loaded=state['loaded'],
+            max_pages=max_pages, stop_before=stop_before, progress=progress
+        )
+    except Exception as e:
+        st.error(f"Error al cargar el historial antiguo: {e}")
+        return False
+    state.update(loaded=state['loaded'] + len(records), total=total, complete=complete)
+    if not records:
+        return complete
+    state['after'] = (records[-1]['Fecha'], records[-1][ROW_ID_COLUMN])
+    # Las filas de la última fecha con id mayor llegan en la siguiente página: se cubre desde el segundo siguiente
+    last_fecha = pd.Timestamp(records[-1]['Fecha']).tz_localize(None) + pd.Timedelta(seconds=1)
+    state['covered_from'] = min(state['covered_from'], last_fecha.strftime(DB_DATETIME_FORMAT))
+
+    df_old = _clean_loaded_frame(records, TRANSACTIONS_TABLE).drop_duplicates(subset=[ROW_ID_COLUMN])
+    df_current = get_transactions()
+    known_ids = pd.Index(df_current[ROW_ID_COLUMN].to_numpy(dtype=object), dtype=object) if ROW_ID_COLUMN in df_current.columns else pd.Index([], dtype=object)
+    # Una fila editada tras cargarse (cambio de Fecha) puede volver a llegar en una página posterior
+    df_old = df_old[~pd.Index(df_old[ROW_ID_COLUMN].to_numpy(dtype=object), dtype=object).isin(known_ids)]
+
+    snapshot = get_snapshot(TRANSACTIONS_TABLE, user_id)
+    if snapshot is not None:
+        new_hashes = _loaded_hashes(records, df_old)
+        new_hashes = new_hashes[~new_hashes.index.isin(snapshot.index) & ~new_hashes.index.duplicated()]
+        set_snapshot(TRANSACTIONS_TABLE, user_id, _concat_hashes(snapshot, new_hashes))
+    set_transactions(pd.concat([df_current, df_old], ignore_index=True), delta=(None, df_old))
+    return complete
+
+
+# --- 11. IMPORTACIÓN DE CSV POR TROZOS ---
+
+CSV_REQUIRED_COLUMNS = ['Fecha', 'Tipo', 'Categoría', 'Cuenta', 'Monto']
+CSV_OPTIONAL_DEFAULTS = {
+    'Descripción': '', 'Miembro': 'N/A', 'Destino': 'N/A',
+    'Recurrente': False, 'Frecuencia': 'Única/N/A'
+}
+
+def clean_csv_chunk(df: pd.DataFrame):
+    """Valida y convierte un trozo del CSV. Devuelve (filas válidas, nº de filas descartadas)."""
+    df.columns = [str(col).strip() for col in df.columns]
+    missing_critical = [col for col in CSV_REQUIRED_COLUMNS if col not in df.columns]
+    if missing_critical:
+        raise ValueError(f"El CSV no contiene las columnas críticas requeridas: {', '.join(missing_critical)}")
+    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
+    df['Monto'] = pd.to_numeric(df['Monto'], errors='coerce')
+    for col, default_val in CSV_OPTIONAL_DEFAULTS.items():
+        if col not in df.columns: df[col] = default_val
+        elif isinstance(default_val, bool): df[col] = df[col].fillna(default_val).astype(bool)
+        else: df[col] = df[col].fillna(default_val)
+    df = df.reindex(columns=list(DEFAULT_TRANSACTIONS.columns))
+    initial_rows = len(df)
+    df = df.dropna(subset=['Fecha', 'Monto', 'Tipo']).reset_index(drop=True)
+    return df, initial_rows - len(df)
+
+def _source_size(source):
+    """Tamaño en bytes del archivo (ruta, UploadedFile o cualquier objeto con seek), o None."""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    size = getattr(source, 'size', None)
+    if size is None and hasattr(source, 'seek'):
+        position = source.tell()
+        size = source.seek(0, os.SEEK_END)
+        source.seek(position)
+    return size
+
+def import_transactions_csv(supabase_client: Client, user_id: str, source, replace: bool = False,
+                            chunk_rows: int = CSV_CHUNK_ROWS, progress=None):
+    """
+    Importa un CSV de transacciones por trozos de `chunk_rows` filas: valida cada trozo,
+    sincroniza sus categorías/miembros/cuentas y lo inserta por lotes, sin tener nunca el
+    archivo entero en memoria. Con `replace` se borra antes el historial (tras validar el primer trozo).
+    `progress(filas importadas, fracción del archivo leída)` se llama tras cada trozo.
+    Al terminar se recarga el historial con la carga paginada.
+    Devuelve {'imported', 'dropped', 'chunks', 'metadata_changed'}.
+    """
+    backend = storage.get_backend(supabase_client)
+    summary = {'imported': 0, 'dropped': 0, 'chunks': 0, 'metadata_changed': False}
+    size = _source_size(source)
+    handle = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else source
+    wrote = False
+    try:
+        for chunk in pd.read_csv(handle, chunksize=chunk_rows):
+            df_chunk, dropped = clean_csv_chunk(chunk)
+            summary['dropped'] += dropped
+            summary['chunks'] += 1
+            if replace and summary['chunks'] == 1:
+                backend.delete(TRANSACTIONS_TABLE, user_id)
+                wrote = True
+            if not df_chunk.empty:
+                summary['metadata_changed'] |= sync_metadata_from_df(supabase_client, user_id, df_chunk)
+                ensure_row_ids(df_chunk)
+                df_db = _to_db_frame(df_chunk)
+                df_db['user_id'] = user_id
+                # Los registros JSON se generan por lote, no para el trozo entero
+                for start in range(0, len(df_db), SAVE_BATCH_SIZE):
+                    backend.insert(TRANSACTIONS_TABLE, _db_records(df_db.iloc[start:start + SAVE_BATCH_SIZE]))
+                    wrote = True
+                summary['imported'] += len(df_chunk)
+            if progress:
+                progress(summary['imported'], handle.tell() / size if size else 0.0)
+    finally:
+        if handle is not source:
+            handle.close()
+        if wrote:
+            # Lo que haya quedado en Supabase (aunque el import se cortara) pasa a ser el historial en memoria
+            set_transactions(load_recent_transactions(supabase_client, user_id))
+    return summary
+
+
+# --- 12. AGREGADOS EN LA BASE DE DATOS ---
+# Saldos, aportes a metas y gasto por categoría sumados por Supabase (RPC) o SQLite,
+# para no depender del historial completo en memoria.
+
+def _load_aggregate(supabase_client: Client, user_id: str, name: str, **params):
+    """Filas del agregado o None si la base de datos no pudo calcularlo (p.ej. funciones RPC sin instalar)."""
+    try:
+        return storage.get_backend(supabase_client).aggregate(name, user_id, **params)
+    except Exception as e:
+        st.warning(f"No se pudo calcular '{name}' en la base de datos: {e}")
+        return None
+
+@profiler.timed()
+def load_account_flows(supabase_client: Client, user_id: str):
+    """Entradas, salidas y transferencias recibidas por nombre (Nombre, Entradas, Salidas, Entradas_T), o None."""
+    rows = _load_aggregate(supabase_client, user_id, 'account_flows')
+    if rows is None:
+        return None
+    df = pd.DataFrame(rows, columns=['nombre', 'entradas', 'salidas', 'entradas_t'])
+    df.columns = ['Nombre', 'Entradas', 'Salidas', 'Entradas_T']
+    return df.astype({'Entradas': 'float64', 'Salidas': 'float64', 'Entradas_T': 'float64'})
+
+@profiler.timed()
+def load_goal_contributions(supabase_client: Client, user_id: str):
+    """Total transferido a cada destino (Nombre, Monto Calculado), o None."""
+    rows = _load_aggregate(supabase_client, user_id, 'goal_contributions')
+    if rows is None:
+        return None
+    df = pd.DataFrame(rows, columns=['nombre', 'aportado'])
+    df.columns = ['Nombre', 'Monto Calculado']
+    return df.astype({'Monto Calculado': 'float64'})
+
+@profiler.timed()
+def load_category_spend(supabase_client: Client, user_id: str, start_date, end_date):
+    """Gasto por categoría entre dos fechas (ambas incluidas) como Series indexada por Categoría, o None."""
+    start = pd.Timestamp(start_date).strftime(DB_DATETIME_FORMAT)
+    end = (pd.Timestamp(end_date) + timedelta(days=1)).strftime(DB_DATETIME_FORMAT)
+    rows = _load_aggregate(supabase_client, user_id, 'category_spend', start=start, end=end)
+    if rows is None:
+        return None
+    return pd.Series({row['categoria']: float(row['monto']) for row in rows}, dtype='float64').rename_axis('Categoría')
+
+@profiler.timed()
+def load_history_totals(supabase_client: Client, user_id: str):
+    """Ingresos y gastos totales y gasto promedio por día de la semana (como en cube_kpis), o None."""
+    totals = _load_aggregate(supabase_client, user_id, 'type_totals')
+    weekdays = _load_aggregate(supabase_client, user_id, 'weekday_spend')
+    if totals is None or weekdays is None:
+        return None
+    by_type = {row['tipo']: float(row['monto'] or 0.0) for row in totals}
+    day_names = list(DAY_NAMES_MAP.values())
+    weekdays = sorted((int(row['dia']), float(row['monto'] or 0.0), int(row['n'])) for row in weekdays if row['n'])
+    dow_profile = pd.Series([monto / n for _, monto, n in weekdays], index=pd.Index([day_names[dia] for dia, _, _ in weekdays], name='Día de la Semana'), dtype='float64')
+    return {'income': by_type.get('Ingreso', 0.0), 'expense': by_type.get('Gasto', 0.0), 'dow_profile': dow_profile}
+
+@profiler.timed()
+def load_server_aggregates(supabase_client: Client, user_id: str, budget_config: dict):
+    """Agregados del dashboard que dependen de todo el historial (saldos, totales, patrón semanal y gasto del período), o None si alguno falla."""
+    flows = load_account_flows(supabase_client, user_id)
+    spend = load_category_spend(supabase_client, user_id, budget_config['period_start'], budget_config['period_end'])
+    totals = load_history_totals(supabase_client, user_id)
+    if flows is None or spend is None or totals is None:
+        return None
+    return {'account_flows': flows, 'period_spend_by_category': spend, 'totals': totals}
+
+
+# --- 13. LIBRO DE SALDOS INCREMENTAL ---
+# Sumas por cuenta/destino que se ajustan con cada alta, edición o borrado en lugar de
+# recorrer todo el historial en cada render. Va ligado a la versión de 'transactions_df':
+# si el historial cambió sin delta (carga, importación, reemplazo) se reconstruye al leerlo.
+
+def transaction_flows(df: pd.DataFrame):
+    """Entradas (Ingreso por Cuenta), salidas (Gasto/Transferencia por Cuenta) y transferencias recibidas (por Destino), indexadas por nombre."""
+    if df is None or df.empty or 'Tipo' not in df.columns:
+        return pd.DataFrame(columns=LEDGER_COLUMNS, dtype='float64')
+    tipo = df['Tipo'].astype(object).to_numpy()
+    monto = pd.to_numeric(df['Monto'], errors='coerce').fillna(0.0).to_numpy(dtype='float64')
+    cuenta = df['Cuenta'].astype(object).to_numpy()
+    destino = df['Destino'].astype(object).to_numpy() if 'Destino' in df.columns else np.full(len(df), None, dtype=object)
+    is_transfer = tipo == 'Transferencia'
+    parts = {
+        'Entradas': pd.Series(monto[tipo == 'Ingreso']).groupby(cuenta[tipo == 'Ingreso']).sum(),
+        'Salidas': pd.Series(monto[(tipo == 'Gasto') | is_transfer]).groupby(cuenta[(tipo == 'Gasto') | is_transfer]).sum(),
+        'Entradas_T': pd.Series(monto[is_transfer]).groupby(destino[is_transfer]).sum(),
+    }
+    return pd.DataFrame(parts).reindex(columns=LEDGER_COLUMNS).fillna(0.0).astype('float64')
+
+def _is_current(key: str):
+    """True si el dato derivado del historial (libro, cubo) corresponde a la versión actual de 'transactions_df'."""
+    derived = st.session_state.get(key)
+    return derived is not None and derived['version'] == get_version('transactions_df')
+
+def rebuild_balance_ledger():
+    """Recalcula el libro desde el historial completo en memoria."""
+    st.session_state[LEDGER_KEY] = {'version': get_version('transactions_df'), 'flows': transaction_flows(get_transactions())}
+    return st.session_state[LEDGER_KEY]['flows']
+
+def apply_ledger_delta(removed: pd.DataFrame = None, added: pd.DataFrame = None):
+    """Resta las filas quitadas y suma las añadidas (solo recorre esas filas)."""
+    flows = st.session_state[LEDGER_KEY]['flows']
+    if removed is not None and not removed.empty:
+        flows = flows.sub(transaction_flows(removed), fill_value=0.0)
+    if added is not None and not added.empty:
+        flows = flows.add(transaction_flows(added), fill_value=0.0)
+    st.session_state[LEDGER_KEY] = {'version': get_version('transactions_df'), 'flows': flows}
+
+def ledger_account_flows():
+    """Flujos del libro en el formato de calculate_account_balances (Nombre, Entradas, Salidas, Entradas_T)."""
+    flows = st.session_state[LEDGER_KEY]['flows'] if _is_current(LEDGER_KEY) else rebuild_balance_ledger()
+    return flows.rename_axis('Nombre').reset_index()
+
+def transaction_changes(df_old: pd.DataFrame, df_new: pd.DataFrame):
+    """
+    (filas quitadas, filas añadidas) entre dos versiones del historial, comparando por id
+    (una edición cuenta como quitar la versión anterior y añadir la nueva).
+    Asigna id a las filas nuevas de `df_new` que no lo tengan.
+    """
+    ensure_row_ids(df_new)
+    if df_old.empty or ROW_ID_COLUMN not in df_old.columns or df_old[ROW_ID_COLUMN].isna().any():
+        return df_old, df_new
+    upsert_ids, delete_ids = diff_rows(_row_hashes(df_old), _row_hashes(df_new))
+    old_ids = pd.Index(df_old[ROW_ID_COLUMN].to_numpy(dtype=object), dtype=object)
+    new_ids = pd.Index(df_new[ROW_ID_COLUMN].to_numpy(dtype=object), dtype=object)
+    return df_old[old_ids.isin(delete_ids.union(upsert_ids))], df_new[new_ids.isin(upsert_ids)]
+
+def _insert_sorted(frame: pd.DataFrame, rows: pd.DataFrame, column: str, descending: bool = False):
+    """Inserta `rows` en `frame` (ambos ordenados por `column`) sin reordenar todo; a igual valor, las de `frame` primero."""
+    if rows.empty:
+        return frame.reset_index(drop=True)
+    rows = rows.sort_values(by=column, ascending=not descending, kind='stable')
+    values, new_values = frame[column].to_numpy(), rows[column].to_numpy()
+    if descending:
+        positions = len(values) - np.searchsorted(values[::-1], new_values, side='left')
+    else:
+        positions = np.searchsorted(values, new_values, side='right')
+    if positions[0] == positions[-1]:
+        # Todas van al mismo hueco (p.ej. un alta con la fecha más reciente): se unen los dos tramos sin reindexar
+        at = int(positions[0])
+        return pd.concat([frame.iloc[:at], rows, frame.iloc[at:]], ignore_index=True)
+    take = np.insert(np.arange(len(frame)), positions, len(frame) + np.arange(len(rows)))
+    return pd.concat([frame, rows], ignore_index=True).iloc[take].reset_index(drop=True)
+
+def _match_store_dtypes(df: pd.DataFrame, rows: pd.DataFrame):
+    """
+    (historial, filas) con los mismos tipos: las categorías nuevas de `rows` se añaden a las del historial
+    (sin recodificarlo) para que al unirlos las columnas sigan siendo categóricas.
+    """
+    rows = normalize_transactions(rows.reindex(columns=df.columns))
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            new_categories = pd.Index(_distinct(rows[col])).difference(df[col].cat.categories)
+            if len(new_categories):
+                df = df.assign(**{col: df[col].cat.add_categories(new_categories)})
+            rows[col] = pd.Categorical(rows[col].astype(object), dtype=df[col].dtype)
+        elif rows[col].dtype != df[col].dtype:
+            try:
+                rows[col] = rows[col].astype(df[col].dtype)
+            except (TypeError, ValueError):
+                pass
+    return df, rows
+
+def apply_transaction_changes(df: pd.DataFrame, removed: pd.DataFrame, added: pd.DataFrame):
+    """
+    Historial nuevo a partir de (filas quitadas, filas añadidas) de transaction_changes: quita por id e inserta
+    en su sitio por Fecha (descendente). No reordena, no recalcula huellas ni reconvierte tipos del historial.
+    """
+    if removed is not None and not removed.empty:
+        ids = pd.Index(df[ROW_ID_COLUMN].to_numpy(dtype=object), dtype=object)
+        df = df[~ids.isin(removed[ROW_ID_COLUMN].to_numpy(dtype=object))]
+    if added is None or added.empty:
+        return df.reset_index(drop=True)
+    df, added = _match_store_dtypes(df, added)
+    return _insert_sorted(df, added, 'Fecha', descending=True)
+
+
+# --- 14. CUBO DE AGREGADOS DIARIOS ---
+# Los gráficos y filtros del dashboard se responden desde totales por día y dimensión:
+# su coste depende de días x combinaciones, no del número de transacciones.
+# Igual que el libro de saldos, se ajusta con el delta de set_transactions o se reconstruye.
+
+def build_daily_cube(df: pd.DataFrame):
+    """Monto y número de transacciones por (Día, Tipo, Categoría, Miembro, Cuenta), ordenado por día."""
+    columns = ['Día'] + CUBE_DIMENSIONS + ['Monto', 'N']
+    if df is None or df.empty or 'Fecha' not in df.columns:
+        return pd.DataFrame({c: pd.Series(dtype='datetime64[ns]' if c == 'Día' else 'float64' if c == 'Monto' else 'int64' if c == 'N' else 'object') for c in columns})
+    keys = {'Día': pd.to_datetime(df['Fecha'], errors='coerce').dt.normalize().to_numpy(dtype='datetime64[ns]')}
+    for col in CUBE_DIMENSIONS:
+        keys[col] = df[col].astype(object).to_numpy() if col in df.columns else np.full(len(df), None, dtype=object)
+    frame = pd.DataFrame(keys)
+    frame['Monto'] = pd.to_numeric(df['Monto'], errors='coerce').fillna(0.0).to_numpy(dtype='float64')
+    frame['N'] = 1
+    return _regroup_cube(frame.dropna(subset=['Día']), ['Día'] + CUBE_DIMENSIONS)
+
+def _regroup_cube(frame: pd.DataFrame, keys: list):
+    cube = frame.groupby(keys, dropna=False, sort=True, observed=True)[['Monto', 'N']].sum().reset_index()
+    return cube[cube['N'] != 0].reset_index(drop=True)
+
+def monthly_cube(daily: pd.DataFrame):
+    """Resumen mensual (Mes = primer día del mes) derivado del cubo diario."""
+    frame = daily.drop(columns=['Día']).assign(Mes=daily['Día'].to_numpy(dtype='datetime64[M]').astype('datetime64[ns]'))
+    return _regroup_cube(frame, ['Mes'] + CUBE_DIMENSIONS)
+
+def _recurring_rows(df: pd.DataFrame):
+    """Solo las transacciones recurrentes (las únicas que cuentan para el flujo fijo), con las columnas que usa compute_kpis."""
+    if df is None or df.empty or 'Recurrente' not in df.columns:
+        return DEFAULT_TRANSACTIONS.assign(**{ROW_ID_COLUMN: pd.Series(dtype='object')})
+    columns = [c for c in [ROW_ID_COLUMN, 'Fecha', 'Tipo', 'Monto', 'Recurrente', 'Frecuencia'] if c in df.columns]
+    return df.loc[df['Recurrente'].to_numpy() == True, columns]
+
+def rebuild_daily_cube():
+    df = get_transactions()
+    st.session_state[CUBE_KEY] = {'version': get_version('transactions_df'), 'daily': build_daily_cube(df), 'monthly': None, 'recurring': _recurring_rows(df)}
+    return st.session_state[CUBE_KEY]
+
+def apply_cube_delta(removed: pd.DataFrame = None, added: pd.DataFrame = None):
+    """Resta las filas quitadas y suma las añadidas; solo se reagrupan los días afectados."""
+    cube = st.session_state[CUBE_KEY]
+    removed = removed if removed is not None and not removed.empty else None
+    added = added if added is not None and not added.empty else None
+    if any(frame is not None and (ROW_ID_COLUMN not in frame.columns or frame[ROW_ID_COLUMN].isna().any()) for frame in (removed, added)):
+        st.session_state.pop(CUBE_KEY, None) # Sin ids no se sabe qué recurrentes quitar después: se reconstruye al leer
+        return
+    parts = []
+    if removed is not None:
+        negative = build_daily_cube(removed)
+        parts.append(negative.assign(Monto=-negative['Monto'], N=-negative['N']))
+    if added is not None:
+        parts.append(build_daily_cube(added))
+    daily, recurring = cube['daily'], cube['recurring']
+    if parts:
+        days = pd.concat([part['Día'] for part in parts]).unique()
+        if len(days) == 1:
+            # Un solo día (el caso de un alta): su tramo del cubo ordenado se localiza por búsqueda binaria
+            start, end = daily['Día'].searchsorted(days[0], side='left'), daily['Día'].searchsorted(days[0], side='right')
+            regrouped = _regroup_cube(pd.concat([daily.iloc[start:end]] + parts, ignore_index=True), ['Día'] + CUBE_DIMENSIONS)
+            daily = pd.concat([daily.iloc[:start], regrouped, daily.iloc[end:]], ignore_index=True)
+        else:
+            touched = daily['Día'].isin(days)
+            regrouped = _regroup_cube(pd.concat([daily[touched]] + parts, ignore_index=True), ['Día'] + CUBE_DIMENSIONS)
+            daily = _insert_sorted(daily[~touched], regrouped, 'Día')
+    if removed is not None:
+        recurring = recurring[~recurring[ROW_ID_COLUMN].isin(removed[ROW_ID_COLUMN])]
+    if added is not None:
+        new_recurring = _recurring_rows(added)
+        if not new_recurring.empty:
+            recurring = pd.concat([recurring, new_recurring], ignore_index=True)
+    st.session_state[CUBE_KEY] = {'version': get_version('transactions_df'), 'daily': daily, 'monthly': None, 'recurring': recurring}
+
+def get_rollup_cube():
+    """
+    {'daily', 'monthly', 'recurring'} al día con el historial (se reconstruye si cambió sin delta;
+    el mensual se deriva al pedirlo). 'recurring' son solo las transacciones recurrentes.
+    """
+    cube = st.session_state[CUBE_KEY] if _is_current(CUBE_KEY) else rebuild_daily_cube()
+    if cube['monthly'] is None:
+        cube['monthly'] = monthly_cube(cube['daily'])
+    return cube
+
+def slice_cube(daily: pd.DataFrame, start_date=None, end_date=None, tipo=FILTER_ALL, miembro=FILTER_ALL):
+    """Filas del cubo que cumplen los filtros del sidebar (rango de días por búsqueda binaria)."""
+    dias = daily['Día'].to_numpy(dtype='datetime64[ns]')
+    start, end = _day_bounds(start_date, end_date)
+    lo = 0 if np.isnat(start) else np.searchsorted(dias, start, side='left')
+    hi = len(dias) if np.isnat(end) else np.searchsorted(dias, end, side='left')
+    sliced = daily.iloc[lo:hi]
+    if tipo is not None and tipo != FILTER_ALL:
+        sliced = sliced[sliced['Tipo'] == tipo]
+    if miembro is not None and miembro != FILTER_ALL:
+        sliced = sliced[sliced['Miembro'] == miembro]
+    return sliced
+
+def cube_kpis(cube: dict, period_start=None, period_end=None):
+    """Las métricas de compute_kpis que no dependen de la recurrencia, calculadas desde el cubo."""
+    daily = cube['daily']
+    kpis = compute_kpis(DEFAULT_TRANSACTIONS)
+    totals = cube['monthly'].groupby('Tipo')['Monto'].sum()
+    kpis['income'], kpis['expense'] = float(totals.get('Ingreso', 0.0)), float(totals.get('Gasto', 0.0))
+    kpis['net'] = kpis['income'] - kpis['expense']
+    if period_start and period_end:
+        in_period = slice_cube(daily, period_start, period_end, tipo='Gasto')
+        if not in_period.empty:
+            kpis['period_spend_by_category'] = in_period.groupby('Categoría', sort=False)['Monto'].sum()
+            kpis['period_spend'] = float(in_period['Monto'].sum())
+    gastos = daily[daily['Tipo'] == 'Gasto']
+    if not gastos.empty:
+        dow = (gastos['Día'].to_numpy(dtype='datetime64[D]').astype('int64') + 3) % 7
+        sums = np.bincount(dow, weights=gastos['Monto'].to_numpy(), minlength=7)
+        counts = np.bincount(dow, weights=gastos['N'].to_numpy(), minlength=7)
+        present = counts > 0
+        kpis['dow_profile'] = pd.Series(sums[present] / counts[present], index=pd.Index(np.array(list(DAY_NAMES_MAP.values()))[present], name='Día de la Semana'))
+    return kpis
+
+
+# --- 15. CACHÉ COMPARTIDA ENTRE SESIONES (datos de referencia) ---
+# Cuentas, categorías, miembros y configuración cambian poco y los miembros de un mismo hogar
+# los leen con el mismo user_id: se guardan una vez por proceso (con TTL) y no una vez por sesión.
+# Las entradas se agrupan por (backend, user_id) y cualquier escritura de la tabla las invalida.
+
+@st.cache_resource
+def _shared_cache_store():
+    """Almacén del proceso: usuarios en orden LRU, contadores y un lock global."""
+    return {'lock': threading.Lock(), 'users': OrderedDict(), 'stats': {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}}
+
+def _cache_owner(supabase_client):
+    """El objeto que identifica los datos (el cliente envuelto o el propio backend)."""
+    backend = storage.get_backend(supabase_client)
+    return backend.client if isinstance(backend, storage.SupabaseBackend) else backend
+
+def _deep_sizeof(value):
+    """Tamaño aproximado en bytes de DataFrames/Series y de listas/dicts de valores simples."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_sizeof(k) + _deep_sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_deep_sizeof(v) for v in value)
+    return size
+
+def _shared_user_entry(store: dict, owner, user_id: str):
+    """Entrada del usuario (la crea y expulsa la menos usada si se pasa de SHARED_CACHE_MAX_USERS). Con el lock tomado."""
+    key = (id(owner), user_id)
+    entry = store['users'].get(key)
+    if entry is None or entry['owner'] is not owner:
+        # La entrada guarda el owner: su id no puede reutilizarse mientras siga en la caché
+        entry = {'owner': owner, 'user_id': user_id, 'loads': {}, 'values': {}, 'generations': {}}
+        store['users'][key] = entry
+        while len(store['users']) > SHARED_CACHE_MAX_USERS:
+            store['users'].popitem(last=False)
+            store['stats']['evictions'] += 1
+    store['users'].move_to_end(key)
+    return entry
+
+def shared_cached(supabase_client, user_id: str, table_name: str, key: tuple, load):
+    """
+    Valor de (tabla, key) para el usuario desde la caché del proceso, o load() si no está o caducó.
+    Las sesiones que piden el mismo (usuario, tabla, key) esperan a una sola carga; las demás tablas
+    se cargan en paralelo. El valor es compartido: no modificarlo.
+    """
+    if SHARED_CACHE_TTL_SECONDS <= 0:
+        return load()
+    store = _shared_cache_store()
+    owner = _cache_owner(supabase_client)
+    with store['lock']:
+        entry = _shared_user_entry(store, owner, user_id)
+        load_lock = entry['loads'].setdefault((table_name, key), threading.Lock())
+    with load_lock: # Solo serializa las cargas del mismo (usuario, tabla, key)
+        with store['lock']:
+            cached = entry['values'].get((table_name, key))
+            if cached is not None and cached['expires'] > time.monotonic():
+                store['stats']['hits'] += 1
+                return cached['value']
+            store['stats']['misses'] += 1
+            generation = entry['generations'].get(table_name, 0)
+        value = load()
+        with store['lock']:
+            # Si otra sesión escribió la tabla durante la carga, el valor puede ser viejo: no se guarda
+            if entry['generations'].get(table_name, 0) == generation:
+                entry['values'][(table_name, key)] = {'value': value, 'expires': time.monotonic() + SHARED_CACHE_TTL_SECONDS, 'bytes': _deep_sizeof(value)}
+        return value
+
+def invalidate_shared_cache(supabase_client, user_id: str, table_name: str = None):
+    """Olvida lo guardado de una tabla (o de todas) para el usuario, tras escribir en ella."""
+    if table_name is not None and table_name not in SHARED_CACHE_TABLES:
+        return
+    store = _shared_cache_store()
+    with store['lock']:
+        entry = store['users'].get((id(_cache_owner(supabase_client)), user_id))
+        if entry is None:
+            return
+        for table in ([table_name] if table_name else SHARED_CACHE_TABLES):
+            entry['generations'][table] = entry['generations'].get(table, 0) + 1
+        entry['values'] = {k: v for k, v in entry['values'].items() if table_name is not None and k[0] != table_name}
+        store['stats']['invalidations'] += 1
+
+def clear_shared_cache():
+    """Vacía la caché del proceso y sus contadores."""
+    store = _shared_cache_store()
+    with store['lock']:
+        store['users'].clear()
+        store['stats'].update({name: 0 for name in store['stats']})
+
+def shared_cache_stats():
+    """Contadores, número de usuarios y memoria aproximada (bytes) de lo que sigue vigente, en total y por usuario."""
+    store = _shared_cache_store()
+    now = time.monotonic()
+    with store['lock']:
+        per_user = {}
+        for entry in store['users'].values():
+            live = [v['bytes'] for v in entry['values'].values() if v['expires'] > now]
+            if live:
+                per_user[entry['user_id']] = per_user.get(entry['user_id'], 0) + sum(live)
+        return {**store['stats'], 'users': len(per_user), 'bytes': sum(per_user.values()), 'bytes_per_user': per_user}
+
+
+# --- 16. HISTORIAL PAGINADO ---
+# El editor solo recibe la página visible. El orden (con búsqueda) se calcula una vez por
+# versión del historial y se guarda en la caché de agregados; cada página es un corte de ese orden.
+
+def history_search_mask(df: pd.DataFrame, text: str):
+    """Filas donde alguna columna de texto contiene `text` (sin distinguir mayúsculas). Las categóricas se buscan en sus categorías."""
+    text = text.strip().lower()
+    mask = np.zeros(len(df), dtype=bool)
+    for col in [c for c in HISTORY_SEARCH_COLUMNS if c in df.columns]:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            hits = np.flatnonzero(values.cat.categories.astype(str).str.lower().str.contains(text, regex=False))
+            mask |= np.isin(values.cat.codes.to_numpy(), hits)
+        else:
+            mask |= values.astype(str).str.lower().str.contains(text, regex=False, na=False).to_numpy(dtype=bool)
+    return mask
+
+def _sort_keys(values: pd.Series):
+    """Claves de orden: las categóricas por su texto (no por el orden de sus categorías); los nulos al final."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        labels = values.cat.categories.astype(str).to_numpy()
+        ranks = np.empty(len(labels), dtype='int64')
+        ranks[np.argsort(labels, kind='stable')] = np.arange(len(labels))
+        codes = values.cat.codes.to_numpy()
+        return pd.Series(np.where(codes >= 0, ranks[np.maximum(codes, 0)], -1)).where(codes >= 0)
+    return values.reset_index(drop=True)
+
+def history_order(df: pd.DataFrame, sort_column: str = 'Fecha', ascending: bool = False, search: str = ''):
+    """Posiciones del historial (que cumplen la búsqueda) en el orden pedido. Empates: orden del historial."""
+    positions = np.flatnonzero(history_search_mask(df, search)) if search.strip() else np.arange(len(df))
+    if sort_column not in df.columns:
+        return positions
+    keys = _sort_keys(df[sort_column].iloc[positions])
+    order = keys.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+    return positions[order]
+
+def get_history_order(sort_column: str = 'Fecha', ascending: bool = False, search: str = ''):
+    """history_order del historial actual, en caché mientras no cambien el historial, el orden ni la búsqueda."""
+    deps = (get_version('transactions_df'), sort_column, ascending, search.strip().lower())
+    return cached_aggregate('history_order', deps, lambda: history_order(get_transactions(), sort_column, ascending, search))
+
+def history_page(df: pd.DataFrame, order: np.ndarray, page: int, page_size: int):
+    """Filas de la página `page` (desde 0) según `order`; cuesta lo mismo sea cual sea el tamaño del historial."""
+    start = max(page, 0) * page_size
+    return df.iloc[order[start:start + page_size]]
+
+def history_page_changes(df_page: pd.DataFrame, edited: pd.DataFrame, deleted_ids=()):
+    """
+    (filas quitadas, filas añadidas) de una página del editor, comparando por id solo contra la página mostrada:
+    las filas editadas cuentan como quitar la original y añadir la nueva, las nuevas (sin id) se añaden
+    y las marcadas o quitadas de la página se borran. Cuesta lo mismo sea cual sea el tamaño del historial.
+    """
+    edited = edited.copy()
+    ensure_row_ids(edited)
+    deleted = pd.Index(list(deleted_ids), dtype=object)
+    kept = edited[~pd.Index(edited[ROW_ID_COLUMN].to_numpy(dtype=object), dtype=object).isin(deleted)]
+    return transaction_changes(df_page, kept[[c for c in df_page.columns if c in kept.columns]])
+
+
+# --- 17. CONTEOS DE REFERENCIAS ---
+# Cuántas transacciones usan cada valor de Cuenta, Categoría, Miembro y Destino, como dicts
+# {valor: n}: comprobar si algo se puede borrar es una búsqueda, no un recorrido del historial.
+
+def count_references(df: pd.DataFrame):
+    """{columna: {valor: nº de transacciones}} (solo valores usados)."""
+    counts = {}
+    for col in REFERENCE_COLUMNS:
+        if col not in df.columns:
+            counts[col] = {}
+            continue
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes = values.cat.codes.to_numpy()
+            totals = np.bincount(codes[codes >= 0], minlength=len(values.cat.categories))
+            counts[col] = {value: int(n) for value, n in zip(values.cat.categories.tolist(), totals.tolist()) if n}
+        else:
+            counts[col] = {value: int(n) for value, n in values.value_counts().items()}
+    return counts
+
+def rebuild_reference_counts():
+    st.session_state[REFERENCES_KEY] = {'version': get_version('transactions_df'), 'counts': count_references(get_transactions())}
+    return st.session_state[REFERENCES_KEY]['counts']
+
+def apply_reference_delta(removed: pd.DataFrame = None, added: pd.DataFrame = None):
+    """Resta los usos de las filas quitadas y suma los de las añadidas (solo recorre esas filas)."""
+    counts = {col: dict(values) for col, values in st.session_state[REFERENCES_KEY]['counts'].items()}
+    for frame, sign in [(removed, -1), (added, 1)]:
+        if frame is None or frame.empty:
+            continue
+        for col, values in count_references(frame).items():
+            column_counts = counts[col]
+            for value, n in values.items():
+                total = column_counts.get(value, 0) + sign * n
+                if total > 0:
+                    column_counts[value] = total
+                else:
+                    column_counts.pop(value, None)
+    st.session_state[REFERENCES_KEY] = {'version': get_version('transactions_df'), 'counts': counts}
+
+def get_reference_counts():
+    """Conteos al día con el historial (se reconstruyen si cambió sin delta)."""
+    return st.session_state[REFERENCES_KEY]['counts'] if _is_current(REFERENCES_KEY) else rebuild_reference_counts()
+
+def reference_count(value, columns):
+    """Transacciones que usan `value` en alguna de `columns` (p.ej. una cuenta como Cuenta y como Destino)."""
+    counts = get_reference_counts()
+    return sum(counts[col].get(value, 0) for col in columns)
+
+
+# --- 18. MOTOR DE METAS ---
+# Aportes a cada meta por mes (transferencias con Destino = meta), ajustados por delta como el libro:
+# el total de cada meta, su ritmo de aporte reciente y su fecha proyectada salen de esta serie
+# (una fila por meta y mes), no del historial.
+
+def _goal_transfers(df: pd.DataFrame):
+    """(Destino, Monto, Fecha) de las transferencias; Destino conserva su tipo (categórico en el historial)."""
+    is_transfer = (df['Tipo'] == 'Transferencia').to_numpy()
+    monto = pd.to_numeric(df['Monto'], errors='coerce').fillna(0.0)[is_transfer]
+    return df['Destino'][is_transfer], monto.astype('float64'), df['Fecha'][is_transfer]
+
+def goal_contribution_months(df: pd.DataFrame):
+    """Transferencias sumadas por (Destino, Mes); el mes es un entero (meses desde 1970-01)."""
+    if df is None or df.empty or 'Tipo' not in df.columns or 'Destino' not in df.columns:
+        return pd.Series(dtype='float64', index=pd.MultiIndex.from_arrays([[], []], names=['Destino', 'Mes']))
+    destino, monto, fecha = _goal_transfers(df)
+    months = pd.to_datetime(fecha, errors='coerce').to_numpy()
+    valid = ~np.isnat(months)
+    months = months[valid].astype('datetime64[M]').astype('int64')
+    monthly = monto[valid].groupby([destino[valid].to_numpy(), months], observed=True).sum()
+    return monthly.rename_axis(['Destino', 'Mes'])
+
+def goal_totals(monthly: pd.Series):
+    """Aporte total por destino a partir de la serie mensual."""
+    return monthly.groupby(level='Destino').sum()
+
+def rebuild_goal_engine():
+    """Recalcula los aportes mensuales desde el historial completo en memoria."""
+    st.session_state[GOAL_ENGINE_KEY] = {'version': get_version('transactions_df'), 'monthly': goal_contribution_months(get_transactions())}
+    return st.session_state[GOAL_ENGINE_KEY]['monthly']
+
+def apply_goal_delta(removed: pd.DataFrame = None, added: pd.DataFrame = None):
+    """Resta las transferencias quitadas y suma las añadidas (solo recorre esas filas)."""
+    monthly = st.session_state[GOAL_ENGINE_KEY]['monthly']
+    if removed is not None and not removed.empty:
+        monthly = monthly.sub(goal_contribution_months(removed), fill_value=0.0)
+    if added is not None and not added.empty:
+        monthly = monthly.add(goal_contribution_months(added), fill_value=0.0)
+    # Los meses que quedan en cero se quitan: el primer mes de aporte de cada meta sigue siendo exacto
+    st.session_state[GOAL_ENGINE_KEY] = {'version': get_version('transactions_df'), 'monthly': monthly[~np.isclose(monthly.to_numpy(), 0.0)]}
+
+def get_goal_engine():
+    """Aportes por (Destino, Mes) al día con el historial (se reconstruyen si cambió sin delta)."""
+    return st.session_state[GOAL_ENGINE_KEY]['monthly'] if _is_current(GOAL_ENGINE_KEY) else rebuild_goal_engine()
+
+def engine_goal_contributions():
+    """Aporte total por destino (Nombre, Monto Calculado), para update_goal_progress."""
+    totals = goal_totals(get_goal_engine())
+    return pd.DataFrame({'Nombre': totals.index.astype(object), 'Monto Calculado': totals.to_numpy()})
+
+def goal_progress(df_goals: pd.DataFrame, user_id: str = None, today=None):
+    """
+    Progreso de todas las metas a la vez: % cumplido, días restantes, aporte mensual estimado
+    (últimos GOAL_RATE_MONTHS meses, o desde el primer aporte si es más reciente) y fecha proyectada.
+    El aporte acumulado se lee de 'Monto Aportado' (sync_goal_progress lo mantiene al día).
+    Con el historial a medias el ritmo se mide solo sobre el tramo cargado.
+    """
+    columns = ['Nombre', 'Monto Objetivo', 'Monto Aportado', 'Fecha Objetivo', 'Progreso (%)', 'Días Restantes', 'Aporte Mensual', 'Fecha Proyectada', 'A Tiempo']
+    if df_goals.empty or 'Nombre' not in df_goals.columns:
+        return pd.DataFrame(columns=columns)
+    today = today or datetime.now().date()
+    today_day = np.datetime64(today, 'D')
+    names = df_goals['Nombre'].astype(object).to_numpy()
+    target = pd.to_numeric(df_goals['Monto Objetivo'], errors='coerce').fillna(0.0).to_numpy(dtype='float64')
+    contributed = pd.to_numeric(df_goals['Monto Aportado'], errors='coerce').fillna(0.0).to_numpy(dtype='float64')
+    deadline = pd.to_datetime(df_goals['Fecha Objetivo'], errors='coerce').to_numpy().astype('datetime64[D]')
+
+    # Ritmo: aportes de la ventana reciente / días transcurridos desde su inicio (o desde el primer aporte)
+    monthly = get_goal_engine()
+    months = monthly.index.get_level_values('Mes').to_numpy()
+    current_month = today_day.astype('datetime64[M]').astype('int64')
+    window_start = current_month - GOAL_RATE_MONTHS + 1
+    in_window = (months >= window_start) & (months <= current_month)
+    window_sum = monthly[in_window].groupby(level='Destino').sum().reindex(names).fillna(0.0).to_numpy()
+    first_month = pd.Series(months, index=monthly.index.get_level_values('Destino')).groupby(level=0).min().reindex(names).to_numpy(dtype='float64')
+    start_month = np.fmax(first_month, window_start).astype('int64')
+    start_day = start_month.astype('datetime64[M]').astype('datetime64[D]')
+    loaded_from = history_loaded_from(user_id) if user_id else None
+    if loaded_from is not None:
+        start_day = np.maximum(start_day, np.datetime64(pd.Timestamp(loaded_from).date(), 'D'))
+    elapsed_days = np.maximum((today_day - start_day).astype('int64') + 1, 1)
+    rate = window_sum / elapsed_days * DAYS_PER_MONTH
+
+    # Proyección: lo que falta al ritmo actual (las metas cumplidas se dan por cumplidas hoy)
+    remaining = np.maximum(target - contributed, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        months_needed = np.where(remaining <= 0, 0.0, np.where(rate > 0, remaining / rate, np.inf))
+    reachable = months_needed <= GOAL_PROJECTION_MAX_MONTHS
+    days_needed = np.ceil(np.where(reachable, months_needed, 0.0) * DAYS_PER_MONTH).astype('int64')
+    projected = np.where(reachable, today_day + days_needed, np.datetime64('NaT', 'D'))
+    on_track = reachable & ~np.isnat(deadline) & (projected <= deadline)
+    days_left = np.where(np.isnat(deadline), 0, np.maximum((deadline - today_day).astype('int64'), 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        progress = np.where(target > 0, contributed / target * 100, 0.0)
+
+    return pd.DataFrame({
+        'Nombre': names, 'Monto Objetivo': target, 'Monto Aportado': contributed,
+        'Fecha Objetivo': pd.Series(deadline).dt.date.to_numpy(), 'Progreso (%)': progress,
+        'Días Restantes': days_left.astype('int64'), 'Aporte Mensual': rate,
+        'Fecha Proyectada': pd.Series(projected).dt.date.to_numpy(), 'A Tiempo': on_track,
+    }, columns=columns)
@@ -0,0 +1,460 @@
+# --- Archivo: fake_supabase.py ---
+# Cliente Supabase en memoria (para benchmarks y pruebas sin red)
+
+import copy
+import itertools
+import json
+import operator
+import random
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+OPERATORS = {'gte': operator.ge, 'gt': operator.gt, 'lte': operator.le, 'lt': operator.lt}
+
+# Con esta variable la app usa el cliente en memoria en vez de Supabase. Valor: '1', o opciones separadas por comas,
+# p.ej. 'latency=0.05,failure_rate=0.01,count_bytes=1,rows=20000' (rows = historial sintético del usuario de prueba)
+FAKE_SUPABASE_ENV = 'GUARDIAN_FAKE_SUPABASE'
+FAKE_OPTIONS = {'latency': float, 'max_rows': int, 'failure_rate': float, 'read_failure_rate': float,
+                'seed': int, 'count_bytes': lambda v: v.lower() in ('1', 'true', 'yes'), 'rows': int}
+FAKE_USER = SimpleNamespace(id='demo-user', email='demo@guardian.local')
+
+
+def _split_top_level(expr: str):
+    """Parte 'a,and(b,c)' por las comas que no están entre paréntesis ni comillas."""
+    parts, depth, quoted, start = [], 0, False, 0
+    for i, ch in enumerate(expr):
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch in '()':
+            depth += 1 if ch == '(' else -1
+        elif not quoted and ch == ',' and depth == 0:
+            parts.append(expr[start:i])
+            start = i + 1
+    parts.append(expr[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+def _parse_or(expr: str):
+    """Filtro de or_() de PostgREST ('col.op.valor,and(...)') como tupla de conjunciones de (columna, op, valor)."""
+    conjunctions = []
+    for part in _split_top_level(expr):
+        conditions = _split_top_level(part[4:-1]) if part.startswith('and(') and part.endswith(')') else [part]
+        parsed = []
+        for condition in conditions:
+            column, op, value = condition.split('.', 2)
+            parsed.append((column, op, value[1:-1] if len(value) >= 2 and value[0] == value[-1] == '"' else value))
+        conjunctions.append(tuple(parsed))
+    return tuple(conjunctions)
+
+def _typed(value: str, like):
+    return type(like)(value) if isinstance(like, (int, float)) and not isinstance(like, bool) else value
+
+
+class FakeResponse:
+    """Imita la respuesta de postgrest (atributos .data y .count)."""
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _sum_by(rows, key, value='Monto'):
+    totals = {}
+    for row in rows:
+        if row.get(key) is not None:
+            totals[row[key]] = totals.get(row[key], 0.0) + float(row.get(value) or 0.0)
+    return totals
+
+
+def _rpc_account_flows(rows, params):
+    entradas = _sum_by([r for r in rows if r.get('Tipo') == 'Ingreso'], 'Cuenta')
+    salidas = _sum_by([r for r in rows if r.get('Tipo') in ('Gasto', 'Transferencia')], 'Cuenta')
+    entradas_t = _sum_by([r for r in rows if r.get('Tipo') == 'Transferencia'], 'Destino')
+    names = {r['Cuenta'] for r in rows if r.get('Cuenta') is not None} | set(entradas_t)
+    return [{'nombre': n, 'entradas': entradas.get(n, 0.0), 'salidas': salidas.get(n, 0.0), 'entradas_t': entradas_t.get(n, 0.0)} for n in names]
+
+
+def _rpc_goal_contributions(rows, params):
+    totals = _sum_by([r for r in rows if r.get('Tipo') == 'Transferencia'], 'Destino')
+    return [{'nombre': n, 'aportado': v} for n, v in totals.items()]
+
+
+def _rpc_category_spend(rows, params):
+    in_period = [r for r in rows if r.get('Tipo') == 'Gasto' and r.get('Fecha') is not None and params['p_start'] <= r['Fecha'] < params['p_end']]
+    return [{'categoria': n, 'monto': v} for n, v in _sum_by(in_period, 'Categoría').items()]
+
+
+def _rpc_type_totals(rows, params):
+    return [{'tipo': n, 'monto': v} for n, v in _sum_by(rows, 'Tipo').items()]
+
+
+def _rpc_weekday_spend(rows, params):
+    days = [{'dia': datetime.fromisoformat(r['Fecha']).weekday(), 'Monto': r.get('Monto'), 'N': 1}
+            for r in rows if r.get('Tipo') == 'Gasto' and r.get('Fecha') is not None]
+    counts = _sum_by(days, 'dia', value='N')
+    return [{'dia': n, 'monto': v, 'n': int(counts[n])} for n, v in _sum_by(days, 'dia').items()]
+
+
+# Equivalentes en memoria de las funciones de supabase_aggregates.sql
+RPC_FUNCTIONS = {
+    'guardian_account_flows': _rpc_account_flows,
+    'guardian_goal_contributions': _rpc_goal_contributions,
+    'guardian_category_spend': _rpc_category_spend,
+    'guardian_type_totals': _rpc_type_totals,
+    'guardian_weekday_spend': _rpc_weekday_spend,
+}
+
+
+class FakeRPC:
+    """Imita client.rpc(fn, params).execute() (solo lectura, sobre la tabla de transacciones)."""
+
+    def __init__(self, client, fn: str, params: dict):
+        self.client = client
+        self.fn = fn
+        self.params = params or {}
+        self.table_name = 'transacciones'
+        self.operation = 'select'
+
+    def execute(self):
+        return self.client._execute(self)
+
+
+class FakeQuery:
+    """Imita la cadena table().select().eq().order().range().execute() de supabase-py."""
+
+    def __init__(self, client, table_name: str):
+        self.client = client
+        self.table_name = table_name
+        self.operation = None
+        self.payload = None
+        self.on_conflict = None
+        self.columns = None
+        self.filters = []
+        self.id_in = None
+        self.count = None
+        self.orders = []
+        self.row_range = None
+
+    # --- Operaciones ---
+    def select(self, columns: str = "*", count=None):
+        self.operation = 'select'
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(',')]
+        self.count = count
+        return self
+
+    def insert(self, rows):
+        self.operation = 'insert'
+        self.payload = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict: str = ''):
+        self.operation = 'upsert'
+        self.payload = rows if isinstance(rows, list) else [rows]
+        self.on_conflict = [c.strip() for c in on_conflict.split(',') if c.strip()] or ['id']
+        return self
+
+    def delete(self):
+        self.operation = 'delete'
+        return self
+
+    # --- Filtros (column, operador, valor) ---
+    def eq(self, column: str, value):
+        self.filters.append((column, 'eq', value))
+        return self
+
+    def gte(self, column: str, value):
+        self.filters.append((column, 'gte', value))
+        return self
+
+    def gt(self, column: str, value):
+        self.filters.append((column, 'gt', value))
+        return self
+
+    def lte(self, column: str, value):
+        self.filters.append((column, 'lte', value))
+        return self
+
+    def lt(self, column: str, value):
+        self.filters.append((column, 'lt', value))
+        return self
+
+    def or_(self, filters: str):
+        self.filters.append((None, 'or', _parse_or(filters)))
+        return self
+
+    def in_(self, column: str, values):
+        values = frozenset(values)
+        if column == 'id':
+            self.id_in = values # Búsqueda directa por clave primaria
+        self.filters.append((column, 'in', values))
+        return self
+
+    # --- Orden y paginación ---
+    def order(self, column: str, desc: bool = False):
+        self.orders.append((column, desc))
+        return self
+
+    def range(self, start: int, end: int):
+        self.row_range = (start, end)
+        return self
+
+    def limit(self, size: int):
+        self.row_range = (0, size - 1)
+        return self
+
+    def _candidates(self, table: dict):
+        if self.id_in is None:
+            return list(table.values())
+        return [table[row_id] for row_id in self.id_in if row_id in table]
+
+    def _matches(self, row: dict, filters=None):
+        for column, op, value in (self.filters if filters is None else filters):
+            if op == 'or':
+                # Los valores de or_() llegan como texto: Postgres los convierte al tipo de la columna
+                if not any(self._matches(row, [(c, o, _typed(v, row.get(c))) for c, o, v in conjunction]) for conjunction in value):
+                    return False
+                continue
+            v = row.get(column)
+            if op == 'eq':
+                ok = v == value
+            elif op == 'in':
+                ok = v in value
+            elif v is None:
+                ok = False # NULL no cumple comparaciones, como en SQL
+            else:
+                ok = OPERATORS[op](v, value)
+            if not ok:
+                return False
+        return True
+
+    def _base_filters(self):
+        return [f for f in self.filters if f[1] != 'or']
+
+    def _plan_key(self):
+        """Clave del resultado filtrado y ordenado (sin paginar ni or_), para reutilizarlo entre páginas."""
+        return (self.table_name, tuple(self._base_filters()), tuple(self.orders))
+
+    def _follows_order(self, conjunctions):
+        """True si el or_ es la clave de paginación del orden (col DESC, id ASC): col < v o (col = v e id > i)."""
+        if len(conjunctions) != 2 or len(conjunctions[0]) != 1 or len(conjunctions[1]) != 2 or len(self.orders) < 2:
+            return False
+        (column, op, value), = conjunctions[0]
+        (eq_column, eq_op, eq_value), (id_column, id_op, _) = conjunctions[1]
+        return (op, eq_op, id_op) == ('lt', 'eq', 'gt') and column == eq_column and value == eq_value \
+            and self.orders[:2] == [(column, True), (id_column, False)]
+
+    def execute(self):
+        return self.client._execute(self)
+
+
+class FakeAuth:
+    """Imita client.auth con un único usuario de prueba (FAKE_USER): el login con Google entra directamente."""
+
+    def __init__(self, signed_in=True):
+        self.signed_in = signed_in
+
+    def get_session(self):
+        return SimpleNamespace(user=FAKE_USER) if self.signed_in else None
+
+    def sign_in_with_oauth(self, credentials):
+        self.signed_in = True
+        return SimpleNamespace(url='about:blank')
+
+    def sign_out(self):
+        self.signed_in = False
+
+
+class FakeSupabaseClient:
+    """
+    Sustituto en memoria del cliente de Supabase.
+    Guarda cada tabla como un dict id -> fila y cuenta las llamadas al backend.
+    `latency` (segundos) simula la red: un número para todas las tablas o un dict por tabla.
+    `max_rows` imita el tope de filas por respuesta de PostgREST (None = sin tope).
+    `failure_rate` (0-1) hace fallar escrituras al azar, antes de aplicarlas (como un corte de red);
+    `read_failure_rate` hace lo mismo con las lecturas. fail_next(n) fuerza que fallen las n escrituras siguientes;
+    lose_next_response(n) las aplica pero falla al responder (como un timeout después de escribir).
+    Con `count_bytes` también cuenta los bytes (JSON) enviados y recibidos.
+    """
+
+    def __init__(self, latency=0.0, max_rows=None, failure_rate=0.0, seed=None, count_bytes=False, read_failure_rate=0.0):
+        self.tables = {}
+        self.auth = FakeAuth()
+        self.count_bytes = count_bytes
+        self.latency = latency
+        self.max_rows = max_rows
+        self.failure_rate = failure_rate
+        self.read_failure_rate = read_failure_rate
+        self._random = random.Random(seed)
+        self._fail_next = 0
+        self._lose_next = 0
+        self._plans = {} # Resultados ordenados de la última consulta por tabla (se invalidan al escribir)
+        self._next_id = itertools.count(1)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def _latency_for(self, table_name: str):
+        if isinstance(self.latency, dict):
+            return self.latency.get(table_name, 0.0)
+        return self.latency
+
+    def reset_stats(self):
+        self.stats = {'round_trips': 0, 'rows_sent': 0, 'rows_received': 0, 'writes': 0, 'failures': 0, 'bytes_sent': 0, 'bytes_received': 0}
+
+    def fail_next(self, n: int = 1):
+        self._fail_next += n
+
+    def lose_next_response(self, n: int = 1):
+        self._lose_next += n
+
+    def table(self, table_name: str):
+        return FakeQuery(self, table_name)
+
+    def rpc(self, fn: str, params: dict = None):
+        return FakeRPC(self, fn, params)
+
+    def _count_bytes(self, key: str, data):
+        if self.count_bytes:
+            self.stats[key] += len(json.dumps(data, default=str, ensure_ascii=False).encode('utf-8'))
+
+    def rows(self, table_name: str):
+        return list(self.tables.get(table_name, {}).values())
+
+    def _execute(self, query: FakeQuery):
+        delay = self._latency_for(query.table_name)
+        if delay:
+            time.sleep(delay) # La espera de red ocurre fuera del lock (las consultas se solapan)
+        with self._lock:
+            if query.operation != 'select' and (self._fail_next or self._random.random() < self.failure_rate):
+                self._fail_next = max(0, self._fail_next - 1)
+                self.stats['failures'] += 1
+                raise ConnectionError(f"Fallo simulado al escribir en '{query.table_name}'")
+            if query.operation == 'select' and self.read_failure_rate and self._random.random() < self.read_failure_rate:
+                self.stats['failures'] += 1
+                raise ConnectionError(f"Fallo simulado al leer de '{query.table_name}'")
+            response = self._apply(query)
+            if query.operation != 'select' and self._lose_next:
+                self._lose_next -= 1
+                self.stats['failures'] += 1
+                raise TimeoutError(f"Respuesta perdida al escribir en '{query.table_name}' (la escritura sí se aplicó)")
+            return response
+
+    def _apply(self, query: FakeQuery):
+        table = self.tables.setdefault(query.table_name, {})
+        self.stats['round_trips'] += 1
+
+        if isinstance(query, FakeRPC):
+            user_id = query.params.get('p_user_id')
+            data = RPC_FUNCTIONS[query.fn]([row for row in table.values() if row.get('user_id') == user_id], query.params)
+            self._count_bytes('bytes_sent', query.params)
+            self._count_bytes('bytes_received', data)
+            self.stats['rows_received'] += len(data)
+            return FakeResponse(data)
+
+        if query.operation == 'select':
+            data = self._select_rows(query, table)
+            count = len(data) if query.count else None
+            if query.row_range is not None:
+                data = data[query.row_range[0]:query.row_range[1] + 1]
+            if self.max_rows is not None:
+                data = data[:self.max_rows]
+            if query.columns:
+                data = [{c: row.get(c) for c in query.columns} for row in data]
+            else:
+                data = [dict(row) for row in data]
+            self.stats['rows_received'] += len(data)
+            self._count_bytes('bytes_received', data)
+            return FakeResponse(data, count)
+
+        self.stats['writes'] += 1
+        self._plans.pop(query.table_name, None)
+        if query.operation == 'delete':
+            ids = [row['id'] for row in query._candidates(table) if query._matches(row)]
+            deleted = [table.pop(row_id) for row_id in ids]
+            return FakeResponse(deleted)
+
+        rows = copy.deepcopy(query.payload)
+        self.stats['rows_sent'] += len(rows)
+        self._count_bytes('bytes_sent', rows)
+        # Como Postgres: un mismo insert/upsert no puede tocar dos veces la misma fila
+        key_columns = query.on_conflict if query.operation == 'upsert' else ['id']
+        keys = [tuple(row.get(c) for c in key_columns) for row in rows if all(row.get(c) is not None for c in key_columns)]
+        if len(set(keys)) != len(keys):
+            if query.operation == 'upsert':
+                raise ValueError("ON CONFLICT DO UPDATE command cannot affect row a second time")
+            raise ValueError("duplicate key value violates unique constraint (id repetido en el lote)")
+        # upsert sobre otra clave única (p.ej. 'user_id, clave'): índice clave -> id, construido una vez por lote
+        conflict_index = None
+        if query.operation == 'upsert' and query.on_conflict != ['id']:
+            conflict_index = {tuple(r.get(c) for c in query.on_conflict): rid for rid, r in table.items()}
+        for row in rows:
+            if conflict_index is not None:
+                key = tuple(row.get(c) for c in query.on_conflict)
+                if key in conflict_index:
+                    row['id'] = conflict_index[key]
+                elif row.get('id') is None:
+                    row['id'] = next(self._next_id)
+                conflict_index[key] = row['id']
+            else:
+                if row.get('id') is None:
+                    row['id'] = next(self._next_id)
+                if query.operation == 'insert' and row['id'] in table:
+                    raise ValueError(f"duplicate key value violates unique constraint (id={row['id']})")
+            table[row['id']] = row
+        return FakeResponse(rows)
+
+    def _select_rows(self, query: FakeQuery, table: dict):
+        """Filas que cumplen los filtros, ordenadas. Las consultas paginadas repiten filtros y orden,
+        así que el resultado se guarda hasta la siguiente escritura en la tabla."""
+        key = query._plan_key()
+        cached = self._plans.get(query.table_name)
+        if cached is not None and cached[0] == key:
+            data = cached[1]
+        else:
+            base_filters = query._base_filters()
+            data = [row for row in query._candidates(table) if query._matches(row, base_filters)]
+            for column, desc in reversed(query.orders):
+                # NULL al final, como en Postgres con ASC (y al principio con DESC)
+                data.sort(key=lambda row: (row.get(column) is None, row.get(column) if row.get(column) is not None else 0), reverse=desc)
+            if query.orders or query.row_range is not None:
+                self._plans[query.table_name] = (key, data)
+        for _, op, conjunctions in query.filters:
+            if op != 'or':
+                continue
+            or_filter = [(None, 'or', conjunctions)]
+            if query._follows_order(conjunctions):
+                # Las filas que siguen a la clave son un sufijo del orden: búsqueda binaria, como un índice
+                lo, hi = 0, len(data)
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if query._matches(data[mid], or_filter):
+                        hi = mid
+                    else:
+                        lo = mid + 1
+                data = data[lo:]
+            else:
+                data = [row for row in data if query._matches(row, or_filter)]
+        return data
+
+
+# --- Configuración desde una sola variable de entorno ---
+
+def parse_setting(value: str):
+    """'latency=0.05,count_bytes=1' -> {'latency': 0.05, 'count_bytes': True}. '1' (o 'true') = opciones por defecto."""
+    options = {}
+    for part in (value or '').split(','):
+        part = part.strip()
+        if not part or '=' not in part:
+            continue
+        name, _, raw = part.partition('=')
+        name = name.strip()
+        if name not in FAKE_OPTIONS:
+            raise ValueError(f"Opción desconocida en {FAKE_SUPABASE_ENV}: '{name}' (válidas: {', '.join(FAKE_OPTIONS)})")
+        options[name] = FAKE_OPTIONS[name](raw.strip())
+    return options
+
+
+def client_from_setting(value: str):
+    """Cliente en memoria configurado con el valor de FAKE_SUPABASE_ENV. Devuelve (cliente, filas sintéticas pedidas)."""
+    options = parse_setting(value)
+    rows = options.pop('rows', 0)
+    return FakeSupabaseClient(**options), rows
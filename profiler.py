@@ -0,0 +1,227 @@
+# --- Archivo: profiler.py ---
+# Instrumentación de los pasos de cada rerun: tiempo, viajes al backend, filas transferidas y copias de DataFrame
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# --- 1. CONFIGURACIÓN ---
+PROFILE_ENV = 'GUARDIAN_PROFILE'            # '1' activa la instrumentación y el panel de desarrollo en la barra lateral
+PROFILE_PATH_ENV = 'GUARDIAN_PROFILE_PATH'  # Si está definida, cada rerun completo se añade a este archivo JSON-lines
+RING_SIZE = 5000                            # Etapas retenidas en memoria (las más antiguas se descartan)
+COUNTERS = ('round_trips', 'rows_sent', 'rows_received', 'df_copies')
+
+# --- 2. ESTADO DEL PROCESO ---
+_ring = deque(maxlen=RING_SIZE)   # Registros de etapas cerradas (dicts), de todas las sesiones
+_reruns = {}                      # session_id -> número del último rerun
+_lock = threading.Lock()          # Protege los contadores compartidos entre hilos y _reruns
+_local = threading.local()        # Pila de etapas abiertas del hilo actual
+_enabled = False
+_original_copy = pd.DataFrame.copy
+
+
+class _Frame:
+    """Etapa abierta: acumula los contadores de todo lo que ocurre dentro (incluidas sus subetapas)."""
+    __slots__ = ('name', 'detail', 'session', 'rerun', 'depth', 'parent', 'start', 'counters')
+
+    def __init__(self, name, detail, session, rerun, depth, parent):
+        self.name, self.detail, self.session, self.rerun = name, detail, session, rerun
+        self.depth, self.parent = depth, parent
+        self.start = time.time()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _counted_copy(self, deep=True):
+    if deep:
+        record_io(df_copies=1)
+    return _original_copy(self, deep=deep)
+
+
+# --- 3. ACTIVACIÓN ---
+
+def enable():
+    """Activa la instrumentación (y el conteo de DataFrame.copy profundas)."""
+    global _enabled
+    _enabled = True
+    pd.DataFrame.copy = _counted_copy
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    pd.DataFrame.copy = _original_copy
+
+
+def is_enabled():
+    return _enabled
+
+
+def session_id():
+    """Id de la sesión de Streamlit del hilo actual (None fuera de una sesión)."""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else None
+
+
+# --- 4. ETAPAS ---
+
+class stage:
+    """
+    Context manager que mide una etapa: `with profiler.stage('db.save_data', detail='transacciones'): ...`.
+    `root=True` abre un rerun nuevo de la sesión actual. Sin instrumentación activa no hace nada.
+    """
+    __slots__ = ('name', 'detail', 'root', 'frame', 't0')
+
+    def __init__(self, name, detail=None, root=False):
+        self.name, self.detail, self.root, self.frame = name, detail, root, None
+
+    def __enter__(self):
+        if not _enabled:
+            return self
+        stack = _stack()
+        if stack and not self.root:
+            parent = stack[-1]
+            session, rerun = parent.session, parent.rerun
+        else:
+            session = session_id()
+            # Lo que corre antes de la raíz (callbacks de widgets) pertenece al rerun que está por empezar
+            with _lock:
+                rerun = _reruns.get(session, 0) + 1
+                if self.root:
+                    _reruns[session] = rerun
+            parent = None
+        self.frame = _Frame(self.name, self.detail, session, rerun, len(stack), parent.name if parent else None)
+        stack.append(self.frame)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        frame = self.frame
+        if frame is None:
+            return False
+        elapsed = (time.perf_counter() - self.t0) * 1000
+        stack = _stack()
+        if stack and stack[-1] is frame:
+            stack.pop()
+        record = {
+            'ts': round(frame.start, 3), 'session': frame.session, 'rerun': frame.rerun, 'stage': frame.name,
+            'detail': frame.detail, 'depth': frame.depth, 'parent': frame.parent, 'thread': threading.current_thread().name,
+            'ms': round(elapsed, 3), **frame.counters, 'root': self.root, 'error': exc_type.__name__ if exc_type else None,
+        }
+        _ring.append(record)
+        if self.root:
+            path = os.environ.get(PROFILE_PATH_ENV, '')
+            if path:
+                export_jsonl(path, rerun_records(frame.session, frame.rerun), append=True)
+        return False
+
+
+def timed(name=None, detail_arg=None, root=False):
+    """
+    Decorador: cada llamada es una etapa `name` (por defecto módulo.función).
+    `detail_arg` = (posición, nombre) del argumento que distingue la llamada (p.ej. (1, 'table_name') en load_data).
+    """
+    def decorator(func):
+        stage_name = name or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            detail = None
+            if detail_arg is not None:
+                position, keyword = detail_arg
+                detail = args[position] if len(args) > position else kwargs.get(keyword)
+            with stage(stage_name, detail=detail, root=root):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_io(**counts):
+    """Suma contadores (round_trips, rows_sent, rows_received, df_copies) a todas las etapas abiertas del hilo."""
+    if not _enabled:
+        return
+    stack = getattr(_local, 'stack', None)
+    if not stack:
+        return
+    with _lock:
+        for frame in stack:
+            for key, value in counts.items():
+                frame.counters[key] += value
+
+
+def current_stack():
+    """Etapas abiertas del hilo actual, para que un hilo de trabajo las herede (ver attach)."""
+    return list(getattr(_local, 'stack', None) or [])
+
+
+def attach(stack):
+    """El hilo actual cuelga sus etapas de `stack` (lo abierto en el hilo que lo lanzó)."""
+    _local.stack = list(stack)
+
+
+# --- 5. CONSULTA Y EXPORTACIÓN ---
+
+def records(session=None):
+    """Registros del buffer (de una sesión si se indica), en orden de cierre."""
+    items = list(_ring)
+    return items if session is None else [r for r in items if r['session'] == session]
+
+
+def last_rerun(session):
+    """Número del último rerun completo de la sesión (el que tiene cerrada su etapa raíz), o None."""
+    for record in reversed(_ring):
+        if record['session'] == session and record['root']:
+            return record['rerun']
+    return None
+
+
+def rerun_records(session, rerun):
+    """Etapas de un rerun ordenadas por inicio."""
+    return sorted((r for r in _ring if r['session'] == session and r['rerun'] == rerun), key=lambda r: (r['ts'], r['depth']))
+
+
+def summarize(stage_records):
+    """Tabla por etapa (y detalle): llamadas, ms totales/máx. y contadores."""
+    if not stage_records:
+        return pd.DataFrame(columns=['stage', 'detail', 'calls', 'ms', 'max_ms', *COUNTERS])
+    frame = pd.DataFrame(stage_records)
+    frame['detail'] = frame['detail'].fillna('').astype(str)
+    summary = frame.groupby(['stage', 'detail'], sort=False).agg(
+        calls=('ms', 'size'), ms=('ms', 'sum'), max_ms=('ms', 'max'), **{key: (key, 'sum') for key in COUNTERS}
+    ).reset_index()
+    return summary.sort_values('ms', ascending=False, ignore_index=True)
+
+
+def to_jsonl(stage_records):
+    return ''.join(json.dumps(r, default=str, ensure_ascii=False) + '\n' for r in stage_records)
+
+
+def export_jsonl(path, stage_records=None, append=False):
+    """Escribe los registros (por defecto todo el buffer) como JSON-lines. Devuelve cuántos escribió."""
+    stage_records = records() if stage_records is None else stage_records
+    with open(path, 'a' if append else 'w', encoding='utf-8') as handle:
+        handle.write(to_jsonl(stage_records))
+    return len(stage_records)
+
+
+def clear():
+    _ring.clear()
+    with _lock:
+        _reruns.clear()
+
+
+if os.environ.get(PROFILE_ENV, '') not in ('', '0'):
+    enable()
@@ -0,0 +1,316 @@
+# --- Archivo: storage.py ---
+# Backends de almacenamiento: Supabase (por defecto) y SQLite embebido (offline / autoalojado)
+
+import json
+import sqlite3
+import threading
+import profiler
+
+# --- 1. CONFIGURACIÓN ---
+SQLITE_PATH_ENV = 'GUARDIAN_SQLITE_PATH' # Si está definida, los datos se guardan en este archivo SQLite
+
+FILTER_OPERATORS = {'eq': '=', 'gte': '>=', 'gt': '>', 'lte': '<=', 'lt': '<'}
+# Paginación por clave: (columna, 'after_key', (valor, id)) deja las filas que siguen a (valor, id) en el orden
+# (columna DESC, id ASC), es decir columna < valor, o columna = valor con id mayor
+
+# Esquema de las tablas (nombre de columna -> tipo SQLite). 'id' es la clave de las tablas con id de fila.
+SQLITE_SCHEMA = {
+    'transacciones': {
+        'id': 'TEXT PRIMARY KEY', 'user_id': 'TEXT NOT NULL', 'Fecha': 'TEXT', 'Tipo': 'TEXT',
+        'Categoría': 'TEXT', 'Cuenta': 'TEXT', 'Monto': 'REAL', 'Descripción': 'TEXT',
+        'Miembro': 'TEXT', 'Destino': 'TEXT', 'Recurrente': 'BOOLEAN', 'Frecuencia': 'TEXT',
+    },
+    'cuentas': {'id': 'TEXT PRIMARY KEY', 'user_id': 'TEXT NOT NULL', 'Nombre': 'TEXT', 'Tipo': 'TEXT', 'Saldo Inicial': 'REAL'},
+    'metas': {
+        'id': 'TEXT PRIMARY KEY', 'user_id': 'TEXT NOT NULL', 'Nombre': 'TEXT',
+        'Monto Objetivo': 'REAL', 'Monto Aportado': 'REAL', 'Fecha Objetivo': 'TEXT',
+    },
+    'categorias': {'id': 'INTEGER PRIMARY KEY AUTOINCREMENT', 'user_id': 'TEXT NOT NULL', 'tipo': 'TEXT', 'nombre': 'TEXT'},
+    'miembros': {'id': 'INTEGER PRIMARY KEY AUTOINCREMENT', 'user_id': 'TEXT NOT NULL', 'nombre': 'TEXT'},
+    'configuracion': {'id': 'INTEGER PRIMARY KEY AUTOINCREMENT', 'user_id': 'TEXT NOT NULL', 'clave': 'TEXT', 'valor': 'JSON'},
+}
+SQLITE_INDEXES = {
+    # (user_id, Fecha) incluye el orden de la carga paginada (Fecha desc, id) para no ordenar en cada página
+    'transacciones': [('user_id', 'Fecha DESC', 'id'), ('user_id', 'Categoría'), ('user_id', 'Cuenta')],
+    'cuentas': [('user_id',)],
+    'metas': [('user_id',)],
+    'categorias': [('user_id',)],
+    'miembros': [('user_id',)],
+}
+SQLITE_UNIQUE = {'configuracion': ('user_id', 'clave')} # Destino de upsert(on_conflict='user_id, clave')
+
+# Agregados calculados en la base de datos (en Supabase son funciones RPC, ver supabase_aggregates.sql).
+# Nombre -> parámetros además de user_id. Las fechas van en ISO y el fin del rango es exclusivo.
+AGGREGATES = {
+    'account_flows': (),              # nombre, entradas (Ingreso), salidas (Gasto/Transferencia), entradas_t (Transferencia recibida)
+    'goal_contributions': (),         # nombre (Destino), aportado
+    'category_spend': ('start', 'end'), # categoria, monto (Gasto en [start, end))
+    'type_totals': (),                # tipo, monto (total del historial por Tipo)
+    'weekday_spend': (),              # dia (0 = lunes), monto, n (Gasto por día de la semana)
+}
+RPC_PREFIX = 'guardian_'
+SQLITE_AGGREGATES = {
+    'account_flows': '''
+        SELECT nombre, SUM(entradas) AS entradas, SUM(salidas) AS salidas, SUM(entradas_t) AS entradas_t FROM (
+            SELECT "Cuenta" AS nombre,
+                   CASE WHEN "Tipo" = 'Ingreso' THEN "Monto" ELSE 0 END AS entradas,
+                   CASE WHEN "Tipo" IN ('Gasto', 'Transferencia') THEN "Monto" ELSE 0 END AS salidas,
+                   0 AS entradas_t
+            FROM transacciones WHERE user_id = :user_id
+            UNION ALL
+            SELECT "Destino", 0, 0, "Monto" FROM transacciones WHERE user_id = :user_id AND "Tipo" = 'Transferencia'
+        ) WHERE nombre IS NOT NULL GROUP BY nombre''',
+    'goal_contributions': '''
+        SELECT "Destino" AS nombre, SUM("Monto") AS aportado FROM transacciones
+        WHERE user_id = :user_id AND "Tipo" = 'Transferencia' AND "Destino" IS NOT NULL GROUP BY "Destino"''',
+    'category_spend': '''
+        SELECT "Categoría" AS categoria, SUM("Monto") AS monto FROM transacciones
+        WHERE user_id = :user_id AND "Tipo" = 'Gasto' AND "Fecha" >= :start AND "Fecha" < :end AND "Categoría" IS NOT NULL
+        GROUP BY "Categoría"''',
+    'type_totals': '''
+        SELECT "Tipo" AS tipo, SUM("Monto") AS monto FROM transacciones
+        WHERE user_id = :user_id AND "Tipo" IS NOT NULL GROUP BY "Tipo"''',
+    'weekday_spend': '''
+        SELECT (CAST(strftime('%w', "Fecha") AS INTEGER) + 6) % 7 AS dia, SUM("Monto") AS monto, COUNT(*) AS n
+        FROM transacciones WHERE user_id = :user_id AND "Tipo" = 'Gasto' AND "Fecha" IS NOT NULL GROUP BY dia''',
+}
+
+
+def _quote(name: str):
+    return '"' + name.replace('"', '""') + '"'
+
+def _index_column(spec: str):
+    """'Fecha DESC' -> '"Fecha" DESC'."""
+    name, _, direction = spec.partition(' ')
+    return f'{_quote(name)} {direction}'.strip()
+
+
+class StorageBackend:
+    """
+    Interfaz común de almacenamiento. Cada backend implementa select/insert/upsert/delete por tabla;
+    la configuración clave-valor se apoya en esas cuatro.
+    Los filtros son tuplas (columna, operador, valor) con operador en eq, in, gte, gt, lte, lt.
+    """
+
+    def select(self, table: str, user_id: str, columns=None, filters=(), order=(), offset: int = None,
+               limit: int = None, count: bool = False):
+        """Devuelve (filas como dicts, total de filas que cumplen los filtros si count, si no None)."""
+        raise NotImplementedError
+
+    def insert(self, table: str, rows: list):
+        raise NotImplementedError
+
+    def upsert(self, table: str, rows: list, on_conflict: str = 'id'):
+        raise NotImplementedError
+
+    def delete(self, table: str, user_id: str, filters=()):
+        raise NotImplementedError
+
+    # --- Configuración clave-valor ---
+    def load_config(self, user_id: str, keys: list):
+        """{clave: valor} de las claves pedidas que existan."""
+        rows, _ = self.select('configuracion', user_id, columns=['clave', 'valor'], filters=[('clave', 'in', list(keys))])
+        return {row['clave']: row['valor'] for row in rows}
+
+    def save_config(self, user_id: str, key: str, value):
+        self.upsert('configuracion', [{'user_id': user_id, 'clave': key, 'valor': value}], on_conflict='user_id, clave')
+
+    # --- Agregados ---
+    def aggregate(self, name: str, user_id: str, **params):
+        """Filas (dicts) del agregado `name` (ver AGGREGATES) calculado por la base de datos, sin traer las transacciones."""
+        raise NotImplementedError
+
+
+class SupabaseBackend(StorageBackend):
+    """Backend sobre un cliente con la interfaz de supabase-py (el real, el de cola local o el de memoria)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name):
+        # auth, wal, stats... siguen disponibles a través del backend
+        if name == 'client':
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def select(self, table, user_id, columns=None, filters=(), order=(), offset=None, limit=None, count=False):
+        query = self.client.table(table).select(", ".join(columns) if columns else "*", count='exact' if count else None).eq("user_id", user_id)
+        query = self._apply_filters(query, filters)
+        for column, desc in order:
+            query = query.order(column, desc=desc)
+        if offset is not None or limit is not None:
+            start = offset or 0
+            query = query.range(start, start + limit - 1) if limit is not None else query.range(start, 2 ** 31 - 1)
+        response = query.execute()
+        profiler.record_io(round_trips=1, rows_received=len(response.data or []))
+        return response.data or [], getattr(response, 'count', None)
+
+    def insert(self, table, rows):
+        if rows:
+            self.client.table(table).insert(rows).execute()
+            profiler.record_io(round_trips=1, rows_sent=len(rows))
+
+    def upsert(self, table, rows, on_conflict='id'):
+        if rows:
+            self.client.table(table).upsert(rows, on_conflict=on_conflict).execute()
+            profiler.record_io(round_trips=1, rows_sent=len(rows))
+
+    def delete(self, table, user_id, filters=()):
+        self._apply_filters(self.client.table(table).delete().eq("user_id", user_id), filters).execute()
+        profiler.record_io(round_trips=1)
+
+    def aggregate(self, name, user_id, **params):
+        args = {'p_user_id': user_id, **{f'p_{key}': params[key] for key in AGGREGATES[name]}}
+        rows = self.client.rpc(RPC_PREFIX + name, args).execute().data or []
+        profiler.record_io(round_trips=1, rows_received=len(rows))
+        return rows
+
+    @staticmethod
+    def _apply_filters(query, filters):
+        for column, op, value in filters:
+            if op == 'after_key':
+                key, row_id = (f'"{v}"' for v in value)
+                query = query.or_(f'{column}.lt.{key},and({column}.eq.{key},id.gt.{row_id})')
+            else:
+                query = query.in_(column, list(value)) if op == 'in' else getattr(query, op)(column, value)
+        return query
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Backend embebido en un archivo SQLite (o ':memory:'), con índices por usuario y fecha/categoría/cuenta.
+    `auth_client` (opcional) atiende el login cuando los datos son locales pero la autenticación sigue en Supabase.
+    """
+
+    def __init__(self, path: str = ':memory:', auth_client=None):
+        self.path = path
+        self.auth_client = auth_client
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._columns = {table: list(columns) for table, columns in SQLITE_SCHEMA.items()}
+        for table, columns in SQLITE_SCHEMA.items():
+            definition = ', '.join(f'{_quote(name)} {sql_type}' for name, sql_type in columns.items())
+            self._db.execute(f'CREATE TABLE IF NOT EXISTS {_quote(table)} ({definition})')
+            for index_columns in SQLITE_INDEXES.get(table, []):
+                index_name = f"{table}_{'_'.join(c.split(' ')[0] for c in index_columns)}_idx"
+                self._db.execute(f"CREATE INDEX IF NOT EXISTS {_quote(index_name)} ON {_quote(table)} ({', '.join(_index_column(c) for c in index_columns)})")
+        for table, unique_columns in SQLITE_UNIQUE.items():
+            self._db.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {_quote(table + '_unique')} ON {_quote(table)} ({', '.join(_quote(c) for c in unique_columns)})")
+
+    def __getattr__(self, name):
+        if name == 'auth_client' or self.auth_client is None:
+            raise AttributeError(name)
+        return getattr(self.auth_client, name)
+
+    # --- Conversión de valores ---
+    def _to_sql(self, table, column, value):
+        sql_type = SQLITE_SCHEMA[table].get(column, 'TEXT')
+        if sql_type == 'JSON':
+            return json.dumps(value, default=str, ensure_ascii=False)
+        if sql_type == 'BOOLEAN' and value is not None:
+            return int(bool(value))
+        return value
+
+    def _from_sql(self, table, column, value):
+        sql_type = SQLITE_SCHEMA[table].get(column, 'TEXT')
+        if value is None:
+            return None
+        if sql_type == 'JSON':
+            return json.loads(value)
+        if sql_type == 'BOOLEAN':
+            return bool(value)
+        return value
+
+    def _where(self, user_id, filters):
+        clauses, params = ['"user_id" = ?'], [user_id]
+        for column, op, value in filters:
+            if op == 'in':
+                values = list(value)
+                if not values:
+                    clauses.append('0')
+                    continue
+                clauses.append(f"{_quote(column)} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+            elif op == 'after_key':
+                clauses.append(f'({_quote(column)} < ? OR ({_quote(column)} = ? AND "id" > ?))')
+                params.extend([value[0], value[0], value[1]])
+            else:
+                clauses.append(f'{_quote(column)} {FILTER_OPERATORS[op]} ?')
+                params.append(value)
+        return ' AND '.join(clauses), params
+
+    # --- Operaciones ---
+    def select(self, table, user_id, columns=None, filters=(), order=(), offset=None, limit=None, count=False):
+        columns = list(columns) if columns else self._columns[table]
+        where, params = self._where(user_id, filters)
+        sql = f"SELECT {', '.join(_quote(c) for c in columns)} FROM {_quote(table)} WHERE {where}"
+        if order:
+            sql += ' ORDER BY ' + ', '.join(f'{_quote(c)} {"DESC" if desc else "ASC"}' for c, desc in order)
+        if limit is not None or offset is not None:
+            sql += f' LIMIT {int(limit) if limit is not None else -1} OFFSET {int(offset or 0)}'
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+            total = self._db.execute(f"SELECT COUNT(*) FROM {_quote(table)} WHERE {where}", params).fetchone()[0] if count else None
+        profiler.record_io(round_trips=1, rows_received=len(rows))
+        records = [dict(zip(columns, row)) for row in rows]
+        # Solo las columnas JSON/BOOLEAN necesitan conversión
+        for column in columns:
+            if SQLITE_SCHEMA[table].get(column) in ('JSON', 'BOOLEAN'):
+                for record in records:
+                    record[column] = self._from_sql(table, column, record[column])
+        return records, total
+
+    def _write_rows(self, table, rows, conflict_clause=''):
+        if not rows:
+            return
+        columns = [c for c in self._columns[table] if any(c in row for row in rows)]
+        sql = f"INSERT INTO {_quote(table)} ({', '.join(_quote(c) for c in columns)}) VALUES ({', '.join('?' * len(columns))}){conflict_clause}"
+        values = [tuple(self._to_sql(table, c, row.get(c)) for c in columns) for row in rows]
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                self._db.executemany(sql, values)
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+        profiler.record_io(round_trips=1, rows_sent=len(values))
+
+    def insert(self, table, rows):
+        self._write_rows(table, rows)
+
+    def upsert(self, table, rows, on_conflict='id'):
+        if not rows:
+            return
+        conflict_columns = [c.strip() for c in on_conflict.split(',') if c.strip()]
+        columns = [c for c in self._columns[table] if any(c in row for row in rows)]
+        updates = ', '.join(f'{_quote(c)} = excluded.{_quote(c)}' for c in columns if c not in conflict_columns)
+        self._write_rows(table, rows, f" ON CONFLICT ({', '.join(_quote(c) for c in conflict_columns)}) DO UPDATE SET {updates}")
+
+    def delete(self, table, user_id, filters=()):
+        where, params = self._where(user_id, filters)
+        with self._lock:
+            self._db.execute(f"DELETE FROM {_quote(table)} WHERE {where}", params)
+        profiler.record_io(round_trips=1)
+
+    def aggregate(self, name, user_id, **params):
+        args = {'user_id': user_id, **{key: params[key] for key in AGGREGATES[name]}}
+        with self._lock:
+            cursor = self._db.execute(SQLITE_AGGREGATES[name], args)
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchall()
+        profiler.record_io(round_trips=1, rows_received=len(rows))
+        return [dict(zip(columns, row)) for row in rows]
+
+    def close(self):
+        self._db.close()
+
+
+def get_backend(client_or_backend):
+    """Acepta un backend o un cliente con la interfaz de supabase-py (que se envuelve en SupabaseBackend)."""
+    if isinstance(client_or_backend, StorageBackend):
+        return client_or_backend
+    return SupabaseBackend(client_or_backend)
+
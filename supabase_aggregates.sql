@@ -0,0 +1,65 @@
+-- --- Archivo: supabase_aggregates.sql ---
+-- Agregados del dashboard calculados en Supabase (se llaman con supabase_client.rpc, ver storage.py).
+-- Ejecutar una vez en el editor SQL del proyecto. Cada función solo lee las filas del usuario pedido.
+
+create index if not exists transacciones_user_id_fecha_idx on transacciones (user_id, "Fecha");
+
+-- Por cuenta: entradas (Ingreso), salidas (Gasto/Transferencia) y transferencias recibidas (por Destino)
+create or replace function guardian_account_flows(p_user_id transacciones.user_id%type)
+returns table (nombre text, entradas double precision, salidas double precision, entradas_t double precision)
+language sql stable as $$
+    select nombre, sum(entradas), sum(salidas), sum(entradas_t) from (
+        select "Cuenta"::text as nombre,
+               case when "Tipo" = 'Ingreso' then "Monto" else 0 end::double precision as entradas,
+               case when "Tipo" in ('Gasto', 'Transferencia') then "Monto" else 0 end::double precision as salidas,
+               0::double precision as entradas_t
+        from transacciones where user_id = p_user_id
+        union all
+        select "Destino"::text, 0, 0, "Monto"::double precision
+        from transacciones where user_id = p_user_id and "Tipo" = 'Transferencia'
+    ) flujos
+    where nombre is not null
+    group by nombre
+$$;
+
+-- Por meta: total transferido a cada Destino
+create or replace function guardian_goal_contributions(p_user_id transacciones.user_id%type)
+returns table (nombre text, aportado double precision)
+language sql stable as $$
+    select "Destino"::text, sum("Monto")::double precision
+    from transacciones
+    where user_id = p_user_id and "Tipo" = 'Transferencia' and "Destino" is not null
+    group by "Destino"
+$$;
+
+-- Por categoría: gasto en [p_start, p_end)
+create or replace function guardian_category_spend(p_user_id transacciones.user_id%type, p_start text, p_end text)
+returns table (categoria text, monto double precision)
+language sql stable as $$
+    select "Categoría"::text, sum("Monto")::double precision
+    from transacciones
+    where user_id = p_user_id and "Tipo" = 'Gasto'
+      and "Fecha" >= p_start::timestamp and "Fecha" < p_end::timestamp
+      and "Categoría" is not null
+    group by "Categoría"
+$$;
+
+-- Por tipo: total del historial (Ingreso, Gasto, Transferencia)
+create or replace function guardian_type_totals(p_user_id transacciones.user_id%type)
+returns table (tipo text, monto double precision)
+language sql stable as $$
+    select "Tipo"::text, sum("Monto")::double precision
+    from transacciones
+    where user_id = p_user_id and "Tipo" is not null
+    group by "Tipo"
+$$;
+
+-- Por día de la semana (0 = lunes): gasto total y número de gastos
+create or replace function guardian_weekday_spend(p_user_id transacciones.user_id%type)
+returns table (dia integer, monto double precision, n bigint)
+language sql stable as $$
+    select (extract(isodow from "Fecha")::integer - 1), sum("Monto")::double precision, count(*)
+    from transacciones
+    where user_id = p_user_id and "Tipo" = 'Gasto' and "Fecha" is not null
+    group by 1
+$$;
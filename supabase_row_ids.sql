@@ -0,0 +1,34 @@
+-- --- Archivo: supabase_row_ids.sql ---
+-- Ids de fila generados en el cliente (database.new_row_id) para transacciones, cuentas y metas.
+-- Ejecutar una vez en el editor SQL del proyecto, ANTES de desplegar el guardado incremental por id.
+-- save_data hace upsert(on_conflict='id') con ids de texto (uuid4 en hex): una columna id bigint/identity los rechaza.
+-- Los ids existentes se conservan como texto; las filas insertadas sin id reciben un uuid del servidor.
+
+do $$
+declare
+    t text;
+begin
+    foreach t in array array['transacciones', 'cuentas', 'metas'] loop
+        execute format('alter table %I alter column id drop identity if exists', t);
+        execute format('alter table %I alter column id drop default', t);
+        execute format('alter table %I alter column id type text using id::text', t);
+        execute format('alter table %I alter column id set default gen_random_uuid()::text', t);
+    end loop;
+end
+$$;
+
+-- El id es la clave primaria de cada tabla (destino de on_conflict='id' y de los borrados por id)
+do $$
+declare
+    t text;
+begin
+    foreach t in array array['transacciones', 'cuentas', 'metas'] loop
+        if not exists (
+            select 1 from pg_constraint
+            where conrelid = format('public.%I', t)::regclass and contype = 'p'
+        ) then
+            execute format('alter table %I add primary key (id)', t);
+        end if;
+    end loop;
+end
+$$;
@@ -0,0 +1,124 @@
+# --- Archivo: synthetic_data.py ---
+# Hogares sintéticos reproducibles (pruebas, benchmarks y el cliente en memoria de la app)
+
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+import database as db
+
+# --- 1. CONFIGURACIÓN ---
+SEED = 42
+# Miembros, cuentas y metas se toman en orden de estas listas
+HOUSEHOLD_MEMBERS = ['Ana', 'Luis', 'Sofía', 'Mateo', 'Lucía', 'Diego', 'Valeria', 'Andrés']
+HOUSEHOLD_ACCOUNTS = [('Efectivo', 'Efectivo'), ('Banco', 'Banco'), ('Crédito', 'Crédito'), ('Ahorros', 'Banco'),
+                      ('Billetera Digital', 'Digital'), ('Banco Secundario', 'Banco')]
+HOUSEHOLD_GOALS = [('Fondo de Emergencia', 6000.0), ('Vacaciones', 2500.0), ('Auto', 15000.0), ('Casa', 40000.0), ('Educación', 12000.0)]
+# Gastos puntuales: categoría -> (peso, monto medio); los montos siguen una lognormal alrededor de la media
+ONE_OFF_EXPENSES = {'Comida': (0.45, 25.0), 'Transporte': (0.2, 12.0), 'Entretenimiento': (0.15, 40.0),
+                    'Servicios': (0.05, 60.0), 'Deudas': (0.03, 150.0), 'Otros Gastos': (0.12, 30.0)}
+ONE_OFF_INCOME = {'Freelance': (0.5, 400.0), 'Regalo': (0.2, 80.0), 'Inversión': (0.2, 150.0), 'Otros Ingresos': (0.1, 60.0)}
+ONE_OFF_MIX = {'Gasto': 0.9, 'Ingreso': 0.06, 'Transferencia': 0.04} # Las transferencias puntuales van entre cuentas
+
+
+
+# --- 2. GENERADOR ---
+
+def _lognormal(rng, means, sigma=0.6):
+    """Montos positivos con la media pedida (por fila) y cola larga, redondeados a centavos."""
+    return np.round(rng.lognormal(np.log(means) - sigma ** 2 / 2, sigma), 2).clip(0.5)
+
+
+def _monthly_schedule(members, accounts, goals, months):
+    """Plantillas de movimientos fijos mensuales: (Tipo, Categoría, Cuenta, Monto, Miembro, Destino, día del mes)."""
+    templates = [('Ingreso', 'Salario', 'Banco', 2800.0 - 400.0 * i, member, 'N/A', 1) for i, member in enumerate(members[:2])]
+    templates += [('Gasto', 'Alquiler', 'Banco', 1200.0, 'N/A', 'N/A', 1), ('Gasto', 'Servicios', 'Banco', 140.0, 'N/A', 'N/A', 10)]
+    if 'Crédito' in accounts:
+        templates.append(('Gasto', 'Deudas', 'Crédito', 300.0, 'N/A', 'N/A', 15))
+    templates += [('Transferencia', 'N/A', 'Banco', round(target / 36, 2), 'N/A', name, 5) for name, target in goals]
+    rows = []
+    for month_index, month in enumerate(months):
+        drift = 1 + 0.002 * month_index # Inflación suave mes a mes
+        for tipo, categoria, cuenta, monto, miembro, destino, day in templates:
+            rows.append((month + pd.Timedelta(days=day - 1, hours=9), tipo, categoria, cuenta, round(monto * drift, 2), miembro, destino))
+    return pd.DataFrame(rows, columns=['Fecha', 'Tipo', 'Categoría', 'Cuenta', 'Monto', 'Miembro', 'Destino'])
+
+
+def make_household(n_rows: int, seed: int = SEED, end=None, years: int = 5, n_members: int = 3, n_accounts: int = 4, n_goals: int = 3):
+    """
+    Genera un hogar completo y reproducible con `n_rows` transacciones en `years` años (desde 2020 o hasta `end`):
+    ingresos y gastos fijos mensuales (Recurrente), aportes mensuales a las metas, y gastos/ingresos puntuales
+    con más movimiento los fines de semana. Devuelve un dict con las mismas claves que db.load_user_data.
+    """
+    rng = np.random.default_rng(seed)
+    members = HOUSEHOLD_MEMBERS[:max(1, n_members)]
+    accounts = HOUSEHOLD_ACCOUNTS[:max(3, n_accounts)]
+    account_names = [name for name, _ in accounts]
+    goals = HOUSEHOLD_GOALS[:n_goals]
+    first_day = pd.Timestamp('2020-01-01') if end is None else pd.Timestamp(end).normalize() - pd.Timedelta(days=years * 365)
+    n_days = years * 365
+
+    # Movimientos fijos: a lo sumo la mitad de las filas (los meses más recientes si no caben todos)
+    months = pd.date_range(first_day, first_day + pd.Timedelta(days=n_days - 1), freq='MS')
+    fixed = _monthly_schedule(members, account_names, goals, months)
+    fixed = fixed[fixed['Fecha'] < first_day + pd.Timedelta(days=n_days)].nlargest(min(len(fixed), n_rows // 2), 'Fecha')
+    fixed['Recurrente'], fixed['Frecuencia'] = True, 'Mensual'
+
+    # Movimientos puntuales
+    n_one_off = n_rows - len(fixed)
+    day_offsets = np.arange(n_days)
+    weights = np.where(((first_day.dayofweek + day_offsets) % 7) >= 5, 1.4, 1.0)
+    fechas = first_day + pd.to_timedelta(rng.choice(day_offsets, size=n_one_off, p=weights / weights.sum()), unit='D') \
+        + pd.to_timedelta(rng.integers(7 * 60, 23 * 60, size=n_one_off), unit='min')
+    tipos = rng.choice(list(ONE_OFF_MIX), size=n_one_off, p=list(ONE_OFF_MIX.values()))
+    expense_names, expense_specs = list(ONE_OFF_EXPENSES), np.array(list(ONE_OFF_EXPENSES.values()))
+    income_names, income_specs = list(ONE_OFF_INCOME), np.array(list(ONE_OFF_INCOME.values()))
+    expense_pick = rng.choice(len(expense_names), size=n_one_off, p=expense_specs[:, 0])
+    income_pick = rng.choice(len(income_names), size=n_one_off, p=income_specs[:, 0])
+    is_expense, is_income, is_transfer = tipos == 'Gasto', tipos == 'Ingreso', tipos == 'Transferencia'
+    categorias = np.where(is_expense, np.array(expense_names)[expense_pick], np.where(is_income, np.array(income_names)[income_pick], 'N/A'))
+    means = np.where(is_expense, expense_specs[expense_pick, 1], np.where(is_income, income_specs[income_pick, 1], 200.0))
+    account_p = np.array([0.3, 0.4, 0.3] + [0.0] * (len(account_names) - 3))
+    cuentas = np.array(account_names)[rng.choice(len(account_names), size=n_one_off, p=account_p)]
+    # Transferencia puntual: de la cuenta elegida a otra distinta
+    shift = rng.integers(1, len(account_names), size=n_one_off)
+    destinos = np.where(is_transfer, np.array(account_names)[(pd.Index(account_names).get_indexer(cuentas) + shift) % len(account_names)], 'N/A')
+    one_off = pd.DataFrame({
+        'Fecha': fechas, 'Tipo': tipos, 'Categoría': categorias, 'Cuenta': cuentas, 'Monto': _lognormal(rng, means),
+        'Miembro': np.array(members + ['N/A'])[rng.integers(0, len(members) + 1, size=n_one_off)], 'Destino': destinos,
+        'Recurrente': False, 'Frecuencia': 'Única/N/A',
+    })
+
+    transactions = pd.concat([fixed, one_off], ignore_index=True)
+    transactions['Descripción'] = ''
+    transactions = transactions[list(db.DEFAULT_TRANSACTIONS.columns)].sort_values(by='Fecha', ascending=False, kind='stable').reset_index(drop=True)
+
+    last_day = (first_day + pd.Timedelta(days=n_days - 1)).date()
+    period_start = last_day.replace(day=1)
+    return {
+        db.TRANSACTIONS_TABLE: transactions,
+        db.ACCOUNTS_TABLE: pd.DataFrame({'Nombre': account_names, 'Tipo': [t for _, t in accounts], 'Saldo Inicial': np.round(rng.uniform(0, 3000, size=len(accounts)), 2)}),
+        db.GOALS_TABLE: pd.DataFrame({'Nombre': [name for name, _ in goals], 'Monto Objetivo': [target for _, target in goals],
+                                      'Monto Aportado': 0.0, 'Fecha Objetivo': [last_day + timedelta(days=365 * (i + 1)) for i in range(len(goals))]}),
+        db.CATEGORIES_TABLE: {tipo: list(names) for tipo, names in db.DEFAULT_CATEGORIES.items()},
+        db.MEMBERS_TABLE: list(members),
+        'budget_config': {'period_start': period_start, 'period_end': period_start + timedelta(days=29), 'budget_amount': 2500.0},
+        'category_budgets': {'Comida': 600.0, 'Transporte': 200.0, 'Entretenimiento': 250.0, 'Servicios': 180.0, 'Otros Gastos': 150.0},
+    }
+
+
+def make_transactions(n_rows: int, seed: int = SEED, end=None):
+    """Solo el historial de un hogar por defecto de make_household (para pruebas y benchmarks que no necesitan el resto)."""
+    return make_household(n_rows, seed=seed, end=end)[db.TRANSACTIONS_TABLE]
+
+
+def store_household(client, user_id, household):
+    """Guarda un hogar de make_household en el cliente (como si el usuario ya lo tuviera en Supabase)."""
+    for table in [db.TRANSACTIONS_TABLE, db.ACCOUNTS_TABLE, db.GOALS_TABLE]:
+        db.set_snapshot(table, user_id, None)
+        db.save_data(client, table, household[table], user_id)
+    db.save_categories(client, household[db.CATEGORIES_TABLE], user_id)
+    db.save_members(client, household[db.MEMBERS_TABLE], user_id)
+    budget_config = {key: value.isoformat() if hasattr(value, 'isoformat') else value for key, value in household['budget_config'].items()}
+    db.save_config_key(client, user_id, db.BUDGET_KEY, budget_config)
+    db.save_config_key(client, user_id, db.CATEGORY_BUDGET_KEY, household['category_budgets'])
+
@@ -0,0 +1,109 @@
+# --- Archivo: tests/conftest.py ---
+# Fixtures comunes: session_state y cachés limpias en cada prueba, datos solo desde synthetic_data
+
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+import streamlit as st
+from streamlit import config as st_config
+
+import charts
+import database as db
+from fake_supabase import FakeSupabaseClient
+from synthetic_data import SEED, make_household, make_transactions, store_household
+
+USER_ID = 'test-user'
+
+
+def _quiet_streamlit():
+    """Fuera de `streamlit run` Streamlit avisa en cada llamada al session_state."""
+    st_config.set_option('global.showWarningOnDirectExecution', False)
+    st_config.set_option('logger.level', 'error')
+    for name in [n for n in logging.root.manager.loggerDict if n.startswith('streamlit')] + ['streamlit']:
+        logging.getLogger(name).setLevel(logging.ERROR)
+
+
+_quiet_streamlit()
+
+
+@pytest.fixture(autouse=True)
+def clean_session():
+    """Cada prueba empieza sin session_state ni cachés del proceso."""
+    st.session_state.clear()
+    db.clear_shared_cache()
+    charts.clear_figure_cache()
+    yield
+    st.session_state.clear()
+    db.clear_shared_cache()
+
+
+@pytest.fixture
+def household():
+    """Hogar sintético con historial hasta hoy."""
+    return make_household(3_000, end=datetime.now())
+
+
+@pytest.fixture
+def client():
+    return FakeSupabaseClient()
+
+
+@pytest.fixture
+def stored_client(client, household):
+    """Cliente en memoria con el hogar ya guardado (como un usuario existente en Supabase)."""
+    store_household(client, USER_ID, household)
+    db.clear_shared_cache()
+    st.session_state.clear()
+    return client
+
+
+@pytest.fixture
+def history_session(client, household):
+    """Sesión con el historial guardado y en memoria, cuentas y metas del hogar (libro, cubo y metas al día)."""
+    df = db.ensure_row_ids(household[db.TRANSACTIONS_TABLE])
+    db.set_snapshot(db.TRANSACTIONS_TABLE, USER_ID, None)
+    db.save_data(client, db.TRANSACTIONS_TABLE, df, USER_ID)
+    db.set_transactions(df)
+    db.set_state('accounts_df', household[db.ACCOUNTS_TABLE])
+    db.set_state('goals_df', household[db.GOALS_TABLE])
+    db.set_snapshot(db.GOALS_TABLE, USER_ID, None)
+    db.save_data(client, db.GOALS_TABLE, st.session_state.goals_df, USER_ID)
+    db.ledger_account_flows()
+    db.get_rollup_cube()
+    db.sync_goal_progress(client, USER_ID)
+    return client
+
+
+@pytest.fixture
+def mutate():
+    """
+    Aplica al historial de la sesión una mutación aleatoria como las de la app, con su delta:
+    alta, edición o borrado (Registrar/Historial), páginas antiguas o reemplazo completo (importación, sin delta).
+    """
+    def apply(rng, step):
+        df = db.get_transactions()
+        op = rng.choice(['add', 'edit', 'delete', 'older', 'replace'], p=[0.35, 0.3, 0.25, 0.07, 0.03])
+        if op == 'add':
+            new_rows = make_transactions(int(rng.integers(1, 4)), seed=int(rng.integers(1 << 31)), end=datetime.now())
+            db.set_transactions(pd.concat([df, new_rows], ignore_index=True).sort_values(by='Fecha', ascending=False), delta=(None, new_rows))
+        elif op in ('edit', 'delete'):
+            df_edited = df.astype({col: object for col in db.TRANSACTION_CATEGORICAL_COLUMNS})
+            rows = rng.choice(len(df_edited), size=min(int(rng.integers(1, 20)), len(df_edited)), replace=False)
+            if op == 'edit':
+                df_edited.loc[rows, 'Monto'] = np.round(rng.uniform(1, 500, size=len(rows)), 2)
+                df_edited.loc[rows, 'Cuenta'] = rng.choice(['Efectivo', 'Banco', 'Crédito', 'Nueva'], size=len(rows))
+                df_edited.loc[rows, 'Tipo'] = rng.choice(['Gasto', 'Ingreso', 'Transferencia'], size=len(rows))
+                df_edited.loc[rows, 'Destino'] = rng.choice(['Banco', 'Fondo de Emergencia', 'N/A'], size=len(rows))
+            else:
+                df_edited = df_edited.drop(index=rows)
+            db.set_transactions(df_edited.sort_values(by='Fecha', ascending=False).reset_index(drop=True), delta=db.transaction_changes(df, df_edited))
+        elif op == 'older':
+            older = db.ensure_row_ids(make_transactions(int(rng.integers(10, 200)), seed=int(rng.integers(1 << 31)), end=datetime(2014, 1, 1)))
+            db.set_transactions(pd.concat([df, older], ignore_index=True), delta=(None, older))
+        else:
+            db.set_transactions(db.ensure_row_ids(make_transactions(len(df), seed=SEED + step, end=datetime.now())))
+        return op
+    return apply
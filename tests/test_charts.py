@@ -0,0 +1,60 @@
+# --- Archivo: tests/test_charts.py ---
+# Fábrica de figuras: caché por contenido, presupuesto en un solo trazo y medidores combinados
+
+from datetime import datetime
+
+import plotly.io as pio
+import plotly.tools
+import pytest
+
+import charts
+import database as db
+from synthetic_data import make_household
+
+TITLE = 'Gasto vs. Presupuesto'
+
+
+def _plotly_chart_payload(fig):
+    """Lo que hace st.plotly_chart con la figura: validarla y serializarla."""
+    return pio.to_json(plotly.tools.return_figure_from_figure_or_data(fig, validate_figure=True), validate=False)
+
+
+def _dashboard_figures(aggregates):
+    """Las figuras que pide view_dash a la fábrica en cada rerun."""
+    return [charts.projection_figure(aggregates['recurring_projection']), charts.budget_figure(aggregates['budget_chart'], TITLE),
+            charts.top5_figure(aggregates['top5']), charts.day_pattern_figure(aggregates['day_pattern']),
+            charts.cash_flow_figure(aggregates['cash_flow']), charts.pie_figure(aggregates['pie_gastos']),
+            charts.pie_figure(aggregates['pie_ingresos'])]
+
+
+@pytest.fixture
+def aggregates(household):
+    db.set_transactions(household[db.TRANSACTIONS_TABLE])
+    budgets = {category: 150.0 for category in db.DEFAULT_CATEGORIES['Gasto']}
+    return db.compute_dashboard_aggregates(db.get_transactions(), household[db.ACCOUNTS_TABLE], db.active_filter_tuple(),
+                                           household['budget_config'], budgets, cube=db.get_rollup_cube())
+
+
+def test_cached_figures_are_reused_until_the_data_changes(aggregates):
+    first = _dashboard_figures(aggregates)
+    assert _plotly_chart_payload(first[1]) == _plotly_chart_payload(charts.build_budget_figure(aggregates['budget_chart'], TITLE))
+    for _ in range(5):
+        assert all(a is b for a, b in zip(first, _dashboard_figures(aggregates)))
+    assert charts.figure_cache_stats()['builds'] == 7
+    changed = aggregates['budget_chart'].assign(Gastado=aggregates['budget_chart']['Gastado'] + 1.0)
+    assert charts.budget_figure(changed, TITLE) is not first[1]
+    assert charts.figure_cache_stats()['builds'] == 8
+
+
+def test_budget_lines_are_a_single_trace(aggregates):
+    fig = charts.build_budget_figure(aggregates['budget_chart'], TITLE)
+    assert len(fig.data) == 2 and len(fig.data[1].x) == 3 * len(aggregates['budget_chart'])
+    assert len(fig.layout.shapes) == 0 and len(fig.layout.annotations) == 0
+
+
+def test_goal_gauges_share_one_figure():
+    household = make_household(2_000, end=datetime.now(), n_goals=5)
+    df_goals = db.goal_progress(household[db.GOALS_TABLE])
+    fig = charts.build_goal_gauges_figure(df_goals)
+    assert len(fig.data) == 5 and fig.layout.height == charts.GAUGE_ROW_HEIGHT * 2
+    assert all(name in trace.title.text for name, trace in zip(df_goals['Nombre'], fig.data))
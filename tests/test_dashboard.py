@@ -0,0 +1,143 @@
+# --- Archivo: tests/test_dashboard.py ---
+# Agregados del dashboard: KPIs en una pasada, superávit fijo, caché por versión y cubo diario
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import database as db
+from synthetic_data import SEED, make_household, make_transactions
+
+NO_PERIOD = {'period_start': None, 'period_end': None, 'budget_amount': 0.0}
+
+
+def _sorted_close(got: pd.Series, want: pd.Series):
+    got, want = got[got != 0].sort_index(), want[want != 0].astype('float64').sort_index()
+    return [str(i) for i in got.index] == [str(i) for i in want.index] and np.allclose(got.to_numpy(), want.to_numpy())
+
+
+def _row_charts(df, filters):
+    """Referencia: los gráficos filtrados agrupando directamente las transacciones."""
+    filtered = df.iloc[db.filter_positions(db.get_filter_index(df), *filters)]
+    gastos = filtered[filtered['Tipo'] == 'Gasto']
+    flujo = filtered[filtered['Tipo'].isin(['Ingreso', 'Gasto'])]
+    all_gastos = df[df['Tipo'] == 'Gasto']
+    return {
+        'count': len(filtered),
+        'pie_gastos': gastos.groupby('Categoría', observed=True)['Monto'].sum(),
+        'pie_ingresos': filtered[filtered['Tipo'] == 'Ingreso'].groupby('Categoría', observed=True)['Monto'].sum(),
+        'cash_flow': flujo.pivot_table(index=flujo['Fecha'].dt.normalize(), columns='Tipo', values='Monto', aggfunc='sum', observed=True).fillna(0),
+        'dow_profile': all_gastos.groupby(all_gastos['Fecha'].dt.day_name().map(db.DAY_NAMES_MAP))['Monto'].mean(),
+    }
+
+
+def _assert_cube_matches(df, filters):
+    expected = _row_charts(df, filters)
+    cube = db.get_rollup_cube()
+    aggregates = db.compute_dashboard_aggregates(df, pd.DataFrame(), filters, NO_PERIOD, {}, cube=cube)
+    assert int(db.slice_cube(cube['daily'], *filters)['N'].sum()) == expected['count']
+    for key in ['pie_gastos', 'pie_ingresos']:
+        got = aggregates[key].set_index('Categoría')['Monto'] if aggregates.get(key) is not None else pd.Series(dtype='float64')
+        assert _sorted_close(got, expected[key]), key
+    if aggregates.get('cash_flow') is not None:
+        got = aggregates['cash_flow'].set_index('Fecha_Dia')
+        for column in expected['cash_flow'].columns:
+            assert np.allclose(got[column].to_numpy(), expected['cash_flow'][column].to_numpy()), column
+    day_pattern = aggregates['day_pattern'].set_index('Día de la Semana')['Gasto Promedio ($)']
+    assert _sorted_close(day_pattern.rename(index=str), expected['dow_profile'])
+
+
+def test_compute_kpis_matches_per_metric_reference():
+    df = db.normalize_transactions(make_transactions(5_000))
+    end_date = df['Fecha'].max().date()
+    start_date = end_date - timedelta(days=15)
+    kpis = db.compute_kpis(df, start_date, end_date)
+    gastos = df[df['Tipo'] == 'Gasto']
+    in_period = gastos[(gastos['Fecha'] >= pd.Timestamp(start_date)) & (gastos['Fecha'] < pd.Timestamp(end_date) + timedelta(days=1))]
+    recurrent = df[df['Recurrente']]
+    monthly = recurrent['Monto'] * recurrent['Frecuencia'].astype(str).map(db.FREQUENCY_MULTIPLIER).fillna(0.0)
+    assert np.isclose(kpis['income'], df.loc[df['Tipo'] == 'Ingreso', 'Monto'].sum())
+    assert np.isclose(kpis['expense'], gastos['Monto'].sum())
+    assert np.isclose(kpis['period_spend'], in_period['Monto'].sum())
+    assert np.isclose(kpis['fixed_income'], monthly[recurrent['Tipo'] == 'Ingreso'].sum())
+    assert _sorted_close(kpis['period_spend_by_category'].rename(index=str), in_period.groupby('Categoría', observed=True)['Monto'].sum().rename(index=str))
+    assert _sorted_close(kpis['dow_profile'], gastos.groupby(gastos['Fecha'].dt.day_name().map(db.DAY_NAMES_MAP))['Monto'].mean())
+
+
+def test_fixed_surplus_matches_row_by_row():
+    rng = np.random.default_rng(SEED)
+    df = make_transactions(3_000)
+    df['Recurrente'] = rng.random(len(df)) < 0.5
+    df['Frecuencia'] = rng.choice(list(db.FREQUENCY_MULTIPLIER) + ['Única/N/A'], size=len(df))
+    fixed = df[df['Recurrente']]
+    monthly = fixed.apply(lambda row: row['Monto'] * db.FREQUENCY_MULTIPLIER.get(row['Frecuencia'], 0.0), axis=1)
+    income, expense, surplus = db.calculate_fixed_surplus(df)
+    assert np.isclose(income, monthly[fixed['Tipo'] == 'Ingreso'].sum()) and np.isclose(expense, monthly[fixed['Tipo'] == 'Gasto'].sum())
+    assert np.isclose(surplus, income - expense)
+    assert len(db.calculate_recurring_projection(df)) == 12
+
+
+def test_dashboard_cache_recomputes_only_when_data_changes():
+    db.set_transactions(make_transactions(2_000))
+    calls = []
+
+    def rerun():
+        deps = (db.get_version('transactions_df'), db.active_filter_tuple())
+        return db.cached_aggregate('dashboard', deps, lambda: calls.append(1) or db.compute_kpis(db.get_transactions()))
+
+    first = rerun()
+    assert all(rerun() is first for _ in range(20))
+    assert len(calls) == 1 and db.aggregate_cache_stats()['hits'] == 20
+    db.set_transactions(db.get_transactions().copy())
+    assert rerun() is not first and len(calls) == 2
+
+
+def test_cube_follows_random_mutations(mutate):
+    rng = np.random.default_rng(SEED)
+    db.set_transactions(db.ensure_row_ids(make_transactions(3_000, end=datetime.now())))
+    db.get_rollup_cube()
+    today = datetime.now().date()
+    for step in range(60):
+        mutate(rng, step)
+        if step % 6 == 0:
+            filters = (today - timedelta(days=int(rng.integers(1, 400))), today, rng.choice([db.FILTER_ALL, 'Gasto', 'Ingreso']), rng.choice([db.FILTER_ALL, 'Ana']))
+            _assert_cube_matches(db.get_transactions(), filters)
+
+
+def test_cube_rebuilds_when_a_delta_has_no_ids():
+    db.set_transactions(db.ensure_row_ids(make_transactions(500, end=datetime.now())))
+    db.get_rollup_cube()
+    new_rows = make_transactions(2, seed=SEED + 1, end=datetime.now())
+    db.set_transactions(pd.concat([db.get_transactions(), new_rows], ignore_index=True), delta=(None, new_rows))
+    assert int(db.get_rollup_cube()['daily']['N'].sum()) == 502
+
+
+@pytest.fixture
+def partial_history():
+    """Hogar completo y la sesión con solo sus últimos 30 días en memoria (el resto aún cargándose)."""
+    household = make_household(3_000, end=datetime.now())
+    df = db.ensure_row_ids(household[db.TRANSACTIONS_TABLE])
+    boundary = pd.Timestamp(datetime.now().date() - timedelta(days=30))
+    db.set_transactions(df[df['Fecha'] >= boundary].reset_index(drop=True))
+    return household, df
+
+
+def test_dashboard_totals_come_from_the_server_while_history_loads(partial_history):
+    household, full = partial_history
+    config = household['budget_config']
+    full_kpis = db.compute_kpis(db.normalize_transactions(full))
+    server = {
+        'account_flows': db.transaction_flows(full).rename_axis('Nombre').reset_index(),
+        'period_spend_by_category': pd.Series(dtype='float64'),
+        'totals': {'income': full_kpis['income'], 'expense': full_kpis['expense'], 'dow_profile': full_kpis['dow_profile']},
+    }
+    df = db.get_transactions()
+    partial = db.compute_dashboard_aggregates(df, household[db.ACCOUNTS_TABLE], db.active_filter_tuple(), config, {}, cube=db.get_rollup_cube())
+    assert partial['kpis']['ingresos'] < full_kpis['income']
+    aggregates = db.compute_dashboard_aggregates(df, household[db.ACCOUNTS_TABLE], db.active_filter_tuple(), config, {}, server, cube=db.get_rollup_cube())
+    assert np.isclose(aggregates['kpis']['ingresos'], full_kpis['income']) and np.isclose(aggregates['kpis']['gastos'], full_kpis['expense'])
+    assert np.isclose(aggregates['kpis']['balance_total'], full_kpis['income'] - full_kpis['expense'])
+    day_pattern = aggregates['day_pattern'].set_index('Día de la Semana')['Gasto Promedio ($)']
+    assert _sorted_close(day_pattern.rename(index=str), full_kpis['dow_profile'])
@@ -0,0 +1,75 @@
+# --- Archivo: tests/test_fake_supabase.py ---
+# Cliente en memoria: upsert por clave única, bytes, fallos inyectados y configuración con una sola variable
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+import streamlit as st
+
+import app
+import database as db
+import fake_supabase
+import storage
+from fake_supabase import FakeSupabaseClient
+
+
+def test_upsert_on_conflict_updates_in_place():
+    client = FakeSupabaseClient()
+    backend = storage.get_backend(client)
+    backend.upsert(db.CONFIG_TABLE, [{'user_id': f'u{i}', 'clave': 'k', 'valor': i} for i in range(50)], on_conflict='user_id, clave')
+    backend.upsert(db.CONFIG_TABLE, [{'user_id': f'u{i}', 'clave': 'k', 'valor': -i} for i in range(10)], on_conflict='user_id, clave')
+    assert len(client.rows(db.CONFIG_TABLE)) == 50
+    assert backend.load_config('u7', ['k']) == {'k': -7} and backend.load_config('u30', ['k']) == {'k': 30}
+
+
+def test_bytes_received_are_the_response_json():
+    client = FakeSupabaseClient(count_bytes=True)
+    backend = storage.get_backend(client)
+    backend.upsert(db.CONFIG_TABLE, [{'user_id': 'u7', 'clave': 'k', 'valor': 'ñandú'}], on_conflict='user_id, clave')
+    client.reset_stats()
+    rows, _ = backend.select(db.CONFIG_TABLE, 'u7')
+    assert client.stats['bytes_received'] == len(json.dumps(rows, default=str, ensure_ascii=False).encode('utf-8'))
+
+
+def test_injected_failures_apply_nothing():
+    failing = FakeSupabaseClient(read_failure_rate=1.0)
+    with pytest.raises(ConnectionError):
+        storage.get_backend(failing).select(db.CONFIG_TABLE, 'u7')
+    failing.read_failure_rate = 0.0
+    failing.fail_next(1)
+    with pytest.raises(ConnectionError):
+        storage.get_backend(failing).insert(db.MEMBERS_TABLE, [{'user_id': 'u', 'nombre': 'X'}])
+    assert failing.rows(db.MEMBERS_TABLE) == [] and failing.stats['failures'] == 2
+
+
+def test_parse_setting():
+    assert fake_supabase.parse_setting('1') == {}
+    with pytest.raises(ValueError):
+        fake_supabase.parse_setting('latencia=1')
+
+
+def test_fake_connection_signs_in_and_loads_a_household():
+    client = app.init_fake_connection('latency=0.001,count_bytes=1,rows=2000')
+    session = client.auth.get_session()
+    assert session.user.id == fake_supabase.FAKE_USER.id and client.latency == 0.001
+    client.auth.sign_out()
+    assert client.auth.get_session() is None
+    client.auth.sign_in_with_oauth({'provider': 'google'})
+    assert client.auth.get_session().user.id == fake_supabase.FAKE_USER.id
+
+    st.session_state.clear()
+    db.clear_shared_cache()
+    app.init_session_state(client, session.user.id, force_load=True)
+    assert len(db.get_transactions()) > 0 and not st.session_state.accounts_df.empty
+    assert client.stats['bytes_received'] > 0
+
+
+def test_app_imports_the_fake_client_only_when_asked():
+    assert app.FAKE_SUPABASE_ENV == fake_supabase.FAKE_SUPABASE_ENV
+    code = "import sys, app; print(sorted({'fake_supabase', 'synthetic_data'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=Path(__file__).resolve().parent.parent)
+    assert result.stdout.strip().splitlines()[-1] == '[]'
@@ -0,0 +1,40 @@
+# --- Archivo: tests/test_filters.py ---
+# Motor de filtros del sidebar (índice ordenado por fecha + códigos) contra máscaras de pandas
+
+import pandas as pd
+import pytest
+
+import database as db
+from synthetic_data import make_transactions
+
+
+@pytest.fixture
+def transactions():
+    return db.normalize_transactions(make_transactions(5_000))
+
+
+@pytest.mark.parametrize('days, tipo, miembro', [
+    (30, db.FILTER_ALL, db.FILTER_ALL), (30, 'Gasto', db.FILTER_ALL), (90, 'Gasto', 'Ana'),
+    (365, 'Ingreso', 'N/A'), (30, 'Gasto', 'Nadie'), (None, db.FILTER_ALL, 'Luis'),
+])
+def test_filters_match_pandas_masks(transactions, days, tipo, miembro):
+    df = transactions
+    end = df['Fecha'].max().date()
+    start = None if days is None else end - pd.Timedelta(days=days)
+    mask = df['Fecha'] < pd.Timestamp(end) + pd.Timedelta(days=1)
+    if start is not None:
+        mask &= df['Fecha'] >= pd.Timestamp(start)
+    if tipo != db.FILTER_ALL:
+        mask &= df['Tipo'] == tipo
+    if miembro != db.FILTER_ALL:
+        mask &= df['Miembro'] == miembro
+    filtered = df.iloc[db.filter_positions(db.get_filter_index(df), start, end, tipo, miembro)]
+    assert sorted(filtered.index) == sorted(df.index[mask])
+    assert filtered['Fecha'].is_monotonic_increasing
+
+
+def test_filter_index_is_rebuilt_for_a_new_history(transactions):
+    index = db.get_filter_index(transactions)
+    assert db.get_filter_index(transactions) is index
+    other = transactions.iloc[:100]
+    assert len(db.get_filter_index(other)['order']) == 100
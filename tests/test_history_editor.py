@@ -0,0 +1,115 @@
+# --- Archivo: tests/test_history_editor.py ---
+# Historial paginado: búsqueda, orden, páginas editadas y guardado por id
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import database as db
+import ui_views as views
+from synthetic_data import SEED, make_transactions
+from conftest import USER_ID
+
+
+def _random_page_edit(rng, page_size=100):
+    """Una página editada como en el editor: celdas cambiadas, filas nuevas, quitadas o marcadas para borrar."""
+    df = db.get_transactions()
+    order = db.history_order(df, rng.choice(['Fecha', 'Monto', 'Cuenta']), bool(rng.integers(2)))
+    page = db.history_page(df, order, int(rng.integers(0, max(1, len(df) // page_size))), page_size)
+    edited = page.astype({col: object for col in db.TRANSACTION_CATEGORICAL_COLUMNS}).reset_index(drop=True)
+    rows = rng.choice(len(edited), size=min(int(rng.integers(1, 6)), len(edited)), replace=False)
+    edited.loc[rows, 'Monto'] = np.round(rng.uniform(1, 500, size=len(rows)), 2)
+    edited.loc[rows, 'Tipo'] = rng.choice(['Gasto', 'Transferencia'], size=len(rows))
+    edited.loc[rows, 'Destino'] = rng.choice(['Fondo de Emergencia', 'N/A'], size=len(rows))
+    edited.loc[rows[:1], 'Fecha'] = pd.Timestamp(datetime.now()).floor('s') - pd.Timedelta(days=int(rng.integers(0, 2000)))
+    edited.loc[rows[:1], 'Cuenta'] = 'Cuenta Nueva'
+    if rng.random() < 0.3:
+        edited = edited.drop(index=rows[-1:])
+    if rng.random() < 0.3:
+        edited = pd.concat([edited, make_transactions(1, seed=int(rng.integers(1 << 31)), end=datetime.now())], ignore_index=True)
+    deleted = edited[db.ROW_ID_COLUMN].dropna().sample(n=min(2, len(edited)), random_state=int(rng.integers(1 << 31))) if rng.random() < 0.3 else []
+    return page, edited, deleted
+
+
+def test_history_order_search_and_sort():
+    df = db.ensure_row_ids(make_transactions(3_000))
+    text = 'comida'
+    matches = np.column_stack([df[c].astype(str).str.lower().str.contains(text, regex=False) for c in db.HISTORY_SEARCH_COLUMNS]).any(axis=1)
+    order = db.history_order(df, 'Monto', True, 'Comida ')
+    assert df.iloc[order][db.ROW_ID_COLUMN].tolist() == df[matches].sort_values('Monto', kind='stable')[db.ROW_ID_COLUMN].tolist()
+    order = db.history_order(df, 'Cuenta', False, '')
+    assert df.iloc[order]['Cuenta'].astype(str).tolist() == df['Cuenta'].astype(str).sort_values(ascending=False, kind='stable').tolist()
+
+
+def test_page_changes_merge_into_history():
+    db.set_transactions(db.ensure_row_ids(make_transactions(3_000)))
+    df = db.get_transactions()
+    page = db.history_page(df, db.history_order(df), 2, 50)
+    shown_ids = page[db.ROW_ID_COLUMN].tolist()
+    edited = page.astype({col: object for col in db.TRANSACTION_CATEGORICAL_COLUMNS})
+    edited.loc[edited.index[0], 'Monto'] = 12345.0
+    edited = edited.drop(index=edited.index[1]) # Fila quitada en el editor
+    new_row = make_transactions(1, seed=SEED + 3)
+    changes = db.history_page_changes(page, pd.concat([edited, new_row], ignore_index=True), deleted_ids=[shown_ids[2]])
+    assert len(changes[0]) == 3 and len(changes[1]) == 2
+
+    merged = db.apply_transaction_changes(df, *changes)
+    merged_by_id = merged.set_index(db.ROW_ID_COLUMN)
+    assert len(merged) == len(df) - 1 and merged['Fecha'].is_monotonic_decreasing
+    assert merged_by_id.loc[shown_ids[0], 'Monto'] == 12345.0
+    assert shown_ids[1] not in merged_by_id.index and shown_ids[2] not in merged_by_id.index
+    assert (merged['Monto'] == new_row['Monto'].iloc[0]).any()
+    assert all(merged[col].dtype == df[col].dtype for col in db.TRANSACTION_CATEGORICAL_COLUMNS)
+    untouched = df[~df[db.ROW_ID_COLUMN].isin(shown_ids[:3])].set_index(db.ROW_ID_COLUMN)
+    pd.testing.assert_frame_equal(merged_by_id.loc[untouched.index], untouched, check_categorical=False)
+
+
+def test_saving_edited_pages_matches_full_recompute(history_session, household):
+    client = history_session
+    rng = np.random.default_rng(SEED)
+    accounts = pd.concat([household[db.ACCOUNTS_TABLE], pd.DataFrame([{'Nombre': 'Cuenta Nueva', 'Tipo': 'Banco', 'Saldo Inicial': 0.0}])], ignore_index=True)
+    everything = (datetime.now().date() - timedelta(days=4000), datetime.now().date(), db.FILTER_ALL, db.FILTER_ALL)
+    for _ in range(25):
+        page, edited, deleted = _random_page_edit(rng)
+        views._save_history_page(client, USER_ID, db.get_transactions(), page, edited, deleted_ids=deleted)
+        df = db.get_transactions()
+        assert df['Fecha'].is_monotonic_decreasing and df[db.ROW_ID_COLUMN].is_unique
+        stored = db._clean_loaded_frame(client.rows(db.TRANSACTIONS_TABLE), db.TRANSACTIONS_TABLE)
+        assert db._row_hashes(stored).sort_index().equals(db._row_hashes(df).sort_index())
+        assert db.get_snapshot(db.TRANSACTIONS_TABLE, USER_ID).sort_index().equals(db._row_hashes(df).sort_index())
+        expected = db.calculate_account_balances(df, accounts)
+        assert np.allclose(expected['Saldo Actual'], db.calculate_account_balances(df, accounts, flows=db.ledger_account_flows())['Saldo Actual'])
+        assert int(db.slice_cube(db.get_rollup_cube()['daily'], *everything)['N'].sum()) == len(df)
+        expected_goals = db.update_goal_progress(df, st.session_state.goals_df)
+        assert np.allclose(expected_goals['Monto Aportado'], st.session_state.goals_df['Monto Aportado'])
+
+
+def test_single_cell_edit_sends_one_row(history_session):
+    client = history_session
+    df_all = db.get_transactions()
+    page = db.history_page(df_all, db.get_history_order(), 0, 100)
+    edited = page.astype({col: object for col in db.TRANSACTION_CATEGORICAL_COLUMNS})
+    edited.loc[edited.index[0], 'Monto'] = 999.0
+    client.reset_stats()
+    views._save_history_page(client, USER_ID, df_all, page, edited)
+    assert client.stats['rows_sent'] == 1
+    assert db.get_transactions().set_index(db.ROW_ID_COLUMN).loc[page[db.ROW_ID_COLUMN].iloc[0], 'Monto'] == 999.0
+
+
+def test_selected_new_rows_are_dropped_not_inserted(history_session):
+    client = history_session
+    df_all = db.get_transactions()
+    page = db.history_page(df_all, db.get_history_order(), 0, 100)
+    edited = page.astype({col: object for col in db.TRANSACTION_CATEGORICAL_COLUMNS}).assign(Seleccionar=False)
+    new_row = make_transactions(1, seed=SEED + 4).drop(columns=[db.ROW_ID_COLUMN], errors='ignore').assign(Monto=123456.78, Seleccionar=True)
+    edited = pd.concat([edited, new_row], ignore_index=True)
+    edited.loc[0, 'Seleccionar'] = True
+    kept, deleted_ids = views._split_selected_rows(edited)
+    assert list(deleted_ids) == [page[db.ROW_ID_COLUMN].iloc[0]] and len(kept) == len(page)
+    client.reset_stats()
+    views._save_history_page(client, USER_ID, df_all, page, kept, deleted_ids=deleted_ids)
+    df = db.get_transactions()
+    assert len(df) == len(df_all) - 1 and not (df['Monto'] == 123456.78).any()
+    assert client.stats['rows_sent'] == 0 and len(client.rows(db.TRANSACTIONS_TABLE)) == len(df)
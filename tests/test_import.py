@@ -0,0 +1,63 @@
+# --- Archivo: tests/test_import.py ---
+# Import de CSV por trozos y sincronización de metadatos (solo las novedades)
+
+import numpy as np
+import pandas as pd
+import pytest
+import streamlit as st
+
+import database as db
+from synthetic_data import SEED, make_transactions
+from conftest import USER_ID
+
+
+@pytest.fixture
+def metadata_session(client):
+    """Sesión y cliente con solo los metadatos por defecto."""
+    st.session_state.members = ['Ana']
+    st.session_state.categories = {k: list(v) for k, v in db.DEFAULT_CATEGORIES.items()}
+    db.save_members(client, st.session_state.members, USER_ID)
+    db.save_categories(client, st.session_state.categories, USER_ID)
+    db.set_state('accounts_df', db.DEFAULT_ACCOUNTS.copy())
+    db.save_data(client, db.ACCOUNTS_TABLE, st.session_state.accounts_df, USER_ID)
+    db.set_state('goals_df', db.DEFAULT_GOALS.copy())
+    client.reset_stats()
+    return client
+
+
+def test_csv_import_in_chunks(metadata_session, tmp_path):
+    client = metadata_session
+    df = make_transactions(2_500)
+    path = tmp_path / 'import.csv'
+    df.to_csv(path, index=False)
+    reports = []
+    summary = db.import_transactions_csv(client, USER_ID, path, chunk_rows=1_000, progress=lambda rows, fraction: reports.append((rows, fraction)))
+    assert summary['imported'] == len(df) and summary['chunks'] == 3 and summary['dropped'] == 0
+    assert reports == [(1_000, reports[0][1]), (2_000, reports[1][1]), (2_500, 1.0)]
+    assert len(client.rows(db.TRANSACTIONS_TABLE)) == len(df)
+    assert set(st.session_state.members) == set(df['Miembro']) - {'N/A'}
+    assert set(df['Cuenta']) <= set(st.session_state.accounts_df['Nombre'])
+    assert len(db.get_transactions()) == int((df['Fecha'] >= pd.Timestamp.now().normalize() - pd.Timedelta(days=db.RECENT_WINDOW_DAYS)).sum())
+
+
+def test_metadata_sync_inserts_only_new_values(metadata_session):
+    client = metadata_session
+    rng = np.random.default_rng(SEED)
+    df = make_transactions(5_000)
+    df['Cuenta'] = [f'Cuenta {i}' for i in rng.integers(0, 300, size=len(df))]
+    df['Categoría'] = [f'Categoría {i}' for i in rng.integers(0, 200, size=len(df))]
+    df['Miembro'] = [f'Miembro {i}' for i in rng.integers(0, 50, size=len(df))]
+
+    assert db.sync_metadata_from_df(client, USER_ID, df)
+    members, accounts = set(st.session_state.members), set(st.session_state.accounts_df['Nombre'])
+    assert members == {'Ana'} | set(df['Miembro'])
+    assert accounts == set(db.DEFAULT_ACCOUNTS['Nombre']) | set(df['Cuenta']) | set(df.loc[df['Destino'] != 'N/A', 'Destino']) - set(db.DEFAULT_GOALS['Nombre'])
+    for tipo in ['Gasto', 'Ingreso']:
+        assert set(st.session_state.categories[tipo]) == set(db.DEFAULT_CATEGORIES[tipo]) | set(df.loc[df['Tipo'] == tipo, 'Categoría'])
+    new_rows = len(members) - 1 + len(accounts) - len(db.DEFAULT_ACCOUNTS) + sum(len(v) for v in st.session_state.categories.values()) - sum(len(v) for v in db.DEFAULT_CATEGORIES.values())
+    assert client.stats['rows_sent'] == new_rows and client.stats['writes'] == 3 # Un insert por tabla
+    assert len(client.rows(db.ACCOUNTS_TABLE)) == len(accounts)
+
+    # Repetir el mismo import no escribe nada
+    client.reset_stats()
+    assert not db.sync_metadata_from_df(client, USER_ID, df) and client.stats['writes'] == 0
@@ -0,0 +1,104 @@
+# --- Archivo: tests/test_incremental_views.py ---
+# Datos derivados mantenidos por delta (libro de saldos, conteos de referencias, motor de metas):
+# tras cualquier secuencia de mutaciones coinciden con recalcularlos sobre el historial
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+import streamlit as st
+
+import database as db
+import ui_views as views
+from synthetic_data import SEED, make_household, make_transactions
+from conftest import USER_ID
+
+ACCOUNTS = pd.DataFrame({'Nombre': ['Efectivo', 'Banco', 'Crédito', 'Ahorros', 'Nueva'], 'Tipo': 'Banco', 'Saldo Inicial': [0.0, 1000.0, 0.0, 10.0, 50.0]})
+GOALS = pd.DataFrame({'Nombre': ['Fondo de Emergencia', 'Banco', 'Sin Aportes'], 'Monto Objetivo': [5000.0, 1e9, 800.0], 'Monto Aportado': 0.0,
+                      'Fecha Objetivo': [(datetime.now() + timedelta(days=365 * i)).date() for i in (1, 2, 3)]})
+
+
+@pytest.fixture
+def session_history():
+    db.set_transactions(db.ensure_row_ids(make_transactions(1_000, end=datetime.now())))
+
+
+def test_ledger_follows_random_mutations(session_history, mutate):
+    rng = np.random.default_rng(SEED)
+    db.ledger_account_flows()
+    ops = set()
+    for step in range(120):
+        ops.add(mutate(rng, step))
+        if step % 3:
+            continue
+        df = db.get_transactions()
+        batch = db.calculate_account_balances(df, ACCOUNTS)
+        incremental = db.calculate_account_balances(df, ACCOUNTS, flows=db.ledger_account_flows())
+        assert np.allclose(batch['Saldo Actual'], incremental['Saldo Actual']), step
+    assert ops == {'add', 'edit', 'delete', 'older', 'replace'}
+
+
+def test_reference_counts_follow_random_mutations(session_history, mutate):
+    rng = np.random.default_rng(SEED + 1)
+    db.get_reference_counts()
+    for step in range(120):
+        mutate(rng, step)
+        assert db.get_reference_counts() == db.count_references(db.get_transactions()), step
+
+
+@pytest.mark.parametrize('value, columns', [
+    ('Banco', ['Cuenta', 'Destino']), ('Comida', ['Categoría']), ('Ana', ['Miembro']),
+    ('Fondo de Emergencia', ['Destino']), ('Sin Uso', ['Cuenta', 'Destino']),
+])
+def test_reference_count_matches_a_scan(session_history, value, columns):
+    df = db.get_transactions()
+    assert db.reference_count(value, columns) == sum(int((df[col].astype(str) == value).sum()) for col in columns)
+
+
+def test_goal_engine_follows_random_mutations(session_history, mutate):
+    rng = np.random.default_rng(SEED + 2)
+    db.get_goal_engine()
+    for step in range(120):
+        mutate(rng, step)
+        df = db.get_transactions()
+        engine, rebuilt = db.get_goal_engine().sort_index(), db.goal_contribution_months(df).sort_index()
+        assert engine.index.equals(rebuilt.index) and np.allclose(engine.to_numpy(), rebuilt.to_numpy()), step
+        transfers = df[(df['Tipo'] == 'Transferencia')].groupby('Destino', observed=True)['Monto'].sum()
+        updated = db.update_goal_progress(None, GOALS, contributions=db.engine_goal_contributions())
+        assert np.allclose(updated['Monto Aportado'], [float(transfers.get(name, 0.0)) for name in GOALS['Nombre']])
+
+
+def test_goal_projection_follows_the_monthly_rate():
+    today = datetime.now().date()
+    household = make_household(20_000, end=datetime.now())
+    db.set_transactions(db.ensure_row_ids(household[db.TRANSACTIONS_TABLE]))
+    goals = household[db.GOALS_TABLE].assign(**{'Monto Objetivo': household[db.GOALS_TABLE]['Monto Objetivo'] * 3})
+    goals = db.update_goal_progress(None, goals, contributions=db.engine_goal_contributions())
+    progress = db.goal_progress(goals, today=today)
+    df = db.get_transactions()
+    for _, goal in progress.iterrows():
+        # En el hogar sintético cada meta recibe una transferencia mensual fija
+        transfers = df[(df['Tipo'] == 'Transferencia') & (df['Destino'] == goal['Nombre'])]
+        monthly = float(transfers.sort_values('Fecha')['Monto'].iloc[-1])
+        assert abs(goal['Aporte Mensual'] / monthly - 1) < 0.25, (goal['Nombre'], goal['Aporte Mensual'], monthly)
+        months_needed = (goal['Monto Objetivo'] - goal['Monto Aportado']) / goal['Aporte Mensual']
+        assert abs((goal['Fecha Proyectada'] - today).days - months_needed * db.DAYS_PER_MONTH) <= 1
+        assert goal['A Tiempo'] == (goal['Fecha Proyectada'] <= goal['Fecha Objetivo'])
+    done = db.goal_progress(goals.assign(**{'Monto Objetivo': 1.0}), today=today)
+    assert (done['Fecha Proyectada'] == today).all() and done['A Tiempo'].all()
+
+
+@pytest.mark.parametrize('name', ['Viaje', 'Ahorros']) # Sin aportes / con transferencias previas a ese destino
+def test_adding_a_goal_writes_the_goals_once(history_session, monkeypatch, name):
+    client = history_session
+    monkeypatch.setattr(st, 'rerun', lambda: None)
+    save_data, saves = db.save_data, []
+    monkeypatch.setattr(db, 'save_data', lambda *args, **kwargs: saves.append(args[1]) or save_data(*args, **kwargs))
+    st.session_state.goal_name_input, st.session_state.goal_amount_input = name, 1500.0
+    st.session_state.goal_date_input = (datetime.now() + timedelta(days=365)).date()
+    client.reset_stats()
+    views.callback_add_goal(client, USER_ID)
+    stored = {row['Nombre']: row['Monto Aportado'] for row in client.rows(db.GOALS_TABLE)}
+    assert saves == [db.GOALS_TABLE] and client.stats['writes'] == 1 and name in stored
+    assert (stored[name] > 0) == (name == 'Ahorros')
@@ -0,0 +1,176 @@
+# --- Archivo: tests/test_loading.py ---
+# Carga inicial en paralelo, reruns sin escrituras, historial paginado y caché compartida entre sesiones
+
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+import database as db
+from fake_supabase import FakeSupabaseClient
+from synthetic_data import SEED, make_household, store_household
+from conftest import USER_ID
+
+IDLE_RERUNS = 100
+
+
+def _recent_rows(household):
+    window_start = pd.Timestamp(datetime.now().date() - timedelta(days=db.RECENT_WINDOW_DAYS))
+    return int((household[db.TRANSACTIONS_TABLE]['Fecha'] >= window_start).sum())
+
+
+def test_load_user_data_runs_the_queries_in_parallel(stored_client, household):
+    client, slow = stored_client, 0.15
+    client.latency = {name: 0.05 for name in [db.ACCOUNTS_TABLE, db.GOALS_TABLE, db.CATEGORIES_TABLE, db.MEMBERS_TABLE, db.CONFIG_TABLE]}
+    client.latency[db.TRANSACTIONS_TABLE] = slow
+    start = time.perf_counter()
+    data, timings = db.load_user_data(client, USER_ID)
+    assert time.perf_counter() - start < slow * 1.5 + 0.1
+    assert set(timings) >= {db.TRANSACTIONS_TABLE, db.ACCOUNTS_TABLE, db.CONFIG_TABLE}
+    assert len(data[db.TRANSACTIONS_TABLE]) == _recent_rows(household)
+    assert sorted(data[db.ACCOUNTS_TABLE]['Nombre']) == sorted(household[db.ACCOUNTS_TABLE]['Nombre'])
+    assert sorted(data[db.MEMBERS_TABLE]) == sorted(household[db.MEMBERS_TABLE])
+    assert data['category_budgets'] == household['category_budgets']
+    assert data['budget_config']['budget_amount'] == household['budget_config']['budget_amount']
+
+
+def test_idle_reruns_write_nothing(stored_client):
+    client = stored_client
+    app.init_session_state(client, USER_ID)
+    db.load_older_transactions(client, USER_ID)
+    app.init_session_state(client, USER_ID) # Primera sincronización de metas
+    client.reset_stats()
+    for _ in range(IDLE_RERUNS):
+        app.init_session_state(client, USER_ID)
+    assert client.stats['writes'] == 0, client.stats
+
+    # Un aporte nuevo sí recalcula y guarda las metas, una vez
+    df = db.get_transactions()
+    new_row = df.iloc[[0]].assign(**{'Tipo': 'Transferencia', 'Destino': 'Fondo de Emergencia', 'Monto': 25.0, db.ROW_ID_COLUMN: db.new_row_id()})
+    db.set_transactions(pd.concat([df, new_row], ignore_index=True))
+    client.reset_stats()
+    for _ in range(IDLE_RERUNS):
+        app.init_session_state(client, USER_ID)
+    assert 1 <= client.stats['writes'] <= 2, client.stats
+
+
+def test_recent_window_then_older_pages(stored_client, household):
+    client = stored_client
+    expected = household[db.TRANSACTIONS_TABLE]
+    client.max_rows = 200 # Tope de filas por respuesta del servidor
+
+    df_recent = db.load_recent_transactions(client, USER_ID)
+    db.set_transactions(df_recent)
+    assert len(df_recent) == _recent_rows(household) and not db.history_covers(USER_ID)
+    client.reset_stats()
+    db.save_data(client, db.TRANSACTIONS_TABLE, db.get_transactions(), USER_ID)
+    assert client.stats['writes'] == 0 # Lo antiguo aún no cargado no se toca
+
+    # Un filtro más amplio trae solo las páginas que necesita
+    wider_start = pd.Timestamp(datetime.now().date() - timedelta(days=db.RECENT_WINDOW_DAYS + 90))
+    db.load_older_transactions(client, USER_ID, until=wider_start)
+    assert db.history_covers(USER_ID, wider_start) and not db.history_covers(USER_ID)
+    assert int((db.get_transactions()['Fecha'] >= wider_start).sum()) == int((expected['Fecha'] >= wider_start).sum())
+
+    # El resto llega por tandas, informando del progreso
+    reports = []
+    while not db.load_older_transactions(client, USER_ID, max_pages=db.HISTORY_PAGES_PER_RUN, progress=lambda loaded, total: reports.append((loaded, total))):
+        pass
+    df_loaded = db.get_transactions()
+    assert db.history_covers(USER_ID) and db.history_progress() is None
+    assert len(df_loaded) == len(expected) and df_loaded[db.ROW_ID_COLUMN].is_unique
+    assert reports[-1][0] == reports[-1][1] == len(expected) - len(df_recent)
+    assert np.isclose(df_loaded['Monto'].sum(), expected['Monto'].sum())
+    client.reset_stats()
+    db.save_data(client, db.TRANSACTIONS_TABLE, df_loaded, USER_ID)
+    assert client.stats['writes'] == 0
+
+
+def test_older_pages_survive_inserts_and_deletes_between_pages(stored_client):
+    client = stored_client
+    client.max_rows = 200
+    db.set_transactions(db.load_recent_transactions(client, USER_ID))
+    table = client.table(db.TRANSACTIONS_TABLE)
+    rng = np.random.default_rng(7)
+    while not db.load_older_transactions(client, USER_ID, max_pages=1):
+        # Entre página y página otra sesión borra filas ya cargadas y añade filas más antiguas que todo
+        loaded_ids = db.get_transactions()[db.ROW_ID_COLUMN].to_numpy(dtype=object)
+        table.delete().in_('id', list(rng.choice(loaded_ids, size=5, replace=False))).execute()
+        oldest = dict(min(client.rows(db.TRANSACTIONS_TABLE), key=lambda row: row['Fecha']), id=db.new_row_id())
+        oldest['Fecha'] = (pd.Timestamp(oldest['Fecha']) - pd.Timedelta(days=1)).strftime(db.DB_DATETIME_FORMAT)
+        client.table(db.TRANSACTIONS_TABLE).insert(oldest).execute()
+    loaded_ids = set(db.get_transactions()[db.ROW_ID_COLUMN])
+    assert db.get_transactions()[db.ROW_ID_COLUMN].is_unique
+    assert {row['id'] for row in client.rows(db.TRANSACTIONS_TABLE)} <= loaded_ids # Ninguna fila se salta
+
+
+@pytest.mark.slow
+def test_first_render_reads_only_the_recent_window_of_a_large_history():
+    client = FakeSupabaseClient()
+    household = make_household(500_000, end=datetime.now())
+    store_household(client, USER_ID, household)
+    client.reset_stats()
+    df = db.load_recent_transactions(client, USER_ID)
+    recent = _recent_rows(household)
+    assert len(df) == recent and client.stats['rows_received'] == recent
+    assert client.stats['round_trips'] == math.ceil(recent / db.LOAD_PAGE_SIZE)
+
+
+def _reference_loads(client, user_id):
+    """Lo que lee cada sesión al entrar (sin el historial)."""
+    accounts = db.load_data(client, db.ACCOUNTS_TABLE, user_id, db.DEFAULT_ACCOUNTS)
+    config = db.load_config_keys(client, user_id, {db.BUDGET_KEY: {}, db.CATEGORY_BUDGET_KEY: {}})
+    return sorted(accounts['Nombre']), db.load_categories(client, user_id), db.load_members(client, user_id), config
+
+
+def test_shared_cache_loads_once_per_household_and_sees_writes():
+    client = FakeSupabaseClient(latency=0.005)
+    households = [f'hogar-{i}' for i in range(4)]
+    for i, user_id in enumerate(households):
+        store_household(client, user_id, make_household(50, seed=SEED + i))
+    db.clear_shared_cache()
+    expected = {user_id: _reference_loads(client, user_id) for user_id in households}
+    db.clear_shared_cache()
+    client.reset_stats()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: _reference_loads(client, households[i % 4]), range(40)))
+    assert results == [expected[households[i % 4]] for i in range(40)]
+    assert client.stats['round_trips'] == 4 * len(households), client.stats # Una carga por tabla y hogar aunque entren a la vez
+    stats = db.shared_cache_stats()
+    assert stats['users'] == len(households) and all(size > 0 for size in stats['bytes_per_user'].values())
+
+    # Quien escribe lee lo que escribió, y al final la caché coincide con la base
+    locks = {user_id: threading.Lock() for user_id in households}
+
+    def session(i):
+        user_id = households[i % 4]
+        if i % 5 == 0:
+            with locks[user_id]:
+                db.save_members(client, db.load_members(client, user_id) + [f'Miembro {i}'], user_id)
+                assert f'Miembro {i}' in db.load_members(client, user_id)
+        return _reference_loads(client, user_id)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(session, range(40)))
+    cached = {user_id: _reference_loads(client, user_id) for user_id in households}
+    db.clear_shared_cache()
+    assert cached == {user_id: _reference_loads(client, user_id) for user_id in households}
+
+
+def test_shared_cache_entries_expire(monkeypatch, client):
+    store_household(client, USER_ID, make_household(50))
+    monkeypatch.setattr(db, 'SHARED_CACHE_TTL_SECONDS', 0.05)
+    db.clear_shared_cache()
+    db.load_members(client, USER_ID)
+    client.reset_stats()
+    db.load_members(client, USER_ID)
+    assert client.stats['round_trips'] == 0
+    time.sleep(0.1)
+    db.load_members(client, USER_ID)
+    assert client.stats['round_trips'] == 1
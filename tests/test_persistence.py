@@ -0,0 +1,84 @@
+# --- Archivo: tests/test_persistence.py ---
+# Guardado incremental por id (save_data) y alta de transacciones desde Registrar
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import database as db
+import ui_views as views
+from synthetic_data import SEED, make_transactions
+from conftest import USER_ID
+
+
+def _assert_backend_matches(client, df):
+    """Lo guardado y la última versión recordada coinciden con el historial en memoria."""
+    stored = db._clean_loaded_frame(client.rows(db.TRANSACTIONS_TABLE), db.TRANSACTIONS_TABLE)
+    assert db._row_hashes(stored).sort_index().equals(db._row_hashes(df).sort_index())
+    assert db.get_snapshot(db.TRANSACTIONS_TABLE, USER_ID).sort_index().equals(db._row_hashes(df).sort_index())
+
+
+def test_save_data_sends_only_changed_rows(client):
+    db.save_data(client, db.TRANSACTIONS_TABLE, make_transactions(2_000), USER_ID)
+    df = db.load_data(client, db.TRANSACTIONS_TABLE, USER_ID, db.DEFAULT_TRANSACTIONS)
+
+    client.reset_stats()
+    db.save_data(client, db.TRANSACTIONS_TABLE, df, USER_ID)
+    assert client.stats['writes'] == 0
+
+    new_entry = make_transactions(1, seed=SEED + 1)
+    df = pd.concat([df, new_entry], ignore_index=True).sort_values(by='Fecha', ascending=False)
+    client.reset_stats()
+    db.save_data(client, db.TRANSACTIONS_TABLE, df, USER_ID)
+    assert client.stats['rows_sent'] == 1 and client.stats['writes'] == 1
+
+    df = df.astype({'Categoría': object})
+    df.loc[df.index[10], 'Monto'] = 4321.0
+    deleted_id = df[db.ROW_ID_COLUMN].iloc[20]
+    df = df[df[db.ROW_ID_COLUMN] != deleted_id]
+    client.reset_stats()
+    db.save_data(client, db.TRANSACTIONS_TABLE, df, USER_ID)
+    assert client.stats['rows_sent'] == 1 and client.stats['writes'] == 2 # Un upsert y un borrado
+    _assert_backend_matches(client, df)
+
+
+def test_save_data_without_snapshot_replaces_everything(client):
+    db.save_data(client, db.TRANSACTIONS_TABLE, make_transactions(500), USER_ID)
+    df = make_transactions(300, seed=SEED + 2)
+    db.set_snapshot(db.TRANSACTIONS_TABLE, USER_ID, None)
+    db.save_data(client, db.TRANSACTIONS_TABLE, df, USER_ID)
+    assert len(client.rows(db.TRANSACTIONS_TABLE)) == 300
+    _assert_backend_matches(client, df)
+
+
+def test_register_transaction_sends_one_row_and_keeps_views_current(history_session, household):
+    client = history_session
+    n_rows = len(db.get_transactions())
+    for i in range(5):
+        new_entry = make_transactions(1, seed=SEED + i, end=datetime.now())
+        client.reset_stats()
+        views._register_transaction(client, USER_ID, new_entry)
+        assert client.stats['rows_sent'] == 1, client.stats
+
+    history = db.get_transactions()
+    assert len(history) == len(client.rows(db.TRANSACTIONS_TABLE)) == n_rows + 5
+    assert history['Fecha'].is_monotonic_decreasing and history[db.ROW_ID_COLUMN].is_unique
+    _assert_backend_matches(client, history)
+    accounts = household[db.ACCOUNTS_TABLE]
+    expected = db.calculate_account_balances(history, accounts)
+    incremental = db.calculate_account_balances(history, accounts, flows=db.ledger_account_flows())
+    assert np.allclose(expected['Saldo Actual'], incremental['Saldo Actual'])
+    expected_goals = db.update_goal_progress(history, st.session_state.goals_df)
+    assert np.allclose(expected_goals['Monto Aportado'], st.session_state.goals_df['Monto Aportado'])
+
+
+def test_register_transaction_gives_ids_to_an_id_less_history(client):
+    df = make_transactions(200, end=datetime.now())
+    db.set_transactions(df)
+    db.get_rollup_cube()
+    views._register_transaction(client, USER_ID, make_transactions(1, seed=SEED + 9, end=datetime.now()))
+    history = db.get_transactions()
+    assert len(history) == 201 and history[db.ROW_ID_COLUMN].notna().all()
+    assert int(db.get_rollup_cube()['daily']['N'].sum()) == 201
@@ -0,0 +1,79 @@
+# --- Archivo: tests/test_profiler.py ---
+# Instrumentación: etapas que cuadran con el cliente, copias contadas, exportación y buffer acotado
+
+import json
+import threading
+
+import pytest
+
+import app
+import database as db
+import profiler
+from conftest import USER_ID
+
+
+@profiler.timed(name='test.noop')
+def _profiled_noop():
+    return None
+
+
+@pytest.fixture
+def profiling():
+    profiler.clear()
+    profiler.enable()
+    yield
+    profiler.disable()
+    profiler.clear()
+
+
+@pytest.fixture
+def startup_records(profiling, stored_client):
+    """Etapas de una carga inicial completa (sin caché compartida) y el cliente que la sirvió."""
+    stored_client.reset_stats()
+    with profiler.stage('test.rerun', root=True):
+        app.init_session_state(stored_client, USER_ID, force_load=True)
+    return profiler.rerun_records(None, profiler.last_rerun(None)), stored_client
+
+
+def test_root_stage_matches_the_client(startup_records):
+    stage_records, client = startup_records
+    root = next(r for r in stage_records if r['root'])
+    assert root['round_trips'] == client.stats['round_trips']
+    assert root['rows_received'] == client.stats['rows_received']
+
+
+def test_parallel_loads_keep_their_parent_stage(startup_records):
+    stage_records, _ = startup_records
+    loads = [r for r in stage_records if r['stage'] == 'database.load_data']
+    assert {r['detail'] for r in loads} == {db.ACCOUNTS_TABLE, db.GOALS_TABLE}
+    assert all(r['parent'] == 'database.load_user_data' and r['thread'] != threading.current_thread().name for r in loads)
+    load_user_data = next(r for r in stage_records if r['stage'] == 'database.load_user_data')
+    assert load_user_data['round_trips'] >= sum(r['round_trips'] for r in loads)
+
+
+def test_deep_copies_are_counted(profiling, household):
+    db.set_transactions(household[db.TRANSACTIONS_TABLE])
+    with profiler.stage('test.copies', root=True):
+        db.get_transactions().copy()
+        db.get_transactions().copy(deep=False)
+    assert profiler.rerun_records(None, profiler.last_rerun(None))[-1]['df_copies'] == 1
+
+
+def test_export_jsonl_round_trips(startup_records, tmp_path):
+    path = tmp_path / 'perfil.jsonl'
+    written = profiler.export_jsonl(str(path))
+    lines = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert written == len(lines) > 0
+    assert lines == json.loads(json.dumps(profiler.records(), default=str))
+
+
+def test_ring_buffer_is_bounded(profiling):
+    for _ in range(profiler.RING_SIZE + 10):
+        _profiled_noop()
+    assert len(profiler.records()) == profiler.RING_SIZE
+
+
+def test_disabled_profiler_records_nothing():
+    profiler.clear()
+    _profiled_noop()
+    assert profiler.records() == []
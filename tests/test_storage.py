@@ -0,0 +1,118 @@
+# --- Archivo: tests/test_storage.py ---
+# Backend SQLite (mismo contrato que Supabase) y agregados calculados en la base de datos
+
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+import streamlit as st
+
+import database as db
+import storage
+from synthetic_data import store_household
+from conftest import USER_ID
+
+TABLES = [db.ACCOUNTS_TABLE, db.TRANSACTIONS_TABLE, db.GOALS_TABLE, db.CATEGORIES_TABLE, db.MEMBERS_TABLE, db.CONFIG_TABLE]
+
+
+@pytest.fixture
+def sqlite_backend(tmp_path):
+    backend = storage.SQLiteBackend(str(tmp_path / 'guardian.sqlite3'))
+    yield backend
+    backend.close()
+
+
+def _contents(client_or_backend):
+    """Filas de cada tabla leídas por la interfaz de backend, sin ids (uuid distintos en cada backend)."""
+    backend = storage.get_backend(client_or_backend)
+    return {
+        table: sorted(json.dumps({k: v for k, v in row.items() if k != 'id'}, sort_keys=True, default=str) for row in backend.select(table, USER_ID)[0])
+        for table in TABLES
+    }
+
+
+def test_sqlite_backend_matches_the_supabase_client(client, sqlite_backend, household):
+    for target in (client, sqlite_backend):
+        st.session_state.clear()
+        store_household(target, USER_ID, household)
+    assert _contents(sqlite_backend) == _contents(client)
+
+    loaded = {}
+    for name, target in [('fake', client), ('sqlite', sqlite_backend)]:
+        st.session_state.clear()
+        db.clear_shared_cache()
+        loaded[name], _ = db.load_user_data(target, USER_ID)
+    for table in [db.TRANSACTIONS_TABLE, db.ACCOUNTS_TABLE, db.GOALS_TABLE]:
+        left, right = (
+            loaded[name][table].drop(columns=db.ROW_ID_COLUMN).astype(str).sort_values(by=[c for c in loaded[name][table].columns if c != db.ROW_ID_COLUMN]).reset_index(drop=True)
+            for name in ('fake', 'sqlite')
+        )
+        pd.testing.assert_frame_equal(left, right, check_dtype=False, check_categorical=False)
+    for key in [db.CATEGORIES_TABLE, db.MEMBERS_TABLE, 'budget_config', 'category_budgets']:
+        assert loaded['fake'][key] == loaded['sqlite'][key]
+
+
+@pytest.mark.parametrize('filters', [
+    [('Fecha', 'gte', (datetime.now().date() - timedelta(days=db.RECENT_WINDOW_DAYS)).strftime(db.DB_DATETIME_FORMAT))],
+    [('Categoría', 'eq', 'Comida')],
+    [('Cuenta', 'eq', 'Banco')],
+])
+def test_sqlite_reads_use_the_indexes(client, sqlite_backend, household, filters):
+    store_household(client, USER_ID, household)
+    st.session_state.clear()
+    store_household(sqlite_backend, USER_ID, household)
+    rows, _ = storage.get_backend(client).select(db.TRANSACTIONS_TABLE, USER_ID, filters=filters)
+    assert len(rows) == len(sqlite_backend.select(db.TRANSACTIONS_TABLE, USER_ID, filters=filters)[0]) > 0
+    where, params = sqlite_backend._where(USER_ID, filters)
+    plan = ' '.join(str(row[-1]) for row in sqlite_backend._db.execute(f'EXPLAIN QUERY PLAN SELECT * FROM transacciones WHERE {where}', params))
+    assert 'USING INDEX' in plan and 'SCAN' not in plan, plan
+
+
+def _client_side(client, household, period):
+    """Referencia: todo el historial traído por páginas y sumado en pandas."""
+    records, _, _ = db.fetch_transaction_pages(client, USER_ID)
+    df = db.normalize_transactions(db._clean_loaded_frame(records, db.TRANSACTIONS_TABLE))
+    kpis = db.compute_kpis(df, *period)
+    return {
+        'balances': db.calculate_account_balances(df, household[db.ACCOUNTS_TABLE]),
+        'goals': db.update_goal_progress(df, household[db.GOALS_TABLE]),
+        'spend': kpis['period_spend_by_category'],
+        'totals': {'income': kpis['income'], 'expense': kpis['expense'], 'dow_profile': kpis['dow_profile']},
+    }
+
+
+def _pushed_down(client, household, period):
+    return {
+        'balances': db.calculate_account_balances(db.DEFAULT_TRANSACTIONS, household[db.ACCOUNTS_TABLE], flows=db.load_account_flows(client, USER_ID)),
+        'goals': db.update_goal_progress(db.DEFAULT_TRANSACTIONS, household[db.GOALS_TABLE], contributions=db.load_goal_contributions(client, USER_ID)),
+        'spend': db.load_category_spend(client, USER_ID, *period),
+        'totals': db.load_history_totals(client, USER_ID),
+    }
+
+
+def _assert_same(left, right):
+    pd.testing.assert_frame_equal(left['balances'], right['balances'], check_exact=False, check_dtype=False)
+    pd.testing.assert_frame_equal(left['goals'], right['goals'], check_exact=False, check_dtype=False)
+    spend_left, spend_right = left['spend'].rename(index=str).sort_index(), right['spend'].rename(index=str).sort_index()
+    assert list(spend_left.index) == list(spend_right.index) and np.allclose(spend_left.to_numpy(), spend_right.to_numpy())
+    assert np.isclose(left['totals']['income'], right['totals']['income']) and np.isclose(left['totals']['expense'], right['totals']['expense'])
+    pd.testing.assert_series_equal(left['totals']['dow_profile'], right['totals']['dow_profile'], check_names=False, check_index_type=False)
+
+
+@pytest.mark.parametrize('backend_name', ['fake', 'sqlite'])
+def test_pushed_down_aggregates_match_client_side(client, sqlite_backend, household, backend_name):
+    target = client if backend_name == 'fake' else sqlite_backend
+    store_household(target, USER_ID, household)
+    today = datetime.now().date()
+    period = (today - timedelta(days=30), today)
+    _assert_same(_client_side(target, household, period), _pushed_down(target, household, period))
+
+
+def test_pushdown_sends_a_few_small_responses(stored_client):
+    client = stored_client
+    client.count_bytes = True
+    client.reset_stats()
+    assert db.load_server_aggregates(client, USER_ID, {'period_start': datetime.now().date(), 'period_end': datetime.now().date()}) is not None
+    assert client.stats['round_trips'] == 4 and client.stats['bytes_received'] < 2_000
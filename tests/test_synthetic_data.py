@@ -0,0 +1,44 @@
+# --- Archivo: tests/test_synthetic_data.py ---
+# Hogares sintéticos: reproducibles y coherentes (saldos y metas cuadran con sus movimientos)
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import database as db
+from synthetic_data import make_household, make_transactions
+
+
+def test_household_is_reproducible():
+    first, second = make_household(2_000, seed=7), make_household(2_000, seed=7)
+    pd.testing.assert_frame_equal(first[db.TRANSACTIONS_TABLE], second[db.TRANSACTIONS_TABLE])
+    assert not first[db.TRANSACTIONS_TABLE].equals(make_household(2_000, seed=8)[db.TRANSACTIONS_TABLE])
+
+
+def test_household_shape():
+    household = make_household(5_000, end=datetime(2026, 1, 31))
+    df = household[db.TRANSACTIONS_TABLE]
+    assert len(df) == 5_000 and list(df.columns) == list(db.DEFAULT_TRANSACTIONS.columns)
+    assert df['Fecha'].is_monotonic_decreasing and df['Fecha'].max() < pd.Timestamp('2026-02-01')
+    assert df['Recurrente'].any() and (df.loc[df['Recurrente'], 'Frecuencia'] == 'Mensual').all()
+    assert set(df['Miembro']) <= set(household[db.MEMBERS_TABLE]) | {'N/A'}
+    assert set(df['Cuenta']) <= set(household[db.ACCOUNTS_TABLE]['Nombre'])
+    assert set(household[db.GOALS_TABLE]['Nombre']) <= set(df.loc[df['Tipo'] == 'Transferencia', 'Destino'])
+
+
+def test_household_balances_and_goals_add_up():
+    household = make_household(5_000, end=datetime.now())
+    df = db.normalize_transactions(household[db.TRANSACTIONS_TABLE])
+    balances = db.calculate_account_balances(df, household[db.ACCOUNTS_TABLE])
+    goals = db.update_goal_progress(df, household[db.GOALS_TABLE])
+    tipos, montos = df['Tipo'].astype(str), df['Monto']
+    to_goals = (tipos == 'Transferencia') & df['Destino'].astype(str).isin(set(household[db.GOALS_TABLE]['Nombre']))
+    expected_total = household[db.ACCOUNTS_TABLE]['Saldo Inicial'].sum() + montos[tipos == 'Ingreso'].sum() - montos[tipos == 'Gasto'].sum() - montos[to_goals].sum()
+    assert np.isclose(balances['Saldo Actual'].sum(), expected_total)
+    assert np.isclose(goals['Monto Aportado'].sum(), montos[to_goals].sum())
+
+
+def test_make_transactions_is_the_household_history():
+    pd.testing.assert_frame_equal(make_transactions(1_000, seed=3), make_household(1_000, seed=3)[db.TRANSACTIONS_TABLE])
+    assert len(make_transactions(1, end=datetime.now())) == 1
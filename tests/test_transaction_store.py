@@ -0,0 +1,24 @@
+# --- Archivo: tests/test_transaction_store.py ---
+# Almacén de transacciones: tipos compactos sin perder valores
+
+import pandas as pd
+
+import database as db
+from synthetic_data import make_transactions
+
+
+def test_normalize_keeps_values_and_shrinks_memory():
+    df = db.ensure_row_ids(make_transactions(5_000))
+    text_cols = [c for c in df.columns if c not in ('Fecha', 'Monto', 'Recurrente')]
+    df_object = df.astype({c: object for c in text_cols})
+    store = db.normalize_transactions(df_object)
+    assert all(isinstance(store[c].dtype, pd.CategoricalDtype) for c in db.TRANSACTION_CATEGORICAL_COLUMNS)
+    assert store['Fecha'].dtype == 'datetime64[ns]' and store['Monto'].dtype == 'float64' and store['Recurrente'].dtype == 'bool'
+    pd.testing.assert_frame_equal(store.astype({c: object for c in text_cols}), df_object, check_dtype=False)
+    assert db.transactions_memory_usage(store)['bytes'] * 2 < db.transactions_memory_usage(df_object)['bytes']
+
+
+def test_normalize_does_not_copy_a_normalized_frame():
+    store = db.normalize_transactions(make_transactions(1_000))
+    assert db.normalize_transactions(store) is store
+
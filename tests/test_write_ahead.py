@@ -0,0 +1,146 @@
+# --- Archivo: tests/test_write_ahead.py ---
+# Cola local de escrituras: mismo resultado que escribir directo, reenvío tras reinicio y manejo de fallos
+
+import json
+import time
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import database as db
+import write_ahead
+from fake_supabase import FakeSupabaseClient
+from synthetic_data import SEED, make_transactions
+from write_ahead import QueuedClient, WriteAheadLog
+from conftest import USER_ID
+
+
+def _run_mutations(client, n_mutations=24):
+    """Escrituras como las de los callbacks: cuentas nuevas, altas y borrados de transacciones, config."""
+    accounts = db.DEFAULT_ACCOUNTS.copy()
+    transactions = make_transactions(100, end=datetime.now())
+    for table, df in [(db.ACCOUNTS_TABLE, accounts), (db.TRANSACTIONS_TABLE, transactions)]:
+        db.set_snapshot(table, USER_ID, None)
+        db.save_data(client, table, df, USER_ID)
+    for i in range(n_mutations):
+        if i % 4 == 0:
+            accounts = pd.concat([accounts, pd.DataFrame([{'Nombre': f'Cuenta {i}', 'Tipo': 'Banco', 'Saldo Inicial': float(i)}])], ignore_index=True)
+            db.save_data(client, db.ACCOUNTS_TABLE, accounts, USER_ID)
+        elif i % 4 == 1:
+            new_row = transactions.iloc[[0]].assign(**{'Monto': float(i), db.ROW_ID_COLUMN: db.new_row_id()})
+            transactions = pd.concat([new_row, transactions], ignore_index=True)
+            db.save_data(client, db.TRANSACTIONS_TABLE, transactions, USER_ID)
+        elif i % 4 == 2:
+            db.save_config_key(client, USER_ID, db.BUDGET_KEY, {'period_start': '2024-01-01', 'period_end': '2024-01-31', 'budget_amount': float(i)})
+        else:
+            transactions = transactions.iloc[1:].reset_index(drop=True)
+            db.save_data(client, db.TRANSACTIONS_TABLE, transactions, USER_ID)
+
+
+def _contents(client):
+    """Filas de cada tabla sin ids (los de fila son uuid aleatorios en cada ejecución)."""
+    return {
+        table: sorted(json.dumps({k: v for k, v in row.items() if k != 'id'}, sort_keys=True, default=str) for row in client.rows(table))
+        for table in [db.ACCOUNTS_TABLE, db.TRANSACTIONS_TABLE, db.CONFIG_TABLE]
+    }
+
+
+def _wal_rows(n):
+    """Filas de transacciones ya convertidas para la API (con id), como las envía save_data."""
+    df = db.ensure_row_ids(make_transactions(n, seed=SEED))
+    return db._db_records(db._to_db_frame(df).assign(user_id=USER_ID))
+
+
+def test_queued_writes_reach_the_same_state_despite_failures(tmp_path):
+    reference = FakeSupabaseClient()
+    _run_mutations(reference)
+    backend = FakeSupabaseClient(failure_rate=0.3, seed=SEED)
+    wal = WriteAheadLog(backend, str(tmp_path / 'wal.sqlite3'), retry_base=0.01).start()
+    _run_mutations(QueuedClient(backend, wal))
+    assert wal.wait_until_flushed(timeout=60)
+    assert wal.pending() == 0 and not wal.failed() and backend.stats['failures'] > 0
+    assert _contents(backend) == _contents(reference)
+    wal.close()
+
+
+def test_pending_writes_are_replayed_after_a_restart(tmp_path):
+    reference = FakeSupabaseClient()
+    _run_mutations(reference)
+    path = str(tmp_path / 'crash.sqlite3')
+    backend = FakeSupabaseClient()
+    crashed = WriteAheadLog(backend, path) # Sin hilo de envío: la app "se cae" antes de enviar
+    _run_mutations(QueuedClient(backend, crashed))
+    assert crashed.pending() > 0 and backend.stats['writes'] == 0
+    crashed.close()
+    restarted = WriteAheadLog(backend, path).start()
+    assert restarted.wait_until_flushed(timeout=30)
+    assert _contents(backend) == _contents(reference)
+    restarted.close()
+
+
+def test_retry_after_a_lost_response_does_not_duplicate(tmp_path):
+    backend = FakeSupabaseClient()
+    wal = WriteAheadLog(backend, str(tmp_path / 'lost.sqlite3'), retry_base=0.01, max_attempts=3)
+    backend.lose_next_response(1) # La escritura se aplica pero la respuesta no llega
+    QueuedClient(backend, wal).table(db.TRANSACTIONS_TABLE).insert(_wal_rows(5)).execute()
+    assert wal.flush_once() == 0
+    time.sleep(0.02)
+    assert wal.flush_once() == 1 # Reintento como upsert por id
+    assert not wal.failed() and len(backend.rows(db.TRANSACTIONS_TABLE)) == 5
+    wal.close()
+
+
+
+def test_upserts_of_the_same_key_go_in_separate_requests(tmp_path):
+    backend = FakeSupabaseClient()
+    with pytest.raises(ValueError): # Postgres rechaza el mismo id dos veces en un upsert
+        backend.table(db.TRANSACTIONS_TABLE).upsert(_wal_rows(1) * 2, on_conflict='id').execute()
+    wal = WriteAheadLog(backend, str(tmp_path / 'same_key.sqlite3'), max_attempts=1)
+    client = QueuedClient(backend, wal)
+    row = _wal_rows(1)[0]
+    for amount in [10.0, 20.0]:
+        client.table(db.TRANSACTIONS_TABLE).upsert(dict(row, Monto=amount), on_conflict='id').execute()
+    for amount in [1.0, 2.0]:
+        db.save_config_key(client, USER_ID, db.BUDGET_KEY, {'budget_amount': amount})
+    while wal.flush_once():
+        pass
+    assert not wal.failed() and wal.pending() == 0 and wal.stats['requests'] == 4
+    assert [r['Monto'] for r in backend.rows(db.TRANSACTIONS_TABLE)] == [20.0]
+    assert [r['valor'] for r in backend.rows(db.CONFIG_TABLE)] == [{'budget_amount': 2.0}]
+    wal.close()
+
+def test_permanent_failure_blocks_only_its_table(tmp_path):
+    backend = FakeSupabaseClient()
+    wal = WriteAheadLog(backend, str(tmp_path / 'blocked.sqlite3'), retry_base=0.001, max_attempts=2)
+    client = QueuedClient(backend, wal)
+    rows = _wal_rows(5)
+    backend.fail_next(2)
+    client.table(db.TRANSACTIONS_TABLE).insert(rows).execute()
+    client.table(db.TRANSACTIONS_TABLE).delete().eq('user_id', USER_ID).in_('id', [rows[0]['id']]).execute()
+    client.table(db.MEMBERS_TABLE).insert({'user_id': USER_ID, 'nombre': 'Ana'}).execute()
+    for _ in range(5):
+        wal.flush_once()
+        time.sleep(0.01)
+    # Lo que sigue al fallo en la misma tabla puede depender de él: no se envía; las demás tablas siguen
+    assert wal.blocked_tables() == {db.TRANSACTIONS_TABLE} and wal.pending(db.TRANSACTIONS_TABLE) == 1
+    assert backend.rows(db.TRANSACTIONS_TABLE) == [] and len(backend.rows(db.MEMBERS_TABLE)) == 1
+    start = time.perf_counter()
+    assert not wal.wait_until_flushed(db.TRANSACTIONS_TABLE, timeout=5) and time.perf_counter() - start < 1
+
+    # La lectura no espera en vano: devuelve lo del servidor y marca la tabla como desactualizada
+    client.table(db.TRANSACTIONS_TABLE).select('*').eq('user_id', USER_ID).execute()
+    assert wal.stale_tables == {db.TRANSACTIONS_TABLE: 1}
+    assert wal.discard(db.TRANSACTIONS_TABLE) == 2
+    assert not wal.blocked_tables() and not wal.stale_tables and wal.pending() == 0
+    wal.close()
+
+
+def test_write_ahead_is_off_unless_configured(monkeypatch, tmp_path):
+    client = FakeSupabaseClient()
+    monkeypatch.delenv(write_ahead.WAL_PATH_ENV, raising=False)
+    assert write_ahead.write_ahead_client(client) is client
+    monkeypatch.setenv(write_ahead.WAL_PATH_ENV, str(tmp_path / 'on.sqlite3'))
+    queued = write_ahead.write_ahead_client(client)
+    assert isinstance(queued, QueuedClient)
+    queued.wal.close()
@@ -4,18 +4,136 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
-import plotly.express as px
-import plotly.graph_objects as go
-import numpy as np
 import time
 from supabase import Client
 
 # Importamos nuestra caja de lógica
 import database as db
+import charts
+import profiler
 
 # --- 5. VISTAS DE PESTAÑA (STREAMLIT) ---
 
+# --- 5.0 Filtros de la Barra Lateral ---
+@profiler.timed()
+def view_sidebar_filters(df_transactions: pd.DataFrame):
+    """Muestra los filtros (fechas, tipo, miembro) y devuelve los filtros activos (ver db.active_filter_tuple)."""
+    st.sidebar.subheader("🔎 Filtros de Análisis")
+    if df_transactions.empty or 'Fecha' not in df_transactions.columns:
+        st.sidebar.caption("Sin transacciones para filtrar.")
+        return db.active_filter_tuple()
+
+    if 'filter_dates' not in st.session_state:
+        today = datetime.now().date()
+        st.session_state.filter_dates = [st.session_state.get('filter_start_date', today), st.session_state.get('filter_end_date', today)]
+    selected_dates = st.sidebar.date_input("🗓️ Rango de Fechas", key="filter_dates")
+    # Mientras se elige el rango, date_input devuelve una sola fecha
+    if isinstance(selected_dates, (list, tuple)) and len(selected_dates) == 2:
+        st.session_state.filter_start_date, st.session_state.filter_end_date = selected_dates
+
+    type_options = [db.FILTER_ALL, 'Ingreso', 'Gasto', 'Transferencia']
+    if st.session_state.get('filter_type') not in type_options:
+        st.session_state.filter_type = db.FILTER_ALL
+    st.sidebar.selectbox("Tipo de Movimiento", type_options, key="filter_type")
+
+    member_options = [db.FILTER_ALL] + st.session_state.get('members', []) + ['N/A']
+    if st.session_state.get('filter_member') not in member_options:
+        st.session_state.filter_member = db.FILTER_ALL
+    st.sidebar.selectbox("Miembro", member_options, key="filter_member")
+
+    # El conteo sale del índice de filtrado (búsqueda binaria por fecha, no recorre las transacciones)
+    filters = db.active_filter_tuple()
+    matching = len(db.filter_positions(db.get_filter_index(df_transactions), *filters))
+    st.sidebar.caption(f"{matching:,} de {len(df_transactions):,} transacciones")
+    return filters
+
+@profiler.timed()
+def load_history_with_progress(supabase_client: Client, user_id: str, until=None, max_pages=None, container=st):
+    """Trae el historial antiguo que falte (hasta `until`, o todo) mostrando una barra de progreso."""
+    if db.history_covers(user_id, until):
+        return True
+    bar = container.progress(0.0, text="⏳ Cargando historial antiguo...")
+
+    def report(loaded, total):
+        if total:
+            bar.progress(min(loaded / total, 1.0), text=f"⏳ Cargando historial antiguo: {loaded:,} de {total:,}")
+
+    complete = db.load_older_transactions(supabase_client, user_id, until=until, max_pages=max_pages, progress=report)
+    bar.empty()
+    return complete
+
+def callback_discard_failed_writes(supabase_client: Client, user_id: str):
+    """Descarta lo que la cola no pudo enviar (y lo encolado después en esas tablas) y recarga los datos del servidor."""
+    wal = supabase_client.wal
+    for table_name in wal.blocked_tables():
+        wal.discard(table_name)
+        db.invalidate_shared_cache(supabase_client, user_id, table_name)
+    st.session_state['data_loaded'] = False # El próximo rerun vuelve a cargar todo
+
+def callback_reload_data():
+    st.session_state['data_loaded'] = False
+
+@profiler.timed()
+def view_sync_status(supabase_client, user_id: str):
+    """Estado de la cola local de escrituras (si la app la usa): pendientes, tablas bloqueadas y lecturas desactualizadas."""
+    wal = getattr(supabase_client, 'wal', None)
+    if wal is None:
+        return
+    pending = wal.pending()
+    if pending:
+        st.sidebar.caption(f"⏳ {pending} cambios pendientes de sincronizar con Supabase.")
+    failed = wal.failed()
+    if failed:
+        blocked = sorted({table_name for _, table_name, _ in failed})
+        # Lo guardado en la sesión ya no coincide con el servidor: el próximo guardado no puede ser por diferencias
+        for table_name in blocked:
+            if table_name in db.ROW_ID_TABLES:
+                db.set_snapshot(table_name, user_id, None)
+        st.sidebar.error(f"❌ No se pudieron guardar cambios en {', '.join(blocked)}; los siguientes cambios de esas tablas "
+                         f"están detenidos. Último error: {failed[-1][2]}")
+        st.sidebar.button("🗑️ Descartar cambios no guardados y recargar", key="discard_failed_writes", use_container_width=True,
+                          on_click=callback_discard_failed_writes, args=(supabase_client, user_id))
+    elif wal.stale_tables:
+        st.sidebar.warning(f"⚠️ Datos posiblemente desactualizados ({', '.join(sorted(wal.stale_tables))}): se leyeron "
+                           f"antes de que la cola enviara {sum(wal.stale_tables.values())} cambios.")
+        st.sidebar.button("🔄 Recargar datos", key="reload_stale_data", use_container_width=True, on_click=callback_reload_data)
+
+@profiler.timed()
+def view_profiler_panel(container=st.sidebar):
+    """Panel de desarrollo (solo con GUARDIAN_PROFILE): etapas del último rerun completo de esta sesión y exportación JSON-lines."""
+    if not profiler.is_enabled():
+        return
+    session = profiler.session_id()
+    with container.expander("⏱️ Perfil del Rerun (desarrollo)"):
+        rerun = profiler.last_rerun(session)
+        if rerun is None:
+            st.caption("Aún no hay un rerun completo registrado.")
+            return
+        stage_records = profiler.rerun_records(session, rerun)
+        root = next(r for r in stage_records if r['root'])
+        st.caption(f"Rerun #{rerun}: {root['ms']:,.0f} ms · {root['round_trips']} viajes al backend · "
+                   f"{root['rows_received']:,} filas recibidas · {root['rows_sent']:,} enviadas · {root['df_copies']} copias de DataFrame")
+        st.dataframe(profiler.summarize(stage_records), hide_index=True, use_container_width=True)
+        st.download_button("📥 Exportar JSON-lines", profiler.to_jsonl(profiler.records(session)),
+                           file_name="perfil_guardian.jsonl", mime="application/jsonl", use_container_width=True)
+
 # --- 5.1 Pestaña: Registrar Transacción ---
+def _register_transaction(supabase_client: Client, user_id: str, new_entry: pd.DataFrame):
+    """
+    Añade transacciones nuevas: se insertan en su sitio por Fecha (sin reordenar el historial) y solo
+    esas filas se envían y se suman a saldos, cubo y metas; el costo no depende del tamaño del historial.
+    """
+    # Con id desde el principio: el libro, el cubo y los conteos pueden quitarla después por id
+    db.ensure_row_ids(new_entry)
+    changes = (new_entry.iloc[0:0], new_entry)
+    df_all = db.get_transactions()
+    if db.ROW_ID_COLUMN not in df_all.columns:
+        df_all = db.ensure_row_ids(df_all.copy())
+    db.set_transactions(db.apply_transaction_changes(df_all, *changes), delta=changes)
+    db.save_data(supabase_client, db.TRANSACTIONS_TABLE, st.session_state.transactions_df, user_id, changes=changes)
+    db.sync_goal_progress(supabase_client, user_id)
+
+@profiler.timed()
 def view_register(supabase_client: Client, user_id: str):
     st.header("📝 Registrar Nueva Transacción")
     st.caption("Añade nuevos movimientos a tu historial financiero.")
@@ -106,44 +224,65 @@ def view_register(supabase_client: Client, user_id: str):
                     'Recurrente': is_recurring,
                     'Frecuencia': current_frequency
                 }])
-
-                st.session_state.transactions_df = pd.concat(
-                    [st.session_state.get('transactions_df', db.DEFAULT_TRANSACTIONS.copy()), new_entry],
-                    ignore_index=True
-                ).sort_values(by='Fecha', ascending=False)
-
-                # Guardar en Supabase
-                db.save_data(supabase_client, db.TRANSACTIONS_TABLE, st.session_state.transactions_df, user_id)
-
-                st.session_state.goals_df = db.update_goal_progress(
-                    st.session_state.transactions_df.copy(),
-                    st.session_state.get('goals_df', db.DEFAULT_GOALS.copy()).copy()
-                )
-                db.save_data(supabase_client, db.GOALS_TABLE, st.session_state.goals_df, user_id)
+                _register_transaction(supabase_client, user_id, new_entry)
 
                 st.success(f"✅ ¡{transaction_type} registrado con éxito!")
                 st.session_state.submitted_success = True
                 st.rerun()
 
 # --- 5.2 Pestaña: Dashboard ---
-def view_dash(df_filtered):
+@profiler.timed()
+def view_dash(filters, supabase_client=None, user_id=None):
     st.header("📊 Dashboard: Flujo y Presupuesto")
 
     # Modificado: Saludo genérico
     st.subheader("¡Bienvenido!")
     st.caption("Aquí tienes un resumen de la salud financiera de tu hogar.")
 
-    df_transactions = st.session_state.get('transactions_df', pd.DataFrame()).copy()
-    df_accounts = st.session_state.get('accounts_df', pd.DataFrame()).copy()
+    df_transactions = db.get_transactions()
+    df_accounts = st.session_state.get('accounts_df', pd.DataFrame())
+    config = st.session_state.get('budget_config', {'period_start': datetime.now().date(), 'period_end': datetime.now().date(), 'budget_amount': 0.0})
+    category_budgets = st.session_state.get('category_budgets', {})
+
+    history_progress = db.history_progress()
+    server_aggregates = None
+    if history_progress is not None:
+        loaded, total = history_progress
+        st.caption(f"⏳ Cargando historial antiguo ({loaded:,} de {total:,} movimientos)." if total else "⏳ Cargando historial antiguo.")
+        if supabase_client is not None:
+            # Mientras tanto, los saldos y el gasto del período se suman en la base de datos
+            server_deps = (db.get_version('transactions_df'), db.get_version('accounts_df'), db.get_version('budget_config'), datetime.now().date())
+            server_aggregates = db.cached_aggregate('server', server_deps, lambda: db.load_server_aggregates(supabase_client, user_id, config))
+        if server_aggregates is None:
+            st.caption("Los saldos, metas, totales y el patrón semanal se completarán cuando termine.")
+    # Sin agregados del servidor, los totales y el patrón semanal solo cubren el historial ya cargado
+    totals_partial = server_aggregates is None and not db.history_covers(user_id)
 
     if df_transactions.empty and df_accounts.empty:
         st.info("ℹ️ Aún no hay transacciones ni cuentas para analizar.")
         st.info("Empieza por añadir una cuenta en 'Configurar' o registrar una transacción.")
         return
 
+    # Los agregados solo se recalculan si cambian los datos, el presupuesto, los filtros o el día
+    deps = (
+        db.get_version('transactions_df'), db.get_version('accounts_df'),
+        db.get_version('budget_config'), db.get_version('category_budgets'),
+        filters, datetime.now().date(), server_aggregates is not None
+    )
+    aggregates = db.cached_aggregate(
+        'dashboard', deps,
+        lambda: db.compute_dashboard_aggregates(
+            df_transactions, df_accounts, filters, config, category_budgets, server_aggregates,
+            account_flows=db.ledger_account_flows(), cube=db.get_rollup_cube()
+        )
+    )
+
     st.subheader("🏦 Resumen de Saldos", divider="rainbow")
-    try:
-        df_balances = db.calculate_account_balances(df_transactions, df_accounts)
+    if aggregates['balances_error']:
+        st.error(f"❌ Error al calcular saldos de cuentas: {aggregates['balances_error']}")
+        st.markdown("---")
+    else:
+        df_balances = aggregates['balances']
         if not df_balances.empty:
             account_cols = st.columns(min(len(df_balances), 4))
             col_idx = 0
@@ -162,146 +301,99 @@ def view_dash(df_filtered):
                 col_idx += 1
         else:
             st.info("ℹ️ No hay cuentas configuradas. Añade una en 'Configurar' para ver los saldos.")
-    except Exception as e:
-        st.error(f"❌ Error al calcular saldos de cuentas: {e}")
-        st.markdown("---")
 
     if df_transactions.empty:
         st.info("ℹ️ Aún no hay transacciones registradas para mostrar más análisis.")
         return
 
     st.subheader("📈 Métricas Clave (KPIs)", divider="rainbow")
-    ingresos, gastos, balance_total = db.calculate_balance(df_transactions)
-    income_fixed, expense_fixed, surplus_fixed = db.calculate_fixed_surplus(df_transactions)
-    config = st.session_state.get('budget_config', {'period_start': datetime.now().date(), 'period_end': datetime.now().date(), 'budget_amount': 0.0})
-
-    daily_budget, days_left, presupuesto_restante = db.calculate_daily_budget(
-        config['period_start'], config['period_end'], config['budget_amount'], df_transactions
-    )
+    kpis = aggregates['kpis']
+    balance_total, surplus_fixed = kpis['balance_total'], kpis['surplus_fixed']
 
     balance_icon = "💹" if balance_total >= 0 else "📉"
     surplus_icon = "🚀" if surplus_fixed > 0 else "⚠️"
 
     col_b1, col_b2, col_b3, col_b4 = st.columns(4)
-    col_b1.metric("Balance Neto Total", f"{balance_icon} ${balance_total:,.2f}", help=f"Ingresos: ${ingresos:,.2f} | Gastos: ${gastos:,.2f}")
-    col_b2.metric("Presup. Restante (Global)", f"💰 ${presupuesto_restante:,.2f}", help=f"Presupuesto Periodo: ${config.get('budget_amount', 0):,.2f} (Hasta {config.get('period_end', datetime.now().date()).strftime('%d-%b-%Y')})")
-    col_b3.metric("Superávit Fijo Mensual", f"{surplus_icon} ${surplus_fixed:,.2f}", help=f"Ingreso Fijo Proy.: ${income_fixed:,.2f} | Gasto Fijo Proy.: ${expense_fixed:,.2f}")
-    col_b4.metric("Presup. Diario Restante", f"⏳ ${daily_budget:,.2f}", help=f"Días restantes en período: {days_left}")
+    partial_note = " (parcial: historial aún cargando)" if totals_partial else ""
+    col_b1.metric("Balance Neto Total (parcial)" if totals_partial else "Balance Neto Total", f"{balance_icon} ${balance_total:,.2f}", help=f"Ingresos: ${kpis['ingresos']:,.2f} | Gastos: ${kpis['gastos']:,.2f}{partial_note}")
+    col_b2.metric("Presup. Restante (Global)", f"💰 ${kpis['presupuesto_restante']:,.2f}", help=f"Presupuesto Periodo: ${config.get('budget_amount', 0):,.2f} (Hasta {config.get('period_end', datetime.now().date()).strftime('%d-%b-%Y')})")
+    col_b3.metric("Superávit Fijo Mensual", f"{surplus_icon} ${surplus_fixed:,.2f}", help=f"Ingreso Fijo Proy.: ${kpis['income_fixed']:,.2f} | Gasto Fijo Proy.: ${kpis['expense_fixed']:,.2f}")
+    col_b4.metric("Presup. Diario Restante", f"⏳ ${kpis['daily_budget']:,.2f}", help=f"Días restantes en período: {kpis['days_left']}")
+
+    df_projection = aggregates['recurring_projection']
+    if df_projection is not None:
+        with st.expander("📅 Proyección Flujo Fijo (12 meses)"):
+            st.plotly_chart(charts.projection_figure(df_projection), use_container_width=True)
 
     st.subheader("🏷️ Control Presupuesto por Categoría", divider="rainbow")
-    if st.session_state.get('category_budgets'):
-        config = st.session_state.get('budget_config')
-        start_date = pd.to_datetime(config['period_start'])
-        end_date = pd.to_datetime(config['period_end']) + timedelta(days=1)
-        df_period_spending = df_transactions[
-            (df_transactions['Tipo'] == 'Gasto') &
-            (df_transactions['Fecha'] >= start_date) &
-            (df_transactions['Fecha'] < end_date)
-        ].copy()
-        spending_by_cat = df_period_spending.groupby('Categoría')['Monto'].sum().reset_index()
-        spending_by_cat.columns = ['Categoría', 'Gastado']
-        budget_data = []
-        for category, budget in st.session_state.category_budgets.items():
-            if budget > 0.0:
-                spent = spending_by_cat[spending_by_cat['Categoría'] == category]['Gastado'].iloc[0] if not spending_by_cat[spending_by_cat['Categoría'] == category].empty else 0.0
-                budget_data.append({'Categoría': category, 'Presupuesto': budget, 'Gastado': spent, 'Porcentaje': (spent / budget) * 100 if budget > 0 else 0, 'Excedido': spent > budget})
-        df_budget_chart = pd.DataFrame(budget_data)
+    if category_budgets:
+        df_budget_chart = aggregates['budget_chart']
         if not df_budget_chart.empty:
-            df_budget_chart = df_budget_chart.sort_values(by='Gastado', ascending=False)
-            color_map = {True: 'crimson', False: 'mediumseagreen'}
-            fig_budget = px.bar(df_budget_chart, y='Categoría', x='Gastado', orientation='h',
-                                title=f"Gasto vs. Presupuesto ({config.get('period_start', datetime.now().date()).strftime('%d %b')} - {config.get('period_end', datetime.now().date()).strftime('%d %b')})",
-                                color='Excedido', color_discrete_map=color_map, text='Gastado',
-                                template='plotly_white')
-            for i, row in df_budget_chart.iterrows():
-                fig_budget.add_shape(type='line', y0=i - 0.4, y1=i + 0.4, x0=row['Presupuesto'], x1=row['Presupuesto'],
-                                     line=dict(color='royalblue', width=2, dash='dash'))
-                fig_budget.add_annotation(x=row['Presupuesto'], y=i,
-                                          text=f" P: ${row['Presupuesto']:,.0f}", showarrow=False,
-                                          xanchor="left", yshift=10, font=dict(color='royalblue', size=10))
-            fig_budget.update_layout(xaxis_title="Monto Gastado ($)", yaxis_title=None, showlegend=False,
-                                     yaxis={'categoryorder':'total descending'})
-            fig_budget.update_traces(texttemplate='$%{text:,.2f}', textposition='outside')
-            st.plotly_chart(fig_budget, use_container_width=True)
+            budget_title = f"Gasto vs. Presupuesto ({config.get('period_start', datetime.now().date()).strftime('%d %b')} - {config.get('period_end', datetime.now().date()).strftime('%d %b')})"
+            st.plotly_chart(charts.budget_figure(df_budget_chart, budget_title), use_container_width=True)
         else: st.info("ℹ️ No hay presupuestos activos (> $0.0) asignados o transacciones en el período actual.")
     else: st.info("ℹ️ No hay presupuestos asignados por categoría.")
 
     st.subheader("🔍 Análisis Detallado (Según Filtros)", divider="rainbow")
-    if df_filtered.empty:
+    if aggregates['filtered_empty']:
         st.info("ℹ️ No hay transacciones que cumplan con los filtros de la barra lateral.")
         return
 
-    # (El resto de los gráficos no necesitan cambios)
     col_top5, col_pattern = st.columns([1, 1])
     with col_top5:
         st.subheader("🏆 Top 5 Gastos", divider="grey")
-        df_gastos_filtrados = df_filtered[df_filtered['Tipo'] == 'Gasto'].copy()
-        if not df_gastos_filtrados.empty:
-            df_top5 = df_gastos_filtrados.groupby('Categoría')['Monto'].sum().nlargest(5).reset_index()
-            fig_top5 = px.bar(df_top5, x='Monto', y='Categoría', orientation='h',
-                              color='Monto', color_continuous_scale=px.colors.sequential.OrRd,
-                              labels={'Monto': 'Monto ($)', 'Categoría': ''},
-                              template='plotly_white')
-            fig_top5.update_layout(yaxis={'categoryorder':'total ascending'}, xaxis_title=None, yaxis_title=None)
-            st.plotly_chart(fig_top5, use_container_width=True)
+        df_top5 = aggregates['top5']
+        if df_top5 is not None:
+            st.plotly_chart(charts.top5_figure(df_top5), use_container_width=True)
         else: st.info("ℹ️ No hay gastos para mostrar con los filtros aplicados.")
     with col_pattern:
-        st.subheader("🗓️ Patrón Gasto Diario", divider="grey")
-        df_day_pattern = df_transactions[df_transactions['Tipo'] == 'Gasto'].copy()
-        if not df_day_pattern.empty:
-            df_day_pattern['Dia'] = df_day_pattern['Fecha'].dt.day_name().map(db.DAY_NAMES_MAP)
-            df_gasto_promedio = df_day_pattern.groupby('Dia')['Monto'].mean().reset_index()
-            df_gasto_promedio.columns = ['Día de la Semana', 'Gasto Promedio ($)']
-            day_order = list(db.DAY_NAMES_MAP.values())
-            df_gasto_promedio['Día de la Semana'] = pd.Categorical(df_gasto_promedio['Día de la Semana'], categories=day_order, ordered=True)
-            df_gasto_promedio = df_gasto_promedio.sort_values('Día de la Semana')
-            fig_day_pattern = px.bar(df_gasto_promedio, x='Día de la Semana', y='Gasto Promedio ($)',
-                                     color_discrete_sequence=['#4CAF50'],
-                                     labels={'Gasto Promedio ($)': 'Gasto Promedio ($)'},
-                                     template='plotly_white')
-            fig_day_pattern.update_layout(xaxis_title=None)
-            st.plotly_chart(fig_day_pattern, use_container_width=True)
+        st.subheader("🗓️ Patrón Gasto Diario (parcial)" if totals_partial else "🗓️ Patrón Gasto Diario", divider="grey")
+        if totals_partial: st.caption("Solo incluye el historial cargado hasta ahora.")
+        df_gasto_promedio = aggregates['day_pattern']
+        if df_gasto_promedio is not None:
+            st.plotly_chart(charts.day_pattern_figure(df_gasto_promedio), use_container_width=True)
         else: st.info("ℹ️ No hay suficientes gastos para analizar patrones.")
     st.subheader("📉 Tendencia Flujo de Caja", divider="grey")
-    df_flujo = df_filtered[df_filtered['Tipo'].isin(['Ingreso', 'Gasto'])].copy()
-    if not df_flujo.empty:
-        df_flujo['Fecha_Dia'] = df_flujo['Fecha'].dt.normalize()
-        df_pivot = df_flujo.pivot_table(index='Fecha_Dia', columns='Tipo', values='Monto', aggfunc='sum').fillna(0)
-        if 'Ingreso' not in df_pivot.columns: df_pivot['Ingreso'] = 0.0
-        if 'Gasto' not in df_pivot.columns: df_pivot['Gasto'] = 0.0
-        df_pivot = df_pivot.reset_index()
-        df_pivot['Balance Neto'] = df_pivot['Ingreso'] - df_pivot['Gasto']
-        df_pivot['Balance Acumulado'] = df_pivot['Balance Neto'].cumsum()
-        fig_line = go.Figure()
-        fig_line.add_trace(go.Scatter(x=df_pivot['Fecha_Dia'], y=df_pivot['Ingreso'], mode='lines+markers', name='Ingreso', line=dict(color='green')))
-        fig_line.add_trace(go.Scatter(x=df_pivot['Fecha_Dia'], y=df_pivot['Gasto'], mode='lines+markers', name='Gasto', line=dict(color='red')))
-        fig_line.add_trace(go.Scatter(x=df_pivot['Fecha_Dia'], y=df_pivot['Balance Acumulado'], mode='lines+markers', name='Balance Acumulado', line=dict(color='blue', dash='dot')))
-        fig_line.update_layout(title='Flujo Diario y Balance Acumulado', xaxis_title='Fecha', yaxis_title='Monto ($)', hovermode="x unified", template='plotly_white')
-        st.plotly_chart(fig_line, use_container_width=True)
+    df_pivot = aggregates['cash_flow']
+    if df_pivot is not None:
+        st.plotly_chart(charts.cash_flow_figure(df_pivot), use_container_width=True)
     else: st.info("ℹ️ No hay transacciones de Ingreso o Gasto en el rango para el análisis de tendencia.")
     col_pie_charts, col_bar_chart = st.columns([1, 1])
     with col_pie_charts:
         st.subheader("🍰 Distribución Gastos", divider="grey")
-        df_gastos = df_filtered[df_filtered['Tipo'] == 'Gasto']
-        if not df_gastos.empty:
-            df_pie_data = df_gastos.groupby('Categoría')['Monto'].sum().reset_index()
-            fig_pie = px.pie(df_pie_data, values='Monto', names='Categoría', template='plotly_white', hole=0.3)
-            fig_pie.update_traces(textposition='outside', textinfo='percent+label')
-            st.plotly_chart(fig_pie, use_container_width=True)
+        df_pie_data = aggregates['pie_gastos']
+        if df_pie_data is not None:
+            st.plotly_chart(charts.pie_figure(df_pie_data), use_container_width=True)
         else: st.info("ℹ️ No hay gastos para mostrar en este rango.")
     with col_bar_chart:
         st.subheader("💰 Distribución Ingresos", divider="grey")
-        df_ingresos = df_filtered[df_filtered['Tipo'] == 'Ingreso']
-        if not df_ingresos.empty:
-            df_pie_data_ingreso = df_ingresos.groupby('Categoría')['Monto'].sum().reset_index()
-            fig_pie_ingreso = px.pie(df_pie_data_ingreso, values='Monto', names='Categoría', template='plotly_white', hole=0.3)
-            fig_pie_ingreso.update_traces(textposition='outside', textinfo='percent+label')
-            st.plotly_chart(fig_pie_ingreso, use_container_width=True)
+        df_pie_data_ingreso = aggregates['pie_ingresos']
+        if df_pie_data_ingreso is not None:
+            st.plotly_chart(charts.pie_figure(df_pie_data_ingreso), use_container_width=True)
         else: st.info("ℹ️ No hay ingresos para mostrar en este rango.")
 
 
 # --- Callbacks para la Pestaña de Configuración ---
 # (Adaptados para pasar supabase_client y user_id)
+ACCOUNT_REFERENCE_COLUMNS = ['Cuenta', 'Destino'] # Una cuenta también se usa como destino de transferencias
+
+def _usage_caption(value, columns, partial=False, container=st):
+    """Bajo los selectores de borrado: cuántas transacciones usan lo seleccionado (con el historial a medias, como mínimo)."""
+    if value is None:
+        return
+    n = db.reference_count(value, columns)
+    if partial:
+        container.caption(f"Usado en al menos {n:,} transacciones (falta cargar historial antiguo).")
+    else:
+        container.caption("Sin transacciones asociadas." if n == 0 else f"Usado en {n:,} transacciones.")
+
+def _references_complete(supabase_client: Client, user_id: str):
+    """Los conteos solo cubren el historial en memoria: antes de comprobar un borrado se trae lo que falte."""
+    if db.load_older_transactions(supabase_client, user_id):
+        return True
+    st.error("❌ No se pudo cargar todo el historial para comprobar si se usa. Inténtalo de nuevo.")
+    return False
+
 def callback_update_budget(supabase_client: Client, user_id: str):
     start_date = st.session_state.budget_start_date
     end_date = st.session_state.budget_end_date
@@ -315,7 +407,7 @@ def callback_update_budget(supabase_client: Client, user_id: str):
             'budget_amount': float(budget_amount)
         }
         db.save_config_key(supabase_client, user_id, db.BUDGET_KEY, new_config_dict)
-        st.session_state.budget_config = db.load_budget_config(supabase_client, user_id)
+        db.set_state('budget_config', db.parse_budget_config(new_config_dict)) # Sin releer: la escritura puede estar en cola
         st.success("✅ Presupuesto global guardado con éxito.")
         st.rerun()
 
@@ -328,24 +420,21 @@ def callback_add_account(supabase_client: Client, user_id: str):
         return
 
     new_account = pd.DataFrame([{'Nombre': acc_name, 'Tipo': acc_type, 'Saldo Inicial': float(initial_balance)}])
-    st.session_state.accounts_df = pd.concat([st.session_state.accounts_df, new_account], ignore_index=True)
+    db.set_state('accounts_df', pd.concat([st.session_state.accounts_df, new_account], ignore_index=True))
     db.save_data(supabase_client, db.ACCOUNTS_TABLE, st.session_state.accounts_df, user_id)
     st.success(f"✅ Cuenta '{acc_name}' añadida.")
     st.rerun()
 
 def callback_delete_account(supabase_client: Client, user_id: str):
     acc_to_delete = st.session_state.del_acc_select
-    # Lógica de comprobación
-    can_delete = True
-    if not st.session_state.transactions_df.empty:
-        if acc_to_delete in st.session_state.transactions_df['Cuenta'].tolist() or \
-           acc_to_delete in st.session_state.transactions_df['Destino'].tolist():
-            can_delete = False
-    if not can_delete:
+    # Lógica de comprobación (conteos mantenidos junto al historial)
+    if not _references_complete(supabase_client, user_id):
+        return
+    if db.reference_count(acc_to_delete, ACCOUNT_REFERENCE_COLUMNS) > 0:
         st.error("❌ No se puede eliminar: La cuenta tiene transacciones asociadas.")
         return
 
-    st.session_state.accounts_df = st.session_state.accounts_df[st.session_state.accounts_df['Nombre'] != acc_to_delete].reset_index(drop=True)
+    db.set_state('accounts_df', st.session_state.accounts_df[st.session_state.accounts_df['Nombre'] != acc_to_delete].reset_index(drop=True))
     db.save_data(supabase_client, db.ACCOUNTS_TABLE, st.session_state.accounts_df, user_id)
     st.success(f"✅ Cuenta '{acc_to_delete}' eliminada.")
     st.rerun()
@@ -373,11 +462,9 @@ def callback_delete_category(supabase_client: Client, user_id: str, category_typ
         cat_to_delete = st.session_state.del_cat_ingreso
 
     # Lógica de comprobación
-    can_delete = True
-    if not st.session_state.transactions_df.empty:
-        if cat_to_delete in st.session_state.transactions_df['Categoría'].tolist():
-            can_delete = False
-    if not can_delete:
+    if not _references_complete(supabase_client, user_id):
+        return
+    if db.reference_count(cat_to_delete, ['Categoría']) > 0:
         st.error(f"❌ No se puede eliminar: La categoría '{cat_to_delete}' tiene transacciones asociadas.")
         return
 
@@ -385,6 +472,7 @@ def callback_delete_category(supabase_client: Client, user_id: str, category_typ
         st.session_state.categories[category_type].remove(cat_to_delete)
         if category_type == 'Gasto' and cat_to_delete in st.session_state.category_budgets:
             del st.session_state.category_budgets[cat_to_delete]
+            db.bump_version('category_budgets')
             db.save_config_key(supabase_client, user_id, db.CATEGORY_BUDGET_KEY, st.session_state.category_budgets)
 
         db.save_categories(supabase_client, st.session_state.categories, user_id)
@@ -411,11 +499,9 @@ def callback_add_member(supabase_client: Client, user_id: str):
 def callback_delete_member(supabase_client: Client, user_id: str):
     member_to_delete = st.session_state.del_member_select
     # Lógica de comprobación
-    can_delete = True
-    if not st.session_state.transactions_df.empty:
-        if member_to_delete in st.session_state.transactions_df['Miembro'].tolist():
-             can_delete = False
-    if not can_delete:
+    if not _references_complete(supabase_client, user_id):
+        return
+    if db.reference_count(member_to_delete, ['Miembro']) > 0:
         st.error("❌ No se puede eliminar: El miembro tiene transacciones asociadas.")
         return
 
@@ -436,32 +522,33 @@ def callback_add_goal(supabase_client: Client, user_id: str):
         return
 
     new_goal = pd.DataFrame([{'Nombre': goal_name, 'Monto Objetivo': float(target_amount), 'Monto Aportado': 0.0, 'Fecha Objetivo': target_date}])
-    st.session_state.goals_df = pd.concat([st.session_state.goals_df, new_goal], ignore_index=True)
-    st.session_state.goals_df = db.update_goal_progress(st.session_state.transactions_df, st.session_state.goals_df)
-    db.save_data(supabase_client, db.GOALS_TABLE, st.session_state.goals_df, user_id)
+    db.set_state('goals_df', pd.concat([st.session_state.goals_df, new_goal], ignore_index=True))
+    # La sincronización guarda las metas si cambió algún aporte; si no, se guarda aquí la meta nueva
+    if not db.sync_goal_progress(supabase_client, user_id):
+        db.save_data(supabase_client, db.GOALS_TABLE, st.session_state.goals_df, user_id)
     st.success(f"✅ Meta '{goal_name}' añadida.")
     st.rerun()
 
 def callback_delete_goal(supabase_client: Client, user_id: str):
     goal_to_delete = st.session_state.del_goal_select
     # Lógica de comprobación
-    can_delete = True
-    if not st.session_state.transactions_df.empty:
-        if goal_to_delete in st.session_state.transactions_df['Destino'].tolist():
-             can_delete = False
-    if not can_delete:
+    if not _references_complete(supabase_client, user_id):
+        return
+    if db.reference_count(goal_to_delete, ['Destino']) > 0:
         st.error("❌ No se puede eliminar: La meta tiene aportaciones asociadas.")
         return
 
-    st.session_state.goals_df = st.session_state.goals_df[st.session_state.goals_df['Nombre'] != goal_to_delete].reset_index(drop=True)
+    db.set_state('goals_df', st.session_state.goals_df[st.session_state.goals_df['Nombre'] != goal_to_delete].reset_index(drop=True))
     db.save_data(supabase_client, db.GOALS_TABLE, st.session_state.goals_df, user_id)
     st.success(f"✅ Meta '{goal_to_delete}' eliminada.")
     st.rerun()
 
 
 # --- 5.3 Pestaña: Configurar ---
+@profiler.timed()
 def view_config(supabase_client: Client, user_id: str):
     st.header("⚙️ Configuración del Hogar")
+    partial = db.history_loaded_from(user_id) is not None # Conteos de uso solo del historial cargado
 
     tab_global, tab_cat, tab_cuentas, tab_cats, tab_miembros, tab_metas = st.tabs([
         "💰 Presupuesto Global", "🏷️ Presupuesto Cat.", "🏦 Cuentas",
@@ -497,7 +584,7 @@ def view_config(supabase_client: Client, user_id: str):
             if st.button("💾 Guardar Presupuestos por Categoría", type="primary"):
                 new_budgets = {row['Categoría']: float(row['Presupuesto']) for _, row in edited_df.iterrows() if float(row['Presupuesto']) >= 0}
                 db.save_config_key(supabase_client, user_id, db.CATEGORY_BUDGET_KEY, new_budgets)
-                st.session_state.category_budgets = new_budgets
+                db.set_state('category_budgets', new_budgets)
                 st.success("✅ Presupuestos por categoría actualizados con éxito.")
                 st.rerun()
 
@@ -512,9 +599,11 @@ def view_config(supabase_client: Client, user_id: str):
                 st.form_submit_button("💾 Añadir Cuenta", on_click=callback_add_account, args=(supabase_client, user_id))
         st.subheader("Cuentas Actuales", divider="grey")
         accounts_df_display = st.session_state.get('accounts_df', pd.DataFrame())
-        st.dataframe(accounts_df_display, hide_index=True, use_container_width=True)
+        accounts_usage = accounts_df_display.assign(Transacciones=[db.reference_count(name, ACCOUNT_REFERENCE_COLUMNS) for name in accounts_df_display['Nombre']]) if 'Nombre' in accounts_df_display.columns else accounts_df_display
+        st.dataframe(accounts_usage, hide_index=True, use_container_width=True, column_config={db.ROW_ID_COLUMN: None})
         if not accounts_df_display.empty:
-            st.selectbox("Seleccionar Cuenta para Eliminar:", accounts_df_display['Nombre'].tolist(), key="del_acc_select", label_visibility="collapsed")
+            acc_selected = st.selectbox("Seleccionar Cuenta para Eliminar:", accounts_df_display['Nombre'].tolist(), key="del_acc_select", label_visibility="collapsed")
+            _usage_caption(acc_selected, ACCOUNT_REFERENCE_COLUMNS, partial)
             st.button("🗑️ Eliminar Cuenta Seleccionada", key="delete_acc_btn", type="secondary", on_click=callback_delete_account, args=(supabase_client, user_id))
 
     with tab_cats:
@@ -533,7 +622,7 @@ def view_config(supabase_client: Client, user_id: str):
             gasto_cats = categories_dict.get('Gasto', [])
             st.write(gasto_cats)
             if gasto_cats:
-                st.selectbox("Eliminar Gasto:", gasto_cats, key="del_cat_gasto", label_visibility="collapsed")
+                _usage_caption(st.selectbox("Eliminar Gasto:", gasto_cats, key="del_cat_gasto", label_visibility="collapsed"), ['Categoría'], partial)
                 st.button("🗑️ Eliminar Gasto Seleccionado", key="delete_cat_gasto_btn", type="secondary",
                           on_click=callback_delete_category, args=(supabase_client, user_id, 'Gasto'))
         with col_del_cat:
@@ -541,7 +630,7 @@ def view_config(supabase_client: Client, user_id: str):
             ingreso_cats = categories_dict.get('Ingreso', [])
             st.write(ingreso_cats)
             if ingreso_cats:
-                st.selectbox("Eliminar Ingreso:", ingreso_cats, key="del_cat_ingreso", label_visibility="collapsed")
+                _usage_caption(st.selectbox("Eliminar Ingreso:", ingreso_cats, key="del_cat_ingreso", label_visibility="collapsed"), ['Categoría'], partial)
                 st.button("🗑️ Eliminar Ingreso Seleccionado", key="delete_cat_ingreso_btn", type="secondary",
                           on_click=callback_delete_category, args=(supabase_client, user_id, 'Ingreso'))
 
@@ -555,7 +644,7 @@ def view_config(supabase_client: Client, user_id: str):
         members_list = st.session_state.get('members', [])
         st.write(members_list)
         if members_list:
-            st.selectbox("Seleccionar Miembro para Eliminar:", members_list, key="del_member_select", label_visibility="collapsed")
+            _usage_caption(st.selectbox("Seleccionar Miembro para Eliminar:", members_list, key="del_member_select", label_visibility="collapsed"), ['Miembro'], partial)
             st.button("🗑️ Eliminar Miembro Seleccionado", key="delete_member_btn", type="secondary", on_click=callback_delete_member, args=(supabase_client, user_id))
 
     with tab_metas:
@@ -570,77 +659,102 @@ def view_config(supabase_client: Client, user_id: str):
         st.subheader("📊 Progreso de Metas", divider="grey")
         goals_df_display = st.session_state.get('goals_df', pd.DataFrame())
         if not goals_df_display.empty and 'Monto Objetivo' in goals_df_display.columns:
-            df_goals = goals_df_display.copy()
-            df_goals['Monto Objetivo'] = pd.to_numeric(df_goals['Monto Objetivo'], errors='coerce').fillna(1.0)
-            df_goals['Monto Aportado'] = pd.to_numeric(df_goals['Monto Aportado'], errors='coerce').fillna(0.0)
-            df_goals['Fecha Objetivo'] = pd.to_datetime(df_goals['Fecha Objetivo'], errors='coerce').dt.date
-            df_goals['Progreso (%)'] = ((df_goals['Monto Aportado'] / df_goals['Monto Objetivo'].replace(0, np.nan)) * 100).fillna(0)
-            df_goals['Días Restantes'] = (df_goals['Fecha Objetivo'] - datetime.now().date()).apply(lambda x: max(0, x.days if pd.notna(x) else 0))
-            # ... (código de los medidores de plotly) ...
-            num_goals = len(df_goals)
-            cols_per_row = 3
-            num_rows = (num_goals + cols_per_row - 1) // cols_per_row
-            goal_idx = 0
-            for _ in range(num_rows):
-                cols = st.columns(cols_per_row)
-                for j in range(cols_per_row):
-                    if goal_idx < num_goals:
-                        row = df_goals.iloc[goal_idx]
-                        progress = min(100, row['Progreso (%)'])
-                        target_amount_val = row['Monto Objetivo'] if row['Monto Objetivo'] > 0 else 1
-                        fig_gauge = go.Figure(go.Indicator(
-                            mode = "gauge+number+delta", value = row['Monto Aportado'],
-                            number = {'prefix': "$", 'valueformat': ',.2f'},
-                            delta = {'reference': target_amount_val, 'relative': False, 'valueformat': ',.2f', 'suffix': ' Objetivo'},
-                            domain = {'x': [0, 1], 'y': [0, 1]},
-                            title = {'text': f"<span style='font-size:1.1em'>{row['Nombre']}</span><br><span style='font-size:0.8em'>Días restantes: {row['Días Restantes']}</span>"},
-                            gauge = {'axis': {'range': [0, target_amount_val]}, 'bar': {'color': "darkorange"},
-                                     'steps': [{'range': [0, target_amount_val * 0.5], 'color': 'lightgray'}, {'range': [target_amount_val * 0.5, target_amount_val], 'color': 'darkgray'}],
-                                    'threshold' : {'line': {'color': "green", 'width': 4}, 'thickness': 0.75, 'value': target_amount_val}}
-                         ))
-                        fig_gauge.update_layout(height=250, margin=dict(l=20, r=20, t=60, b=20))
-                        cols[j].plotly_chart(fig_gauge, use_container_width=True, config={'displayModeBar': False})
-                        goal_idx += 1
-                    else:
-                        cols[j].empty()
+            # Progreso, ritmo de aporte y fecha proyectada de todas las metas (motor de metas, vectorizado)
+            df_goals = db.goal_progress(goals_df_display, user_id)
+            # Todos los medidores en una sola figura (subplots), en caché mientras las metas no cambien
+            st.plotly_chart(charts.goal_gauges_figure(df_goals), use_container_width=True, config={'displayModeBar': False})
+            st.dataframe(
+                df_goals[['Nombre', 'Progreso (%)', 'Aporte Mensual', 'Fecha Proyectada', 'Fecha Objetivo', 'A Tiempo']],
+                column_config={
+                    "Nombre": st.column_config.TextColumn("Meta"),
+                    "Progreso (%)": st.column_config.ProgressColumn("Progreso", format="%.0f%%", min_value=0, max_value=100),
+                    "Aporte Mensual": st.column_config.NumberColumn(f"Aporte Mensual (últ. {db.GOAL_RATE_MONTHS} meses)", format="$%.2f"),
+                    "Fecha Proyectada": st.column_config.DateColumn("Fecha Proyectada"),
+                    "Fecha Objetivo": st.column_config.DateColumn("Fecha Límite"),
+                    "A Tiempo": st.column_config.CheckboxColumn("¿A Tiempo?"),
+                },
+                hide_index=True, use_container_width=True
+            )
 
             with st.expander("✏️ Editar Detalles / Eliminar Metas"):
                 st.subheader("Detalle de Metas", divider="grey")
                 edited_goals_df = st.data_editor(
-                    df_goals.drop(columns=['Progreso (%)', 'Días Restantes']),
+                    goals_df_display.reindex(columns=[c for c in [*db.DEFAULT_GOALS.columns, db.ROW_ID_COLUMN] if c in goals_df_display.columns]),
                     column_config={
                         "Nombre": st.column_config.TextColumn("Meta", width="large"),
                         "Monto Objetivo": st.column_config.NumberColumn("Objetivo ($)", format="%.2f", min_value=0.01),
                         "Monto Aportado": st.column_config.NumberColumn("Aportado ($) - (Se recalcula)", format="%.2f", disabled=True),
-                        "Fecha Objetivo": st.column_config.DateColumn("Fecha Límite")
+                        "Fecha Objetivo": st.column_config.DateColumn("Fecha Límite"),
+                        db.ROW_ID_COLUMN: None
                     },
                     hide_index=True, use_container_width=True, num_rows="fixed", key="goals_editor"
                 )
                 if st.button("💾 Guardar Cambios en Metas", key="save_edited_goals"):
-                    df_to_save = edited_goals_df[['Nombre', 'Monto Objetivo', 'Fecha Objetivo']].copy()
-                    df_to_save = pd.merge(df_to_save, st.session_state.goals_df[['Nombre', 'Monto Aportado']], on='Nombre', how='left').fillna({'Monto Aportado': 0.0})
+                    if db.ROW_ID_COLUMN in edited_goals_df.columns:
+                        df_to_save = edited_goals_df[[db.ROW_ID_COLUMN, 'Nombre', 'Monto Objetivo', 'Fecha Objetivo']].copy()
+                        df_to_save = pd.merge(df_to_save, st.session_state.goals_df[[db.ROW_ID_COLUMN, 'Monto Aportado']], on=db.ROW_ID_COLUMN, how='left').fillna({'Monto Aportado': 0.0})
+                    else:
+                        df_to_save = edited_goals_df[['Nombre', 'Monto Objetivo', 'Fecha Objetivo']].copy()
+                        df_to_save = pd.merge(df_to_save, st.session_state.goals_df[['Nombre', 'Monto Aportado']], on='Nombre', how='left').fillna({'Monto Aportado': 0.0})
                     df_to_save['Monto Objetivo'] = pd.to_numeric(df_to_save['Monto Objetivo'], errors='coerce').fillna(0.0)
                     df_to_save['Fecha Objetivo'] = pd.to_datetime(df_to_save['Fecha Objetivo'], errors='coerce').dt.date
-                    st.session_state.goals_df = df_to_save
+                    db.set_state('goals_df', df_to_save)
                     db.save_data(supabase_client, db.GOALS_TABLE, st.session_state.goals_df, user_id)
                     st.success("✅ Cambios en metas guardados.")
                     st.rerun()
                 st.markdown("---")
-                st.selectbox("Seleccionar Meta para Eliminar:", df_goals['Nombre'].tolist(), key="del_goal_select", label_visibility="collapsed")
+                _usage_caption(st.selectbox("Seleccionar Meta para Eliminar:", df_goals['Nombre'].tolist(), key="del_goal_select", label_visibility="collapsed"), ['Destino'], partial)
                 st.button("🗑️ Eliminar Meta Seleccionada", key="delete_goal_btn", type="secondary", on_click=callback_delete_goal, args=(supabase_client, user_id))
         else: st.info("ℹ️ Aún no hay metas de ahorro configuradas.")
 
 
 # --- 5.4 Pestaña: Historial Completo ---
+def _coerce_history_page(edited_df: pd.DataFrame):
+    """Página editada sin la columna de selección, con Monto y Fecha convertidos (descarta filas inválidas)."""
+    df_page = edited_df.drop(columns=['Seleccionar'], errors='ignore')
+    df_page['Monto'] = pd.to_numeric(df_page['Monto'], errors='coerce').fillna(0.0)
+    df_page['Fecha'] = pd.to_datetime(df_page['Fecha'], errors='coerce')
+    return df_page.dropna(subset=['Fecha', 'Monto'])
+
+def _save_history_page(supabase_client: Client, user_id: str, df_all: pd.DataFrame, df_shown: pd.DataFrame, edited_df: pd.DataFrame, deleted_ids=()):
+    """
+    Guarda una página del editor: solo las filas cambiadas, añadidas o borradas (comparadas por id con la página
+    mostrada) se convierten, se aplican al historial y se envían; saldos, cubo y metas se actualizan por delta.
+    """
+    changes = db.history_page_changes(df_shown, _coerce_history_page(edited_df), deleted_ids)
+    if changes[0].empty and changes[1].empty:
+        return
+    db.set_transactions(db.apply_transaction_changes(df_all, *changes), delta=changes)
+    db.save_data(supabase_client, db.TRANSACTIONS_TABLE, st.session_state.transactions_df, user_id, changes=changes)
+    db.sync_goal_progress(supabase_client, user_id)
+
+def _split_selected_rows(edited_df: pd.DataFrame):
+    """
+    (página sin las filas nuevas marcadas, ids marcados para borrar). Una fila añadida en el editor aún no tiene id:
+    marcarla la descarta (no se inserta para luego borrarla).
+    """
+    selected = edited_df['Seleccionar'] == True
+    new_selected = selected & edited_df[db.ROW_ID_COLUMN].isna()
+    return edited_df[~new_selected], edited_df.loc[selected & ~new_selected, db.ROW_ID_COLUMN]
+
+@profiler.timed()
 def view_history(supabase_client: Client, user_id: str):
     st.header("📋 Historial Completo y Gestión")
     st.caption("Marca 'Eliminar?' para borrar. Edita directamente en la tabla y guarda los cambios.")
+    # El historial completo se edita y exporta entero: traer primero las páginas antiguas que falten
+    if not load_history_with_progress(supabase_client, user_id):
+        st.warning("⚠️ No se pudo cargar todo el historial antiguo. Guardar cambios aquí no afectará a lo que falta.")
+    import_summary = st.session_state.pop('csv_import_summary', None)
+    if import_summary:
+        st.success(f"✅ Se importaron {import_summary['imported']:,} transacciones. {import_summary['dropped']:,} filas descartadas.")
+        if not import_summary['metadata_changed']:
+            st.toast("¡Todo estaba al día! No se añadieron nuevos metadatos.")
 
     with st.expander("📥/📤 Importar o Exportar Historial (CSV)"):
         st.subheader("📥 Descargar Historial (CSV)")
-        df_to_download = st.session_state.get('transactions_df', pd.DataFrame())
+        df_to_download = db.get_transactions()
         if not df_to_download.empty:
-            df_csv_export = df_to_download.copy()
+            df_csv_export = df_to_download.drop(columns=[db.ROW_ID_COLUMN], errors='ignore')
             if 'Fecha' in df_csv_export.columns:
                  df_csv_export['Fecha'] = pd.to_datetime(df_csv_export['Fecha']).dt.strftime('%Y-%m-%dT%H:%M:%S')
             csv_data = df_csv_export.to_csv(index=False, encoding='utf-8-sig')
@@ -663,66 +777,29 @@ def view_history(supabase_client: Client, user_id: str):
 
         if st.button("🚀 Procesar Archivo CSV", key="process_csv_btn", type="primary"):
             if uploaded_file is not None:
+                # Se lee, valida e inserta por trozos: la memoria no depende del tamaño del archivo
+                bar = st.progress(0.0, text="📤 Importando CSV...")
+
+                def report(imported, fraction):
+                    bar.progress(min(fraction, 1.0), text=f"📤 Importando CSV: {imported:,} filas guardadas")
+
                 try:
-                    df_new = pd.read_csv(uploaded_file)
-                    df_processed = df_new.copy()
-                    # (Toda la lógica de validación de CSV no cambia...)
-                    required_cols_types = {
-                        'Fecha': 'datetime64[ns]', 'Tipo': 'object',
-                        'Categoría': 'object', 'Cuenta': 'object', 'Monto': 'float64'
-                    }
-                    optional_cols_defaults = {
-                        'Descripción': '', 'Miembro': 'N/A', 'Destino': 'N/A',
-                        'Recurrente': False, 'Frecuencia': 'Única/N/A'
-                    }
-                    df_processed.columns = [col.strip() for col in df_processed.columns]
-                    missing_critical = [col for col in required_cols_types.keys() if col not in df_processed.columns]
-                    if missing_critical:
-                        st.error(f"❌ Error: El CSV no contiene las columnas críticas requeridas: {', '.join(missing_critical)}")
-                        return
-                    df_processed['Fecha'] = pd.to_datetime(df_processed['Fecha'], errors='coerce')
-                    df_processed['Monto'] = pd.to_numeric(df_processed['Monto'], errors='coerce')
-                    for col, default_val in optional_cols_defaults.items():
-                        if col not in df_processed.columns: df_processed[col] = default_val
-                        else:
-                            if isinstance(default_val, bool): df_processed[col] = df_processed[col].fillna(default_val).astype(bool)
-                            else: df_processed[col] = df_processed[col].fillna(default_val)
-                    all_expected_cols = list(db.DEFAULT_TRANSACTIONS.columns)
-                    df_processed = df_processed.reindex(columns=all_expected_cols)
-                    initial_rows = len(df_processed)
-                    df_processed = df_processed.dropna(subset=['Fecha', 'Monto', 'Tipo'])
-                    rows_dropped = initial_rows - len(df_processed)
-                    if df_processed.empty:
-                        st.error("❌ No se encontraron datos válidos (Fecha, Monto, Tipo) en el CSV.")
-                        return
-
-                    st.info(f"Archivo leído. {len(df_processed)} filas válidas encontradas. {rows_dropped} filas descartadas.")
-                    if import_mode == 'Reemplazar historial completo':
-                        df_final = df_processed
-                        st.success(f"✅ Historial reemplazado con {len(df_final)} nuevas transacciones.")
-                    else:
-                        df_current = st.session_state.get('transactions_df', db.DEFAULT_TRANSACTIONS.copy())
-                        df_final = pd.concat([df_current, df_processed], ignore_index=True)
-                        st.success(f"✅ Se añadieron {len(df_processed)} transacciones. Total: {len(df_final)}.")
-
-                    st.info("Sincronizando categorías, miembros y cuentas del CSV...")
-                    changes = db.sync_metadata_from_df(supabase_client, user_id, df_processed) # Adaptado V5.0
-                    if not changes:
-                        st.toast("¡Todo estaba al día! No se añadieron nuevos metadatos.")
-
-                    st.session_state.transactions_df = df_final.sort_values(by='Fecha', ascending=False).reset_index(drop=True)
-                    db.save_data(supabase_client, db.TRANSACTIONS_TABLE, st.session_state.transactions_df, user_id) # Adaptado V5.0
-                    st.session_state.goals_df = db.update_goal_progress(
-                        st.session_state.transactions_df.copy(),
-                        st.session_state.get('goals_df', db.DEFAULT_GOALS.copy()).copy()
+                    summary = db.import_transactions_csv(
+                        supabase_client, user_id, uploaded_file,
+                        replace=import_mode == 'Reemplazar historial completo', progress=report
                     )
-                    db.save_data(supabase_client, db.GOALS_TABLE, st.session_state.goals_df, user_id) # Adaptado V5.0
-                    st.success("¡Sincronización completa! Recargando...")
-                    st.session_state.force_filter_recalc = True
-                    time.sleep(2)
-                    st.rerun()
+                except ValueError as e:
+                    st.error(f"❌ Error: {e}")
+                    return
                 except Exception as e:
                     st.error(f"❌ Ocurrió un error al procesar el archivo CSV: {e}")
+                    return
+                if summary['imported'] == 0:
+                    st.error("❌ No se encontraron datos válidos (Fecha, Monto, Tipo) en el CSV.")
+                    return
+                st.session_state.csv_import_summary = summary
+                st.session_state.force_filter_recalc = True
+                st.rerun()
             else:
                 st.warning("⚠️ No se ha seleccionado ningún archivo.")
 
@@ -730,16 +807,38 @@ def view_history(supabase_client: Client, user_id: str):
         st.info("ℹ️ Aún no hay transacciones en el historial.")
         return
 
-    df_historial = st.session_state.transactions_df.copy().sort_values(by='Fecha', ascending=False)
-    df_historial.insert(0, "Seleccionar", False)
+    # Solo la página visible va al editor: el orden (y la búsqueda) se calculan una vez por versión del historial
+    col_search, col_sort, col_order, col_size = st.columns([3, 2, 1, 1])
+    search = col_search.text_input("🔍 Buscar", key="history_search", placeholder="Descripción, categoría, cuenta, miembro...")
+    sort_column = col_sort.selectbox("Ordenar por", db.HISTORY_SORT_COLUMNS, key="history_sort_column")
+    ascending = col_order.selectbox("Orden", ["Desc.", "Asc."], key="history_sort_order") == "Asc."
+    page_size = col_size.selectbox("Filas", db.HISTORY_PAGE_SIZES, index=1, key="history_page_size")
+
+    df_all = db.get_transactions()
+    order = db.get_history_order(sort_column, ascending, search)
+    n_pages = max(1, -(-len(order) // page_size))
+    if st.session_state.get('history_page', 1) > n_pages:
+        st.session_state.history_page = n_pages
+    col_page, col_info = st.columns([1, 4])
+    page = col_page.number_input("Página", min_value=1, max_value=n_pages, step=1, key="history_page")
+    first_row = (page - 1) * page_size
+    col_info.caption(f"Mostrando {min(first_row + 1, len(order)):,}–{min(first_row + page_size, len(order)):,} de {len(order):,} transacciones"
+                     + (f" (de {len(df_all):,} en total)" if search.strip() else "") + ". Los cambios sin guardar se pierden al cambiar de página.")
+
+    # El editor trabaja con texto: las categóricas no aceptan valores nuevos al editar
+    df_shown = db.history_page(df_all, order, page - 1, page_size)
+    df_page = df_shown.astype({col: object for col in db.TRANSACTION_CATEGORICAL_COLUMNS if col in df_shown.columns})
+    df_page.insert(0, "Seleccionar", False)
     all_categories_list = st.session_state.get('categories', {}).get('Ingreso', []) + st.session_state.get('categories', {}).get('Gasto', [])
     account_options = st.session_state.get('accounts_df', pd.DataFrame(columns=['Nombre']))['Nombre'].tolist()
     member_options = st.session_state.get('members', [])
     goal_options = st.session_state.get('goals_df', pd.DataFrame(columns=['Nombre']))['Nombre'].tolist()
     destination_options = sorted(list(set(account_options + goal_options + ['N/A'])))
 
+    # La clave cambia con la página y con cada versión del historial: el estado de edición no pasa de una página a otra
+    editor_key = f"history_editor_{db.get_version('transactions_df')}_{sort_column}_{ascending}_{search}_{page_size}_{page}"
     edited_df = st.data_editor(
-        df_historial,
+        df_page,
         column_config={
             "Seleccionar": st.column_config.CheckboxColumn("Eliminar?", width="small"),
             "Fecha": st.column_config.DatetimeColumn("Fecha", format="YYYY-MM-DD HH:mm", width="small"),
@@ -752,22 +851,16 @@ def view_history(supabase_client: Client, user_id: str):
             "Destino": st.column_config.SelectboxColumn("Destino", options=destination_options, width="medium"),
             "Recurrente": st.column_config.CheckboxColumn("Rec?", width="small"),
             "Frecuencia": st.column_config.SelectboxColumn("Frec.", options=list(db.FREQUENCY_MULTIPLIER.keys()), width="small"),
+            db.ROW_ID_COLUMN: None,
         },
-        key="history_editor", hide_index=True, use_container_width=True, num_rows="dynamic", height=600
+        key=editor_key, hide_index=True, use_container_width=True, num_rows="dynamic", height=600
     )
 
     col_save, col_delete = st.columns([1, 4])
     with col_save:
         if st.button("💾 Guardar Cambios", type="primary"):
             try:
-                df_to_save = edited_df.drop(columns=['Seleccionar'], errors='ignore')
-                df_to_save['Monto'] = pd.to_numeric(df_to_save['Monto'], errors='coerce').fillna(0.0)
-                df_to_save['Fecha'] = pd.to_datetime(df_to_save['Fecha'], errors='coerce')
-                df_to_save = df_to_save.dropna(subset=['Fecha', 'Monto'])
-                st.session_state.transactions_df = df_to_save.sort_values(by='Fecha', ascending=False).reset_index(drop=True)
-                db.save_data(supabase_client, db.TRANSACTIONS_TABLE, st.session_state.transactions_df, user_id)
-                st.session_state.goals_df = db.update_goal_progress(st.session_state.transactions_df, st.session_state.goals_df)
-                db.save_data(supabase_client, db.GOALS_TABLE, st.session_state.goals_df, user_id)
+                _save_history_page(supabase_client, user_id, df_all, df_shown, edited_df)
                 st.session_state.force_filter_recalc = True
                 st.success("✅ Cambios guardados con éxito.")
                 st.rerun()
@@ -775,19 +868,12 @@ def view_history(supabase_client: Client, user_id: str):
                 st.error(f"❌ Error al guardar cambios: {e}. Verifica los datos editados.")
     with col_delete:
         if st.button("🗑️ Eliminar Seleccionados", type="secondary"):
-            rows_to_keep = edited_df[edited_df['Seleccionar'] == False]
-            rows_deleted = edited_df[edited_df['Seleccionar'] == True]
-            num_deleted = len(rows_deleted)
+            kept_df, deleted_ids = _split_selected_rows(edited_df)
+            num_deleted = len(deleted_ids) + len(edited_df) - len(kept_df)
             if num_deleted > 0:
                 try:
-                    df_updated = rows_to_keep.drop(columns=['Seleccionar'], errors='ignore')
-                    df_updated['Monto'] = pd.to_numeric(df_updated['Monto'], errors='coerce').fillna(0.0)
-                    df_updated['Fecha'] = pd.to_datetime(df_updated['Fecha'], errors='coerce')
-                    df_updated = df_updated.dropna(subset=['Fecha', 'Monto'])
-                    st.session_state.transactions_df = df_updated.sort_values(by='Fecha', ascending=False).reset_index(drop=True)
-                    db.save_data(supabase_client, db.TRANSACTIONS_TABLE, st.session_state.transactions_df, user_id)
-                    st.session_state.goals_df = db.update_goal_progress(st.session_state.transactions_df, st.session_state.goals_df)
-                    db.save_data(supabase_client, db.GOALS_TABLE, st.session_state.goals_df, user_id)
+                    # Se borran por id (y se guardan las demás ediciones de la página)
+                    _save_history_page(supabase_client, user_id, df_all, df_shown, kept_df, deleted_ids=deleted_ids)
                     st.session_state.force_filter_recalc = True
                     st.success(f"✅ {num_deleted} transacciones eliminadas con éxito.")
                     st.rerun()
@@ -798,6 +884,7 @@ def view_history(supabase_client: Client, user_id: str):
 
 
 # --- Asistente de Configuración Inicial (Adaptado V5.0) ---
+@profiler.timed()
 def run_setup_wizard(supabase_client: Client, user_id: str):
     st.title("👋 ¡Bienvenido a Guardian Doméstico!")
     st.subheader("Configuración Inicial Rápida")
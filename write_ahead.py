@@ -0,0 +1,310 @@
+# --- Archivo: write_ahead.py ---
+# Registro local de escrituras (write-ahead log en SQLite) con envío a Supabase en segundo plano
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# --- 1. CONFIGURACIÓN ---
+WAL_PATH_ENV = 'GUARDIAN_WAL_PATH' # Ruta del archivo SQLite; sin definir (o '') se escribe directo a Supabase
+DEFAULT_WAL_PATH = 'guardian_wal.sqlite3'
+FLUSH_BATCH_ROWS = 1000 # Máximo de filas por petición al juntar inserts/upserts consecutivos
+MAX_ATTEMPTS = 8 # Tras esto la operación pasa a 'failed' y su tabla deja de enviarse hasta descartarla
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 30.0
+READ_WAIT_SECONDS = 10.0 # Una lectura espera (como mucho) a que se envíen las escrituras pendientes de su tabla
+ROW_ID_COLUMN = 'id' # Clave de los reintentos idempotentes (insert -> upsert por id)
+
+WRITE_OPERATIONS = ('insert', 'upsert', 'delete', 'update')
+
+
+class QueuedResponse:
+    """Respuesta inmediata de una escritura encolada (la fila aún no está en Supabase)."""
+    def __init__(self, entry_id):
+        self.data = []
+        self.count = None
+        self.entry_id = entry_id
+
+
+def _conflict_keys(verb: str, kwargs: dict, rows: list):
+    """Claves únicas que toca cada fila: on_conflict en un upsert (por defecto el id), el id en un insert."""
+    columns = [c.strip() for c in kwargs.get('on_conflict', '').split(',') if c.strip()] if verb == 'upsert' else []
+    columns = columns or [ROW_ID_COLUMN]
+    return {tuple(row.get(c) for c in columns) for row in rows if all(row.get(c) is not None for c in columns)}
+
+
+class WriteAheadLog:
+    """
+    Cola persistente de escrituras. Cada escritura se guarda en SQLite como la cadena de llamadas
+    de supabase-py que la produce (p.ej. delete().eq().in_()) y un hilo la repite contra el cliente real,
+    en orden de llegada. Si el envío falla se reintenta con espera exponencial sin adelantar las
+    siguientes; al reiniciar, lo que quedó pendiente en el archivo se vuelve a enviar.
+    Si una escritura agota los reintentos, su tabla queda bloqueada (las siguientes pueden depender de ella)
+    hasta que se descarte con discard(); las demás tablas siguen enviándose.
+    """
+
+    def __init__(self, client, path: str = DEFAULT_WAL_PATH, batch_rows: int = FLUSH_BATCH_ROWS,
+                 max_attempts: int = MAX_ATTEMPTS, retry_base: float = RETRY_BASE_SECONDS):
+        self.client = client
+        self.path = path
+        self.batch_rows = batch_rows
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flushed = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'enqueued': 0, 'requests': 0, 'retries': 0, 'failed': 0, 'stale_reads': 0}
+        self.stale_tables = {} # Tabla -> escrituras pendientes cuando se leyó sin esperar a que se enviaran
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS wal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                calls TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS wal_status_seq ON wal (status, seq)")
+
+    # --- Encolar ---
+    def enqueue(self, table_name: str, calls: list):
+        """Guarda una escritura (tabla + cadena de llamadas) y despierta al hilo de envío."""
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO wal (table_name, calls, created_at) VALUES (?, ?, ?)",
+                (table_name, json.dumps(calls, default=str, ensure_ascii=False), time.time())
+            )
+            self.stats['enqueued'] += 1
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    def pending(self, table_name: str = None):
+        """Número de escrituras aún no enviadas (de una tabla o de todas)."""
+        with self._lock:
+            if table_name is None:
+                return self._db.execute("SELECT COUNT(*) FROM wal WHERE status = 'pending'").fetchone()[0]
+            return self._db.execute("SELECT COUNT(*) FROM wal WHERE status = 'pending' AND table_name = ?", (table_name,)).fetchone()[0]
+
+    def _flushable(self):
+        """True si hay escrituras pendientes en alguna tabla no bloqueada."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT EXISTS (SELECT 1 FROM wal WHERE status = 'pending' "
+                "AND table_name NOT IN (SELECT table_name FROM wal WHERE status = 'failed'))"
+            ).fetchone()[0] == 1
+
+    def failed(self):
+        """Escrituras que agotaron los reintentos: [(seq, tabla, último error)]. Bloquean su tabla."""
+        with self._lock:
+            return self._db.execute("SELECT seq, table_name, last_error FROM wal WHERE status = 'failed' ORDER BY seq").fetchall()
+
+    def blocked_tables(self):
+        """Tablas detenidas por una escritura fallida."""
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT DISTINCT table_name FROM wal WHERE status = 'failed'")}
+
+    def discard(self, table_name: str):
+        """Descarta la escritura fallida de la tabla y todo lo encolado después (desbloquea la tabla). Devuelve cuántas quitó."""
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM wal WHERE table_name = ?", (table_name,))
+        self.stale_tables.pop(table_name, None)
+        self._notify_flushed()
+        return cursor.rowcount
+
+    # --- Envío ---
+    def _next_batch(self):
+        """
+        Primera escritura pendiente, junto con los inserts/upserts consecutivos idénticos salvo por las filas.
+        La tanda se corta antes de repetir una clave: Postgres rechaza un upsert que toca dos veces la misma fila.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, table_name, calls, attempts FROM wal WHERE status = 'pending' "
+                "AND table_name NOT IN (SELECT table_name FROM wal WHERE status = 'failed') ORDER BY seq LIMIT 200"
+            ).fetchall()
+        if not rows:
+            return None
+        seq, table_name, calls_json, attempts = rows[0]
+        calls = json.loads(calls_json)
+        batch_seqs = [seq]
+        if calls[0][0] in ('insert', 'upsert'):
+            shape = (table_name, calls[0][0], json.dumps(calls[0][2]), json.dumps(calls[1:]))
+            payload = list(calls[0][1][0]) if isinstance(calls[0][1][0], list) else [calls[0][1][0]]
+            keys = _conflict_keys(calls[0][0], calls[0][2], payload)
+            for next_seq, next_table, next_json, _ in rows[1:]:
+                next_calls = json.loads(next_json)
+                if next_calls[0][0] != calls[0][0] or (next_table, next_calls[0][0], json.dumps(next_calls[0][2]), json.dumps(next_calls[1:])) != shape:
+                    break
+                next_rows = next_calls[0][1][0] if isinstance(next_calls[0][1][0], list) else [next_calls[0][1][0]]
+                next_keys = _conflict_keys(calls[0][0], calls[0][2], next_rows)
+                if len(payload) + len(next_rows) > self.batch_rows or not keys.isdisjoint(next_keys):
+                    break
+                keys |= next_keys
+                payload.extend(next_rows)
+                batch_seqs.append(next_seq)
+            calls = [[calls[0][0], [payload], calls[0][2]]] + calls[1:]
+            if attempts and calls[0][0] == 'insert' and all(ROW_ID_COLUMN in row for row in payload):
+                # Un intento anterior pudo llegar a aplicarse (p.ej. timeout): el reintento no debe duplicar filas
+                calls = [['upsert', [payload], {'on_conflict': ROW_ID_COLUMN}]] + calls[1:]
+        return batch_seqs, table_name, calls, attempts
+
+    def _replay(self, table_name: str, calls: list):
+        """Repite la cadena de llamadas de supabase-py contra el cliente real."""
+        query = self.client.table(table_name)
+        for method, args, kwargs in calls:
+            query = getattr(query, method)(*args, **kwargs)
+        return query.execute()
+
+    def flush_once(self):
+        """Envía la siguiente tanda. Devuelve cuántas escrituras salieron de la cola (0 si falló o no había)."""
+        batch = self._next_batch()
+        if batch is None:
+            return 0
+        seqs, table_name, calls, attempts = batch
+        placeholders = ','.join('?' * len(seqs))
+        try:
+            self._replay(table_name, calls)
+        except Exception as e:
+            self.stats['retries'] += 1
+            with self._lock:
+                # Solo cuenta el intento a la cabeza; las que venían juntas se reintentan igual
+                status = 'failed' if attempts + 1 >= self.max_attempts else 'pending'
+                self._db.execute("UPDATE wal SET attempts = attempts + 1, last_error = ?, status = ? WHERE seq = ?", (str(e), status, seqs[0]))
+            if status == 'failed':
+                self.stats['failed'] += 1
+                self._notify_flushed()
+                return 1
+            self._stop.wait(min(self.retry_base * 2 ** attempts, RETRY_MAX_SECONDS))
+            return 0
+        self.stats['requests'] += 1
+        with self._lock:
+            self._db.execute(f"DELETE FROM wal WHERE seq IN ({placeholders})", seqs)
+        self._notify_flushed()
+        return len(seqs)
+
+    def _notify_flushed(self):
+        with self._flushed:
+            self._flushed.notify_all()
+
+    def wait_until_flushed(self, table_name: str = None, timeout: float = None):
+        """
+        Espera a que no queden escrituras pendientes (de una tabla o de todas). True si lo logró;
+        False al agotar el tiempo o si la tabla está bloqueada por una escritura fallida.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._flushed:
+            while self.pending(table_name):
+                blocked = self.blocked_tables()
+                if (table_name in blocked) if table_name is not None else blocked:
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._wakeup.set()
+                self._flushed.wait(0.05 if remaining is None else min(remaining, 0.05))
+        return True
+
+    def read_barrier(self, table_name: str = None):
+        """
+        Antes de leer: espera a que se envíe lo pendiente (como mucho READ_WAIT_SECONDS). Si no se pudo,
+        la lectura sigue pero la tabla queda en stale_tables (lo leído no incluye esas escrituras).
+        """
+        if self.wait_until_flushed(table_name, timeout=READ_WAIT_SECONDS):
+            for table in ([table_name] if table_name is not None else list(self.stale_tables)):
+                self.stale_tables.pop(table, None)
+            return True
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT table_name, COUNT(*) FROM wal WHERE status = 'pending' " + ("AND table_name = ? " if table_name is not None else "") + "GROUP BY table_name",
+                (table_name,) if table_name is not None else ()
+            ).fetchall()
+        self.stale_tables.update(dict(rows))
+        self.stats['stale_reads'] += 1
+        return False
+
+    # --- Hilo de envío ---
+    def _run(self):
+        while not self._stop.is_set():
+            if self.flush_once() == 0 and not self._flushable():
+                self._wakeup.wait(1.0)
+                self._wakeup.clear()
+
+    def start(self):
+        """Arranca el hilo de envío (también reenvía lo que quedó pendiente de una ejecución anterior)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='guardian-wal-flush', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        self._db.close()
+
+
+class _QueuedQuery:
+    """Graba la cadena table().insert/upsert/delete(...).eq(...) y la encola al hacer execute()."""
+
+    def __init__(self, queued_client, table_name: str):
+        self._queued_client = queued_client
+        self._table_name = table_name
+        self._calls = []
+
+    def __getattr__(self, method):
+        def record(*args, **kwargs):
+            self._calls.append([method, list(args), kwargs])
+            return self
+        return record
+
+    def execute(self):
+        wal = self._queued_client.wal
+        if self._calls and self._calls[0][0] in WRITE_OPERATIONS:
+            return QueuedResponse(wal.enqueue(self._table_name, self._calls))
+        # Lecturas: primero que lleguen a Supabase las escrituras pendientes de la tabla
+        wal.read_barrier(self._table_name)
+        return wal._replay(self._table_name, self._calls)
+
+
+class QueuedClient:
+    """Cliente con la misma interfaz que supabase-py: las escrituras van a la cola, el resto (auth, lecturas) al cliente real."""
+
+    def __init__(self, client, wal: WriteAheadLog):
+        self.client = client
+        self.wal = wal
+
+    def table(self, table_name: str):
+        return _QueuedQuery(self, table_name)
+
+    def rpc(self, fn: str, params: dict = None):
+        # Los agregados leen cualquier tabla: antes se envía todo lo pendiente
+        self.wal.read_barrier()
+        return self.client.rpc(fn, params)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def write_ahead_client(client, path: str = None):
+    """
+    Envuelve el cliente con la cola local solo si hay ruta configurada (variable GUARDIAN_WAL_PATH,
+    p.ej. guardian_wal.sqlite3). Sin ella se devuelve el cliente tal cual.
+    """
+    path = os.environ.get(WAL_PATH_ENV, '') if path is None else path
+    if not path:
+        return client
+    return QueuedClient(client, WriteAheadLog(client, path).start())